@@ -0,0 +1,223 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Contention load harness for catalog_update and catalog_delete, against a
+# local fake API server, for evaluating changes to how the catalog is written.
+#
+# Usage: python -m benchmarks.bench_contention [--updaters N] [--deleters N] [--processes]
+#            [--lock lease] [--latency S] [--jitter S] [--error-rate F]
+#
+# Each updater records a new product version, and each deleter removes one
+# of two versions of a product, all in the same ConfigMap and all at once.
+# Writers run as threads calling update_config_map and modify_config_map, or
+# with --processes as catalog_update and catalog_delete processes given a
+# kubeconfig for the fake server, as they run in install jobs.
+#
+# The time until every writer has finished and the ConfigMap holds all of
+# their changes, the conflicts per successful write, the requests sent to the
+# API server, and the bytes of request and response bodies are reported as a
+# JSON object.
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from kubernetes import client
+from yaml import safe_dump, safe_load
+
+from benchmarks.fake_k8s import FakeKubernetesServer
+from cray_product_catalog.util.catalog_write import modify_config_map, update_config_map
+
+NAME = 'cray-product-catalog'
+NAMESPACE = 'services'
+VERSION_DATA = {'component_versions': {'docker': [{'name': 'cray/example', 'version': '1.0.0'}]}}
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction (0-1) of the sorted values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def initial_data(deleters):
+    """Return the ConfigMap data before the writers start: two versions of each product to delete from."""
+    return {
+        f'deleted-{index}': safe_dump({'1.0.0': VERSION_DATA, '2.0.0': VERSION_DATA}, default_flow_style=False)
+        for index in range(deleters)
+    }
+
+
+def converged(data, updaters, deleters):
+    """Return whether ConfigMap data holds the changes of every writer."""
+    data = data or {}
+    for index in range(updaters):
+        if '1.0.0' not in safe_load(data.get(f'updated-{index}') or '{}'):
+            return False
+    for index in range(deleters):
+        if set(safe_load(data.get(f'deleted-{index}') or '{}')) != {'2.0.0'}:
+            return False
+    return True
+
+
+def thread_writers(updaters, deleters, lock_mode):
+    """Return callables which write as threads in this process, each returning whether it succeeded."""
+    def update(index):
+        update_config_map(VERSION_DATA, NAME, NAMESPACE, product=f'updated-{index}', product_version='1.0.0',
+                          set_active=False, remove_active=False, lock_mode=lock_mode)
+
+    def delete(index):
+        modify_config_map(NAME, NAMESPACE, f'deleted-{index}', '1.0.0', lock_mode=lock_mode)
+
+    def succeeds(write, index):
+        def run():
+            try:
+                write(index)
+                return True
+            except Exception:  # pylint: disable=broad-except
+                return False
+        return run
+
+    return ([succeeds(update, index) for index in range(updaters)] +
+            [succeeds(delete, index) for index in range(deleters)])
+
+
+def process_writers(updaters, deleters, lock_mode, kubeconfig):
+    """Return callables which write as catalog_update and catalog_delete processes."""
+    env = dict(os.environ, KUBECONFIG=kubeconfig, CONFIG_MAP=NAME, CONFIG_MAP_NAMESPACE=NAMESPACE,
+               CATALOG_LOCK=lock_mode or '', PRODUCT_VERSION='1.0.0', YAML_CONTENT_STRING=safe_dump(VERSION_DATA))
+    # Do not use the in-cluster configuration if this runs in a pod.
+    env.pop('KUBERNETES_SERVICE_HOST', None)
+
+    def writer(module, product):
+        def run():
+            return subprocess.run(
+                [sys.executable, '-m', module], env=dict(env, PRODUCT=product),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False
+            ).returncode == 0
+        return run
+
+    return ([writer('cray_product_catalog.catalog_update', f'updated-{index}') for index in range(updaters)] +
+            [writer('cray_product_catalog.catalog_delete', f'deleted-{index}') for index in range(deleters)])
+
+
+def run_writers(writers):
+    """Run the writers at once. Return the elapsed time, the latency of each, and the number that failed."""
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    start_event = threading.Event()
+
+    def run(write):
+        start_event.wait()
+        start = time.monotonic()
+        succeeded = write()
+        with lock:
+            latencies.append(time.monotonic() - start)
+            if not succeeded:
+                failures.append(write)
+
+    threads = [threading.Thread(target=run, args=(write,)) for write in writers]
+    for thread in threads:
+        thread.start()
+    start = time.monotonic()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, latencies, len(failures)
+
+
+def bench(updaters, deleters, lock_mode=None, processes=False, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+    """Run the writers against a fake API server and return the results."""
+    with FakeKubernetesServer(latency=latency, jitter=jitter, error_rate=error_rate, seed=seed) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        server.store.create(NAMESPACE, {'metadata': {'name': NAME}, 'data': initial_data(deleters)})
+        if processes:
+            kubeconfig = os.path.join(tmp_dir, 'kubeconfig')
+            server.write_kubeconfig(kubeconfig, NAMESPACE)
+            elapsed, latencies, failures = run_writers(process_writers(updaters, deleters, lock_mode, kubeconfig))
+        else:
+            # The writers build their own ApiClients from the default configuration.
+            with patch.object(client.Configuration, '_default', server.configuration()):
+                elapsed, latencies, failures = run_writers(thread_writers(updaters, deleters, lock_mode))
+
+        stats = dict(server.store.stats)
+        successes = updaters + deleters - failures
+        requests = {method: stats[method] for method in ('GET', 'POST', 'PATCH', 'PUT', 'DELETE', 'WATCH')}
+        return {
+            'mode': lock_mode or 'optimistic',
+            'writers': 'processes' if processes else 'threads',
+            'updaters': updaters,
+            'deleters': deleters,
+            'latency_seconds': latency,
+            'jitter_seconds': jitter,
+            'error_rate': error_rate,
+            'converged': converged(server.store.get(NAMESPACE, NAME)['data'], updaters, deleters),
+            'time_to_converge_seconds': round(elapsed, 3),
+            'failures': failures,
+            'conflicts': stats['conflicts'],
+            'conflicts_per_success': round(stats['conflicts'] / successes, 3) if successes else None,
+            'requests_sent': sum(requests.values()),
+            'requests': requests,
+            'injected_errors': stats['injected_errors'],
+            'bytes_sent_to_server': stats['bytes_received'],
+            'bytes_received_from_server': stats['bytes_sent'],
+            'writer_latency_p50_seconds': round(percentile(latencies, 0.5), 3),
+            'writer_latency_p95_seconds': round(percentile(latencies, 0.95), 3),
+            'writer_latency_max_seconds': round(max(latencies), 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure concurrent catalog_update and catalog_delete writers '
+                                                 'against a local fake Kubernetes API server.')
+    parser.add_argument('--updaters', type=int, default=50, help='Number of concurrent updaters.')
+    parser.add_argument('--deleters', type=int, default=10, help='Number of concurrent deleters.')
+    parser.add_argument('--processes', action='store_true',
+                        help='Run writers as catalog_update and catalog_delete processes rather than threads.')
+    parser.add_argument('--lock', choices=('optimistic', 'lease'), default='optimistic',
+                        help='The write lock mode, as for CATALOG_LOCK.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency added to each request.')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Up to this many more seconds of latency, chosen at random, for each request.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='The fraction of requests answered with 500 or 503.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed for injected latency and errors.')
+    args = parser.parse_args()
+    # Expected conflicts and injected errors are logged by the writers.
+    logging.getLogger('cray_product_catalog').setLevel(logging.CRITICAL)
+
+    result = bench(args.updaters, args.deleters, None if args.lock == 'optimistic' else args.lock,
+                   args.processes, args.latency, args.jitter, args.error_rate, args.seed)
+    print(json.dumps(result))
+    if not result['converged']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
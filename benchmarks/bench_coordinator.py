@@ -0,0 +1,125 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Load test comparing catalog_update's direct read-modify-write loop with the
+# write-combining catalog coordinator, against a local fake API server.
+#
+# Usage: python -m benchmarks.bench_coordinator [--writers N]
+#
+# Each writer records a different product version in the same ConfigMap, as
+# the install Jobs of a full system install do. Throughput is reported in
+# updates per second for each mode, along with the requests and conflicts
+# seen by the fake API server.
+
+import argparse
+import json
+import logging
+import threading
+import time
+from unittest.mock import patch
+
+from kubernetes import client
+
+from benchmarks.fake_k8s import FakeKubernetesServer
+from cray_product_catalog.catalog_coordinator import CatalogCoordinator, make_server, submit_request
+from cray_product_catalog.util.catalog_data import update_request
+from cray_product_catalog.util.catalog_write import update_config_map
+
+NAME = 'cray-product-catalog'
+NAMESPACE = 'services'
+VERSION_DATA = {'component_versions': {'docker': [{'name': 'cray/example', 'version': '1.0.0'}]}}
+
+
+def _run_writers(count, write):
+    """Run `write(index)` in `count` concurrent threads and return the elapsed time."""
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(count)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start
+
+
+def _result(mode, server, writers, elapsed):
+    data = server.store.get(NAMESPACE, NAME)['data'] or {}
+    return {
+        'mode': mode,
+        'writers': writers,
+        'products_recorded': len(data),
+        'elapsed_seconds': round(elapsed, 3),
+        'updates_per_second': round(writers / elapsed, 2),
+        'api_requests': server.store.stats,
+    }
+
+
+def bench_direct(writers):
+    """Measure concurrent catalog_write.update_config_map calls."""
+    with FakeKubernetesServer() as server:
+        server.store.create(NAMESPACE, {'metadata': {'name': NAME}})
+        # update_config_map builds its own ApiClient from the default configuration.
+        with patch.object(client.Configuration, '_default', server.configuration()):
+            elapsed = _run_writers(writers, lambda i: update_config_map(
+                VERSION_DATA, NAME, NAMESPACE, product=f'product-{i}', product_version='1.0.0',
+                set_active=False, remove_active=False
+            ))
+        return _result('direct', server, writers, elapsed)
+
+
+def bench_coordinator(writers):
+    """Measure concurrent clients submitting to a catalog coordinator over HTTP."""
+    with FakeKubernetesServer() as server:
+        server.store.create(NAMESPACE, {'metadata': {'name': NAME}})
+        coordinator = CatalogCoordinator(client.CoreV1Api(client.ApiClient(server.configuration())))
+        httpd = make_server(coordinator, '127.0.0.1', 0)
+        url = 'http://{}:{}'.format(*httpd.server_address[:2])
+        threading.Thread(target=coordinator.run, daemon=True).start()
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        try:
+            elapsed = _run_writers(writers, lambda i: submit_request(
+                url, NAME, NAMESPACE, update_request(f'product-{i}', '1.0.0', VERSION_DATA)
+            ))
+        finally:
+            coordinator.stop()
+            httpd.shutdown()
+            httpd.server_close()
+        return _result('coordinator', server, writers, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare direct catalog writes with the catalog coordinator.')
+    parser.add_argument('--writers', type=int, default=20, help='Number of concurrent writers.')
+    parser.add_argument('--skip-direct', action='store_true',
+                        help='Only measure the coordinator; the direct path sleeps 1-3s per attempt.')
+    args = parser.parse_args()
+    # Expected conflicts are logged as warnings by the direct path.
+    logging.getLogger('cray_product_catalog').setLevel(logging.ERROR)
+
+    results = [bench_coordinator(args.writers)]
+    if not args.skip_direct:
+        results.append(bench_direct(args.writers))
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Benchmark comparing the memory held by a catalog loaded with and without
+# intern_data, for a catalog with many versions of each product.
+#
+# Usage: python -m benchmarks.bench_intern [--size-bytes N] [--products N] [--churn F]
+#
+# Each version of a product keeps the components of the previous version
+# except for a fraction `churn` of them. For each setting, the time to load
+# the catalog, the peak memory allocated while loading, and the memory still
+# held by the loaded catalog are reported.
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.catalog_data import generate_catalog
+from cray_product_catalog.query import ProductCatalog
+
+
+def bench(data, intern_data):
+    """Time one load of the catalog, then measure the memory of another."""
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    ProductCatalog.from_mapping(data, intern_data=intern_data)
+    wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+
+    tracemalloc.start()
+    catalog = ProductCatalog.from_mapping(data, intern_data=intern_data)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'intern_data': intern_data,
+        'product_versions': len(catalog.products),
+        'wall_ms_per_load': round(wall * 1000, 2),
+        'cpu_ms_per_load': round(cpu * 1000, 2),
+        'peak_memory_kib': round(peak / 1024),
+        'retained_memory_kib': round(retained / 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory held by catalogs loaded with and without '
+                                                 'intern_data.')
+    parser.add_argument('--size-bytes', type=int, default=1024 * 1024, help='Approximate size of the catalog.')
+    parser.add_argument('--products', type=int, default=5, help='Number of products.')
+    parser.add_argument('--churn', type=float, default=0.1,
+                        help='Fraction of components which change between consecutive versions.')
+    args = parser.parse_args()
+
+    data = generate_catalog(args.size_bytes, products=args.products, churn=args.churn)
+    for intern_data in (False, True):
+        result = bench(data, intern_data)
+        result['catalog_bytes'] = sum(len(value) for value in data.values())
+        result['churn'] = args.churn
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
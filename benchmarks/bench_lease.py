@@ -0,0 +1,104 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Benchmark comparing catalog_update's optimistic retry loop with the opt-in
+# Lease-based write lock (CATALOG_LOCK=lease), against a local fake API server.
+#
+# Usage: python -m benchmarks.bench_lease [--writers N]
+#
+# Each writer records a different product version in the same ConfigMap.
+# Throughput and the per-writer latency distribution are reported for each
+# mode, along with the requests and conflicts seen by the fake API server.
+
+import argparse
+import json
+import logging
+import threading
+import time
+from unittest.mock import patch
+
+from kubernetes import client
+
+from benchmarks.fake_k8s import FakeKubernetesServer
+from cray_product_catalog.util.catalog_write import update_config_map
+from cray_product_catalog.util.lease import LEASE_LOCK
+
+NAME = 'cray-product-catalog'
+NAMESPACE = 'services'
+VERSION_DATA = {'component_versions': {'docker': [{'name': 'cray/example', 'version': '1.0.0'}]}}
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction (0-1) of the sorted values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(writers, lock_mode):
+    """Run concurrent update_config_map calls with the given lock mode."""
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def write(index):
+        start = time.monotonic()
+        update_config_map(VERSION_DATA, NAME, NAMESPACE, product=f'product-{index}', product_version='1.0.0',
+                          set_active=False, remove_active=False, lock_mode=lock_mode)
+        with latencies_lock:
+            latencies.append(time.monotonic() - start)
+
+    with FakeKubernetesServer() as server:
+        server.store.create(NAMESPACE, {'metadata': {'name': NAME}})
+        with patch.object(client.Configuration, '_default', server.configuration()):
+            threads = [threading.Thread(target=write, args=(index,)) for index in range(writers)]
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - start
+
+        return {
+            'mode': lock_mode or 'optimistic',
+            'writers': writers,
+            'products_recorded': len(server.store.get(NAMESPACE, NAME)['data'] or {}),
+            'elapsed_seconds': round(elapsed, 3),
+            'updates_per_second': round(writers / elapsed, 2),
+            'latency_p50_seconds': round(percentile(latencies, 0.5), 3),
+            'latency_p95_seconds': round(percentile(latencies, 0.95), 3),
+            'latency_max_seconds': round(max(latencies), 3),
+            'api_requests': server.store.stats,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare optimistic catalog writes with the Lease-based lock.')
+    parser.add_argument('--writers', type=int, default=20, help='Number of concurrent writers.')
+    args = parser.parse_args()
+    # Expected conflicts are logged as warnings by the optimistic path.
+    logging.getLogger('cray_product_catalog').setLevel(logging.ERROR)
+
+    for lock_mode in (LEASE_LOCK, None):
+        print(json.dumps(bench(args.writers, lock_mode)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Benchmark comparing loading all of a large catalog with loading only some
+# fields of it, as callers that need one field per version do.
+#
+# Usage: python -m benchmarks.bench_projection [--size-bytes N] [--loads N]
+#
+# For each set of fields, the wall time and CPU time per load, the peak
+# memory allocated while loading, and the memory still held by the loaded
+# catalog are reported.
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.catalog_data import generate_catalog
+from cray_product_catalog.query import ProductCatalog
+
+FIELDS = (
+    None,
+    ['component_versions.docker'],
+    ['configuration.commit'],
+)
+
+
+def bench(data, fields, loads):
+    """Time `loads` loads of the catalog, then measure the memory of one more."""
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    for _ in range(loads):
+        ProductCatalog.from_mapping(data, fields=fields)
+    wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+
+    tracemalloc.start()
+    catalog = ProductCatalog.from_mapping(data, fields=fields)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'fields': fields,
+        'loads': loads,
+        'product_versions': len(catalog.products),
+        'wall_ms_per_load': round(wall * 1000 / loads, 2),
+        'cpu_ms_per_load': round(cpu * 1000 / loads, 2),
+        'peak_memory_kib': round(peak / 1024),
+        'retained_memory_kib': round(retained / 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare loading all fields of a catalog with loading a few.')
+    parser.add_argument('--size-bytes', type=int, default=1024 * 1024, help='Approximate size of the catalog.')
+    parser.add_argument('--loads', type=int, default=3, help='Number of loads to time for each set of fields.')
+    args = parser.parse_args()
+
+    data = generate_catalog(args.size_bytes)
+    for fields in FIELDS:
+        result = bench(data, fields, args.loads)
+        result['catalog_bytes'] = sum(len(value) for value in data.values())
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
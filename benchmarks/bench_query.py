@@ -0,0 +1,85 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Benchmark of ProductCatalog loading and queries, without Kubernetes.
+#
+# Usage: python -m benchmarks.bench_query [--size-bytes N] [--loads N] [--queries N]
+#
+# The catalog is built with ProductCatalog.from_mapping, so the parse,
+# validate, and index pipeline and the query paths are measured in isolation,
+# with no API server and without importing the kubernetes client. The time
+# per operation is reported for each.
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from benchmarks.catalog_data import generate_catalog
+from cray_product_catalog.query import ProductCatalog
+
+
+def bench(operation, iterations, func):
+    """Time `iterations` calls to `func` and return a result."""
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    for index in range(iterations):
+        func(index)
+    wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+    return {
+        'operation': operation,
+        'iterations': iterations,
+        'wall_us_per_op': round(wall * 1e6 / iterations, 2),
+        'cpu_us_per_op': round(cpu * 1e6 / iterations, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure ProductCatalog loading and queries without Kubernetes.')
+    parser.add_argument('--size-bytes', type=int, default=64 * 1024, help='Approximate size of the catalog.')
+    parser.add_argument('--loads', type=int, default=3, help='Number of times to load the catalog.')
+    parser.add_argument('--queries', type=int, default=10000, help='Number of each query to time.')
+    args = parser.parse_args()
+
+    data = generate_catalog(args.size_bytes)
+    catalog = ProductCatalog.from_mapping(data)
+    rng = random.Random(0)
+    names = sorted({product.name for product in catalog.products})
+    keys = [(product.name, product.version) for product in catalog.products]
+    name_queries = [rng.choice(names) for _ in range(args.queries)]
+    version_queries = [rng.choice(keys) for _ in range(args.queries)]
+
+    results = [
+        bench('load', args.loads, lambda _: ProductCatalog.from_mapping(data)),
+        bench('get_product_latest', args.queries, lambda index: catalog.get_product(name_queries[index])),
+        bench('get_product_version', args.queries, lambda index: catalog.get_product(*version_queries[index])),
+        bench('products', args.queries, lambda _: catalog.products),
+    ]
+    for result in results:
+        result['catalog_bytes'] = sum(len(value) for value in data.values())
+        result['product_versions'] = len(keys)
+        result['kubernetes_imported'] = 'kubernetes' in sys.modules
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
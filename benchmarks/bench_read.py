@@ -0,0 +1,100 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Benchmark comparing reading the catalog ConfigMap through the kubernetes
+# client's V1ConfigMap model with the raw JSON read used by the catalog.
+#
+# Usage: python -m benchmarks.bench_read [--size-bytes N] [--iterations N]
+#
+# For each path, the wall time and CPU time of the reading thread, and the
+# peak memory allocated while reading, are reported per read.
+
+import argparse
+import json
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from kubernetes import client
+
+from benchmarks.catalog_data import generate_catalog
+from benchmarks.fake_k8s import FakeKubernetesServer
+from cray_product_catalog.util.k8s import read_config_map
+
+NAME = 'cray-product-catalog'
+NAMESPACE = 'services'
+
+
+def read_model(api_instance):
+    """Read the ConfigMap as a V1ConfigMap, keeping the fields the catalog uses."""
+    config_map = api_instance.read_namespaced_config_map(NAME, NAMESPACE)
+    return config_map.data, config_map.metadata.resource_version
+
+
+def read_raw(api_instance):
+    """Read the ConfigMap with read_config_map."""
+    return read_config_map(api_instance, NAME, NAMESPACE)
+
+
+def bench(api_instance, read, iterations):
+    """Time `iterations` calls to `read`, then measure the peak memory of one more."""
+    read(api_instance)  # Warm up the connection
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    for _ in range(iterations):
+        read(api_instance)
+    wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+
+    tracemalloc.start()
+    result = read(api_instance)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+
+    return {
+        'path': read.__name__,
+        'iterations': iterations,
+        'wall_ms_per_read': round(wall * 1000 / iterations, 2),
+        'cpu_ms_per_read': round(cpu * 1000 / iterations, 2),
+        'peak_memory_kib': round(peak / 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare V1ConfigMap and raw JSON ConfigMap reads.')
+    parser.add_argument('--size-bytes', type=int, default=1024 * 1024, help='Approximate size of the catalog.')
+    parser.add_argument('--iterations', type=int, default=20, help='Number of reads to time for each path.')
+    args = parser.parse_args()
+
+    data = generate_catalog(args.size_bytes)
+    with FakeKubernetesServer() as server:
+        server.store.create(NAMESPACE, {'metadata': {'name': NAME}, 'data': data})
+        with patch.object(client.Configuration, '_default', server.configuration()):
+            api_instance = client.CoreV1Api()
+            for read in (read_model, read_raw):
+                result = bench(api_instance, read, args.iterations)
+                result['catalog_bytes'] = sum(len(value) for value in data.values())
+                print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
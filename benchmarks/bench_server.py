@@ -0,0 +1,159 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Load test comparing clients which each read the catalog ConfigMap with
+# clients of the catalog query service, against a local fake API server.
+#
+# Usage: python -m benchmarks.bench_server [--clients N] [--queries N] [--direct-queries N] [--size-bytes N]
+#
+# Each client looks up the latest version of a product `--queries` times:
+#   direct       constructs a ProductCatalog for each query, `--direct-queries`
+#                times since each parses and validates the whole catalog
+#   server       queries the catalog query service over HTTP
+#   server_etag  also sends If-None-Match with the ETag of its last response
+# Throughput, latency, and the requests seen by the fake API server are reported.
+
+import argparse
+import http.client
+import json
+import logging
+import statistics
+import threading
+import time
+from unittest.mock import patch
+
+from kubernetes import client
+
+from benchmarks.catalog_data import generate_catalog
+from benchmarks.fake_k8s import FakeKubernetesServer
+from cray_product_catalog.catalog_server import CatalogQueryService, make_server
+from cray_product_catalog.query import ProductCatalog
+
+NAME = 'cray-product-catalog'
+NAMESPACE = 'services'
+
+
+def _run_clients(count, queries, query):
+    """Run `query(index)` `queries` times in each of `count` threads.
+
+    Returns:
+        tuple: the elapsed time, the latency of each query, and the response bytes read.
+    """
+    latencies = []
+    received = []
+
+    def run(index):
+        state = {}
+        for _ in range(queries):
+            start = time.perf_counter()
+            received.append(query(index, state))
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, latencies, sum(received)
+
+
+def _result(mode, server, clients, elapsed, latencies, received):
+    latencies = sorted(latencies)
+    return {
+        'mode': mode,
+        'clients': clients,
+        'queries': len(latencies),
+        'elapsed_seconds': round(elapsed, 3),
+        'queries_per_second': round(len(latencies) / elapsed, 2),
+        'median_latency_ms': round(statistics.median(latencies) * 1000, 2),
+        'p99_latency_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        'response_bytes': received,
+        'api_requests': dict(server.store.stats),
+    }
+
+
+def bench_direct(server, clients, queries, products):
+    """Measure clients which construct a ProductCatalog for each query."""
+    def query(index, state):
+        catalog = ProductCatalog(NAME, NAMESPACE)
+        catalog.get_product(products[index % len(products)])
+        # The whole ConfigMap is read, approximately this many bytes.
+        return sum(len(value) for value in server.store.get(NAMESPACE, NAME)['data'].values())
+
+    with patch.object(client.Configuration, '_default', server.configuration()):
+        return _run_clients(clients, queries, query)
+
+
+def bench_server(server, clients, queries, products, etag):
+    """Measure clients querying the catalog query service over keep-alive connections."""
+    with patch.object(client.Configuration, '_default', server.configuration()):
+        service = CatalogQueryService(ProductCatalog(NAME, NAMESPACE))
+    httpd = make_server(service, '127.0.0.1', 0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address[:2]
+
+    def query(index, state):
+        connection = state.setdefault('connection', http.client.HTTPConnection(host, port))
+        headers = {'If-None-Match': state['etag']} if etag and 'etag' in state else {}
+        connection.request('GET', f'/v1/products/{products[index % len(products)]}/latest', headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        if response.status == 200:
+            state['etag'] = response.headers['ETag']
+        elif response.status != 304:
+            raise RuntimeError(f'Query failed with status {response.status}')
+        return len(body)
+
+    try:
+        return _run_clients(clients, queries, query)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare direct catalog reads with the catalog query service.')
+    parser.add_argument('--clients', type=int, default=20, help='Number of concurrent clients.')
+    parser.add_argument('--queries', type=int, default=20, help='Number of queries made by each client.')
+    parser.add_argument('--direct-queries', type=int, default=1,
+                        help='Number of queries made by each client in the direct mode.')
+    parser.add_argument('--size-bytes', type=int, default=64 * 1024, help='Approximate size of the catalog.')
+    args = parser.parse_args()
+    logging.getLogger('cray_product_catalog').setLevel(logging.ERROR)
+
+    data = generate_catalog(args.size_bytes)
+    products = sorted(data)
+    for mode in ('direct', 'server', 'server_etag'):
+        # ProductCatalog uses the patched default configuration rather than loading one.
+        with FakeKubernetesServer() as server, patch('cray_product_catalog.util.k8s.load_k8s'):
+            server.store.create(NAMESPACE, {'metadata': {'name': NAME}, 'data': data})
+            if mode == 'direct':
+                results = bench_direct(server, args.clients, args.direct_queries, products)
+            else:
+                results = bench_server(server, args.clients, args.queries, products, etag=mode == 'server_etag')
+            print(json.dumps(_result(mode, server, args.clients, *results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Generates synthetic product catalog data for benchmarks, either of a given
+# size or of a given number of products, versions, and components.
+
+import random
+
+from yaml import safe_dump
+
+
+def generate_version(rng, product, version, components=None):
+    """Return catalog data for one product version, shaped like a real install.
+
+    Args:
+        rng (random.Random): The random number generator.
+        product (str): The product name.
+        version (str): The version.
+        components (int, optional): The number of Docker images, with a
+            quarter as many Helm charts. By default, 5 to 20 images and 2 to 8
+            charts are chosen at random.
+
+    Returns:
+        dict: the data of the version.
+    """
+    images = rng.randint(5, 20) if components is None else components
+    charts = rng.randint(2, 8) if components is None else max(1, components // 4)
+    return {
+        'component_versions': {
+            'docker': [
+                {'name': f'cray/{product}-service-{index}', 'version': f'{rng.randint(0, 9)}.{rng.randint(0, 30)}.0'}
+                for index in range(images)
+            ],
+            'helm': [
+                {'name': f'{product}-chart-{index}', 'version': f'{rng.randint(0, 9)}.{rng.randint(0, 30)}.0'}
+                for index in range(charts)
+            ],
+            'repositories': [
+                {'name': f'{product}-{version}-sle-15sp{sp}', 'type': 'hosted'} for sp in range(2, 5)
+            ],
+        },
+        'configuration': {
+            'clone_url': f'https://vcs.cmn.example.com/vcs/cray/{product}-config-management.git',
+            'commit': f'{rng.getrandbits(160):040x}',
+            'import_branch': f'cray/{product}/{version}',
+            'import_date': '2023-06-01T12:00:00.000000Z',
+            'ssh_url': f'git@vcs.cmn.example.com:cray/{product}-config-management.git',
+        },
+    }
+
+
+def evolve_version(rng, product, version, previous, churn):
+    """Return catalog data for the version after `previous`, changing a fraction of its components.
+
+    Args:
+        rng (random.Random): The random number generator.
+        product (str): The product name.
+        version (str): The new version.
+        previous (dict): The data of the previous version, which is not modified.
+        churn (float): The fraction of components given a new version.
+
+    Returns:
+        dict: the data of the new version.
+    """
+    data = generate_version(rng, product, version, components=len(previous['component_versions']['docker']))
+    for component_type in ('docker', 'helm'):
+        data['component_versions'][component_type] = [
+            {'name': component['name'], 'version': f'{rng.randint(0, 9)}.{rng.randint(0, 30)}.0'}
+            if rng.random() < churn else dict(component)
+            for component in previous['component_versions'][component_type]
+        ]
+    data['configuration']['clone_url'] = previous['configuration']['clone_url']
+    return data
+
+
+def generate_catalog(size_bytes, products=20, seed=0, churn=None):
+    """Generate config map data for a product catalog of roughly the given size.
+
+    Versions are added to each product in turn until the encoded data reaches
+    `size_bytes`. The same arguments always produce the same data.
+
+    Args:
+        size_bytes (int): The approximate total size of the YAML values.
+        products (int): The number of products.
+        seed (int): The seed for the random number generator.
+        churn (float, optional): If given, each version of a product keeps
+            the components of the previous version, except for this fraction
+            of them, as consecutive releases do. By default, the components
+            of each version are independent.
+
+    Returns:
+        dict: A mapping from product name to a YAML string of its versions.
+    """
+    rng = random.Random(seed)
+    versions = {f'product-{index}': {} for index in range(products)}
+    sizes = dict.fromkeys(versions, 0)
+    minor = 0
+    while sum(sizes.values()) < size_bytes:
+        for product, product_versions in versions.items():
+            version = f'{minor // 10}.{minor % 10}.0'
+            if churn is None or not product_versions:
+                product_versions[version] = generate_version(rng, product, version)
+            else:
+                previous = product_versions[next(reversed(product_versions))]
+                product_versions[version] = evolve_version(rng, product, version, previous, churn)
+            # Estimate rather than re-encode the whole product on each iteration
+            sizes[product] += len(safe_dump({version: product_versions[version]}))
+        minor += 1
+    return {product: safe_dump(product_versions) for product, product_versions in versions.items()}
+
+
+def generate_products(products, versions, components, seed=0, churn=0.1):
+    """Generate decoded data for a product catalog of the given shape.
+
+    Each product has `versions` versions, numbered 1.0.0, 1.1.0, and so on,
+    of which only the newest is active. Each version has `components` Docker
+    images and a quarter as many Helm charts. The same arguments always
+    produce the same data.
+
+    Args:
+        products (int): The number of products.
+        versions (int): The number of versions of each product.
+        components (int): The number of Docker images of each version.
+        seed (int): The seed for the random number generator.
+        churn (float, optional): The fraction of components which change
+            between consecutive versions, or None for independent versions.
+
+    Returns:
+        dict: A mapping from product name to a mapping from version to data.
+    """
+    rng = random.Random(seed)
+    catalog = {}
+    for product_index in range(products):
+        product = f'product-{product_index}'
+        product_versions = catalog[product] = {}
+        previous = None
+        for minor in range(versions):
+            version = f'{1 + minor // 10}.{minor % 10}.0'
+            if churn is None or previous is None:
+                data = generate_version(rng, product, version, components)
+            else:
+                data = evolve_version(rng, product, version, previous, churn)
+            data['active'] = minor == versions - 1
+            product_versions[version] = previous = data
+    return catalog
+
+
+def generate_product_catalog(products, versions, components, seed=0, churn=0.1):
+    """Generate config map data for a product catalog of the given shape.
+
+    See generate_products for the arguments.
+
+    Returns:
+        dict: A mapping from product name to a YAML string of its versions.
+    """
+    return {
+        product: safe_dump(product_versions, default_flow_style=False)
+        for product, product_versions in generate_products(products, versions, components, seed, churn).items()
+    }
@@ -0,0 +1,465 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# A minimal in-memory stand-in for the Kubernetes API server, for load tests.
+#
+# Only the ConfigMap and Lease endpoints used by cray_product_catalog are
+# implemented: GET, POST, PATCH, PUT and DELETE of single objects, and list and
+# watch of ConfigMaps, optionally by metadata.name field selector.
+# resourceVersion is tracked per object, and a PATCH or PUT carrying a stale
+# metadata.resourceVersion is rejected with 409 Conflict as the real API
+# server does. Watches are served from a bounded history of changes, and a
+# watch from a resourceVersion older than the history ends with a 410 Expired
+# ERROR event.
+#
+# Latency, and 500 and 503 responses at a given rate, can be injected into
+# every request, and the server counts requests and the bytes of request and
+# response bodies.
+
+from collections import deque
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from kubernetes import client
+
+RESOURCE_PATH = re.compile(
+    r'^/(?:api/v1|apis/coordination\.k8s\.io/v1)/namespaces/(?P<namespace>[^/]+)/'
+    r'(?P<resource>configmaps|leases)(?:/(?P<name>[^/?]+))?'
+)
+KINDS = {'configmaps': ('v1', 'ConfigMap'), 'leases': ('coordination.k8s.io/v1', 'Lease')}
+
+
+class FakeObjectStore:
+    """Thread-safe storage for ConfigMaps and Leases with resourceVersion semantics.
+
+    Objects are keyed by (resource, namespace, name), where resource is
+    'configmaps' or 'leases'.
+
+    Attributes:
+        stats (dict): Counts of requests by method, of watches and the
+            events sent on them, of conflicts, of injected errors, and of
+            the bytes of request and response bodies.
+    """
+    def __init__(self, history=1000):
+        """Create an empty store.
+
+        Args:
+            history (int): The number of changes kept for watches.
+        """
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._objects = {}
+        self._resource_version = 0
+        # (resourceVersion, event type, resource, namespace, object) of recent changes
+        self._history = deque(maxlen=history)
+        self._closed = False
+        self.stats = {'GET': 0, 'POST': 0, 'PATCH': 0, 'PUT': 0, 'DELETE': 0, 'WATCH': 0, 'watch_events': 0,
+                      'conflicts': 0, 'injected_errors': 0, 'bytes_received': 0, 'bytes_sent': 0}
+
+    def _next_resource_version(self):
+        self._resource_version += 1
+        return str(self._resource_version)
+
+    def _record(self, event_type, resource, namespace, obj):
+        """Add a change to the history and wake watchers. Called with the lock held."""
+        self._history.append((int(obj['metadata']['resourceVersion']), event_type, resource, namespace,
+                              json.loads(json.dumps(obj))))
+        self._changed.notify_all()
+
+    def count(self, key, amount=1):
+        """Add to the named counter in stats."""
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    @property
+    def resource_version(self):
+        """str: the resourceVersion of the latest change."""
+        with self._lock:
+            return str(self._resource_version)
+
+    def list(self, namespace, name=None, resource='configmaps'):
+        """Return copies of the objects in a namespace, optionally only the one with a name, and the resourceVersion.
+
+        Returns:
+            tuple: (list of objects, resourceVersion of the list).
+        """
+        with self._lock:
+            items = [
+                obj for (obj_resource, obj_namespace, obj_name), obj in sorted(self._objects.items())
+                if obj_resource == resource and obj_namespace == namespace and name in (None, obj_name)
+            ]
+            return json.loads(json.dumps(items)), str(self._resource_version)
+
+    def wait_for_changes(self, namespace, name, resource_version, timeout, resource='configmaps'):
+        """Wait for changes to objects in a namespace after a resourceVersion.
+
+        Args:
+            namespace (str): The namespace.
+            name (str): The name of the object, or None for all objects.
+            resource_version (int): Return changes after this resourceVersion.
+            timeout (float): Seconds to wait for a change.
+
+        Returns:
+            tuple: (list of (resourceVersion, event type, object) of the
+                changes, in order, or None if resource_version is older than
+                the history; bool, whether the store has been closed).
+        """
+        end = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                expired = (len(self._history) == self._history.maxlen
+                           and resource_version < self._history[0][0] - 1)
+                if expired:
+                    return None, self._closed
+                changes = [
+                    (change_rv, event_type, obj) for change_rv, event_type, change_resource, change_namespace, obj
+                    in self._history
+                    if change_rv > resource_version and change_resource == resource and
+                    change_namespace == namespace and name in (None, obj['metadata']['name'])
+                ]
+                remaining = end - time.monotonic()
+                if changes or self._closed or remaining <= 0:
+                    return changes, self._closed
+                self._changed.wait(remaining)
+
+    def close(self):
+        """End all watches."""
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+
+    def get(self, namespace, name, resource='configmaps'):
+        """Return a copy of an object, or None if it does not exist."""
+        with self._lock:
+            obj = self._objects.get((resource, namespace, name))
+            return json.loads(json.dumps(obj)) if obj else None
+
+    def create(self, namespace, body, resource='configmaps'):
+        """Create an object. Return (status, object)."""
+        name = body.get('metadata', {}).get('name')
+        api_version, kind = KINDS[resource]
+        with self._lock:
+            if (resource, namespace, name) in self._objects:
+                return 409, None
+            obj = {key: value for key, value in body.items() if key != 'metadata'}
+            obj.update({
+                'apiVersion': api_version,
+                'kind': kind,
+                'metadata': {'name': name, 'namespace': namespace,
+                             'resourceVersion': self._next_resource_version()},
+            })
+            if resource == 'configmaps':
+                obj['data'] = body.get('data') or None
+            self._objects[(resource, namespace, name)] = obj
+            self._record('ADDED', resource, namespace, obj)
+            return 201, json.loads(json.dumps(obj))
+
+    def patch(self, namespace, name, body, replace=False, resource='configmaps'):
+        """Merge-patch (or replace) an object. Return (status, object)."""
+        with self._lock:
+            obj = self._objects.get((resource, namespace, name))
+            if obj is None:
+                return 404, None
+            expected = (body.get('metadata') or {}).get('resourceVersion')
+            if expected and expected != obj['metadata']['resourceVersion']:
+                self.stats['conflicts'] += 1
+                return 409, None
+            for field, value in body.items():
+                if field in ('metadata', 'apiVersion', 'kind'):
+                    continue
+                if replace or not isinstance(value, dict):
+                    obj[field] = value
+                    continue
+                merged = dict(obj.get(field) or {})
+                for key, item in value.items():
+                    if item is None:
+                        merged.pop(key, None)
+                    else:
+                        merged[key] = item
+                obj[field] = merged or None
+            obj['metadata']['resourceVersion'] = self._next_resource_version()
+            self._record('MODIFIED', resource, namespace, obj)
+            return 200, json.loads(json.dumps(obj))
+
+    def delete(self, namespace, name, resource='configmaps'):
+        """Delete an object. Return the status."""
+        with self._lock:
+            obj = self._objects.pop((resource, namespace, name), None)
+            if obj is None:
+                return 404
+            obj['metadata']['resourceVersion'] = self._next_resource_version()
+            self._record('DELETED', resource, namespace, obj)
+            return 200
+
+
+class FaultInjector:
+    """Injects latency and server errors into requests.
+
+    Attributes:
+        latency (float): Seconds to wait before handling each request.
+        jitter (float): Up to this many more seconds, chosen at random, to
+            wait before handling each request.
+        error_rate (float): The fraction of requests, other than watches,
+            answered with 500 Internal Server Error or 503 Service Unavailable.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Wait for the injected latency."""
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def error(self):
+        """Return the status of an injected error, or None if the request should be handled."""
+        with self._lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            return self._rng.choice((500, 503))
+
+
+class FakeKubernetesRequestHandler(BaseHTTPRequestHandler):
+    """Handle ConfigMap and Lease requests against the server's FakeObjectStore."""
+    protocol_version = 'HTTP/1.1'
+    # Send each response in as few segments as possible, as a real server
+    # would, to avoid delayed-ACK stalls on keep-alive connections.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Do not log each request."""
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def _send(self, status, obj=None):
+        if obj is None:
+            reasons = {404: 'NotFound', 409: 'Conflict', 500: 'InternalError', 503: 'ServiceUnavailable'}
+            obj = {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure',
+                   'reason': reasons.get(status, 'Unknown'), 'code': status}
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.store.count('bytes_sent', len(body))
+
+    def _send_chunk(self, obj):
+        """Send one line of JSON as a chunk of a chunked response."""
+        body = json.dumps(obj).encode() + b'\n'
+        self.wfile.write(f'{len(body):x}\r\n'.encode() + body + b'\r\n')
+        self.wfile.flush()
+        self.store.count('bytes_sent', len(body))
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        self.store.count('bytes_received', length)
+        return json.loads(body or b'{}')
+
+    def _route(self):
+        """Parse the path, inject faults, and count the request.
+
+        Returns:
+            tuple: (namespace, name, resource, query), or None if a response
+                has already been sent.
+        """
+        # Read the body first so the connection can be reused after an injected error.
+        self._body = self._read_body() if self.command in ('POST', 'PATCH', 'PUT') else None
+        url = urlsplit(self.path)
+        match = RESOURCE_PATH.match(url.path)
+        if not match:
+            self._send(404)
+            return None
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        watching = query.get('watch', '').lower() in ('true', '1')
+        self.server.faults.delay()
+        if not watching:
+            status = self.server.faults.error()
+            if status:
+                self.store.count('injected_errors')
+                self._send(status)
+                return None
+        self.store.count('WATCH' if watching else self.command)
+        return match.group('namespace'), match.group('name'), match.group('resource'), query
+
+    def _selected_name(self, query):
+        """Return the name in a metadata.name field selector, or None."""
+        for selector in query.get('fieldSelector', '').split(','):
+            field, _, value = selector.partition('=')
+            if field == 'metadata.name':
+                return value
+        return None
+
+    def _watch(self, namespace, name, resource, query):
+        """Stream changes as watch events until the timeout or the server stops."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        resource_version = query.get('resourceVersion')
+        if resource_version in (None, '', '0'):
+            # Without a resourceVersion, a watch starts with the current objects.
+            items, resource_version = self.store.list(namespace, name, resource)
+            for item in items:
+                self._send_chunk({'type': 'ADDED', 'object': item})
+                self.store.count('watch_events')
+        resource_version = int(resource_version)
+        end = time.monotonic() + float(query.get('timeoutSeconds') or 1800)
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            changes, closed = self.store.wait_for_changes(namespace, name, resource_version, remaining, resource)
+            if changes is None:
+                self._send_chunk({'type': 'ERROR', 'object': {
+                    'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'reason': 'Expired', 'code': 410,
+                    'message': f'too old resource version: {resource_version}',
+                }})
+                break
+            for resource_version, event_type, obj in changes:
+                self._send_chunk({'type': event_type, 'object': obj})
+                self.store.count('watch_events')
+            if closed:
+                break
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        route = self._route()
+        if not route:
+            return
+        namespace, name, resource, query = route
+        if name:
+            obj = self.store.get(namespace, name, resource)
+            self._send(200 if obj else 404, obj)
+        elif query.get('watch', '').lower() in ('true', '1'):
+            try:
+                self._watch(namespace, self._selected_name(query), resource, query)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped watching.
+                self.close_connection = True
+        else:
+            items, resource_version = self.store.list(namespace, self._selected_name(query), resource)
+            api_version, kind = KINDS[resource]
+            self._send(200, {'apiVersion': api_version, 'kind': f'{kind}List',
+                             'metadata': {'resourceVersion': resource_version}, 'items': items})
+
+    def do_POST(self):
+        route = self._route()
+        if route:
+            namespace, _, resource, _ = route
+            self._send(*self.store.create(namespace, self._body, resource))
+
+    def do_PATCH(self):
+        route = self._route()
+        if route:
+            namespace, name, resource, _ = route
+            self._send(*self.store.patch(namespace, name, self._body, resource=resource))
+
+    def do_PUT(self):
+        route = self._route()
+        if route:
+            namespace, name, resource, _ = route
+            self._send(*self.store.patch(namespace, name, self._body, replace=True, resource=resource))
+
+    def do_DELETE(self):
+        route = self._route()
+        if route:
+            namespace, name, resource, _ = route
+            status = self.store.delete(namespace, name, resource)
+            self._send(status, {'kind': 'Status', 'status': 'Success'} if status == 200 else None)
+
+
+class FakeKubernetesServer:
+    """An in-memory Kubernetes API stand-in served from a background thread.
+
+    Example:
+        with FakeKubernetesServer(latency=0.01, error_rate=0.05) as server:
+            server.store.create('services', {'metadata': {'name': 'cray-product-catalog'}})
+            api = client.CoreV1Api(client.ApiClient(server.configuration()))
+
+    Attributes:
+        store (FakeObjectStore): The objects served.
+        faults (FaultInjector): The latency and errors injected into requests,
+            which may be changed while the server is running.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, history=1000):
+        self.store = FakeObjectStore(history)
+        self.faults = FaultInjector(latency, jitter, error_rate, seed)
+        self._httpd = ThreadingHTTPServer((host, port), FakeKubernetesRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.store = self.store
+        self._httpd.faults = self.faults
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def configuration(self):
+        """Return a kubernetes client Configuration pointing at this server."""
+        configuration = client.Configuration()
+        configuration.host = self.url
+        return configuration
+
+    def write_kubeconfig(self, path, namespace='default'):
+        """Write a kubeconfig file for this server, for clients in other processes."""
+        kubeconfig = {
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'clusters': [{'name': 'fake', 'cluster': {'server': self.url}}],
+            'users': [{'name': 'fake', 'user': {'token': 'fake'}}],
+            'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake', 'namespace': namespace}}],
+            'current-context': 'fake',
+        }
+        with open(path, 'w') as kubeconfig_file:
+            json.dump(kubeconfig, kubeconfig_file)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.store.close()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
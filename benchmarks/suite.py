@@ -0,0 +1,304 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Benchmark suite for the hot paths of cray_product_catalog, with results that
+# can be compared between commits.
+#
+# Usage:
+#   python -m benchmarks.suite [--scenario NAME ...] [--benchmark NAME ...] [--output FILE]
+#   python -m benchmarks.suite --compare BASELINE [--results FILE] [--threshold F] [--threshold-for NAME=F ...]
+#
+# Each benchmark is run on catalogs made by benchmarks.catalog_data with a
+# fixed seed, in scenarios of increasing numbers of products, versions per
+# product, and components per version. The CPU time per operation is the
+# minimum over `--repeat` rounds, which is the least noisy measure on shared
+# machines. Results are written as a JSON document.
+#
+# With --compare, the results, either of this run or read from --results, are
+# compared with a baseline written by an earlier run. The exit status is 1 if
+# the CPU time of any benchmark in any scenario grew by more than its
+# threshold, a fraction which is 0.25 unless given with --threshold, or for a
+# benchmark or benchmark/scenario with --threshold-for.
+
+import argparse
+import copy
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+from yaml import safe_dump, safe_load
+
+from benchmarks.catalog_data import generate_products
+from cray_product_catalog.query import ProductCatalog
+from cray_product_catalog.schema.validate import validate
+from cray_product_catalog.util.catalog_data import apply_requests, update_request
+from cray_product_catalog.util.merge_dict import merge_dict
+
+# Incremented when the format of the results changes
+RESULTS_VERSION = 1
+
+# Scenario name: (products, versions per product, components per version)
+SCENARIOS = {
+    'small': (5, 5, 10),
+    'medium': (10, 10, 20),
+    'large': (20, 20, 40),
+}
+
+DEFAULT_THRESHOLD = 0.25
+
+
+class Fixture:
+    """The catalog data of one scenario, in the forms the benchmarks need."""
+
+    def __init__(self, products, versions, components):
+        self.products = generate_products(products, versions, components)
+        self.config_map_data = {
+            product: safe_dump(product_versions, default_flow_style=False)
+            for product, product_versions in self.products.items()
+        }
+        self.versions = [
+            (product, version, data)
+            for product, product_versions in self.products.items()
+            for version, data in product_versions.items()
+        ]
+        self.catalog = ProductCatalog.from_mapping(self.config_map_data)
+        rng = random.Random(0)
+        self.queries = [rng.choice(self.versions)[:2] for _ in range(1000)]
+
+
+def bench_merge_dict(fixture):
+    """Merge each version's data into the data of the version before it, as apply_update does."""
+    pairs = [
+        (data, previous) for (_, _, data), (_, _, previous) in zip(fixture.versions[1:], fixture.versions)
+    ]
+    return lambda index: merge_dict(*pairs[index % len(pairs)])
+
+
+def bench_validate(fixture):
+    """Validate one version's data against the schema."""
+    return lambda index: validate(fixture.versions[index % len(fixture.versions)][2])
+
+
+def bench_catalog_load(fixture):
+    """Parse, validate, and index the whole catalog."""
+    return lambda index: ProductCatalog.from_mapping(fixture.config_map_data)
+
+
+def bench_get_product_latest(fixture):
+    """Get the latest version of a product."""
+    return lambda index: fixture.catalog.get_product(fixture.queries[index % len(fixture.queries)][0])
+
+
+def bench_get_product_version(fixture):
+    """Get a product version by name and version."""
+    return lambda index: fixture.catalog.get_product(*fixture.queries[index % len(fixture.queries)])
+
+
+def bench_yaml_round_trip(fixture):
+    """Decode and encode the YAML of one product, as every write does."""
+    texts = list(fixture.config_map_data.values())
+    return lambda index: safe_dump(safe_load(texts[index % len(texts)]), default_flow_style=False)
+
+
+def bench_update_loop(fixture):
+    """The CPU work of one attempt of catalog_update: add a version and make it active.
+
+    This decodes the product, merges the new version, sets the active
+    version, and encodes the product, as each attempt in the update loop does
+    before patching the config map.
+    """
+    requests = []
+    for product, product_versions in fixture.products.items():
+        data = copy.deepcopy(product_versions[next(reversed(product_versions))])
+        data.pop('active')
+        requests.append(update_request(product, '99.0.0', data, set_active=True))
+    return lambda index: apply_requests(fixture.config_map_data, [requests[index % len(requests)]])
+
+
+BENCHMARKS = {
+    'merge_dict': bench_merge_dict,
+    'validate': bench_validate,
+    'catalog_load': bench_catalog_load,
+    'get_product_latest': bench_get_product_latest,
+    'get_product_version': bench_get_product_version,
+    'yaml_round_trip': bench_yaml_round_trip,
+    'update_loop': bench_update_loop,
+}
+
+
+def measure(operation, repeat, min_time):
+    """Time an operation, returning the CPU and wall time per call in microseconds.
+
+    The number of calls per round is chosen so that each round takes at least
+    `min_time` seconds of CPU time.
+    """
+    start = time.thread_time()
+    operation(0)
+    number = max(1, int(min_time / max(time.thread_time() - start, 1e-6)))
+
+    cpu_times, wall_times = [], []
+    for _ in range(repeat):
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
+        for index in range(number):
+            operation(index)
+        cpu_times.append((time.thread_time() - start_cpu) / number)
+        wall_times.append((time.perf_counter() - start_wall) / number)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'cpu_us_per_op': round(min(cpu_times) * 1e6, 3),
+        'wall_us_per_op': round(statistics.median(wall_times) * 1e6, 3),
+    }
+
+
+def run(scenarios, benchmarks, repeat, min_time):
+    """Run the benchmarks in the scenarios and return the results document."""
+    results = []
+    for scenario in scenarios:
+        products, versions, components = SCENARIOS[scenario]
+        fixture = Fixture(products, versions, components)
+        for name in benchmarks:
+            result = {'benchmark': name, 'scenario': scenario}
+            result.update(measure(BENCHMARKS[name](fixture), repeat, min_time))
+            print(f'{scenario:>8} {name:<20} {result["cpu_us_per_op"]:>14.3f} us/op', file=sys.stderr)
+            results.append(result)
+    return {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'scenarios': {name: dict(zip(('products', 'versions', 'components'), SCENARIOS[name])) for name in scenarios},
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold, thresholds):
+    """Compare results with a baseline.
+
+    Args:
+        baseline (dict): The results document of the baseline.
+        current (dict): The results document to compare with it.
+        threshold (float): The fraction by which the CPU time of a benchmark
+            may grow before it is a regression.
+        thresholds (dict): Thresholds for benchmark names or
+            'benchmark/scenario' names which override `threshold`.
+
+    Returns:
+        list of dict: a comparison of each benchmark and scenario in both,
+            with its baseline and current CPU time per operation, its change
+            as a fraction, its threshold, and whether it regressed.
+    """
+    baseline_results = {(r['benchmark'], r['scenario']): r for r in baseline['results']}
+    comparisons = []
+    for result in current['results']:
+        key = (result['benchmark'], result['scenario'])
+        if key not in baseline_results:
+            continue
+        old, new = baseline_results[key]['cpu_us_per_op'], result['cpu_us_per_op']
+        change = (new - old) / old if old else 0.0
+        limit = thresholds.get('/'.join(key), thresholds.get(key[0], threshold))
+        comparisons.append({
+            'benchmark': key[0],
+            'scenario': key[1],
+            'baseline_us_per_op': old,
+            'cpu_us_per_op': new,
+            'change': round(change, 4),
+            'threshold': limit,
+            'regressed': change > limit,
+        })
+    return comparisons
+
+
+def _threshold_for(value):
+    """Parse a NAME=FRACTION argument."""
+    name, sep, fraction = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f'expected NAME=FRACTION, not "{value}"')
+    try:
+        return name, float(fraction)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid fraction "{fraction}"')
+
+
+def _read_results(path):
+    """Read a results document written by this suite."""
+    with open(path) as results_file:
+        results = json.load(results_file)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f'{path} has results version {results.get("version")}, not {RESULTS_VERSION}')
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the cray_product_catalog benchmark suite.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='A scenario to run. May be repeated. By default, all are run.')
+    parser.add_argument('--benchmark', action='append', choices=list(BENCHMARKS),
+                        help='A benchmark to run. May be repeated. By default, all are run.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed rounds of each benchmark.')
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='Minimum CPU seconds of each round.')
+    parser.add_argument('--output', help='Write the results to this file rather than standard output.')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare the results with a baseline results file.')
+    parser.add_argument('--results', help='Compare the results in this file rather than running the benchmarks.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='The fraction by which CPU time may grow before it is a regression.')
+    parser.add_argument('--threshold-for', type=_threshold_for, action='append', default=[],
+                        metavar='NAME=FRACTION', help='The threshold for a benchmark or benchmark/scenario.')
+    args = parser.parse_args(argv)
+    if args.results and not args.compare:
+        parser.error('--results requires --compare')
+
+    try:
+        baseline = _read_results(args.compare) if args.compare else None
+        current = _read_results(args.results) if args.results else None
+    except (OSError, ValueError) as err:
+        print(f'suite: {err}', file=sys.stderr)
+        raise SystemExit(2)
+
+    if current is None:
+        current = run(args.scenario or list(SCENARIOS), args.benchmark or list(BENCHMARKS), args.repeat,
+                      args.min_time)
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(current, output_file, indent=2)
+                output_file.write('\n')
+        elif baseline is None:
+            json.dump(current, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+
+    if baseline is None:
+        return
+
+    comparisons = compare(baseline, current, args.threshold, dict(args.threshold_for))
+    for comparison in comparisons:
+        print(f'{comparison["scenario"]:>8} {comparison["benchmark"]:<20} '
+              f'{comparison["baseline_us_per_op"]:>12.3f} -> {comparison["cpu_us_per_op"]:>12.3f} us/op '
+              f'{comparison["change"]:>+8.1%}{"  REGRESSION" if comparison["regressed"] else ""}')
+    if any(comparison['regressed'] for comparison in comparisons):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
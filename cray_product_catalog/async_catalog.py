@@ -0,0 +1,269 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Defines asyncio counterparts of ProductCatalog and catalog_update for
+# services which serve many concurrent requests that need catalog data.
+#
+# The kubernetes client is blocking, so API requests and parsing are run in the
+# event loop's default executor using the shared ApiClient. Waits between
+# attempts use asyncio.sleep and never block the event loop.
+import asyncio
+from functools import partial
+import logging
+import random
+import threading
+import weakref
+
+from kubernetes.client import CoreV1Api, V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from cray_product_catalog.constants import (
+    PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+)
+from cray_product_catalog.query import ProductCatalog
+from cray_product_catalog.util.catalog_data import apply_requests, delete_request, update_request
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, read_config_map, wait_for_config_map
+
+LOGGER = logging.getLogger(__name__)
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+
+# Loads in progress in each event loop, keyed by the arguments to AsyncProductCatalog.load
+_loads_in_flight = weakref.WeakKeyDictionary()
+
+
+class AsyncProductCatalog(ProductCatalog):
+    """A ProductCatalog which is loaded without blocking the event loop.
+
+    Create one with `await AsyncProductCatalog.load(...)` rather than by
+    calling the class. Once loaded it behaves exactly like a ProductCatalog.
+    """
+
+    def __init__(self, *args, **kwargs):  # pylint: disable=super-init-not-called
+        raise TypeError('Use "await AsyncProductCatalog.load()" to create an AsyncProductCatalog')
+
+    @classmethod
+    async def load(cls, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, namespace=PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+                   include_archived=False, archive_name=PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME):
+        """Load the product catalog.
+
+        Concurrent loads of the same config map share one fetch and receive
+        the same AsyncProductCatalog object, which callers should not modify.
+        Cancelling one caller does not cancel the fetch for the others.
+
+        Args:
+            See ProductCatalog.
+
+        Returns:
+            AsyncProductCatalog: the loaded product catalog.
+
+        Raises:
+            ProductCatalogError: if reading the config map failed.
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = _loads_in_flight.setdefault(loop, {})
+        key = (name, namespace, include_archived, archive_name)
+        task = in_flight.get(key)
+        if task is None:
+            task = loop.create_task(cls._load(name, namespace, include_archived, archive_name))
+            in_flight[key] = task
+            task.add_done_callback(lambda _: in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _load(cls, name, namespace, include_archived, archive_name):
+        """Read and parse the config maps in the default executor."""
+        loop = asyncio.get_running_loop()
+        catalog = cls.__new__(cls)
+        catalog.name = name
+        catalog.namespace = namespace
+        catalog.include_archived = include_archived
+        catalog.archive_name = archive_name
+        catalog.context = None
+        catalog._refresh_lock = threading.Lock()
+        catalog.k8s_client = await loop.run_in_executor(None, cls._get_k8s_api)
+        config_map = await loop.run_in_executor(None, catalog._read_config_map, name)
+        archive_config_map = None
+        if include_archived and config_map.data is not None:
+            archive_config_map = await loop.run_in_executor(None, catalog._read_config_map, archive_name, True)
+        await loop.run_in_executor(None, catalog._load_config_maps, config_map, archive_config_map)
+        return catalog
+
+
+class AsyncCatalogWriter:
+    """Applies updates and deletes to a product catalog config map from asyncio code.
+
+    Requests made concurrently are coalesced: everything submitted while a
+    write is waiting to start or is in progress is applied by the next write,
+    in a single patch. Each caller waits until the patch containing its request
+    has been applied. As with catalog_update, a patch only succeeds if the
+    config map has not changed since it was read, and conflicts are retried.
+
+    Attributes:
+        name (str): The name of the config map.
+        namespace (str): The namespace of the config map.
+        coalesce_window (float): Seconds to wait after the first request of a
+            write arrives, to let other requests join it.
+        max_attempts (int): The number of times a write is attempted before
+            its requests are failed.
+        max_backoff (float): The maximum seconds to wait after a conflict.
+        wait_timeout (float): Seconds to wait for the config map to be
+            created if it does not exist, or None to wait indefinitely.
+    """
+
+    def __init__(self, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, namespace=PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+                 api_instance=None, coalesce_window=0.05, max_attempts=100, max_backoff=3, wait_timeout=None):
+        """Create the AsyncCatalogWriter.
+
+        Args:
+            api_instance (CoreV1Api, optional): The Kubernetes API to use. By
+                default the Kubernetes configuration is loaded and the shared
+                ApiClient is used.
+            Others: see class attributes.
+        """
+        self.name = name
+        self.namespace = namespace
+        self.api_instance = api_instance
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.wait_timeout = wait_timeout
+        self._pending = []
+        self._writer = None
+
+    async def update(self, product, product_version, data, set_active=False, remove_active=False):
+        """Add `data` to a product version, as catalog_update does.
+
+        Raises:
+            ValueError: if both `set_active` and `remove_active` are set.
+            TypeError: if the data cannot be merged with the existing data.
+            ApiException: if the config map could not be read or patched.
+        """
+        await self.submit(update_request(product, product_version, data, set_active, remove_active))
+
+    async def delete(self, product, product_version, key=None):
+        """Remove a product version, or a key of it, as catalog_delete does.
+
+        Raises:
+            ApiException: if the config map could not be read or patched.
+        """
+        await self.submit(delete_request(product, product_version, key))
+
+    async def submit(self, request):
+        """Apply a request from catalog_data.update_request or catalog_data.delete_request.
+
+        Raises:
+            ValueError, TypeError: if the request could not be applied to the
+                existing data.
+            ApiException: if the config map could not be read or patched.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._write())
+        await future
+
+    async def _write(self):
+        """Apply pending requests until there are none left."""
+        while self._pending:
+            if self.coalesce_window:
+                await asyncio.sleep(self.coalesce_window)
+            batch, self._pending = self._pending, []
+            try:
+                errors = await self._apply_batch([request for request, _ in batch])
+            except Exception as err:  # pylint: disable=broad-except
+                errors = {id(request): err for request, _ in batch}
+            for request, future in batch:
+                if future.done():
+                    continue  # the caller was cancelled
+                if id(request) in errors:
+                    future.set_exception(errors[id(request)])
+                else:
+                    future.set_result(None)
+
+    def _get_api(self):
+        """Return the Kubernetes API, loading the configuration if needed."""
+        if self.api_instance is None:
+            load_k8s()
+            self.api_instance = CoreV1Api(get_api_client(retries=100))
+        return self.api_instance
+
+    async def _apply_batch(self, requests):
+        """Apply requests to the config map in one patch.
+
+        Returns:
+            dict: a mapping from the id of each request which could not be
+                applied to its error. The other requests were applied.
+
+        Raises:
+            ApiException: if the config map could not be read or patched.
+        """
+        loop = asyncio.get_running_loop()
+        api_instance = await loop.run_in_executor(None, self._get_api)
+        name, namespace = self.name, self.namespace
+        LOGGER.debug("Applying %s request(s) to ConfigMap %s/%s", len(requests), namespace, name)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                config_map = await loop.run_in_executor(None, read_config_map, api_instance, name, namespace)
+            except ApiException as err:
+                if err.status != ERR_NOT_FOUND or attempt >= self.max_attempts:
+                    raise
+                LOGGER.warning("ConfigMap %s/%s doesn't exist, waiting for it to be created", namespace, name)
+                if not await loop.run_in_executor(None, wait_for_config_map, api_instance, name, namespace,
+                                                  self.wait_timeout):
+                    raise err
+                continue
+
+            # Parsing and dumping the catalog's YAML would block the event loop,
+            # so it is done in the executor like the API calls.
+            errors = {}
+            patch_data = await loop.run_in_executor(None, partial(
+                apply_requests, config_map.data or {}, requests,
+                on_error=lambda request, err: errors.__setitem__(id(request), err)
+            ))
+            if not patch_data:
+                return errors
+
+            body = V1ConfigMap(
+                metadata=V1ObjectMeta(name=name, resource_version=config_map.resource_version),
+                data=patch_data
+            )
+            try:
+                await loop.run_in_executor(None, api_instance.patch_namespaced_config_map, name, namespace, body)
+            except ApiException as err:
+                if err.status != ERR_CONFLICT or attempt >= self.max_attempts:
+                    raise
+                backoff = random.uniform(0, min(self.max_backoff, 0.05 * 2 ** attempt))
+                LOGGER.debug("Conflict updating ConfigMap %s/%s; retrying in %.2fs", namespace, name, backoff)
+                await asyncio.sleep(backoff)
+                continue
+
+            LOGGER.debug("Applied %s request(s) to ConfigMap %s/%s in attempt %s",
+                         len(requests), namespace, name, attempt)
+            return errors
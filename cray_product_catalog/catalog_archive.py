@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# This script moves old product versions out of a Kubernetes ConfigMap and into
+# an archive, according to a retention policy. For every product, the
+# KEEP_VERSIONS newest versions and the active version stay in the catalog:
+#
+# {CONFIG_MAP}:                    {ARCHIVE_CONFIG_MAP} or ARCHIVE_FILE:
+#   {PRODUCT}:                       {PRODUCT}:
+#     {newest versions}                {older versions}  # <- moved here
+#     {active version}
+#
+# Versions are always written to the archive before they are removed from the
+# catalog, so an interrupted run leaves a version in both places rather than in
+# neither. Since updates to a configmap are not atomic, this script will
+# continue to attempt to modify the config maps until they have been patched
+# successfully, or until CATALOG_DEADLINE_SECONDS have elapsed.
+import logging
+import os
+import random
+import urllib3
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from pkg_resources import parse_version
+import yaml
+
+from cray_product_catalog.constants import (
+    PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+)
+from cray_product_catalog.logging import configure_logging
+from cray_product_catalog.util.deadline import DEADLINE_EXCEEDED_EXIT_CODE, Deadline, DeadlineExceeded
+from cray_product_catalog.util.journal import journal_from_env, record_patch
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, wait_for_config_map
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+
+LOGGER = logging.getLogger(__name__)
+
+
+def select_versions_to_archive(product_data, keep):
+    """Return the versions of a product which fall outside the retention policy.
+
+    Args:
+        product_data (dict): A mapping from version to version data for a
+            single product.
+        keep (int): The number of newest versions to keep.
+
+    Returns:
+        list of str: the versions to archive, oldest first. The `keep` newest
+            versions and any version marked active are never included.
+    """
+    newest_first = sorted(product_data, key=lambda v: parse_version(str(v)), reverse=True)
+    return [
+        version for version in reversed(newest_first[keep:])
+        if not (product_data[version] or {}).get('active')
+    ]
+
+
+def split_config_map_data(config_map_data, keep, products=None):
+    """Determine which product versions in ConfigMap data should be archived.
+
+    Args:
+        config_map_data (dict): The ConfigMap data, a mapping from product
+            name to a YAML string of that product's versions.
+        keep (int): The number of newest versions to keep for each product.
+        products (list of str, optional): If given, only consider these
+            products. Otherwise, consider all products.
+
+    Returns:
+        A tuple of (archived, retained) where `archived` maps product names
+        to a dict of the versions to move to the archive, and `retained` maps
+        the same product names to a dict of the versions to keep. Products
+        with nothing to archive are omitted from both.
+    """
+    archived = {}
+    retained = {}
+    for product, product_versions in config_map_data.items():
+        if products and product not in products:
+            continue
+        product_data = yaml.safe_load(product_versions) or {}
+        versions_to_archive = select_versions_to_archive(product_data, keep)
+        if not versions_to_archive:
+            continue
+        archived[product] = {version: product_data.pop(version) for version in versions_to_archive}
+        retained[product] = product_data
+    return archived, retained
+
+
+def merge_archive_data(archive_data, archived):
+    """Merge newly archived versions into existing archive ConfigMap data.
+
+    Args:
+        archive_data (dict): The existing archive data, a mapping from product
+            name to a YAML string of that product's archived versions.
+        archived (dict): A mapping from product name to a dict of versions to
+            add to the archive.
+
+    Returns:
+        dict: the archive data for the products in `archived` only, suitable
+            for patching into the archive ConfigMap.
+    """
+    patch_data = {}
+    for product, versions in archived.items():
+        product_data = yaml.safe_load(archive_data.get(product) or '') or {}
+        product_data.update(versions)
+        patch_data[product] = yaml.safe_dump(product_data, default_flow_style=False)
+    return patch_data
+
+
+def write_archive_file(path, archived):
+    """Merge newly archived versions into a local YAML archive file.
+
+    The file contains a mapping from product name to a mapping of archived
+    versions, in the same layout as the decoded catalog ConfigMap data.
+
+    Args:
+        path (str): The path of the archive file. It is created if missing.
+        archived (dict): A mapping from product name to a dict of versions to
+            add to the archive.
+    """
+    try:
+        with open(path) as afile:
+            file_data = yaml.safe_load(afile) or {}
+    except FileNotFoundError:
+        file_data = {}
+
+    for product, versions in archived.items():
+        file_data.setdefault(product, {}).update(versions)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as afile:
+        yaml.safe_dump(file_data, afile, default_flow_style=False)
+    os.replace(tmp_path, path)
+    LOGGER.info("Archived versions written to %s", path)
+
+
+def _archived_versions(archived):
+    """Return a mapping from product name to the archived versions, for record_patch."""
+    return {product: ', '.join(versions) for product, versions in archived.items()}
+
+
+def write_archive_config_map(api_instance, name, namespace, archived, deadline=None, journal=None):
+    """Merge newly archived versions into the archive ConfigMap.
+
+    The archive ConfigMap is created if it does not exist yet.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the archive ConfigMap.
+        namespace (str): The namespace of the archive ConfigMap.
+        archived (dict): A mapping from product name to a dict of versions to
+            add to the archive.
+        deadline (Deadline, optional): The deadline which bounds every
+            request and retry. Unlimited if None.
+        journal (Journal, optional): The journal in which to record each
+            product changed in the archive ConfigMap.
+
+    Raises:
+        DeadlineExceeded: if the deadline elapsed before the archive was written.
+    """
+    deadline = deadline or Deadline()
+    while True:
+        deadline.check(f'writing archive ConfigMap {namespace}/{name}')
+        try:
+            response = api_instance.read_namespaced_config_map(name, namespace, **deadline.request_kwargs())
+        except ApiException as e:
+            if e.status != ERR_NOT_FOUND:
+                raise  # unrecoverable
+            LOGGER.info("Creating archive ConfigMap %s/%s", namespace, name)
+            body = client.V1ConfigMap(
+                metadata=client.V1ObjectMeta(name=name), data=merge_archive_data({}, archived)
+            )
+            try:
+                result = api_instance.create_namespaced_config_map(namespace, body, **deadline.request_kwargs())
+                record_patch(journal, namespace, name, {}, body.data, _archived_versions(archived), result)
+                return
+            except ApiException as e:
+                if e.status != ERR_CONFLICT:
+                    raise
+                # Another process created it first; merge into theirs.
+                continue
+
+        body = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(name=name, resource_version=response.metadata.resource_version),
+            data=merge_archive_data(response.data or {}, archived)
+        )
+        try:
+            result = api_instance.patch_namespaced_config_map(name, namespace, body, **deadline.request_kwargs())
+            record_patch(journal, namespace, name, response.data or {}, body.data, _archived_versions(archived),
+                         result, response.metadata.resource_version)
+            return
+        except ApiException as e:
+            if e.status != ERR_CONFLICT:
+                raise
+            deadline.count('conflicts')
+            LOGGER.warning("Conflict updating archive ConfigMap %s/%s", namespace, name)
+            deadline.sleep(random.randint(1, 3))
+
+
+def archive_config_map(name, namespace, keep, archive_name=None, archive_file=None, products=None,
+                       wait_timeout=200, deadline=None, journal=None):
+    """Move product versions which fall outside the retention policy to an archive.
+
+    1. Wait for the config map to be present in the namespace
+    2. Read the config map and select the versions to archive
+    3. Merge those versions into the archive ConfigMap or file
+    4. Patch the config map to remove the archived versions
+    5. Repeat steps 2-4 until no versions remain to be archived
+
+    Args:
+        name (str): The name of the catalog ConfigMap.
+        namespace (str): The namespace of the catalog and archive ConfigMaps.
+        keep (int): The number of newest versions to keep for each product.
+        archive_name (str, optional): The name of the archive ConfigMap.
+        archive_file (str, optional): The path of a local archive file. If
+            given, this is used instead of an archive ConfigMap.
+        products (list of str, optional): If given, only archive versions of
+            these products.
+        wait_timeout (float, optional): Seconds to wait for the catalog
+            config map to be created if it does not exist. Wait indefinitely
+            if None.
+        deadline (Deadline, optional): The deadline which bounds every
+            request, retry, and wait. Unlimited if None.
+        journal (Journal, optional): The journal in which to record each
+            product changed in the catalog and archive ConfigMaps.
+
+    Raises:
+        ApiException: if reading or patching a ConfigMap failed with an error
+            other than a conflict.
+        DeadlineExceeded: if the deadline elapsed before archiving finished.
+    """
+    deadline = deadline or Deadline()
+    k8sclient = get_api_client(retries=100)
+    api_instance = client.CoreV1Api(k8sclient)
+    journal = journal and journal.bind(api_instance, namespace)
+    attempt = 0
+    not_found_error = None
+
+    # Requests retried by the shared client stop at the deadline while it is entered.
+    with deadline:
+        while True:
+            # If the config map doesn't exist yet, watch for it to be created.
+            # Otherwise, wait a while to check the config map in case multiple
+            # products are attempting to update the same config map.
+            attempt += 1
+            deadline.check(f'archiving ConfigMap {namespace}/{name}')
+            deadline.count('attempts')
+            if not_found_error:
+                if not wait_for_config_map(api_instance, name, namespace, deadline.limit(wait_timeout)):
+                    deadline.check(f'waiting for ConfigMap {namespace}/{name} to be created')
+                    LOGGER.error("ConfigMap %s/%s was not created within %ss", namespace, name, wait_timeout)
+                    raise not_found_error
+                not_found_error = None
+            else:
+                sleepy_time = random.randint(1, 3)
+                LOGGER.info("Resting %ss before reading ConfigMap", sleepy_time)
+                deadline.sleep(sleepy_time)
+
+            # Read in the config map
+            try:
+                response = api_instance.read_namespaced_config_map(name, namespace, **deadline.request_kwargs())
+            except ApiException as e:
+                # Config map doesn't exist yet
+                if e.status == ERR_NOT_FOUND:
+                    LOGGER.warning("ConfigMap %s/%s doesn't exist, waiting for it to be created.", namespace, name)
+                    deadline.count('not_found')
+                    not_found_error = e
+                    continue
+                else:
+                    LOGGER.exception("Error calling read_namespaced_config_map")
+                    raise  # unrecoverable
+
+            archived, retained = split_config_map_data(response.data or {}, keep, products)
+            if not archived:
+                LOGGER.info("No versions remain to be archived")
+                break
+
+            for product, versions in archived.items():
+                LOGGER.info("Archiving product=%s, versions=%s", product, ', '.join(versions))
+
+            if archive_file:
+                write_archive_file(archive_file, archived)
+            else:
+                write_archive_config_map(api_instance, archive_name, namespace, archived, deadline, journal)
+
+            # Patch only the products that changed, guarded by resourceVersion so
+            # that versions added since the read above are not lost.
+            patch_data = {
+                product: yaml.safe_dump(product_data, default_flow_style=False)
+                for product, product_data in retained.items()
+            }
+            LOGGER.info("ConfigMap update attempt=%s", attempt)
+            try:
+                result = api_instance.patch_namespaced_config_map(
+                    name, namespace, client.V1ConfigMap(
+                        metadata=client.V1ObjectMeta(name=name, resource_version=response.metadata.resource_version),
+                        data=patch_data
+                    ), **deadline.request_kwargs()
+                )
+                LOGGER.info("ConfigMap update attempt %s successful", attempt)
+                record_patch(journal, namespace, name, response.data or {}, patch_data, _archived_versions(archived),
+                             result, response.metadata.resource_version)
+            except ApiException as e:
+                if e.status != ERR_CONFLICT:
+                    LOGGER.exception("Error calling patch_namespaced_config_map")
+                    raise  # unrecoverable
+                deadline.count('conflicts')
+                LOGGER.warning("Conflict updating config map")
+
+
+def main():
+    configure_logging()
+    # Parameters to identify config maps and the retention policy
+    CONFIG_MAP = os.environ.get("CONFIG_MAP", PRODUCT_CATALOG_CONFIG_MAP_NAME).strip()
+    CONFIG_MAP_NS = os.environ.get("CONFIG_MAP_NAMESPACE", PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE).strip()
+    ARCHIVE_CONFIG_MAP = os.environ.get("ARCHIVE_CONFIG_MAP", PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME).strip()
+    ARCHIVE_FILE = os.environ.get("ARCHIVE_FILE", "").strip() or None
+    PRODUCTS = [p.strip() for p in os.environ.get("PRODUCT", "").split(",") if p.strip()] or None
+    CONFIG_MAP_WAIT_TIMEOUT = float(os.environ.get("CONFIG_MAP_WAIT_TIMEOUT") or 200)
+    deadline = Deadline.from_env()
+
+    try:
+        KEEP_VERSIONS = int(os.environ.get("KEEP_VERSIONS", "3"))
+    except ValueError:
+        KEEP_VERSIONS = 0
+    if KEEP_VERSIONS < 1:
+        LOGGER.error("KEEP_VERSIONS must be a positive integer")
+        raise SystemExit(1)
+
+    LOGGER.info(
+        "Archiving all but the %s newest and active versions of %s from config_map=%s "
+        "in namespace=%s to %s",
+        KEEP_VERSIONS, ', '.join(PRODUCTS) if PRODUCTS else 'all products', CONFIG_MAP, CONFIG_MAP_NS,
+        ARCHIVE_FILE or f'config_map={ARCHIVE_CONFIG_MAP}'
+    )
+    load_k8s()
+    try:
+        archive_config_map(
+            CONFIG_MAP, CONFIG_MAP_NS, KEEP_VERSIONS,
+            archive_name=ARCHIVE_CONFIG_MAP, archive_file=ARCHIVE_FILE, products=PRODUCTS,
+            wait_timeout=CONFIG_MAP_WAIT_TIMEOUT, deadline=deadline, journal=journal_from_env()
+        )
+    except DeadlineExceeded as err:
+        LOGGER.error("%s", err)
+        raise SystemExit(DEADLINE_EXCEEDED_EXIT_CODE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# This script backs up the product catalog ConfigMap before a Helm upgrade or
+# rollback, for catalog_restore to restore afterwards:
+#
+# {CONFIG_MAP} ---> {BACKUP_CONFIG_MAP} and/or BACKUP_FILE
+#
+# The ConfigMap is read in one request and the backup ConfigMap written in
+# another. Only the name, namespace, and labels are copied from its metadata.
+# The data written is checked against the SHA-256 hash of each product's data
+# as read. BACKUP_FILE, if set, is a snapshot file, compressed if its name
+# ends in .gz.
+import logging
+import os
+
+import urllib3
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError
+
+from cray_product_catalog.constants import (
+    PRODUCT_CATALOG_BACKUP_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+)
+from cray_product_catalog.logging import configure_logging
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, read_config_map, write_config_map
+from cray_product_catalog.util.snapshot import (
+    SnapshotError,
+    make_snapshot,
+    read_snapshot,
+    verify_hashes,
+    write_snapshot,
+)
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+LOGGER = logging.getLogger(__name__)
+
+
+def copy_config_map(api_instance, snapshot, name, namespace, labels=None):
+    """Write a snapshot's data to a ConfigMap and verify what was written.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        snapshot (Snapshot): The data to write, with its hashes.
+        name (str): The name of the ConfigMap to write.
+        namespace (str): The namespace of the ConfigMap to write.
+        labels (dict, optional): The labels of the ConfigMap.
+
+    Raises:
+        ApiException: if the ConfigMap could not be written.
+        SnapshotError: if the data written does not match the hashes.
+    """
+    written = write_config_map(api_instance, name, namespace, snapshot.data, labels)
+    try:
+        verify_hashes(written.data, snapshot.hashes)
+    except SnapshotError as err:
+        raise SnapshotError(f'ConfigMap {namespace}/{name} was not written correctly: {err}')
+    LOGGER.info("Wrote %s product(s) to ConfigMap %s/%s", len(snapshot.data), namespace, name)
+
+
+def backup_catalog(api_instance, name, namespace, backup_name=None, backup_file=None):
+    """Back up a product catalog ConfigMap to another ConfigMap and/or a file.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the product catalog ConfigMap.
+        namespace (str): The namespace of both ConfigMaps.
+        backup_name (str, optional): The name of the backup ConfigMap.
+        backup_file (str, optional): The path of the backup snapshot file.
+
+    Returns:
+        Snapshot: the data backed up.
+
+    Raises:
+        ApiException: if a ConfigMap could not be read or written.
+        SnapshotError: if a backup could not be written or verified.
+    """
+    config_map = read_config_map(api_instance, name, namespace)
+    snapshot = make_snapshot(config_map.data, name, namespace, config_map.resource_version)
+    LOGGER.info("Read %s product(s) from ConfigMap %s/%s at resourceVersion %s",
+                len(snapshot.data), namespace, name, snapshot.resource_version)
+    if backup_name:
+        copy_config_map(api_instance, snapshot, backup_name, namespace, config_map.labels)
+    if backup_file:
+        write_snapshot(backup_file, snapshot)
+        verify_hashes(read_snapshot(backup_file).data, snapshot.hashes)
+        LOGGER.info("Wrote %s product(s) to %s", len(snapshot.data), backup_file)
+    return snapshot
+
+
+def main():
+    configure_logging()
+    CONFIG_MAP = os.environ.get("CONFIG_MAP", PRODUCT_CATALOG_CONFIG_MAP_NAME).strip()
+    CONFIG_MAP_NS = os.environ.get("CONFIG_MAP_NAMESPACE", PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE).strip()
+    BACKUP_CONFIG_MAP = os.environ.get("BACKUP_CONFIG_MAP", PRODUCT_CATALOG_BACKUP_CONFIG_MAP_NAME).strip()
+    BACKUP_FILE = os.environ.get("BACKUP_FILE", "").strip() or None
+
+    load_k8s()
+    api_instance = client.CoreV1Api(get_api_client(retries=100))
+    try:
+        backup_catalog(api_instance, CONFIG_MAP, CONFIG_MAP_NS, BACKUP_CONFIG_MAP, BACKUP_FILE)
+    except ApiException as err:
+        LOGGER.error("Error backing up ConfigMap %s/%s: %s", CONFIG_MAP_NS, CONFIG_MAP, err.reason)
+        raise SystemExit(1)
+    except (MaxRetryError, SnapshotError) as err:
+        LOGGER.error("Error backing up ConfigMap %s/%s: %s", CONFIG_MAP_NS, CONFIG_MAP, err)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
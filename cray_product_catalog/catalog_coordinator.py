@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# This script runs the catalog coordinator, a long-running process which
+# accepts update and delete requests for product catalog ConfigMaps and
+# applies them in batches. All requests pending for a ConfigMap are merged
+# into a single patch per cycle, so dozens of install Jobs writing at once
+# result in a handful of writes rather than a storm of conflicting ones.
+#
+# Requests are submitted over HTTP by catalog_update and catalog_delete when
+# CATALOG_COORDINATOR_URL is set, or in-process with CatalogCoordinator.submit.
+# Each client waits until the patch containing its request has been applied.
+#
+# Clients authenticate with their service account token. The coordinator
+# checks the token with a TokenReview, and applies a request only if a
+# SubjectAccessReview shows that the client may patch the ConfigMap itself.
+import errno
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib3
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from cray_product_catalog.logging import configure_logging
+from cray_product_catalog.util import metrics
+from cray_product_catalog.util.catalog_data import DELETE, UPDATE, apply_requests
+from cray_product_catalog.util.journal import journal_from_env, record_patch, request_versions
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, wait_for_config_map
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+REQUESTS_PATH = '/v1/requests'
+
+# The token sent by clients to authenticate to the coordinator
+SERVICE_ACCOUNT_TOKEN_FILE = '/var/run/secrets/kubernetes.io/serviceaccount/token'
+
+# The values of COORDINATOR_AUTH
+KUBERNETES_AUTH = 'kubernetes'
+NO_AUTH = 'none'
+
+# Errors connecting to the coordinator, after which the request was certainly not sent
+CONNECTION_ERRNOS = (errno.ECONNREFUSED, errno.ENETUNREACH, errno.EHOSTUNREACH, errno.EADDRNOTAVAIL)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CoordinatorError(Exception):
+    """A request to the catalog coordinator failed."""
+
+
+class CoordinatorUnavailableError(CoordinatorError):
+    """The catalog coordinator could not be reached."""
+
+
+class CoordinatorAuthError(CoordinatorError):
+    """A client was not allowed to submit a request.
+
+    Attributes:
+        status (int): The HTTP status with which to reject the request.
+    """
+    def __init__(self, message, status=403):
+        super().__init__(message)
+        self.status = status
+
+
+class PendingRequest:
+    """A request waiting to be applied by the coordinator.
+
+    Attributes:
+        name (str): The name of the ConfigMap to modify.
+        namespace (str): The namespace of the ConfigMap to modify.
+        request (dict): The request, from catalog_data.update_request or
+            catalog_data.delete_request.
+        error (Exception or None): The error applying the request, if any.
+    """
+    def __init__(self, name, namespace, request):
+        self.name = name
+        self.namespace = namespace
+        self.request = request
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, error=None):
+        """Mark the request as applied, or as failed with the given error."""
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Wait for the request to be applied.
+
+        Raises:
+            CoordinatorError: if the request failed or timed out.
+        """
+        if not self._done.wait(timeout):
+            raise CoordinatorError(f'Timed out after {timeout}s waiting for request to be applied')
+        if self.error is not None:
+            raise CoordinatorError(str(self.error))
+
+
+class CatalogCoordinator:
+    """Queues catalog requests and applies them as one patch per ConfigMap per cycle."""
+
+    def __init__(self, api_instance, coalesce_window=0.05, max_attempts=100, wait_timeout=60, journal=None):
+        """Create the CatalogCoordinator.
+
+        Args:
+            api_instance (CoreV1Api): The Kubernetes API used to apply requests.
+            coalesce_window (float): Seconds to wait after the first request
+                of a cycle arrives, to let other requests join the batch.
+            max_attempts (int): The number of times a batch is attempted
+                before its requests are failed.
+            wait_timeout (float): Seconds to wait for a ConfigMap to be
+                created, per attempt, if it does not exist.
+            journal (Journal, optional): The journal in which to record each
+                product changed by a patch.
+        """
+        self.api_instance = api_instance
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.wait_timeout = wait_timeout
+        self.journal = journal
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def enqueue(self, name, namespace, request):
+        """Queue a request without waiting for it. Return the PendingRequest."""
+        if request.get('op') not in (UPDATE, DELETE) or not request.get('product') or not request.get('version'):
+            raise CoordinatorError(f'Invalid catalog request: {request}')
+        pending = PendingRequest(name, namespace, request)
+        with self._condition:
+            self._pending.append(pending)
+            self._condition.notify()
+        return pending
+
+    def submit(self, name, namespace, request, timeout=None):
+        """Queue a request and wait until it has been applied.
+
+        Raises:
+            CoordinatorError: if the request failed or timed out.
+        """
+        self.enqueue(name, namespace, request).wait(timeout)
+
+    def run_once(self, block=True):
+        """Apply all pending requests.
+
+        Args:
+            block (bool): If True, wait for at least one request first.
+
+        Returns:
+            int: the number of requests processed.
+        """
+        with self._condition:
+            while block and not self._pending and not self._stopped:
+                self._condition.wait()
+        if self.coalesce_window:
+            time.sleep(self.coalesce_window)
+        with self._condition:
+            batch, self._pending = self._pending, []
+
+        batches = {}
+        for pending in batch:
+            batches.setdefault((pending.name, pending.namespace), []).append(pending)
+        for (name, namespace), requests in batches.items():
+            self._apply_batch(name, namespace, requests)
+        return len(batch)
+
+    def run(self):
+        """Apply requests until stop() is called."""
+        while not self._stopped:
+            self.run_once()
+
+    def stop(self):
+        """Stop run() after the current cycle."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _apply_batch(self, name, namespace, batch):
+        """Apply a batch of requests to one ConfigMap in a single patch.
+
+        Requests which cannot be applied, e.g. because their data conflicts
+        with the existing data, are failed individually; the rest of the batch
+        is still applied.
+        """
+        LOGGER.info("Applying %s request(s) to ConfigMap %s/%s", len(batch), namespace, name)
+        attempt = 0
+        while True:
+            attempt += 1
+            metrics.ATTEMPTS.inc(operation='coordinator')
+            try:
+                response = self.api_instance.read_namespaced_config_map(name, namespace)
+            except ApiException as err:
+                if err.status == ERR_NOT_FOUND and attempt < self.max_attempts:
+                    metrics.NOT_FOUND_RETRIES.inc(operation='coordinator')
+                    LOGGER.warning("ConfigMap %s/%s doesn't exist, waiting for it to be created", namespace, name)
+                    wait_for_config_map(self.api_instance, name, namespace, self.wait_timeout)
+                    continue
+                metrics.API_ERRORS.inc(operation='coordinator')
+                LOGGER.error("Error reading ConfigMap %s/%s: %s", namespace, name, err.reason)
+                for pending in batch:
+                    pending.finish(err)
+                return
+
+            errors = {}
+            requests = [pending.request for pending in batch]
+            patch_data = apply_requests(
+                response.data or {}, requests,
+                on_error=lambda request, err, errors=errors: errors.__setitem__(id(request), err)
+            )
+            if patch_data:
+                try:
+                    result = self.api_instance.patch_namespaced_config_map(
+                        name, namespace, client.V1ConfigMap(
+                            metadata=client.V1ObjectMeta(
+                                name=name, resource_version=response.metadata.resource_version
+                            ),
+                            data=patch_data
+                        )
+                    )
+                except ApiException as err:
+                    if err.status == ERR_CONFLICT:
+                        metrics.CONFLICTS.inc(operation='coordinator')
+                    else:
+                        metrics.API_ERRORS.inc(operation='coordinator')
+                    if err.status == ERR_CONFLICT and attempt < self.max_attempts:
+                        # Another writer bypassed the coordinator; re-read and re-apply.
+                        LOGGER.warning("Conflict updating ConfigMap %s/%s", namespace, name)
+                        delay = random.uniform(0, self.coalesce_window or 0.05)
+                        time.sleep(delay)
+                        metrics.SLEEP_SECONDS.observe(delay)
+                        continue
+                    LOGGER.error("Error patching ConfigMap %s/%s: %s", namespace, name, err.reason)
+                    for pending in batch:
+                        pending.finish(err)
+                    return
+                if self.journal:
+                    record_patch(self.journal.bind(self.api_instance, namespace), namespace, name,
+                                 response.data or {}, patch_data, request_versions(requests), result,
+                                 response.metadata.resource_version)
+
+            LOGGER.info("Applied %s request(s) to ConfigMap %s/%s changing %s product(s) in attempt %s",
+                        len(batch), namespace, name, len(patch_data), attempt)
+            for pending in batch:
+                pending.finish(errors.get(id(pending.request)))
+            return
+
+
+class KubernetesAuthenticator:
+    """Check that clients of the coordinator may modify the ConfigMaps they submit requests for.
+
+    A client sends a bearer token, normally its service account token, which
+    is checked with a TokenReview. A SubjectAccessReview then checks that the
+    authenticated user may patch the ConfigMap, so the coordinator does not
+    let clients make writes they could not make directly.
+    """
+    def __init__(self, api_client):
+        """Create the KubernetesAuthenticator.
+
+        Args:
+            api_client (ApiClient): The Kubernetes API client to use.
+        """
+        self.authentication_api = client.AuthenticationV1Api(api_client)
+        self.authorization_api = client.AuthorizationV1Api(api_client)
+
+    def authorize(self, token, name, namespace):
+        """Check that the holder of a token may modify a ConfigMap.
+
+        Args:
+            token (str or None): The bearer token sent by the client.
+            name (str): The name of the ConfigMap.
+            namespace (str): The namespace of the ConfigMap.
+
+        Raises:
+            CoordinatorAuthError: if the token is missing or invalid, or its
+                user may not patch the ConfigMap.
+        """
+        if not token:
+            raise CoordinatorAuthError('A bearer token is required', status=401)
+        review = self.authentication_api.create_token_review(
+            client.V1TokenReview(spec=client.V1TokenReviewSpec(token=token))
+        )
+        if not review.status.authenticated:
+            raise CoordinatorAuthError('The bearer token is not valid', status=401)
+
+        user = review.status.user
+        access = self.authorization_api.create_subject_access_review(client.V1SubjectAccessReview(
+            spec=client.V1SubjectAccessReviewSpec(
+                user=user.username, groups=user.groups, uid=user.uid, extra=user.extra,
+                resource_attributes=client.V1ResourceAttributes(
+                    verb='patch', resource='configmaps', name=name, namespace=namespace
+                )
+            )
+        ))
+        if not access.status.allowed:
+            raise CoordinatorAuthError(f'{user.username} may not patch ConfigMap {namespace}/{name}')
+
+
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """Accept catalog requests over HTTP for the server's coordinator.
+
+    POST /v1/requests with a JSON body of the form
+    {"config_map": ..., "namespace": ..., "request": {...}} responds once the
+    request has been applied, with 200, or with 4xx/5xx and an error message.
+    If the server has an authenticator, the request must carry an
+    "Authorization: Bearer" header which it accepts. GET /metrics responds
+    with the coordinator's metrics in the Prometheus text format.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            body = metrics.REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', metrics.PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != REQUESTS_PATH:
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length))
+            name, namespace = body['config_map'], body['namespace']
+        except (ValueError, KeyError, TypeError) as err:
+            self._send_json(400, {'error': f'Invalid request: {err}'})
+            return
+
+        if self.server.authenticator:
+            scheme, _, token = (self.headers.get('Authorization') or '').partition(' ')
+            try:
+                self.server.authenticator.authorize(token if scheme.lower() == 'bearer' else None, name, namespace)
+            except CoordinatorAuthError as err:
+                LOGGER.warning("Rejected request for ConfigMap %s/%s from %s: %s",
+                               namespace, name, self.address_string(), err)
+                self._send_json(err.status, {'error': str(err)})
+                return
+            except ApiException as err:
+                LOGGER.error("Unable to authorize request: %s", err.reason)
+                self._send_json(503, {'error': f'Unable to authorize request: {err.reason}'})
+                return
+
+        try:
+            pending = self.server.coordinator.enqueue(name, namespace, body['request'])
+        except (KeyError, TypeError, AttributeError, CoordinatorError) as err:
+            self._send_json(400, {'error': f'Invalid request: {err}'})
+            return
+
+        try:
+            pending.wait(self.server.request_timeout)
+        except CoordinatorError as err:
+            self._send_json(500, {'error': str(err)})
+            return
+        self._send_json(200, {'status': 'applied'})
+
+
+def read_token(path=SERVICE_ACCOUNT_TOKEN_FILE):
+    """Return the token with which to authenticate to the coordinator, or None if there is none."""
+    try:
+        with open(path, encoding='utf-8') as token_file:
+            return token_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _not_connected(reason):
+    """Return True if a URLError reason shows that no connection was made to the coordinator."""
+    if isinstance(reason, (ConnectionRefusedError, socket.gaierror)):
+        return True
+    return isinstance(reason, OSError) and not isinstance(reason, socket.timeout) and reason.errno in CONNECTION_ERRNOS
+
+
+def submit_request(url, name, namespace, request, timeout=300, token=None):
+    """Submit a request to a catalog coordinator and wait for it to be applied.
+
+    Args:
+        url (str): The base URL of the coordinator, e.g. http://host:8080.
+        name (str): The name of the ConfigMap to modify.
+        namespace (str): The namespace of the ConfigMap to modify.
+        request (dict): The request, from catalog_data.update_request or
+            catalog_data.delete_request.
+        timeout (float): Seconds to wait for the request to be applied.
+        token (str, optional): The bearer token with which to authenticate.
+            Defaults to the service account token, if there is one.
+
+    Raises:
+        CoordinatorUnavailableError: if no connection could be made to the
+            coordinator, so the request was certainly not submitted.
+        CoordinatorError: if the coordinator failed to apply the request, or
+            did not respond in time, in which case it may still apply it.
+    """
+    body = json.dumps({'config_map': name, 'namespace': namespace, 'request': request}).encode()
+    headers = {'Content-Type': 'application/json'}
+    token = token or read_token()
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    http_request = urllib.request.Request(url.rstrip('/') + REQUESTS_PATH, data=body, method='POST',
+                                          headers=headers)
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout):
+            return
+    except urllib.error.HTTPError as err:
+        try:
+            message = json.loads(err.read()).get('error')
+        except ValueError:
+            message = err.reason
+        raise CoordinatorError(f'Catalog coordinator rejected request: {message}')
+    except urllib.error.URLError as err:
+        if _not_connected(err.reason):
+            raise CoordinatorUnavailableError(f'Unable to reach catalog coordinator at {url}: {err.reason}')
+        # The request may have been sent, so falling back to a direct write could apply it twice.
+        raise CoordinatorError(f'Request to catalog coordinator at {url} failed and may still be applied: '
+                               f'{err.reason}')
+    except OSError as err:
+        raise CoordinatorError(f'No response from catalog coordinator at {url}; the request may still be '
+                               f'applied: {err}')
+
+
+def make_server(coordinator, address='', port=8080, request_timeout=300, authenticator=None):
+    """Create an HTTP server that accepts requests for the given coordinator.
+
+    If an `authenticator` is given, each request must be authorized by it.
+    """
+    server = ThreadingHTTPServer((address, port), CoordinatorRequestHandler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    server.request_timeout = request_timeout
+    server.authenticator = authenticator
+    return server
+
+
+def main():
+    configure_logging()
+    ADDRESS = os.environ.get("COORDINATOR_ADDRESS", "").strip()
+    PORT = int(os.environ.get("COORDINATOR_PORT", "8080"))
+    COALESCE_WINDOW = float(os.environ.get("COALESCE_WINDOW_SECONDS", "0.05"))
+    REQUEST_TIMEOUT = float(os.environ.get("COORDINATOR_REQUEST_TIMEOUT", "300"))
+    AUTH = os.environ.get("COORDINATOR_AUTH", KUBERNETES_AUTH).strip().lower()
+    if AUTH not in (KUBERNETES_AUTH, NO_AUTH):
+        LOGGER.error("COORDINATOR_AUTH must be '%s' or '%s'", KUBERNETES_AUTH, NO_AUTH)
+        raise SystemExit(1)
+
+    load_k8s()
+    k8sclient = get_api_client(retries=100)
+    coordinator = CatalogCoordinator(client.CoreV1Api(k8sclient), coalesce_window=COALESCE_WINDOW,
+                                     journal=journal_from_env())
+
+    writer = threading.Thread(target=coordinator.run, name='catalog-writer', daemon=True)
+    writer.start()
+    metrics.start_file_exporter()
+    authenticator = None
+    if AUTH == KUBERNETES_AUTH:
+        authenticator = KubernetesAuthenticator(k8sclient)
+    else:
+        LOGGER.warning("Accepting requests without authentication")
+    server = make_server(coordinator, ADDRESS, PORT, REQUEST_TIMEOUT, authenticator)
+    LOGGER.info("Catalog coordinator listening on %s:%s", ADDRESS or '*', PORT)
+    try:
+        server.serve_forever()
+    finally:
+        coordinator.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
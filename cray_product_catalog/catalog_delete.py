@@ -2,7 +2,7 @@
 #
 # MIT License
 #
-# (C) Copyright 2021-2022 Hewlett Packard Enterprise Development LP
+# (C) Copyright 2021-2023 Hewlett Packard Enterprise Development LP
 #
 # Permission is hereby granted, free of charge, to any person obtaining a
 # copy of this software and associated documentation files (the "Software"),
@@ -40,123 +40,30 @@
 # attempt to modify the config map until it has been patched successfully.
 import logging
 import os
-import random
-import time
 import urllib3
-from urllib3.util.retry import Retry
-
-from kubernetes import client
-from kubernetes.client.api_client import ApiClient
-from kubernetes.client.rest import ApiException
-import yaml
 
+from cray_product_catalog.catalog_coordinator import (
+    CoordinatorError,
+    CoordinatorUnavailableError,
+    submit_request,
+)
+from cray_product_catalog.fanout import delete_all, report, targets_from_env
 from cray_product_catalog.logging import configure_logging
-from cray_product_catalog.util import load_k8s
+from cray_product_catalog.util import metrics, tracing
+from cray_product_catalog.util.catalog_data import delete_request
+from cray_product_catalog.util.catalog_write import modify_config_map
+from cray_product_catalog.util.deadline import DEADLINE_EXCEEDED_EXIT_CODE, Deadline, DeadlineExceeded
+from cray_product_catalog.util.journal import journal_from_env
+from cray_product_catalog.util.k8s import load_k8s
+from cray_product_catalog.util.spool import SpoolError, spool_request
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 LOGGER = logging.getLogger(__name__)
 
 
-def modify_config_map(name, namespace, product, product_version, key=None):
-    """Remove a product version from the catalog config map.
-
-    If a key is specified, delete the `key` content from a specific section
-    of the catalog config map. If there are no more keys after it has been
-    removed, remove the version mapping as well.
-
-    1. Wait for the config map to be present in the namespace
-    2. Patch the config_map
-    3. Read back the config_map
-    4. Repeat steps 2-3 if config_map does not reflect the changes requested
-    """
-    k8sclient = ApiClient()
-    retries = 100
-    retry = Retry(
-        total=retries, read=retries, connect=retries, backoff_factor=0.3,
-        status_forcelist=(500, 502, 503, 504)
-    )
-    k8sclient.rest_client.pool_manager.connection_pool_kw['retries'] = retry
-    api_instance = client.CoreV1Api(k8sclient)
-    attempt = 0
-    max_attempts = 100
-
-    while True:
-
-        # Wait a while to check the config map in case multiple products are
-        # attempting to update the same config map, or the config map doesn't
-        # exist yet
-        attempt += 1
-        sleepy_time = random.randint(1, 3)
-        LOGGER.info("Resting %ss before reading ConfigMap", sleepy_time)
-        time.sleep(sleepy_time)
-
-        # Read in the config map
-        try:
-            response = api_instance.read_namespaced_config_map(name, namespace)
-        except ApiException as e:
-            LOGGER.exception("Error calling read_namespaced_config_map")
-
-            # Config map doesn't exist yet
-            if e.status == 404 and attempt < max_attempts:
-                LOGGER.warning("ConfigMap %s/%s doesn't exist, attempting again.", namespace, name)
-                continue
-            else:
-                raise  # unrecoverable
-
-        # Determine if ConfigMap needs to be updated
-        config_map_data = response.data or {}  # if no config map data exists
-        if product not in config_map_data:
-            break  # product doesn't exist, don't need to remove anything
-
-        # Product exists in ConfigMap
-        product_data = yaml.safe_load(config_map_data[product])
-        if product_version not in product_data:
-            LOGGER.info(
-                "Version %s not in ConfigMap", product_version
-            )
-            break  # product version is gone, we are done
-
-        # Product version exists in ConfigMap
-        if key:
-            # Key exists, remove it
-            if key in product_data[product_version]:
-                LOGGER.info(
-                    "key=%s in version=%s exists; to be removed",
-                    key, product_version
-                )
-                product_data[product_version].pop(key)
-            else:
-                # No keys left
-                if not product_data[product_version].keys():
-                    LOGGER.info(
-                        "No keys remain in version=%s; removing version",
-                        product_version
-                    )
-                    product_data.pop(product_version)
-                else:
-                    break  # key is gone, we are done
-        else:
-            LOGGER.info(
-                "Removing product=%s, version=%s",
-                product, product_version
-            )
-            product_data.pop(product_version)
-
-        # Patch the config map
-        config_map_data[product] = yaml.safe_dump(
-            product_data, default_flow_style=False
-        )
-        LOGGER.info("ConfigMap update attempt=%s", attempt)
-        try:
-            api_instance.patch_namespaced_config_map(
-                name, namespace, client.V1ConfigMap(data=config_map_data)
-            )
-            LOGGER.info("ConfigMap update attempt %s successful", attempt)
-        except ApiException:
-            LOGGER.exception("Error calling patch_namespaced_config_map")
-
-
+@metrics.report_at_exit
+@tracing.traced('catalog_delete')
 def main():
     configure_logging()
     # Parameters to identify config map and product/version to remove
@@ -165,14 +72,61 @@ def main():
     CONFIG_MAP = os.environ.get("CONFIG_MAP", "cray-product-catalog").strip()
     CONFIG_MAP_NS = os.environ.get("CONFIG_MAP_NAMESPACE", "services").strip()
     KEY = os.environ.get("KEY", "").strip() or None
+    CATALOG_COORDINATOR_URL = os.environ.get("CATALOG_COORDINATOR_URL", "").strip()
+    CATALOG_COORDINATOR_TIMEOUT = float(os.environ.get("CATALOG_COORDINATOR_TIMEOUT", "300"))
+    CATALOG_SPOOL_DIR = os.environ.get("CATALOG_SPOOL_DIR", "").strip()
+    CATALOG_LOCK = os.environ.get("CATALOG_LOCK", "").strip().lower()
+    CATALOG_LOCK_DURATION = int(os.environ.get("CATALOG_LOCK_DURATION", "15"))
+    CONFIG_MAP_WAIT_TIMEOUT = float(os.environ.get("CONFIG_MAP_WAIT_TIMEOUT") or 200)
+    deadline = Deadline.from_env()
+    journal = journal_from_env()
 
     args = (CONFIG_MAP, CONFIG_MAP_NS, PRODUCT, PRODUCT_VERSION, KEY)
     LOGGER.info(
         "Removing from config_map=%s in namespace=%s for %s/%s (key=%s)",
         *args
     )
+    targets = targets_from_env(CONFIG_MAP_NS)
+    if targets:
+        LOGGER.info("Removing from config_map=%s in %s namespace(s)/context(s)", CONFIG_MAP, len(targets))
+        if any(target.context is None for target in targets):
+            load_k8s()
+        status = report(delete_all(targets, CONFIG_MAP, PRODUCT, PRODUCT_VERSION, KEY, lock_mode=CATALOG_LOCK,
+                                   lock_duration=CATALOG_LOCK_DURATION, wait_timeout=CONFIG_MAP_WAIT_TIMEOUT,
+                                   deadline=deadline, journal=journal))
+        if status:
+            raise SystemExit(status)
+        return
+
+    request = delete_request(PRODUCT, PRODUCT_VERSION, KEY)
+    if CATALOG_SPOOL_DIR:
+        try:
+            path = spool_request(CATALOG_SPOOL_DIR, CONFIG_MAP, CONFIG_MAP_NS, request)
+            LOGGER.info("ConfigMap update spooled to %s for catalog_flush to apply", path)
+            return
+        except SpoolError as err:
+            LOGGER.warning("%s; updating ConfigMap directly", err)
+
+    if CATALOG_COORDINATOR_URL:
+        try:
+            submit_request(CATALOG_COORDINATOR_URL, CONFIG_MAP, CONFIG_MAP_NS, request,
+                           timeout=deadline.limit(CATALOG_COORDINATOR_TIMEOUT))
+            LOGGER.info("ConfigMap update applied by catalog coordinator")
+            return
+        except CoordinatorUnavailableError as err:
+            LOGGER.warning("%s; updating ConfigMap directly", err)
+        except CoordinatorError as err:
+            LOGGER.error("%s", err)
+            raise SystemExit(1)
+
     load_k8s()
-    modify_config_map(*args)
+    try:
+        modify_config_map(*args, lock_mode=CATALOG_LOCK, lock_duration=CATALOG_LOCK_DURATION,
+                          wait_timeout=CONFIG_MAP_WAIT_TIMEOUT, deadline=deadline, journal=journal)
+    except DeadlineExceeded as err:
+        LOGGER.error("%s", err)
+        raise SystemExit(DEADLINE_EXCEEDED_EXIT_CODE)
+    LOGGER.debug("ConfigMap updated: %s", deadline.summary())
 
 
 if __name__ == "__main__":
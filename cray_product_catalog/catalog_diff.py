@@ -0,0 +1,170 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# This script compares two product catalogs at the product, version, and
+# field level. Each catalog may be a live ConfigMap or a file, either a
+# snapshot or a ConfigMap saved with kubectl:
+#
+#   catalog_diff configmap:services/cpc-backup configmap:cray-product-catalog
+#   catalog_diff before.json configmap:cray-product-catalog --deep
+#
+# Products whose data is identical in both catalogs are skipped without being
+# parsed, and each difference is written as soon as it is found. The exit
+# status is 0 if the catalogs are the same, 1 if they differ, and 2 if either
+# could not be read, as for diff(1).
+import argparse
+import json
+import sys
+
+from kubernetes.client import CoreV1Api
+from kubernetes.client.rest import ApiException
+from kubernetes.config import ConfigException
+from urllib3.exceptions import MaxRetryError
+from yaml import YAMLError
+
+from cray_product_catalog.constants import PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE
+from cray_product_catalog.util.diff import (
+    ACTIVE_CHANGED,
+    KEY_CHANGED,
+    PRODUCT_ADDED,
+    PRODUCT_REMOVED,
+    VERSION_ADDED,
+    VERSION_REMOVED,
+    diff_catalog_data,
+)
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, read_config_map
+from cray_product_catalog.util.snapshot import Snapshot, SnapshotError, read_snapshot
+
+CONFIG_MAP_PREFIXES = ('configmap:', 'cm:')
+
+EXIT_SAME = 0
+EXIT_DIFFERENT = 1
+EXIT_ERROR = 2
+
+
+def load_catalog(source):
+    """Load a product catalog from a ConfigMap or a file.
+
+    Args:
+        source (str): 'configmap:[NAMESPACE/]NAME' (or 'cm:...') for a live
+            ConfigMap, in the services namespace by default, or the path of a
+            snapshot or a ConfigMap saved with kubectl.
+
+    Returns:
+        Snapshot: the catalog data.
+
+    Raises:
+        SnapshotError: if the catalog could not be read.
+    """
+    for prefix in CONFIG_MAP_PREFIXES:
+        if source.startswith(prefix):
+            break
+    else:
+        return read_snapshot(source)
+
+    namespace, _, name = source[len(prefix):].rpartition('/')
+    namespace = namespace or PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE
+    try:
+        load_k8s()
+        config_map = read_config_map(CoreV1Api(get_api_client()), name, namespace)
+    except ConfigException as err:
+        raise SnapshotError(f'Unable to load kubernetes configuration: {err}')
+    except ApiException as err:
+        raise SnapshotError(f'Error reading {namespace}/{name} ConfigMap: {err.reason}')
+    except MaxRetryError as err:
+        raise SnapshotError(f'Unable to connect to Kubernetes to read {namespace}/{name} ConfigMap: {err}')
+    return Snapshot(config_map.data or {}, None, name, namespace, config_map.resource_version)
+
+
+def _value(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def format_change(change):
+    """Format a CatalogChange as one line of text."""
+    if change.type == PRODUCT_ADDED:
+        return f'+ {change.product}'
+    if change.type == PRODUCT_REMOVED:
+        return f'- {change.product}'
+    if change.type == VERSION_ADDED:
+        return f'+ {change.product} {change.version}'
+    if change.type == VERSION_REMOVED:
+        return f'- {change.product} {change.version}'
+    if change.type == ACTIVE_CHANGED:
+        return f'~ {change.product} {change.version} active: {_value(change.old)} -> {_value(change.new)}'
+    if change.type == KEY_CHANGED:
+        return f'~ {change.product} {change.version} {change.key}: {_value(change.old)} -> {_value(change.new)}'
+    return str(change)
+
+
+def format_change_json(change):
+    """Format a CatalogChange as a line of JSON, omitting empty fields."""
+    return json.dumps(
+        {field: value for field, value in change._asdict().items() if value is not None}, default=str
+    )
+
+
+def diff_catalogs(old, new, out, deep=False, output_format='text'):
+    """Write the differences between two catalogs.
+
+    Args:
+        old (Snapshot): The catalog before the change.
+        new (Snapshot): The catalog after the change.
+        out (file): The file to write each difference to.
+        deep (bool): If True, compare nested fields of each version.
+        output_format (str): 'text' or 'json', for a JSON object per line.
+
+    Returns:
+        int: the number of differences.
+    """
+    formatter = format_change_json if output_format == 'json' else format_change
+    count = 0
+    for change in diff_catalog_data(old.data, new.data, old.hashes, new.hashes, deep=deep):
+        out.write(formatter(change) + '\n')
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two product catalogs.')
+    parser.add_argument('old', help='configmap:[NAMESPACE/]NAME, or the path of a snapshot or saved ConfigMap.')
+    parser.add_argument('new', help='configmap:[NAMESPACE/]NAME, or the path of a snapshot or saved ConfigMap.')
+    parser.add_argument('--deep', action='store_true', help='Compare nested fields of each version.')
+    parser.add_argument('--format', choices=('text', 'json'), default='text', dest='output_format',
+                        help='Write text, or a JSON object per line.')
+    args = parser.parse_args(argv)
+
+    try:
+        old, new = load_catalog(args.old), load_catalog(args.new)
+        count = diff_catalogs(old, new, sys.stdout, deep=args.deep, output_format=args.output_format)
+    except SnapshotError as err:
+        print(f'catalog_diff: {err}', file=sys.stderr)
+        raise SystemExit(EXIT_ERROR)
+    except YAMLError as err:
+        print(f'catalog_diff: Failed to load product data: {err}', file=sys.stderr)
+        raise SystemExit(EXIT_ERROR)
+    raise SystemExit(EXIT_DIFFERENT if count else EXIT_SAME)
+
+
+if __name__ == "__main__":
+    main()
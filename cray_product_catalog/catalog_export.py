@@ -0,0 +1,346 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# This script exports product catalogs to a SQLite database for ad-hoc
+# queries across many systems:
+#
+#   catalog_export catalogs.db configmap:cray-product-catalog
+#   catalog_export catalogs.db system-a=system-a.yaml system-b=system-b.json.gz
+#
+# Each catalog is a live ConfigMap or a file, either a snapshot or a ConfigMap
+# saved with kubectl, optionally preceded by a label for it in the database,
+# which is the source itself by default. Exporting a catalog again replaces the
+# one with the same label, rewriting only the products whose content hashes
+# have changed. The tables are:
+#
+#   catalogs            one row per label
+#   products            one row per product of each catalog, with its hash
+#   versions            one row per product version, with the integer parts
+#                       of its version for comparisons, e.g. (major, minor) < (2, 4)
+#   components          the docker images, helm charts, and other components
+#                       of each version
+#   repositories        the repositories of each version
+#   repository_members  the members of each group repository
+#   ims_resources       the IMS images and recipes of each version
+#
+# and the catalog_versions view joins each version with its catalog's label.
+from collections import namedtuple
+from datetime import datetime, timezone
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import warnings
+
+from pkg_resources import parse_version
+
+from cray_product_catalog.catalog_diff import CONFIG_MAP_PREFIXES
+from cray_product_catalog.constants import COMPONENT_REPOS_KEY, PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE
+from cray_product_catalog.query import ProductCatalog, ProductCatalogError
+
+# Incremented when the tables change in a way older databases cannot be used with
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogs (
+    id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL UNIQUE,
+    name TEXT,
+    namespace TEXT,
+    resource_version TEXT,
+    exported_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    catalog_id INTEGER NOT NULL REFERENCES catalogs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    UNIQUE (catalog_id, name)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products (id) ON DELETE CASCADE,
+    product TEXT NOT NULL,
+    version TEXT NOT NULL,
+    major INTEGER,
+    minor INTEGER,
+    patch INTEGER,
+    active INTEGER,
+    archived INTEGER NOT NULL,
+    clone_url TEXT,
+    config_commit TEXT,
+    import_branch TEXT,
+    data TEXT NOT NULL,
+    UNIQUE (product_id, version)
+);
+CREATE INDEX IF NOT EXISTS versions_by_product ON versions (product, major, minor, patch);
+CREATE TABLE IF NOT EXISTS components (
+    version_id INTEGER NOT NULL REFERENCES versions (id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT
+);
+CREATE INDEX IF NOT EXISTS components_by_version ON components (version_id);
+CREATE INDEX IF NOT EXISTS components_by_name ON components (name, version);
+CREATE TABLE IF NOT EXISTS repositories (
+    version_id INTEGER NOT NULL REFERENCES versions (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type TEXT
+);
+CREATE INDEX IF NOT EXISTS repositories_by_version ON repositories (version_id);
+CREATE INDEX IF NOT EXISTS repositories_by_name ON repositories (name);
+CREATE TABLE IF NOT EXISTS repository_members (
+    version_id INTEGER NOT NULL REFERENCES versions (id) ON DELETE CASCADE,
+    repository TEXT NOT NULL,
+    member TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repository_members_by_version ON repository_members (version_id);
+CREATE INDEX IF NOT EXISTS repository_members_by_member ON repository_members (member);
+CREATE TABLE IF NOT EXISTS ims_resources (
+    version_id INTEGER NOT NULL REFERENCES versions (id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ims_id TEXT
+);
+CREATE INDEX IF NOT EXISTS ims_resources_by_version ON ims_resources (version_id);
+CREATE INDEX IF NOT EXISTS ims_resources_by_name ON ims_resources (name);
+CREATE INDEX IF NOT EXISTS ims_resources_by_id ON ims_resources (ims_id);
+CREATE VIEW IF NOT EXISTS catalog_versions AS
+    SELECT catalogs.label AS catalog, versions.id AS version_id, versions.product, versions.version,
+           versions.major, versions.minor, versions.patch, versions.active, versions.archived
+    FROM versions
+    JOIN products ON versions.product_id = products.id
+    JOIN catalogs ON products.catalog_id = catalogs.id;
+"""
+
+# The number of products of a catalog written, left unchanged, and removed by an export
+ExportResult = namedtuple('ExportResult', ('written', 'unchanged', 'removed'))
+
+
+class ExportError(Exception):
+    """A catalog could not be exported."""
+
+
+def open_database(path):
+    """Open an export database, creating its tables if needed.
+
+    Args:
+        path (str): The path of the database.
+
+    Returns:
+        sqlite3.Connection: the connection.
+
+    Raises:
+        ExportError: if the database could not be opened, or was created by
+            an incompatible version of this script.
+    """
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA foreign_keys = ON')
+        schema_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if schema_version not in (0, SCHEMA_VERSION):
+            conn.close()
+            raise ExportError(f'Database {path} has schema version {schema_version}, not {SCHEMA_VERSION}')
+        with conn:
+            conn.executescript(SCHEMA)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    except sqlite3.Error as err:
+        raise ExportError(f'Unable to open database {path}: {err}')
+    return conn
+
+
+def hash_product(product_versions):
+    """Return a hash of the content of all versions of one product.
+
+    Args:
+        product_versions (list of InstalledProductVersion): The versions.
+
+    Returns:
+        str: the hash, e.g. 'sha256:0a1b...'.
+    """
+    content = json.dumps(
+        sorted([version.version, version.archived, version.data] for version in product_versions),
+        sort_keys=True, default=str
+    )
+    return 'sha256:' + hashlib.sha256(content.encode()).hexdigest()
+
+
+def _version_parts(version):
+    """Return the major, minor, and patch numbers of a version, each None if missing."""
+    with warnings.catch_warnings():
+        # Versions which are not PEP 440 versions have no numeric parts.
+        warnings.simplefilter('ignore')
+        release = getattr(parse_version(version), 'release', None) or ()
+    return (tuple(release[:3]) + (None, None, None))[:3]
+
+
+def _insert_version(conn, product_id, product):
+    """Insert one InstalledProductVersion and its components."""
+    version_id = conn.execute(
+        'INSERT INTO versions (product_id, product, version, major, minor, patch, active, archived, '
+        'clone_url, config_commit, import_branch, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (product_id, product.name, product.version, *_version_parts(product.version),
+         product.active if product.supports_active else None, product.archived,
+         product.clone_url, product.commit, product.import_branch,
+         json.dumps(product.data, sort_keys=True, default=str))
+    ).lastrowid
+
+    conn.executemany(
+        'INSERT INTO components (version_id, type, name, version) VALUES (?, ?, ?, ?)',
+        [
+            (version_id, component_type, component['name'], component.get('version'))
+            for component_type, components in product.component_data.items()
+            if component_type != COMPONENT_REPOS_KEY and isinstance(components, list)
+            for component in components if isinstance(component, dict) and component.get('name')
+        ]
+    )
+    conn.executemany(
+        'INSERT INTO repositories (version_id, name, type) VALUES (?, ?, ?)',
+        [(version_id, repo.get('name'), repo.get('type')) for repo in product.repositories]
+    )
+    conn.executemany(
+        'INSERT INTO repository_members (version_id, repository, member) VALUES (?, ?, ?)',
+        [
+            (version_id, repo.get('name'), member)
+            for repo in product.group_repositories for member in repo.get('members') or []
+        ]
+    )
+    conn.executemany(
+        'INSERT INTO ims_resources (version_id, type, name, ims_id) VALUES (?, ?, ?, ?)',
+        [(version_id, 'image', image['name'], image['id']) for image in product.images] +
+        [(version_id, 'recipe', recipe['name'], recipe['id']) for recipe in product.recipes]
+    )
+
+
+def export_catalog(conn, label, catalog):
+    """Export a product catalog to the database, replacing the catalog with the same label.
+
+    Products whose hash matches the one stored for the catalog are left as
+    they are. The export is made in a single transaction.
+
+    Args:
+        conn (sqlite3.Connection): A connection made by open_database.
+        label (str): The label of the catalog in the database.
+        catalog (ProductCatalog): The catalog to export.
+
+    Returns:
+        ExportResult: the number of products written, unchanged, and removed.
+    """
+    by_name = {}
+    for product in catalog.products:
+        by_name.setdefault(product.name, []).append(product)
+    hashes = {name: hash_product(versions) for name, versions in by_name.items()}
+    exported_at = datetime.now(timezone.utc).isoformat()
+
+    with conn:
+        conn.execute(
+            'INSERT INTO catalogs (label, name, namespace, resource_version, exported_at) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (label) DO UPDATE SET name = excluded.name, namespace = excluded.namespace, '
+            'resource_version = excluded.resource_version, exported_at = excluded.exported_at',
+            (label, catalog.name, catalog.namespace, catalog.resource_version, exported_at)
+        )
+        catalog_id = conn.execute('SELECT id FROM catalogs WHERE label = ?', (label,)).fetchone()[0]
+        stored = {
+            name: (product_id, product_hash) for product_id, name, product_hash in conn.execute(
+                'SELECT id, name, hash FROM products WHERE catalog_id = ?', (catalog_id,)
+            )
+        }
+
+        removed = [product_id for name, (product_id, _) in stored.items() if name not in hashes]
+        changed = [name for name in by_name if stored.get(name, (None, None))[1] != hashes[name]]
+        conn.executemany('DELETE FROM products WHERE id = ?', [(product_id,) for product_id in removed] +
+                         [(stored[name][0],) for name in changed if name in stored])
+        for name in changed:
+            product_id = conn.execute(
+                'INSERT INTO products (catalog_id, name, hash) VALUES (?, ?, ?)', (catalog_id, name, hashes[name])
+            ).lastrowid
+            for product in by_name[name]:
+                _insert_version(conn, product_id, product)
+
+    return ExportResult(len(changed), len(by_name) - len(changed), len(removed))
+
+
+def load_catalog(source, include_archived=False):
+    """Load a ProductCatalog from a ConfigMap or a file.
+
+    Args:
+        source (str): 'configmap:[NAMESPACE/]NAME' (or 'cm:...') for a live
+            ConfigMap, in the services namespace by default, or the path of a
+            snapshot or a ConfigMap saved with kubectl.
+        include_archived (bool): If True, include archived versions of a live
+            ConfigMap.
+
+    Returns:
+        ProductCatalog: the catalog.
+
+    Raises:
+        ProductCatalogError: if the catalog could not be loaded.
+    """
+    for prefix in CONFIG_MAP_PREFIXES:
+        if source.startswith(prefix):
+            namespace, _, name = source[len(prefix):].rpartition('/')
+            return ProductCatalog(name, namespace or PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+                                  include_archived=include_archived)
+    return ProductCatalog.from_configmap_file(source)
+
+
+def parse_source(argument):
+    """Split a 'LABEL=SOURCE' argument into (label, source); the label is the source if not given."""
+    label, sep, source = argument.partition('=')
+    if not sep or label.startswith(CONFIG_MAP_PREFIXES):
+        return argument, argument
+    return label, source
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export product catalogs to a SQLite database.')
+    parser.add_argument('database', help='The path of the SQLite database, which is created if needed.')
+    parser.add_argument('catalogs', nargs='+', metavar='[LABEL=]SOURCE',
+                        help='configmap:[NAMESPACE/]NAME, or the path of a snapshot or saved ConfigMap.')
+    parser.add_argument('--include-archived', action='store_true',
+                        help='Include archived versions of catalogs read from ConfigMaps.')
+    args = parser.parse_args(argv)
+
+    status = 0
+    try:
+        conn = open_database(args.database)
+    except ExportError as err:
+        print(f'catalog_export: {err}', file=sys.stderr)
+        raise SystemExit(1)
+    with conn:
+        for argument in args.catalogs:
+            label, source = parse_source(argument)
+            try:
+                result = export_catalog(conn, label, load_catalog(source, args.include_archived))
+            except (ProductCatalogError, sqlite3.Error) as err:
+                print(f'catalog_export: {label}: {err}', file=sys.stderr)
+                status = 1
+                continue
+            print(f'{label}: {result.written} product(s) written, {result.unchanged} unchanged, '
+                  f'{result.removed} removed')
+    conn.close()
+    raise SystemExit(status)
+
+
+if __name__ == "__main__":
+    main()
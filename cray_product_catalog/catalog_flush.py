@@ -0,0 +1,196 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# This script applies the catalog requests spooled by catalog_update and
+# catalog_delete when CATALOG_SPOOL_DIR is set (see util/spool.py), so that
+# installs need not wait for the Kubernetes API server to be available.
+#
+# The spooled requests for each ConfigMap are applied in the order they were
+# spooled, merged into a single patch which is conditional on the
+# resourceVersion read, and removed from the spool only once the patch has
+# succeeded, so each request is applied at least once. A request which was
+# applied but not removed before a crash is applied again by the next flush.
+# That has no further effect unless another writer changed the same product
+# version in between, in which case the replayed update or delete is applied
+# on top of that change and overwrites the fields it sets. Requests which can
+# never be applied are moved to the spool's failed subdirectory.
+#
+# With CATALOG_FLUSH_INTERVAL set, the spool is flushed every that many
+# seconds until the process is stopped. Otherwise it is flushed once, and the
+# exit status is 1 if any requests remain spooled.
+from collections import OrderedDict
+import logging
+import os
+import time
+
+import urllib3
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError
+
+from cray_product_catalog.logging import configure_logging
+from cray_product_catalog.util.catalog_data import apply_requests
+from cray_product_catalog.util.journal import journal_from_env, record_patch, request_versions
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, read_config_map
+from cray_product_catalog.util.spool import (
+    SpoolError,
+    fail_request,
+    pending_requests,
+    read_request,
+    remove_requests,
+)
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+FLUSH_MAX_ATTEMPTS = 5
+
+LOGGER = logging.getLogger(__name__)
+
+
+def flush_config_map(api_instance, name, namespace, batch, journal=None, max_attempts=FLUSH_MAX_ATTEMPTS):
+    """Apply a batch of spooled requests to one ConfigMap in a single patch.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        batch (list): (path, request) tuples for the spooled requests, oldest
+            first.
+        journal (Journal, optional): A journal in which to record the changes.
+        max_attempts (int): The number of times to read and patch the
+            ConfigMap if it is changed by another writer in between.
+
+    Returns:
+        bool: True if the requests were applied and removed from the spool.
+
+    Raises:
+        MaxRetryError: if the API server could not be reached.
+    """
+    requests = [request for _, request in batch]
+    for attempt in range(1, max_attempts + 1):
+        try:
+            config_map = read_config_map(api_instance, name, namespace)
+        except ApiException as err:
+            if err.status == ERR_NOT_FOUND:
+                LOGGER.warning("ConfigMap %s/%s does not exist; leaving %s request(s) spooled",
+                               namespace, name, len(batch))
+            else:
+                LOGGER.error("Error reading ConfigMap %s/%s: %s", namespace, name, err.reason)
+            return False
+
+        errors = {}
+        config_map_data = config_map.data or {}
+        patch_data = apply_requests(
+            config_map_data, requests, on_error=lambda request, err, errors=errors: errors.__setitem__(id(request), err)
+        )
+        if patch_data:
+            body = client.V1ConfigMap(
+                metadata=client.V1ObjectMeta(name=name, resource_version=config_map.resource_version),
+                data=patch_data
+            )
+            try:
+                response = api_instance.patch_namespaced_config_map(name, namespace, body)
+            except ApiException as err:
+                if err.status == ERR_CONFLICT and attempt < max_attempts:
+                    LOGGER.warning("Conflict updating ConfigMap %s/%s", namespace, name)
+                    continue
+                LOGGER.error("Error patching ConfigMap %s/%s: %s", namespace, name, err.reason)
+                return False
+            if journal:
+                record_patch(journal.bind(api_instance, namespace), namespace, name, config_map_data, patch_data,
+                             request_versions(requests), response, config_map.resource_version)
+        break
+
+    applied = []
+    for path, request in batch:
+        if id(request) in errors:
+            LOGGER.error("Unable to apply spooled request %s: %s; moved to %s", path, errors[id(request)],
+                         fail_request(path))
+        else:
+            applied.append(path)
+    remove_requests(applied)
+    LOGGER.info("Applied %s spooled request(s) to ConfigMap %s/%s in %s patch(es)",
+                len(applied), namespace, name, int(bool(patch_data)))
+    return True
+
+
+def flush_spool(api_instance, spool_dir, journal=None, max_attempts=FLUSH_MAX_ATTEMPTS):
+    """Apply all the requests in a spool directory.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        spool_dir (str): The spool directory.
+        journal (Journal, optional): A journal in which to record the changes.
+        max_attempts (int): See flush_config_map.
+
+    Returns:
+        int: the number of requests left in the spool.
+
+    Raises:
+        SpoolError: if the spool directory could not be listed.
+    """
+    batches = OrderedDict()
+    for path in pending_requests(spool_dir):
+        try:
+            entry = read_request(path)
+        except SpoolError as err:
+            LOGGER.error("%s; moved to %s", err, fail_request(path))
+            continue
+        batches.setdefault((entry['namespace'], entry['name']), []).append((path, entry['request']))
+
+    for (namespace, name), batch in batches.items():
+        try:
+            flush_config_map(api_instance, name, namespace, batch, journal, max_attempts)
+        except MaxRetryError as err:
+            LOGGER.error("Unable to connect to Kubernetes to update ConfigMap %s/%s: %s", namespace, name, err)
+            break
+    return len(pending_requests(spool_dir))
+
+
+def main():
+    configure_logging()
+    SPOOL_DIR = os.environ.get("CATALOG_SPOOL_DIR", "").strip()
+    FLUSH_INTERVAL = float(os.environ.get("CATALOG_FLUSH_INTERVAL") or 0)
+    if not SPOOL_DIR:
+        LOGGER.error("The environment variable CATALOG_SPOOL_DIR must be specified")
+        raise SystemExit(1)
+
+    load_k8s()
+    api_instance = client.CoreV1Api(get_api_client())
+    journal = journal_from_env()
+    while True:
+        try:
+            remaining = flush_spool(api_instance, SPOOL_DIR, journal)
+        except SpoolError as err:
+            LOGGER.error("%s", err)
+            remaining = None
+        if not FLUSH_INTERVAL:
+            if remaining != 0:
+                raise SystemExit(1)
+            return
+        time.sleep(FLUSH_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# This script restores the product catalog ConfigMap from the backup made by
+# catalog_backup after a Helm upgrade or rollback:
+#
+# {BACKUP_CONFIG_MAP} or BACKUP_FILE ---> {CONFIG_MAP}
+#
+# Only products which are missing from the ConfigMap are restored, so products
+# written to it since the backup was made, e.g. by install Jobs, are kept. The
+# products restored are checked against the SHA-256 hash of each product's data
+# in the backup, and a backup file is checked against the hashes recorded in it
+# before anything is written. The backup ConfigMap is then deleted unless
+# KEEP_BACKUP is set.
+import logging
+import os
+
+import urllib3
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError
+
+from cray_product_catalog.constants import (
+    PRODUCT_CATALOG_BACKUP_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+)
+from cray_product_catalog.logging import configure_logging
+from cray_product_catalog.util.k8s import get_api_client, load_k8s, merge_config_map, read_config_map
+from cray_product_catalog.util.snapshot import SnapshotError, make_snapshot, read_snapshot, verify_hashes
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+LOGGER = logging.getLogger(__name__)
+
+
+def restore_catalog(api_instance, name, namespace, backup_name=None, backup_file=None, keep_backup=False):
+    """Restore a product catalog ConfigMap from a backup ConfigMap or file.
+
+    Products in the backup which are missing from the product catalog
+    ConfigMap are added to it, and the ConfigMap is created if it does not
+    exist. Products which it already has are left as they are, since they
+    may have been written after the backup was made.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the product catalog ConfigMap.
+        namespace (str): The namespace of both ConfigMaps.
+        backup_name (str, optional): The name of the backup ConfigMap. Only
+            used if `backup_file` is not given.
+        backup_file (str, optional): The path of the backup snapshot file.
+        keep_backup (bool): If True, do not delete the backup ConfigMap.
+
+    Returns:
+        Snapshot: the data restored.
+
+    Raises:
+        ApiException: if a ConfigMap could not be read, written, or deleted.
+        SnapshotError: if the backup file could not be read, or the backup
+            or the restored data did not match the hashes.
+    """
+    labels = None
+    if backup_file:
+        snapshot = read_snapshot(backup_file)
+        if snapshot.hashes is None:
+            snapshot = make_snapshot(snapshot.data)
+        else:
+            verify_hashes(snapshot.data, snapshot.hashes)
+        LOGGER.info("Read %s product(s) from %s", len(snapshot.data), backup_file)
+    else:
+        config_map = read_config_map(api_instance, backup_name, namespace)
+        snapshot = make_snapshot(config_map.data)
+        labels = config_map.labels
+        LOGGER.info("Read %s product(s) from ConfigMap %s/%s", len(snapshot.data), namespace, backup_name)
+
+    written, restored = merge_config_map(api_instance, name, namespace, snapshot.data, labels)
+    try:
+        written_data = written.data or {}
+        verify_hashes({product: written_data[product] for product in restored if product in written_data},
+                      {product: snapshot.hashes[product] for product in restored})
+    except SnapshotError as err:
+        raise SnapshotError(f'ConfigMap {namespace}/{name} was not restored correctly: {err}')
+    LOGGER.info("Restored %s of %s product(s) to ConfigMap %s/%s; the others were already present",
+                len(restored), len(snapshot.data), namespace, name)
+    if not backup_file and not keep_backup:
+        api_instance.delete_namespaced_config_map(backup_name, namespace)
+        LOGGER.info("Deleted ConfigMap %s/%s", namespace, backup_name)
+    return snapshot
+
+
+def main():
+    configure_logging()
+    CONFIG_MAP = os.environ.get("CONFIG_MAP", PRODUCT_CATALOG_CONFIG_MAP_NAME).strip()
+    CONFIG_MAP_NS = os.environ.get("CONFIG_MAP_NAMESPACE", PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE).strip()
+    BACKUP_CONFIG_MAP = os.environ.get("BACKUP_CONFIG_MAP", PRODUCT_CATALOG_BACKUP_CONFIG_MAP_NAME).strip()
+    BACKUP_FILE = os.environ.get("BACKUP_FILE", "").strip() or None
+    KEEP_BACKUP = bool(os.environ.get("KEEP_BACKUP"))
+
+    load_k8s()
+    api_instance = client.CoreV1Api(get_api_client(retries=100))
+    try:
+        restore_catalog(api_instance, CONFIG_MAP, CONFIG_MAP_NS, BACKUP_CONFIG_MAP, BACKUP_FILE, KEEP_BACKUP)
+    except ApiException as err:
+        LOGGER.error("Error restoring ConfigMap %s/%s: %s", CONFIG_MAP_NS, CONFIG_MAP, err.reason)
+        raise SystemExit(1)
+    except (MaxRetryError, SnapshotError) as err:
+        LOGGER.error("Error restoring ConfigMap %s/%s: %s", CONFIG_MAP_NS, CONFIG_MAP, err)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# This script rebuilds the product catalog as it was at an earlier time or
+# resourceVersion by undoing the changes recorded since then in the journal
+# kept by catalog_update and catalog_delete (see util/journal.py):
+#
+#   catalog_rewind --time 2023-06-01T12:00:00Z
+#   catalog_rewind --resource-version 4567 --apply
+#   catalog_rewind --time 2023-06-01T12:00 --catalog saved.json --journal journal.jsonl --output rewound.json
+#
+# The differences between the current catalog and the rewound catalog are
+# written to stdout. With --apply, the products which differ are patched in
+# the ConfigMap, provided it has not changed since it was read. With
+# --output, the rewound catalog is written to a snapshot file.
+import argparse
+import sys
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from kubernetes.config import ConfigException
+from urllib3.exceptions import MaxRetryError
+from yaml import YAMLError
+
+from cray_product_catalog.catalog_diff import CONFIG_MAP_PREFIXES, diff_catalogs, load_catalog
+from cray_product_catalog.constants import (
+    PRODUCT_CATALOG_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+    PRODUCT_CATALOG_JOURNAL_CONFIG_MAP_NAME,
+)
+from cray_product_catalog.util.journal import ConfigMapJournal, FileJournal, JournalError, parse_time, rewind
+from cray_product_catalog.util.k8s import get_api_client, load_k8s
+from cray_product_catalog.util.snapshot import Snapshot, SnapshotError, write_snapshot
+
+ERR_CONFLICT = 409
+
+
+def _config_map_name(source):
+    """Return (namespace, name) for a 'configmap:[NAMESPACE/]NAME' source, or None for a file."""
+    for prefix in CONFIG_MAP_PREFIXES:
+        if source.startswith(prefix):
+            namespace, _, name = source[len(prefix):].rpartition('/')
+            return namespace or PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE, name
+    return None
+
+
+def _api():
+    try:
+        load_k8s()
+    except ConfigException as err:
+        raise JournalError(f'Unable to load kubernetes configuration: {err}')
+    return client.CoreV1Api(get_api_client())
+
+
+def load_journal(source):
+    """Load the entries of a journal ConfigMap or file.
+
+    Args:
+        source (str): 'configmap:[NAMESPACE/]NAME' (or 'cm:...') for a
+            journal ConfigMap, in the services namespace by default, or the
+            path of a journal file.
+
+    Returns:
+        list of dict: the journal entries, oldest first.
+
+    Raises:
+        JournalError: if the journal could not be read.
+    """
+    config_map = _config_map_name(source)
+    if config_map is None:
+        return FileJournal(source).entries()
+    namespace, name = config_map
+    return ConfigMapJournal(name, namespace, _api()).entries()
+
+
+def apply_rewind(api_instance, catalog, data):
+    """Patch the products of a catalog ConfigMap which differ from the given data.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        catalog (Snapshot): The catalog ConfigMap as it was read.
+        data (dict): The catalog data to write.
+
+    Returns:
+        int: the number of products patched.
+
+    Raises:
+        JournalError: if the ConfigMap has changed since it was read, or
+            could not be patched.
+    """
+    patch_data = {
+        product: data.get(product) for product in set(catalog.data) | set(data)
+        if catalog.data.get(product) != data.get(product)
+    }
+    if not patch_data:
+        return 0
+    body = client.V1ConfigMap(
+        metadata=client.V1ObjectMeta(name=catalog.name, resource_version=catalog.resource_version),
+        data=patch_data
+    )
+    try:
+        api_instance.patch_namespaced_config_map(catalog.name, catalog.namespace, body)
+    except ApiException as err:
+        if err.status == ERR_CONFLICT:
+            raise JournalError(f'ConfigMap {catalog.namespace}/{catalog.name} changed while it was being '
+                               f'rewound; try again')
+        raise JournalError(f'Error patching ConfigMap {catalog.namespace}/{catalog.name}: {err.reason}')
+    except MaxRetryError as err:
+        raise JournalError(f'Unable to connect to Kubernetes to patch ConfigMap '
+                           f'{catalog.namespace}/{catalog.name}: {err}')
+    return len(patch_data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rewind the product catalog using its journal.')
+    point = parser.add_mutually_exclusive_group(required=True)
+    point.add_argument('--time', help='The ISO 8601 time to rewind to, in UTC unless an offset is given.')
+    point.add_argument('--resource-version', help='The resourceVersion of the catalog ConfigMap to rewind to.')
+    parser.add_argument('--catalog', default=f'configmap:{PRODUCT_CATALOG_CONFIG_MAP_NAME}',
+                        help='configmap:[NAMESPACE/]NAME, or the path of a snapshot or saved ConfigMap.')
+    parser.add_argument('--journal', default=f'configmap:{PRODUCT_CATALOG_JOURNAL_CONFIG_MAP_NAME}',
+                        help='configmap:[NAMESPACE/]NAME, or the path of a journal file.')
+    parser.add_argument('--output', help='Write the rewound catalog to this snapshot file.')
+    parser.add_argument('--apply', action='store_true', help='Patch the catalog ConfigMap with the rewound catalog.')
+    args = parser.parse_args(argv)
+
+    if args.apply and _config_map_name(args.catalog) is None:
+        parser.error('--apply requires the catalog to be a ConfigMap')
+
+    try:
+        time = parse_time(args.time) if args.time else None
+        catalog = load_catalog(args.catalog)
+        entries = load_journal(args.journal)
+        data = rewind(catalog.data, entries, time=time, resource_version=args.resource_version,
+                      name=catalog.name, namespace=catalog.namespace)
+        diff_catalogs(catalog, Snapshot(data), sys.stdout)
+        if args.output:
+            write_snapshot(args.output, Snapshot(data, None, catalog.name, catalog.namespace))
+        if args.apply:
+            count = apply_rewind(_api(), catalog, data)
+            print(f'Patched {count} product(s) in ConfigMap {catalog.namespace}/{catalog.name}', file=sys.stderr)
+    except (JournalError, SnapshotError) as err:
+        print(f'catalog_rewind: {err}', file=sys.stderr)
+        raise SystemExit(1)
+    except YAMLError as err:
+        print(f'catalog_rewind: Failed to load product data: {err}', file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
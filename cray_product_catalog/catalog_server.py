@@ -0,0 +1,415 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# This script runs the catalog query service, a long-running, read-only HTTP
+# server which answers queries about installed products from one in-memory
+# copy of the product catalog. The copy is kept up to date by watching the
+# ConfigMap, so clients do not each read the whole ConfigMap from the API
+# server to look up a few fields.
+#
+# Every response to a query carries an ETag derived from the resourceVersion
+# of the ConfigMap, and a request with a matching If-None-Match header is
+# answered with 304 Not Modified and no body.
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import MappingProxyType
+from urllib.parse import unquote, urlsplit
+
+import urllib3
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from pkg_resources import parse_version
+from urllib3.exceptions import HTTPError
+
+from cray_product_catalog.constants import (
+    PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAME,
+    PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+)
+from cray_product_catalog.logging import configure_logging
+from cray_product_catalog.query import ProductCatalog, ProductCatalogError
+from cray_product_catalog.util import metrics
+from cray_product_catalog.util.k8s import MAX_WATCH_SECONDS, ConfigMapContent
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+LOGGER = logging.getLogger(__name__)
+
+# A response to a query: the HTTP status and the encoded JSON body.
+Response = namedtuple('Response', ('status', 'body'))
+
+
+def _json_default(value):
+    """Encode the read-only mappings of catalogs loaded with intern_data as JSON objects."""
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _product_version(product):
+    """Return the JSON representation of an InstalledProductVersion."""
+    return {
+        'name': product.name,
+        'version': product.version,
+        'active': product.active,
+        'archived': product.archived,
+        'data': product.data,
+    }
+
+
+class CatalogIndex:
+    """An immutable, indexed view of one version of the product catalog.
+
+    Responses which found something are computed from the view on first use
+    and then reused until the catalog changes and a new CatalogIndex replaces
+    this one.
+
+    Attributes:
+        etag (str): The ETag of every query response, derived from the
+            resourceVersion of the config maps.
+        products (dict): A mapping from (name, version) to the
+            InstalledProductVersion.
+        versions (dict): A mapping from product name to its versions, from
+            oldest to newest.
+        docker_images (dict): A mapping from Docker image name to the
+            product versions which include it.
+        repositories (dict): A mapping from repository name to the product
+            versions which include it.
+    """
+    def __init__(self, catalog):
+        """Build the index of the catalog's current products.
+
+        The catalog must not be refreshed while the index is built.
+
+        Args:
+            catalog (ProductCatalog): The product catalog.
+        """
+        resource_versions = [catalog.resource_version]
+        if catalog.include_archived:
+            resource_versions.append(catalog.archive_resource_version or '')
+        self.etag = '"' + '.'.join(resource_versions) + '"'
+
+        # Queries must only use what is captured here, since the catalog may
+        # be refreshed while this index is still serving requests.
+        self.products = {(product.name, product.version): product for product in catalog.products}
+        self.versions = {}
+        self.docker_images = {}
+        self.repositories = {}
+        for product in self.products.values():
+            self.versions.setdefault(product.name, []).append(product.version)
+            for image_name, image_version in product.docker_images:
+                self.docker_images.setdefault(image_name, []).append(
+                    {'name': product.name, 'version': product.version, 'image_version': image_version}
+                )
+            for repository in product.repositories:
+                self.repositories.setdefault(repository.get('name'), []).append(
+                    {'name': product.name, 'version': product.version, 'type': repository.get('type')}
+                )
+        for versions in self.versions.values():
+            versions.sort(key=parse_version)
+        self._responses = {}
+
+    def get(self, path):
+        """Get the response to a query.
+
+        Only responses which found something in the index are cached, keyed
+        by the decoded parts of the path, so the cache cannot grow beyond
+        the size of the index however many different paths are queried.
+
+        Args:
+            path (str): The path of the query, e.g. /v1/products/sat/latest.
+
+        Returns:
+            Response: the response.
+        """
+        parts = tuple(unquote(part) for part in path.strip('/').split('/'))
+        response = self._responses.get(parts)
+        if response is None:
+            status, obj = self._query(path, parts)
+            response = Response(status, json.dumps(obj, default=_json_default).encode())
+            if status == 200 and obj:
+                self._responses[parts] = response
+        return response
+
+    def _query(self, path, parts):
+        """Return the (status, object) response to a query with the given decoded path parts."""
+        if parts[:1] != ('v1',) or len(parts) < 2:
+            return 404, {'error': f'Unknown path {path}'}
+        resource, args = parts[1], parts[2:]
+
+        if resource == 'products' and not args:
+            return 200, self.versions
+        if resource == 'products' and args[0] not in self.versions:
+            return 404, {'error': f'No installed products with name {args[0]}.'}
+        if resource == 'products' and len(args) == 1:
+            return 200, [_product_version(self.products[(args[0], version)]) for version in self.versions[args[0]]]
+        if resource == 'products' and len(args) == 2:
+            name, version = args
+            if version == 'latest':
+                version = self.versions[name][-1]
+            if (name, version) not in self.products:
+                return 404, {'error': f'No installed products with name {name} and version {version}.'}
+            return 200, _product_version(self.products[(name, version)])
+        if resource == 'active' and not args:
+            return 200, {name: version for (name, version), product in self.products.items() if product.active}
+        if resource == 'images' and args:
+            # Docker image names contain slashes, e.g. cray/cray-sat.
+            return 200, self.docker_images.get('/'.join(args), [])
+        if resource == 'repositories' and len(args) == 1:
+            return 200, self.repositories.get(args[0], [])
+        return 404, {'error': f'Unknown path {path}'}
+
+
+class CatalogQueryService:
+    """Keeps an up-to-date CatalogIndex of a product catalog ConfigMap.
+
+    Attributes:
+        catalog (ProductCatalog): The product catalog, refreshed only by
+            this service.
+        index (CatalogIndex): The index of the current catalog. It is
+            replaced, never modified, so it can be read without a lock.
+        refresh_interval (float): Seconds to wait before refreshing again
+            when the ConfigMap cannot be watched.
+    """
+    def __init__(self, catalog, refresh_interval=30):
+        """Create the CatalogQueryService.
+
+        Args:
+            catalog (ProductCatalog): The loaded product catalog.
+            refresh_interval (float): See the attribute of the same name.
+        """
+        self.catalog = catalog
+        self.index = CatalogIndex(catalog)
+        self.refresh_interval = refresh_interval
+        # Serializes loading the catalog and publishing its index, which the
+        # catalog and archive watches both do
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def refresh(self):
+        """Reload the catalog if it has changed and publish a new index.
+
+        Errors are logged, and the current index is kept.
+
+        Returns:
+            bool: True if a new index was published.
+        """
+        with self._lock:
+            try:
+                if not self.catalog.refresh():
+                    return False
+            except ProductCatalogError as err:
+                LOGGER.warning("Unable to refresh product catalog: %s", err)
+                return False
+            self.index = CatalogIndex(self.catalog)
+        LOGGER.info("Loaded product catalog at resourceVersion %s", self.catalog.resource_version)
+        return True
+
+    def _apply_event(self, name, event):
+        """Load the catalog from the ConfigMap in a watch event and publish a new index.
+
+        Errors are logged, and the current index is kept.
+        """
+        metadata = event['raw_object']['metadata']
+        data = None if event['type'] == 'DELETED' else event['raw_object'].get('data') or {}
+        content = ConfigMapContent(data, metadata['resourceVersion'], metadata.get('labels'))
+        with self._lock:
+            try:
+                if name == self.catalog.name:
+                    self.catalog.refresh_from(config_map=content)
+                else:
+                    self.catalog.refresh_from(archive_config_map=content)
+            except ProductCatalogError as err:
+                LOGGER.warning("Unable to load product catalog from ConfigMap %s/%s: %s",
+                               self.catalog.namespace, name, err)
+                return
+            self.index = CatalogIndex(self.catalog)
+        LOGGER.info("Loaded product catalog at resourceVersion %s", self.catalog.resource_version)
+
+    def _resource_version(self, name):
+        """Return the resourceVersion of the catalog or archive ConfigMap that was loaded."""
+        if name == self.catalog.name:
+            return self.catalog.resource_version
+        return self.catalog.archive_resource_version
+
+    def _watch_once(self, name, resource_version):
+        """Apply each change to a ConfigMap until the watch ends.
+
+        Returns:
+            str: the last resourceVersion seen, to watch from next.
+        """
+        catalog = self.catalog
+        config_map_watch = watch.Watch()
+        for event in config_map_watch.stream(
+            catalog.k8s_client.list_namespaced_config_map, catalog.namespace,
+            field_selector=f'metadata.name={name}', resource_version=resource_version,
+            timeout_seconds=MAX_WATCH_SECONDS, _request_timeout=MAX_WATCH_SECONDS + 10
+        ):
+            if self._stopped.is_set():
+                config_map_watch.stop()
+                break
+            resource_version = event['raw_object']['metadata']['resourceVersion']
+            if event['type'] != 'BOOKMARK':
+                self._apply_event(name, event)
+        return resource_version
+
+    def _watch(self, name):
+        """Watch a ConfigMap and apply its changes until stop() is called."""
+        resource_version = self._resource_version(name)
+        while not self._stopped.is_set():
+            try:
+                resource_version = self._watch_once(name, resource_version)
+                continue
+            except ApiException as err:
+                if err.status == 410:
+                    # The resourceVersion is too old to watch from, so load the
+                    # catalog again at once and watch from there.
+                    LOGGER.debug("Watch of ConfigMap %s/%s expired", self.catalog.namespace, name)
+                    self.refresh()
+                    resource_version = self._resource_version(name)
+                    continue
+                LOGGER.debug("Unable to watch ConfigMap %s/%s: %s", self.catalog.namespace, name, err.reason)
+            except HTTPError as err:
+                LOGGER.debug("Unable to watch ConfigMap %s/%s: %s", self.catalog.namespace, name, err)
+            self._stopped.wait(self.refresh_interval)
+            self.refresh()
+            resource_version = self._resource_version(name)
+
+    def run(self):
+        """Watch the ConfigMap, and the archive ConfigMap if it is included, until stop() is called.
+
+        Each change seen by a watch is loaded from the watch event without
+        reading the ConfigMap again. If a ConfigMap cannot be watched, the
+        catalog is refreshed every refresh_interval seconds instead.
+        Refreshing an unchanged catalog only reads the metadata of the
+        ConfigMaps.
+        """
+        if self.catalog.include_archived:
+            threading.Thread(target=self._watch, args=(self.catalog.archive_name,), name='archive-watcher',
+                             daemon=True).start()
+        self._watch(self.catalog.name)
+
+    def stop(self):
+        """Stop run() after the current watch event or refresh."""
+        self._stopped.set()
+
+
+class CatalogQueryRequestHandler(BaseHTTPRequestHandler):
+    """Answer product catalog queries over HTTP from the server's service.
+
+    GET /v1/products                            versions of each product
+    GET /v1/products/{name}                     all versions of a product
+    GET /v1/products/{name}/{version}           one version of a product
+    GET /v1/products/{name}/latest              the latest version of a product
+    GET /v1/active                              the active version of each product
+    GET /v1/images/{image name}                 product versions including a Docker image
+    GET /v1/repositories/{repository name}      product versions including a repository
+    GET /metrics                                metrics in the Prometheus text format
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body, etag=None, content_type='application/json'):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status == 304:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/healthz':
+            self._send(200, b'{"status": "ok"}')
+            return
+        if path == '/metrics':
+            self._send(200, metrics.REGISTRY.render().encode(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+            return
+
+        index = self.server.service.index
+        response = index.get(path)
+        if response.status != 200:
+            self._send(response.status, response.body)
+            return
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            if index.etag in tags or '*' in tags:
+                self._send(304, b'', index.etag)
+                return
+        self._send(200, response.body, index.etag)
+
+
+def make_server(service, address='', port=8080):
+    """Create an HTTP server that answers queries from the given service."""
+    server = ThreadingHTTPServer((address, port), CatalogQueryRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main():
+    configure_logging()
+    CONFIG_MAP = os.environ.get("CONFIG_MAP", PRODUCT_CATALOG_CONFIG_MAP_NAME).strip()
+    CONFIG_MAP_NS = os.environ.get("CONFIG_MAP_NAMESPACE", PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE).strip()
+    ADDRESS = os.environ.get("CATALOG_SERVER_ADDRESS", "").strip()
+    PORT = int(os.environ.get("CATALOG_SERVER_PORT", "8080"))
+    REFRESH_INTERVAL = float(os.environ.get("CATALOG_SERVER_REFRESH_SECONDS", "30"))
+    INCLUDE_ARCHIVED = bool(os.environ.get("INCLUDE_ARCHIVED"))
+    ARCHIVE_CONFIG_MAP = os.environ.get("ARCHIVE_CONFIG_MAP", PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME).strip()
+    INTERN_DATA = bool(os.environ.get("CATALOG_SERVER_INTERN_DATA"))
+
+    try:
+        catalog = ProductCatalog(CONFIG_MAP, CONFIG_MAP_NS, include_archived=INCLUDE_ARCHIVED,
+                                 archive_name=ARCHIVE_CONFIG_MAP, intern_data=INTERN_DATA)
+    except ProductCatalogError as err:
+        LOGGER.error("%s", err)
+        raise SystemExit(1)
+    service = CatalogQueryService(catalog, refresh_interval=REFRESH_INTERVAL)
+
+    watcher = threading.Thread(target=service.run, name='catalog-watcher', daemon=True)
+    watcher.start()
+    metrics.start_file_exporter()
+    server = make_server(service, ADDRESS, PORT)
+    LOGGER.info("Catalog query service listening on %s:%s", ADDRESS or '*', PORT)
+    try:
+        server.serve_forever()
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -33,29 +33,31 @@
 # attempt to update the config map until it has been patched successfully.
 import logging
 import os
-import random
-import time
 import urllib3
-from urllib3.util.retry import Retry
 
 from jsonschema.exceptions import ValidationError
-from kubernetes import client
-from kubernetes.client.api_client import ApiClient
-from kubernetes.client.models.v1_config_map import V1ConfigMap
-from kubernetes.client.models.v1_object_meta import V1ObjectMeta
-from kubernetes.client.rest import ApiException
 import yaml
 
+from cray_product_catalog.catalog_coordinator import (
+    CoordinatorError,
+    CoordinatorUnavailableError,
+    submit_request,
+)
+from cray_product_catalog.fanout import report, targets_from_env, update_all
 from cray_product_catalog.logging import configure_logging
 from cray_product_catalog.schema.validate import validate
+from cray_product_catalog.util import catalog_write, metrics, tracing
+from cray_product_catalog.util.catalog_data import update_request
+from cray_product_catalog.util.deadline import DEADLINE_EXCEEDED_EXIT_CODE, Deadline, DeadlineExceeded
+from cray_product_catalog.util.journal import journal_from_env
 from cray_product_catalog.util.k8s import load_k8s
-from cray_product_catalog.util.merge_dict import merge_dict
+from cray_product_catalog.util.spool import SpoolError, spool_request
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # Parameters to identify config map and content in it to update
-PRODUCT = os.environ.get("PRODUCT").strip()  # required
-PRODUCT_VERSION = os.environ.get("PRODUCT_VERSION").strip()  # required
+PRODUCT = os.environ.get("PRODUCT", "").strip()  # required
+PRODUCT_VERSION = os.environ.get("PRODUCT_VERSION", "").strip()  # required
 CONFIG_MAP = os.environ.get("CONFIG_MAP", "cray-product-catalog").strip()
 CONFIG_MAP_NAMESPACE = os.environ.get("CONFIG_MAP_NAMESPACE", "services").strip()
 # One of (YAML_CONTENT_FILE, YAML_CONTENT_STRING) required. For backwards compatibility, YAML_CONTENT
@@ -65,9 +67,20 @@ YAML_CONTENT_STRING = os.environ.get("YAML_CONTENT_STRING", "").strip()   # see
 SET_ACTIVE_VERSION = bool(os.environ.get("SET_ACTIVE_VERSION"))
 REMOVE_ACTIVE_FIELD = bool(os.environ.get("REMOVE_ACTIVE_FIELD"))
 VALIDATE_SCHEMA = bool(os.environ.get("VALIDATE_SCHEMA"))
-
-ERR_NOT_FOUND = 404
-ERR_CONFLICT = 409
+# When set, submit the update to a catalog coordinator instead of patching the
+# ConfigMap directly (see catalog_coordinator.py).
+CATALOG_COORDINATOR_URL = os.environ.get("CATALOG_COORDINATOR_URL", "").strip()
+CATALOG_COORDINATOR_TIMEOUT = float(os.environ.get("CATALOG_COORDINATOR_TIMEOUT", "300"))
+# When set, write the update to this local directory and return at once, for
+# catalog_flush to apply to the ConfigMap later (see catalog_flush.py).
+CATALOG_SPOOL_DIR = os.environ.get("CATALOG_SPOOL_DIR", "").strip()
+# When set to 'lease', hold a coordination.k8s.io Lease for each read-modify-write
+# of the ConfigMap instead of relying only on resourceVersion conflicts.
+CATALOG_LOCK = os.environ.get("CATALOG_LOCK", "").strip().lower()
+CATALOG_LOCK_DURATION = int(os.environ.get("CATALOG_LOCK_DURATION", "15"))
+# Seconds to wait for the ConfigMap to be created if it does not exist. Wait
+# indefinitely if unset.
+CONFIG_MAP_WAIT_TIMEOUT = float(os.environ.get("CONFIG_MAP_WAIT_TIMEOUT") or 0) or None
 
 LOGGER = logging.getLogger(__name__)
 
@@ -87,154 +100,39 @@ def validate_schema(data):
 def read_yaml_content(yaml_file):
     """ Read and return the raw content contained in the `yaml_file`. """
     LOGGER.debug("Retrieving content from %s", yaml_file)
-    with open(yaml_file) as yfile:
+    with open(yaml_file) as yfile, tracing.span('yaml.safe_load'):
         return yaml.safe_load(yfile)
 
 
 def read_yaml_content_string(yaml_string):
     """ Read and return the raw content contained in the `yaml_string` string. """
     LOGGER.debug("Retrieving raw content specified as a string")
-    return yaml.safe_load(yaml_string)
-
-
-def set_active_version(product_data):
-    """ Modify product_data in place to set the 'active' key for PRODUCT_VERSION.
-
-    This also sets the 'active' key for other versions in product_data to False."""
-    # Set the current version to 'active'
-    for version in product_data:
-        product_data[version]['active'] = version == PRODUCT_VERSION
-
-
-def current_version_is_active(product_data):
-    """ Return True if PRODUCT_VERSION is active and no other version of the product is active."""
-    current_version = product_data[PRODUCT_VERSION]
-    other_versions = [version for version in product_data if version != PRODUCT_VERSION]
-
-    return current_version.get('active') and not any(
-               [product_data[version].get('active') for version in other_versions]
-           )
-
+    with tracing.span('yaml.safe_load'):
+        return yaml.safe_load(yaml_string)
 
-def remove_active_field(product_data):
-    """ Remove the 'active' field for a given product. """
-    LOGGER.info(f"Deleting 'active' field for all versions of %s", PRODUCT)
-    for version in product_data:
-        if "active" in product_data[version]:
-            del product_data[version]["active"]
 
+def update_config_map(data, name, namespace, product=PRODUCT, product_version=PRODUCT_VERSION,
+                      set_active=SET_ACTIVE_VERSION, remove_active=REMOVE_ACTIVE_FIELD,
+                      lock_mode=CATALOG_LOCK, lock_duration=CATALOG_LOCK_DURATION,
+                      wait_timeout=CONFIG_MAP_WAIT_TIMEOUT, **kwargs):
+    """Add `data` to the config map, with defaults taken from the environment.
 
-def active_field_exists(product_data):
-    """ Return True if any version of the given product is using the 'active' field."""
-    return any("active" in product_data[version] for version in product_data)
-
-
-def update_config_map(data, name, namespace):
-    """
-    Get the config map `data` to be added.
-
-    1. Wait for the config map to be present in the namespace
-    2. Read the config map
-    3. Patch the config_map
-    4. Read back the config_map
-    5. Repeat steps 2-4 if config_map does not include the changes requested,
-       or if step 3 failed due to a conflict.
+    See util.catalog_write.update_config_map, which takes the same arguments.
     """
-    k8sclient = ApiClient()
-    retries = 100
-    retry = Retry(
-        total=retries, read=retries, connect=retries, backoff_factor=0.3,
-        status_forcelist=(500, 502, 503, 504)
-    )
-    k8sclient.rest_client.pool_manager.connection_pool_kw['retries'] = retry
-    api_instance = client.CoreV1Api(k8sclient)
-    attempt = 0
-
-    while True:
-
-        # Wait a while to check the config map in case multiple products are
-        # attempting to update the same config map, or the config map doesn't
-        # exist yet
-        attempt += 1
-        sleepy_time = random.randint(1, 3)
-        LOGGER.debug("Resting %ss before reading ConfigMap", sleepy_time)
-        time.sleep(sleepy_time)
-
-        # Read in the config map
-        try:
-            response = api_instance.read_namespaced_config_map(name, namespace)
-        except ApiException as e:
-            LOGGER.exception("Error calling read_namespaced_config_map")
-
-            # Config map doesn't exist yet
-            if e.status == ERR_NOT_FOUND:
-                LOGGER.warning("ConfigMap %s/%s doesn't exist, attempting again", namespace, name)
-                continue
-            else:
-                raise  # unrecoverable
-
-        # Determine if ConfigMap needs to be updated
-        config_map_data = response.data or {}  # if no config map data exists
-        if PRODUCT not in config_map_data:
-            LOGGER.info("Product=%s does not exist; will update", PRODUCT)
-            config_map_data[PRODUCT] = product_data = {PRODUCT_VERSION: {}}
-        # Product exists in ConfigMap
-        else:
-            product_data = yaml.safe_load(config_map_data[PRODUCT])
-            if PRODUCT_VERSION not in product_data:
-                LOGGER.info(
-                    "Version=%s does not exist; will update", PRODUCT_VERSION
-                )
-                product_data[PRODUCT_VERSION] = {}
-            # Key with same version exists in ConfigMap
-            else:
-                # Data to insert matches data found in configmap.
-                if merge_dict(data, product_data[PRODUCT_VERSION]) == product_data[PRODUCT_VERSION]:
-                    if SET_ACTIVE_VERSION and REMOVE_ACTIVE_FIELD:
-                        # This should not happen (see main method).
-                        raise SystemExit(1)
-                    elif SET_ACTIVE_VERSION:
-                        if current_version_is_active(product_data):
-                            LOGGER.debug("ConfigMap data updates exist and desired version is active; Exiting")
-                            break
-                    elif REMOVE_ACTIVE_FIELD:
-                        if not active_field_exists(product_data):
-                            LOGGER.debug("ConfigMap data updates exist and 'active' field has been cleared; Exiting")
-                            break
-                    else:
-                        LOGGER.debug("ConfigMap data updates exist; Exiting")
-                        break
-
-        # Patch the config map if needed
-        product_data[PRODUCT_VERSION] = merge_dict(data, product_data[PRODUCT_VERSION])
-        if SET_ACTIVE_VERSION:
-            set_active_version(product_data)
-        if REMOVE_ACTIVE_FIELD:
-            remove_active_field(product_data)
-        config_map_data[PRODUCT] = yaml.safe_dump(
-            product_data, default_flow_style=False
-        )
-        LOGGER.debug("ConfigMap update attempt=%s", attempt)
-        try:
-            new_config_map = V1ConfigMap(data=config_map_data)
-            new_config_map.metadata = V1ObjectMeta(
-                name=name, resource_version=response.metadata.resource_version
-            )
-            api_instance.patch_namespaced_config_map(
-                name, namespace, body=new_config_map
-            )
-        except ApiException as e:
-            if e.status == ERR_CONFLICT:
-                # A conflict is raised if the resourceVersion field was unexpectedly
-                # incremented, e.g. if another process updated the config map. This
-                # provides concurrency protection.
-                LOGGER.warning("Conflict updating config map")
-            else:
-                LOGGER.exception("Error calling replace_namespaced_config_map")
+    return catalog_write.update_config_map(data, name, namespace, product, product_version, set_active=set_active,
+                                           remove_active=remove_active, lock_mode=lock_mode,
+                                           lock_duration=lock_duration, wait_timeout=wait_timeout, **kwargs)
 
 
+@metrics.report_at_exit
+@tracing.traced('catalog_update')
 def main():
     configure_logging()
+    deadline = Deadline.from_env()
+    if not PRODUCT or not PRODUCT_VERSION:
+        LOGGER.error("The environment variables PRODUCT and PRODUCT_VERSION must be specified")
+        raise SystemExit(1)
+
     LOGGER.info(
         "Updating config_map=%s in namespace=%s for product/version=%s/%s",
         CONFIG_MAP, CONFIG_MAP_NAMESPACE, PRODUCT, PRODUCT_VERSION
@@ -257,7 +155,6 @@ def main():
             "Product %s will have 'active' value cleared because REMOVE_ACTIVE_FIELD was set", PRODUCT
         )
 
-    load_k8s()
     if YAML_CONTENT_FILE:
         data = read_yaml_content(YAML_CONTENT_FILE)
     elif YAML_CONTENT_STRING:
@@ -271,7 +168,48 @@ def main():
     if VALIDATE_SCHEMA:
         validate_schema(data)
 
-    update_config_map(data, CONFIG_MAP, CONFIG_MAP_NAMESPACE)
+    journal = journal_from_env()
+    targets = targets_from_env(CONFIG_MAP_NAMESPACE)
+    if targets:
+        LOGGER.info("Updating config_map=%s in %s namespace(s)/context(s)", CONFIG_MAP, len(targets))
+        if any(target.context is None for target in targets):
+            load_k8s()
+        status = report(update_all(targets, data, CONFIG_MAP, PRODUCT, PRODUCT_VERSION,
+                                   set_active=SET_ACTIVE_VERSION, remove_active=REMOVE_ACTIVE_FIELD,
+                                   lock_mode=CATALOG_LOCK, lock_duration=CATALOG_LOCK_DURATION,
+                                   wait_timeout=CONFIG_MAP_WAIT_TIMEOUT, deadline=deadline, journal=journal))
+        if status:
+            raise SystemExit(status)
+        return
+
+    request = update_request(PRODUCT, PRODUCT_VERSION, data, SET_ACTIVE_VERSION, REMOVE_ACTIVE_FIELD)
+    if CATALOG_SPOOL_DIR:
+        try:
+            path = spool_request(CATALOG_SPOOL_DIR, CONFIG_MAP, CONFIG_MAP_NAMESPACE, request)
+            LOGGER.info("ConfigMap update spooled to %s for catalog_flush to apply", path)
+            return
+        except SpoolError as err:
+            LOGGER.warning("%s; updating ConfigMap directly", err)
+
+    if CATALOG_COORDINATOR_URL:
+        try:
+            submit_request(CATALOG_COORDINATOR_URL, CONFIG_MAP, CONFIG_MAP_NAMESPACE, request,
+                           timeout=deadline.limit(CATALOG_COORDINATOR_TIMEOUT))
+            LOGGER.info("ConfigMap update applied by catalog coordinator")
+            return
+        except CoordinatorUnavailableError as err:
+            LOGGER.warning("%s; updating ConfigMap directly", err)
+        except CoordinatorError as err:
+            LOGGER.error("%s", err)
+            raise SystemExit(1)
+
+    load_k8s()
+    try:
+        update_config_map(data, CONFIG_MAP, CONFIG_MAP_NAMESPACE, deadline=deadline, journal=journal)
+    except DeadlineExceeded as err:
+        LOGGER.error("%s", err)
+        raise SystemExit(DEADLINE_EXCEEDED_EXIT_CODE)
+    LOGGER.debug("ConfigMap updated: %s", deadline.summary())
 
 
 if __name__ == "__main__":
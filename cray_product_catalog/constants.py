@@ -24,6 +24,9 @@
 
 PRODUCT_CATALOG_CONFIG_MAP_NAME = 'cray-product-catalog'
 PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE = 'services'
+PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME = 'cray-product-catalog-archive'
+PRODUCT_CATALOG_BACKUP_CONFIG_MAP_NAME = 'cpc-backup'
+PRODUCT_CATALOG_JOURNAL_CONFIG_MAP_NAME = 'cpc-journal'
 COMPONENT_VERSIONS_PRODUCT_MAP_KEY = 'component_versions'
 COMPONENT_REPOS_KEY = 'repositories'
 COMPONENT_DOCKER_KEY = 'docker'
@@ -0,0 +1,206 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Defines functions for running catalog operations against several clusters
+# or namespaces at once.
+#
+# Each target is a kubeconfig context and a namespace. Operations run
+# concurrently in a bounded pool of threads, so the total time tracks the
+# slowest target rather than the sum of all of them, and the result or error
+# of each target is reported separately.
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
+import os
+import time
+
+from cray_product_catalog.constants import PRODUCT_CATALOG_CONFIG_MAP_NAME
+from cray_product_catalog.query import ProductCatalog
+from cray_product_catalog.util.catalog_write import modify_config_map, update_config_map
+from cray_product_catalog.util.deadline import DEADLINE_EXCEEDED_EXIT_CODE, DeadlineExceeded
+
+LOGGER = logging.getLogger(__name__)
+
+# The default maximum number of targets operated on at once
+FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', '8'))
+
+# A cluster and namespace. A context of None means the default configuration.
+Target = namedtuple('Target', ['context', 'namespace'])
+
+# The outcome of an operation on one target. Exactly one of result and error is set,
+# unless the operation returned None.
+TargetResult = namedtuple('TargetResult', ['target', 'result', 'error', 'seconds'])
+
+
+def format_target(target):
+    """Return a short description of a target, e.g. 'context/namespace'."""
+    return f'{target.context or "(default)"}/{target.namespace}'
+
+
+def make_targets(contexts, namespaces):
+    """Return a target for every combination of the given contexts and namespaces.
+
+    Args:
+        contexts (list of str): The kubeconfig contexts. If empty, the default
+            configuration is used.
+        namespaces (list of str): The namespaces. Must not be empty.
+
+    Returns:
+        list of Target: the targets.
+    """
+    return [Target(context, namespace) for context, namespace in itertools.product(contexts or [None], namespaces)]
+
+
+def targets_from_env(default_namespace):
+    """Return the targets given by the KUBE_CONTEXTS and CONFIG_MAP_NAMESPACES environment variables.
+
+    Both are comma-separated lists. If neither is set, fan-out is not
+    requested and an empty list is returned.
+
+    Args:
+        default_namespace (str): The namespace used if only KUBE_CONTEXTS is set.
+
+    Returns:
+        list of Target: the targets, or an empty list.
+    """
+    contexts = [c.strip() for c in os.environ.get('KUBE_CONTEXTS', '').split(',') if c.strip()]
+    namespaces = [n.strip() for n in os.environ.get('CONFIG_MAP_NAMESPACES', '').split(',') if n.strip()]
+    if not contexts and not namespaces:
+        return []
+    return make_targets(contexts, namespaces or [default_namespace])
+
+
+def _run_one(func, target):
+    """Call func(target), timing it and catching any error."""
+    start = time.monotonic()
+    try:
+        result = func(target)
+    except Exception as err:  # pylint: disable=broad-except
+        LOGGER.debug("Operation on %s failed", format_target(target), exc_info=True)
+        return TargetResult(target, None, err, time.monotonic() - start)
+    return TargetResult(target, result, None, time.monotonic() - start)
+
+
+def fan_out(func, targets, max_workers=FANOUT_MAX_WORKERS):
+    """Call `func` once for each target, concurrently.
+
+    Args:
+        func (callable): Called with a Target.
+        targets (list of Target): The targets.
+        max_workers (int): The maximum number of targets operated on at once.
+
+    Returns:
+        list of TargetResult: the outcome for each target, in the order of
+            `targets`. Errors raised by `func` are returned, not raised.
+    """
+    if not targets:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(targets)), thread_name_prefix='catalog-fanout') as pool:
+        return list(pool.map(lambda target: _run_one(func, target), targets))
+
+
+def query_all(targets, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, max_workers=FANOUT_MAX_WORKERS, **kwargs):
+    """Load the ProductCatalog of each target concurrently.
+
+    Args:
+        targets (list of Target): The targets.
+        name (str): The name of the product catalog config map.
+        max_workers (int): See fan_out.
+        **kwargs: Other arguments to ProductCatalog, e.g. `include_archived`.
+
+    Returns:
+        list of TargetResult: the ProductCatalog, or the ProductCatalogError,
+            of each target.
+    """
+    return fan_out(
+        lambda target: ProductCatalog(name, target.namespace, context=target.context, **kwargs),
+        targets, max_workers
+    )
+
+
+def update_all(targets, data, name, product, product_version, max_workers=FANOUT_MAX_WORKERS, **kwargs):
+    """Add `data` to a product version in the config map of each target concurrently.
+
+    Args:
+        targets (list of Target): The targets.
+        data (dict): The data to add, as for catalog_write.update_config_map.
+        name (str): The name of the config map.
+        product (str): The product name.
+        product_version (str): The product version.
+        max_workers (int): See fan_out.
+        **kwargs: Other arguments to update_config_map, e.g. `set_active` or `deadline`.
+
+    Returns:
+        list of TargetResult: the outcome for each target.
+    """
+    return fan_out(
+        lambda target: update_config_map(data, name, target.namespace, product=product,
+                                         product_version=product_version, context=target.context, **kwargs),
+        targets, max_workers
+    )
+
+
+def delete_all(targets, name, product, product_version, key=None, max_workers=FANOUT_MAX_WORKERS, **kwargs):
+    """Remove a product version, or a key of it, from the config map of each target concurrently.
+
+    Args:
+        targets (list of Target): The targets.
+        name (str): The name of the config map.
+        product (str): The product name.
+        product_version (str): The product version.
+        key (str, optional): The key to remove from the product version.
+        max_workers (int): See fan_out.
+        **kwargs: Other arguments to catalog_write.modify_config_map.
+
+    Returns:
+        list of TargetResult: the outcome for each target.
+    """
+    return fan_out(
+        lambda target: modify_config_map(name, target.namespace, product, product_version, key,
+                                         context=target.context, **kwargs),
+        targets, max_workers
+    )
+
+
+def report(results):
+    """Log the outcome for each target and return an exit status for all of them.
+
+    Returns:
+        int: 0 if every target succeeded, DEADLINE_EXCEEDED_EXIT_CODE if every
+            failure was due to the deadline, or 1 otherwise.
+    """
+    errors = []
+    for target_result in results:
+        if target_result.error is None:
+            LOGGER.info("%s: succeeded in %.1fs", format_target(target_result.target), target_result.seconds)
+        else:
+            LOGGER.error("%s: failed after %.1fs: %s", format_target(target_result.target),
+                         target_result.seconds, target_result.error)
+            errors.append(target_result.error)
+    LOGGER.info("%s of %s targets succeeded", len(results) - len(errors), len(results))
+    if not errors:
+        return 0
+    if all(isinstance(err, DeadlineExceeded) for err in errors):
+        return DEADLINE_EXCEEDED_EXIT_CODE
+    return 1
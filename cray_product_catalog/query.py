@@ -1,6 +1,6 @@
 # MIT License
 #
-# (C) Copyright 2021-2022 Hewlett Packard Enterprise Development LP
+# (C) Copyright 2021-2023 Hewlett Packard Enterprise Development LP
 #
 # Permission is hereby granted, free of charge, to any person obtaining a
 # copy of this software and associated documentation files (the "Software"),
@@ -21,13 +21,20 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 #
 # Defines classes for querying for information about the installed products.
+#
+# The kubernetes client is only imported when a catalog is read from
+# Kubernetes, so catalogs loaded from files or mappings with the from_*
+# constructors of ProductCatalog work without it being configured.
+from collections import namedtuple
+from functools import partial
 import logging
 from pkg_resources import parse_version
+import sys
+import threading
+import time
+from types import MappingProxyType
 
 from jsonschema.exceptions import ValidationError
-from kubernetes.client import CoreV1Api
-from kubernetes.client.rest import ApiException
-from kubernetes.config import ConfigException
 from urllib3.exceptions import MaxRetryError
 from yaml import safe_load, YAMLError
 
@@ -35,18 +42,33 @@ from cray_product_catalog.constants import (
     COMPONENT_DOCKER_KEY,
     COMPONENT_REPOS_KEY,
     COMPONENT_VERSIONS_PRODUCT_MAP_KEY,
+    PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME,
     PRODUCT_CATALOG_CONFIG_MAP_NAME,
     PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
 )
 from cray_product_catalog.schema.validate import validate
-from cray_product_catalog.util import load_k8s
+from cray_product_catalog.util import tracing
+from cray_product_catalog.util.diff import diff_catalog_data
+from cray_product_catalog.util.intern import Interner
+from cray_product_catalog.util.metrics import YAML_SECONDS
+from cray_product_catalog.util.projection import field_tree, load_fields
+from cray_product_catalog.util.snapshot import Snapshot, SnapshotError, parse_snapshot, read_snapshot, verify_hashes
 
 LOGGER = logging.getLogger(__name__)
 
+# The default number of seconds a cached ProductCatalog is used before it is revalidated
+CACHE_TTL_SECONDS = 60
+
+# An immutable view of the loaded product catalog. `by_name` maps a product
+# name, and `by_name_version` a (name, version) pair, to a tuple of products.
+_CatalogSnapshot = namedtuple(
+    '_CatalogSnapshot',
+    ('products', 'by_name', 'by_name_version', 'resource_version', 'archive_resource_version')
+)
+
 
 class ProductCatalogError(Exception):
     """An error occurred reading or manipulating product installs."""
-    pass
 
 
 class ProductCatalog:
@@ -56,11 +78,37 @@ class ProductCatalog:
         name (str): The product catalog Kubernetes config map name.
         namespace (str): The product catalog Kubernetes config map namespace.
         products ([InstalledProductVersion]): A list of installed product
-            versions.
+            versions. This is a copy of the current snapshot, so modifying it
+            does not affect the catalog.
+        include_archived (bool): Whether archived product versions were
+            loaded in addition to those in the product catalog config map.
+        archive_name (str): The archive Kubernetes config map name.
+        context (str): The kubeconfig context of the cluster, or None if the
+            default Kubernetes configuration is used.
+        resource_version (str): The resourceVersion of the product catalog
+            config map that was loaded.
+        archive_resource_version (str): The resourceVersion of the archive
+            config map that was loaded, or None if it was not loaded.
+        fields (list of str): The dotted paths of the only fields loaded from
+            each product version's data, or None if all fields were loaded.
+        intern_data (bool): Whether identical parts of the product versions'
+            data are shared as read-only mappings and tuples.
     """
+    # Cached ProductCatalogs, see get_cached
+    _cache = {}
+    _cache_lock = threading.Lock()
+    # Replaced in a single assignment by _load_config_maps, so readers never need a lock
+    _snapshot = _CatalogSnapshot((), MappingProxyType({}), MappingProxyType({}), None, None)
+    fields = None
+    intern_data = False
+
     @staticmethod
-    def _get_k8s_api():
-        """Load a Kubernetes CoreV1Api and return it.
+    def _get_k8s_api(context=None):
+        """Load a Kubernetes CoreV1Api using the shared ApiClient and return it.
+
+        Args:
+            context (str, optional): The kubeconfig context to use instead of
+                the default configuration.
 
         Returns:
             CoreV1Api: The Kubernetes API.
@@ -69,65 +117,678 @@ class ProductCatalog:
             ProductCatalogError: if there was an error loading the
                 Kubernetes configuration.
         """
+        # pylint: disable=import-outside-toplevel
+        from kubernetes.client import CoreV1Api
+        from kubernetes.config import ConfigException
+
+        from cray_product_catalog.util.k8s import get_api_client, load_k8s
+
         try:
-            load_k8s()
-            return CoreV1Api()
+            if context is None:
+                load_k8s()
+            return CoreV1Api(get_api_client(context=context))
         except ConfigException as err:
             raise ProductCatalogError(f'Unable to load kubernetes configuration: {err}.')
 
-    def __init__(self, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, namespace=PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE):
+    def __init__(self, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, namespace=PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+                 include_archived=False, archive_name=PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME, context=None,
+                 fields=None, intern_data=False):
         """Create the ProductCatalog object.
 
         Args:
             name (str): The name of the product catalog Kubernetes config map.
             namespace (str): The namespace of the product catalog Kubernetes
                 config map.
+            include_archived (bool): If True, also load the product versions
+                that have been moved to the archive config map. Versions
+                archived by catalog_archive to a local ARCHIVE_FILE are not
+                loaded.
+            archive_name (str): The name of the archive Kubernetes config map
+                in the same namespace. Only used if `include_archived` is True.
+            context (str, optional): The kubeconfig context of the cluster to
+                read from. By default, the in-cluster configuration or the
+                current kubeconfig context is used.
+            fields (list of str, optional): The dotted paths of the fields
+                to load from each product version's data, e.g.
+                ['component_versions.docker', 'configuration.commit']. Only
+                these are parsed and kept, which is much faster and smaller
+                than loading all of the data. Versions are validated using
+                only the loaded fields. By default, all fields are loaded.
+            intern_data (bool): If True, share identical strings, mappings,
+                and lists among all product versions after they have been
+                validated. Each version's data is then made of read-only
+                MappingProxyTypes and tuples, which saves memory in
+                long-running services that keep a catalog loaded.
 
         Raises:
             ProductCatalogError: if reading the config map failed.
+            ValueError: if a field is not a valid dotted path.
         """
+        if fields is not None:
+            field_tree(fields)
         self.name = name
         self.namespace = namespace
-        self.k8s_client = self._get_k8s_api()
+        self.include_archived = include_archived
+        self.archive_name = archive_name
+        self.context = context
+        self.fields = fields
+        self.intern_data = intern_data
+        self._refresh_lock = threading.Lock()
+        with tracing.span('ProductCatalog', config_map=name, namespace=namespace):
+            self.k8s_client = self._get_k8s_api(context)
+            config_map = self._read_config_map(name)
+            archive_config_map = None
+            if include_archived and config_map.data is not None:
+                archive_config_map = self._read_config_map(archive_name, missing_ok=True)
+            self._load_config_maps(config_map, archive_config_map)
+
+    @classmethod
+    def from_mapping(cls, data, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, namespace=PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+                     resource_version=None, archive_data=None, fields=None, intern_data=False):
+        """Create a ProductCatalog from product catalog data without reading from Kubernetes.
+
+        The data is parsed, validated, and indexed exactly as the data read
+        from the config map is. The catalog cannot be refreshed or watched.
+
+        Args:
+            data (dict): A mapping from product name to a YAML string of that
+                product's versions, as in the config map.
+            name (str): The name of the config map the data is from.
+            namespace (str): The namespace of the config map the data is from.
+            resource_version (str, optional): The resourceVersion of the data.
+            archive_data (dict, optional): The data of the archive config map,
+                if archived versions are to be included.
+            fields (list of str, optional): The fields to load, as for
+                ProductCatalog.
+            intern_data (bool): Whether to share identical data, as for
+                ProductCatalog.
+
+        Returns:
+            ProductCatalog: the product catalog.
+
+        Raises:
+            ProductCatalogError: if the data is None or could not be parsed.
+        """
+        archive = None if archive_data is None else Snapshot(archive_data)
+        return cls._from_config_maps(Snapshot(data, resource_version=resource_version), archive, name, namespace,
+                                     fields, intern_data)
+
+    @classmethod
+    def from_configmap_file(cls, path, archive_path=None, fields=None, intern_data=False):
+        """Create a ProductCatalog from a config map saved with `kubectl get configmap -o yaml` or `-o json`.
+
+        Snapshot files written by util.snapshot.write_snapshot are read too.
+
+        Args:
+            path (str): The path of the file, or '-' to read standard input.
+            archive_path (str, optional): The path of the saved archive config
+                map, if archived versions are to be included.
+            fields (list of str, optional): The fields to load, as for
+                ProductCatalog.
+            intern_data (bool): Whether to share identical data, as for
+                ProductCatalog.
+
+        Returns:
+            ProductCatalog: the product catalog, named after the config map
+                in the file.
+
+        Raises:
+            ProductCatalogError: if the file could not be read or parsed.
+        """
+        config_map = cls._read_file(path)
+        archive_config_map = None if archive_path is None else cls._read_file(archive_path)
+        return cls._from_config_maps(config_map, archive_config_map, config_map.name, config_map.namespace,
+                                     fields, intern_data)
+
+    @classmethod
+    def from_snapshot(cls, path, archive_path=None, fields=None, intern_data=False):
+        """Create a ProductCatalog from a snapshot file, checking the hashes recorded in it.
+
+        Args:
+            path (str): The path of the snapshot file, which may be
+                compressed, or '-' to read standard input.
+            archive_path (str, optional): The path of a snapshot of the
+                archive config map, if archived versions are to be included.
+            fields (list of str, optional): The fields to load, as for
+                ProductCatalog.
+            intern_data (bool): Whether to share identical data, as for
+                ProductCatalog.
+
+        Returns:
+            ProductCatalog: the product catalog, named after the config map
+                the snapshot was taken of.
+
+        Raises:
+            ProductCatalogError: if the file could not be read or parsed, or
+                its data does not match its hashes.
+        """
+        config_map = cls._read_file(path, verify=True)
+        archive_config_map = None if archive_path is None else cls._read_file(archive_path, verify=True)
+        return cls._from_config_maps(config_map, archive_config_map, config_map.name, config_map.namespace,
+                                     fields, intern_data)
+
+    @staticmethod
+    def _read_file(path, verify=False):
+        """Read a snapshot or saved config map from a file or standard input.
+
+        Args:
+            path (str): The path of the file, or '-' to read standard input.
+            verify (bool): If True, check the data against the hashes in the
+                file, which must have them.
+
+        Returns:
+            Snapshot: the data of the file.
+
+        Raises:
+            ProductCatalogError: if the file could not be read or parsed, or
+                did not match its hashes.
+        """
         try:
-            config_map = self.k8s_client.read_namespaced_config_map(name, namespace)
+            snapshot = parse_snapshot(sys.stdin.read()) if path == '-' else read_snapshot(path)
+            if verify:
+                if snapshot.hashes is None:
+                    raise SnapshotError(f'{path} is not a snapshot file')
+                verify_hashes(snapshot.data, snapshot.hashes)
+        except SnapshotError as err:
+            raise ProductCatalogError(f'Unable to load product catalog: {err}')
+        return snapshot
+
+    @classmethod
+    def _from_config_maps(cls, config_map, archive_config_map=None, name=None, namespace=None, fields=None,
+                          intern_data=False):
+        """Create a ProductCatalog from config maps which have already been read.
+
+        Args:
+            config_map (Snapshot or ConfigMapContent): The product catalog
+                config map.
+            archive_config_map (Snapshot or ConfigMapContent, optional): The
+                archive config map, if archived versions are to be included.
+            name (str, optional): The name of the product catalog config map.
+            namespace (str, optional): The namespace of the product catalog
+                config map.
+            fields (list of str, optional): The fields to load, as for
+                ProductCatalog.
+            intern_data (bool): Whether to share identical data, as for
+                ProductCatalog.
+
+        Returns:
+            ProductCatalog: the product catalog, which has no Kubernetes API.
+        """
+        if fields is not None:
+            field_tree(fields)
+        catalog = cls.__new__(cls)
+        catalog.name = name or PRODUCT_CATALOG_CONFIG_MAP_NAME
+        catalog.namespace = namespace or PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE
+        catalog.include_archived = archive_config_map is not None
+        catalog.archive_name = PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME
+        catalog.context = None
+        catalog.fields = fields
+        catalog.intern_data = intern_data
+        catalog._refresh_lock = threading.Lock()
+        catalog.k8s_client = None
+        catalog._load_config_maps(config_map, archive_config_map)
+        return catalog
+
+    @tracing.traced('ProductCatalog.load')
+    def _load_config_maps(self, config_map, archive_config_map=None):
+        """Parse and validate the product versions read from the config maps.
+
+        This builds a new snapshot of the catalog and publishes it with a
+        single assignment, so concurrent readers see either the old or the
+        new catalog, never a mixture. It does no I/O, so the config maps may
+        be read by other means, e.g. asynchronously.
+
+        Args:
+            config_map (ConfigMapContent): The product catalog config map.
+            archive_config_map (ConfigMapContent, optional): The archive
+                config map, if archived versions are to be included and it
+                exists.
+
+        Raises:
+            ProductCatalogError: if the product catalog config map has no
+                data, or the data could not be parsed.
+        """
+        if config_map.data is None:
+            raise ProductCatalogError(
+                f'No data found in {self.namespace}/{self.name} ConfigMap.'
+            )
+
+        with tracing.span('ProductCatalog.parse') as parse_span:
+            products = self._load_products(config_map.data, fields=self.fields)
+            if archive_config_map is not None:
+                products.extend(self._load_archived_products(archive_config_map, products))
+            parse_span.set_attribute('product_versions', len(products))
+
+        with tracing.span('ProductCatalog.validate'):
+            invalid_products = [
+                str(p) for p in products if not p.is_valid
+            ]
+            if invalid_products:
+                LOGGER.debug(
+                    f'The following products have product catalog data that '
+                    f'is not valid against the expected schema: {", ".join(invalid_products)}'
+                )
+
+            products = [p for p in products if p.is_valid]
+        if self.intern_data:
+            with tracing.span('ProductCatalog.intern'):
+                interner = Interner()
+                for product in products:
+                    product.data = interner.intern(product.data)
+            LOGGER.debug(f'Shared {interner.shared} of {interner.values} values in '
+                         f'{self.namespace}/{self.name} product catalog data.')
+
+        with tracing.span('ProductCatalog.build_snapshot'):
+            self._snapshot = self._build_snapshot(
+                products,
+                config_map.resource_version,
+                getattr(archive_config_map, 'resource_version', None),
+            )
+
+    @staticmethod
+    def _build_snapshot(products, resource_version=None, archive_resource_version=None):
+        """Build an immutable snapshot of the given products and their indexes.
+
+        Args:
+            products (list of InstalledProductVersion): The valid products.
+            resource_version (str): The resourceVersion of the catalog.
+            archive_resource_version (str): The resourceVersion of the archive.
+
+        Returns:
+            _CatalogSnapshot: the snapshot.
+        """
+        by_name = {}
+        by_name_version = {}
+        for product in products:
+            by_name.setdefault(product.name, []).append(product)
+            by_name_version.setdefault((product.name, product.version), []).append(product)
+        return _CatalogSnapshot(
+            tuple(products),
+            MappingProxyType({key: tuple(value) for key, value in by_name.items()}),
+            MappingProxyType({key: tuple(value) for key, value in by_name_version.items()}),
+            resource_version,
+            archive_resource_version,
+        )
+
+    @property
+    def products(self):
+        """list of InstalledProductVersion: the valid installed product versions."""
+        return list(self._snapshot.products)
+
+    @products.setter
+    def products(self, products):
+        snapshot = self._snapshot
+        self._snapshot = self._build_snapshot(
+            products, snapshot.resource_version, snapshot.archive_resource_version
+        )
+
+    @property
+    def resource_version(self):
+        """str: the resourceVersion of the product catalog config map that was loaded."""
+        return self._snapshot.resource_version
+
+    @property
+    def archive_resource_version(self):
+        """str: the resourceVersion of the archive config map that was loaded, or None."""
+        return self._snapshot.archive_resource_version
+
+    def refresh(self):
+        """Load the config maps again if they have changed.
+
+        The new catalog is parsed, validated and indexed before it replaces
+        the current one in a single assignment. Readers such as get_product
+        never wait for a refresh and never see a partially loaded catalog.
+        Concurrent refreshes of the same catalog are serialized.
+
+        Returns:
+            bool: True if the catalog was reloaded, False if it was unchanged.
+
+        Raises:
+            ProductCatalogError: if reading the config maps failed, or the
+                catalog was not loaded from Kubernetes. The current catalog
+                is kept in that case.
+        """
+        with self._refresh_lock:
+            if self._is_current():
+                LOGGER.debug(f'ConfigMap {self.namespace}/{self.name} is unchanged; not refreshing.')
+                return False
+            self._reload()
+            return True
+
+    def refresh_from(self, config_map=None, archive_config_map=None):
+        """Load the catalog from config map content received by other means, e.g. in a watch event.
+
+        Only the config maps which are not given are read, so a caller which
+        already has the new content of one of them does not read it again.
+
+        Args:
+            config_map (ConfigMapContent, optional): The content of the
+                product catalog config map. Read if None.
+            archive_config_map (ConfigMapContent, optional): The content of
+                the archive config map. Read if None and archived versions
+                are included.
+
+        Raises:
+            ProductCatalogError: if reading a config map failed, or the
+                product catalog config map has no data. The current catalog
+                is kept in that case.
+        """
+        with self._refresh_lock:
+            self._reload(config_map, archive_config_map)
+
+    def _reload(self, config_map=None, archive_config_map=None):
+        """Read the config maps which are not given and load the catalog from them."""
+        if config_map is None:
+            config_map = self._read_config_map(self.name)
+        if not self.include_archived or config_map.data is None:
+            archive_config_map = None
+        elif archive_config_map is None:
+            archive_config_map = self._read_config_map(self.archive_name, missing_ok=True)
+        self._load_config_maps(config_map, archive_config_map)
+
+    @classmethod
+    def get_cached(cls, name=PRODUCT_CATALOG_CONFIG_MAP_NAME, namespace=PRODUCT_CATALOG_CONFIG_MAP_NAMESPACE,
+                   ttl=CACHE_TTL_SECONDS, include_archived=False,
+                   archive_name=PRODUCT_CATALOG_ARCHIVE_CONFIG_MAP_NAME, context=None):
+        """Get a ProductCatalog shared by all callers in this process.
+
+        The first call loads the product catalog. Later calls within `ttl`
+        seconds return the same object without making any API requests. After
+        that, the first caller checks the resourceVersion of the config map,
+        which is much cheaper than reading it, and loads it again only if it
+        has changed. Concurrent callers wait for a single load or check.
+
+        The returned ProductCatalog is shared, so it must not be modified.
+        Cached catalogs are kept until they are removed with evict_cached.
+
+        Args:
+            ttl (float): Seconds for which a cached catalog is used without
+                being revalidated.
+            Others: see __init__.
+
+        Returns:
+            ProductCatalog: the cached product catalog.
+
+        Raises:
+            ProductCatalogError: if reading the config map failed.
+        """
+        key = (name, namespace, include_archived, archive_name, context)
+        with cls._cache_lock:
+            entry = cls._cache.setdefault(key, _CacheEntry())
+        catalog = entry.catalog
+        if catalog is not None and time.monotonic() < entry.expires:
+            return catalog
+
+        with entry.lock:
+            # Another caller may have loaded or revalidated it while this one waited.
+            if entry.catalog is not None and time.monotonic() < entry.expires:
+                return entry.catalog
+            if entry.catalog is not None and entry.catalog._is_current():
+                LOGGER.debug(f'ConfigMap {namespace}/{name} is unchanged; using cached product catalog.')
+            else:
+                entry.catalog = cls(name, namespace, include_archived=include_archived,
+                                    archive_name=archive_name, context=context)
+            entry.expires = time.monotonic() + ttl
+            return entry.catalog
+
+    @classmethod
+    def evict_cached(cls, name=None, namespace=None):
+        """Remove product catalogs cached by get_cached.
+
+        Args:
+            name (str, optional): Only remove catalogs of this config map name.
+            namespace (str, optional): Only remove catalogs in this namespace.
+
+        Returns:
+            int: the number of cached catalogs removed.
+        """
+        with cls._cache_lock:
+            keys = [
+                key for key in cls._cache
+                if name in (None, key[0]) and namespace in (None, key[1])
+            ]
+            for key in keys:
+                del cls._cache[key]
+        return len(keys)
+
+    def changes(self, since=None, timeout=None):
+        """Watch the product catalog config map and yield the changes made to it.
+
+        Each version of the config map is compared with the previous one,
+        starting with the config map as it was at `since`, which is read
+        again rather than kept in memory. Only products whose data changed
+        are parsed. The catalog itself is not modified; use refresh() to
+        update it. Archived versions are not watched.
+
+        Args:
+            since (str, optional): The resourceVersion to watch from. By
+                default, the resourceVersion this catalog was loaded at.
+            timeout (float, optional): Seconds to watch for. Watch
+                indefinitely if None.
+
+        Yields:
+            CatalogChange: each change, with the resourceVersion of the config
+                map it was made in.
+
+        Raises:
+            ProductCatalogError: if the config map could not be watched or
+                read, `since` is too old for the config map to be read as it
+                was then, or changed data could not be parsed.
+        """
+        # pylint: disable=import-outside-toplevel
+        from kubernetes import watch
+        from kubernetes.client.rest import ApiException
+
+        from cray_product_catalog.util.k8s import MAX_WATCH_SECONDS
+
+        self._check_k8s_client()
+        field_selector = f'metadata.name={self.name}'
+        resource_version = since or self.resource_version
+        data, resource_version = self._read_baseline(field_selector, resource_version)
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = MAX_WATCH_SECONDS if end is None else end - time.monotonic()
+            if remaining <= 0:
+                return
+            watch_seconds = max(1, int(min(remaining, MAX_WATCH_SECONDS)))
+            try:
+                for event in watch.Watch().stream(
+                    self.k8s_client.list_namespaced_config_map, self.namespace, field_selector=field_selector,
+                    resource_version=resource_version, timeout_seconds=watch_seconds,
+                    _request_timeout=watch_seconds + 10
+                ):
+                    raw_object = event['raw_object']
+                    resource_version = raw_object['metadata']['resourceVersion']
+                    if event['type'] == 'BOOKMARK':
+                        continue
+                    new_data = {} if event['type'] == 'DELETED' else raw_object.get('data') or {}
+                    yield from self._diff(data, new_data, resource_version)
+                    data = new_data
+            except ApiException as err:
+                if err.status != 410:
+                    raise ProductCatalogError(
+                        f'Error watching {self.namespace}/{self.name} ConfigMap: {err.reason}'
+                    )
+                # The resourceVersion is too old to watch from, so compare the
+                # current data with the last data seen and watch from there.
+                LOGGER.debug(f'Watch of ConfigMap {self.namespace}/{self.name} expired; reading it again.')
+                config_map = self._read_config_map(self.name, missing_ok=True)
+                resource_version = getattr(config_map, 'resource_version', None)
+                new_data = getattr(config_map, 'data', None) or {}
+                yield from self._diff(data, new_data, resource_version)
+                data = new_data
+            except MaxRetryError as err:
+                raise ProductCatalogError(
+                    f'Unable to connect to Kubernetes to watch {self.namespace}/{self.name} ConfigMap: {err}'
+                )
+
+    def _read_baseline(self, field_selector, resource_version):
+        """Return the data of the config map exactly as it was at a resourceVersion, and that resourceVersion.
+
+        If `resource_version` is None, the current data and resourceVersion
+        are returned.
+
+        Raises:
+            ProductCatalogError: if the config map could not be read, e.g.
+                because the resourceVersion is too old.
+        """
+        # pylint: disable=import-outside-toplevel
+        from kubernetes.client.rest import ApiException
+
+        kwargs = {'resource_version': resource_version, 'resource_version_match': 'Exact'} if resource_version else {}
+        try:
+            config_maps = self.k8s_client.list_namespaced_config_map(
+                self.namespace, field_selector=field_selector, **kwargs
+            )
+        except ApiException as err:
+            if err.status == 410:
+                raise ProductCatalogError(
+                    f'ConfigMap {self.namespace}/{self.name} cannot be watched from resourceVersion '
+                    f'{resource_version}, which is too old; refresh the catalog and watch again.'
+                )
+            raise ProductCatalogError(f'Error reading {self.namespace}/{self.name} ConfigMap: {err.reason}')
+        except MaxRetryError as err:
+            raise ProductCatalogError(
+                f'Unable to connect to Kubernetes to read {self.namespace}/{self.name} ConfigMap: {err}'
+            )
+        data = (config_maps.items[0].data or {}) if config_maps.items else {}
+        return data, resource_version or config_maps.metadata.resource_version
+
+    @staticmethod
+    def _diff(old_data, new_data, resource_version):
+        """Yield the changes between two versions of config map data."""
+        try:
+            for change in diff_catalog_data(old_data, new_data):
+                yield change._replace(resource_version=resource_version)
+        except YAMLError as err:
+            raise ProductCatalogError(
+                f'Failed to load ConfigMap data: {err}'
+            )
+
+    def _check_k8s_client(self):
+        """Raise ProductCatalogError if this catalog was not read from Kubernetes."""
+        if self.k8s_client is None:
+            raise ProductCatalogError(
+                f'Product catalog {self.namespace}/{self.name} was not loaded from Kubernetes.'
+            )
+
+    def _read_resource_version(self, name):
+        """Return the resourceVersion of a config map, or None if it does not exist."""
+        # pylint: disable=import-outside-toplevel
+        from kubernetes.client.rest import ApiException
+
+        from cray_product_catalog.util.k8s import read_config_map_resource_version
+
+        try:
+            return read_config_map_resource_version(self.k8s_client, name, self.namespace)
+        except ApiException as err:
+            if err.status == 404:
+                return None
+            raise
+
+    def _is_current(self):
+        """Return True if the config maps have not changed since this catalog was loaded."""
+        # pylint: disable=import-outside-toplevel
+        from kubernetes.client.rest import ApiException
+
+        self._check_k8s_client()
+        try:
+            if self._read_resource_version(self.name) != self.resource_version:
+                return False
+            return (not self.include_archived or
+                    self._read_resource_version(self.archive_name) == self.archive_resource_version)
+        except (ApiException, MaxRetryError) as err:
+            LOGGER.debug(f'Unable to check resourceVersion of ConfigMap {self.namespace}/{self.name}: {err}')
+            return False
+
+    def _read_config_map(self, name, missing_ok=False):
+        """Read a config map in the product catalog namespace.
+
+        Args:
+            name (str): The name of the config map to read.
+            missing_ok (bool): If True, return None instead of raising an
+                error when the config map does not exist.
+
+        Returns:
+            ConfigMapContent: the data and resourceVersion of the config map,
+                or None if it does not exist and `missing_ok` is True.
+
+        Raises:
+            ProductCatalogError: if reading the config map failed.
+        """
+        # pylint: disable=import-outside-toplevel
+        from kubernetes.client.rest import ApiException
+
+        from cray_product_catalog.util.k8s import read_config_map
+
+        self._check_k8s_client()
+        namespace = self.namespace
+        try:
+            return read_config_map(self.k8s_client, name, namespace)
         except MaxRetryError as err:
             raise ProductCatalogError(
                 f'Unable to connect to Kubernetes to read {namespace}/{name} ConfigMap: {err}'
             )
         except ApiException as err:
+            if missing_ok and err.status == 404:
+                LOGGER.debug(f'ConfigMap {namespace}/{name} does not exist.')
+                return None
             # The full string representation of ApiException is very long, so just log err.reason.
             raise ProductCatalogError(
                 f'Error reading {namespace}/{name} ConfigMap: {err.reason}'
             )
 
-        if config_map.data is None:
-            raise ProductCatalogError(
-                f'No data found in {namespace}/{name} ConfigMap.'
-            )
+    @staticmethod
+    def _load_products(config_map_data, archived=False, fields=None):
+        """Parse config map data into a list of InstalledProductVersions.
 
+        Args:
+            config_map_data (dict): A mapping from product name to a YAML
+                string of that product's versions.
+            archived (bool): Whether the data came from the archive.
+            fields (list of str, optional): The dotted paths of the only
+                fields to load from each version's data.
+
+        Returns:
+            list of InstalledProductVersion: the parsed product versions.
+
+        Raises:
+            ProductCatalogError: if the data could not be parsed.
+        """
+        load = safe_load if fields is None else partial(load_fields, fields=field_tree(fields))
         try:
-            self.products = [
-                InstalledProductVersion(product_name, product_version, product_version_data)
-                for product_name, product_versions in config_map.data.items()
-                for product_version, product_version_data in safe_load(product_versions).items()
-            ]
+            with YAML_SECONDS.time(action='parse'):
+                return [
+                    InstalledProductVersion(product_name, product_version, product_version_data, archived=archived)
+                    for product_name, product_versions in config_map_data.items()
+                    for product_version, product_version_data in load(product_versions).items()
+                ]
         except YAMLError as err:
             raise ProductCatalogError(
                 f'Failed to load ConfigMap data: {err}'
             )
 
-        invalid_products = [
-            str(p) for p in self.products if not p.is_valid
-        ]
-        if invalid_products:
-            LOGGER.debug(
-                f'The following products have product catalog data that '
-                f'is not valid against the expected schema: {", ".join(invalid_products)}'
-            )
+    def _load_archived_products(self, archive_config_map, products):
+        """Load product versions from the archive config map.
+
+        Versions which are present in both the catalog and the archive, e.g.
+        because archiving was interrupted, are taken from the catalog.
+
+        Args:
+            archive_config_map (ConfigMapContent): The archive config map.
+            products (list of InstalledProductVersion): The product versions
+                loaded from the catalog.
+
+        Returns:
+            list of InstalledProductVersion: the archived product versions.
+        """
+        if not archive_config_map.data:
+            return []
 
-        self.products = [
-            p for p in self.products if p.is_valid
+        current = {(p.name, p.version) for p in products}
+        return [
+            p for p in self._load_products(archive_config_map.data, archived=True, fields=self.fields)
+            if (p.name, p.version) not in current
         ]
 
     def get_product(self, name, version=None):
@@ -145,8 +806,9 @@ class ProductCatalog:
             ProductCatalogError: If there is more than one matching
                 InstalledProductVersion, or if there are none.
         """
+        snapshot = self._snapshot
         if not version:
-            matching_name_products = [product for product in self.products if product.name == name]
+            matching_name_products = snapshot.by_name.get(name)
             if not matching_name_products:
                 raise ProductCatalogError(f'No installed products with name {name}.')
             latest = sorted(matching_name_products,
@@ -154,10 +816,7 @@ class ProductCatalog:
             LOGGER.debug(f'Using latest version ({latest.version}) of product {name}')
             return latest
 
-        matching_products = [
-            product for product in self.products
-            if product.name == name and product.version == version
-        ]
+        matching_products = snapshot.by_name_version.get((name, version))
         if not matching_products:
             raise ProductCatalogError(
                 f'No installed products with name {name} and version {version}.'
@@ -170,6 +829,21 @@ class ProductCatalog:
         return matching_products[0]
 
 
+class _CacheEntry:
+    """A product catalog cached by ProductCatalog.get_cached.
+
+    Attributes:
+        catalog (ProductCatalog): The catalog, or None if not loaded yet.
+        expires (float): The time.monotonic() value after which the catalog
+            must be revalidated.
+        lock (threading.Lock): Held while loading or revalidating the catalog.
+    """
+    def __init__(self):
+        self.catalog = None
+        self.expires = 0
+        self.lock = threading.Lock()
+
+
 class InstalledProductVersion:
     """A representation of a version of a product that is currently installed.
 
@@ -180,11 +854,14 @@ class InstalledProductVersion:
             version in the product catalog, which is expected to contain a
             'component_versions' key that will point to the respective
             versions of product components, e.g. Docker images.
+        archived (bool): True if this version was loaded from the archive
+            config map rather than the product catalog config map.
     """
-    def __init__(self, name, version, data):
+    def __init__(self, name, version, data, archived=False):
         self.name = name
         self.version = version
         self.data = data
+        self.archived = archived
 
     def __str__(self):
         return f'{self.name}-{self.version}'
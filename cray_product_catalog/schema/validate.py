@@ -21,13 +21,37 @@
 # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 # OTHER DEALINGS IN THE SOFTWARE.
 #
+from collections.abc import Mapping
+from functools import lru_cache
 import pkgutil
 
 import jsonschema
 import yaml
 
+from cray_product_catalog.util.tracing import traced
 
+
+@lru_cache(maxsize=None)
+def _validator():
+    """Load the schema defined in schema.yaml, check it, and return a validator for it.
+
+    The validator accepts any Mapping as an object and tuples as well as lists
+    as arrays, so that data shared read-only by ProductCatalog(intern_data=True)
+    can be validated.
+    """
+    schema = yaml.safe_load(pkgutil.get_data(__name__, 'schema.yaml'))
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    type_checker = validator_class.TYPE_CHECKER.redefine_many({
+        'object': lambda checker, instance: isinstance(instance, Mapping),
+        'array': lambda checker, instance: isinstance(instance, (list, tuple)),
+    })
+    return jsonschema.validators.extend(validator_class, type_checker=type_checker)(schema)
+
+
+@traced('validate')
 def validate(data):
     """Use the schema defined in schema.yaml to validate the given data."""
-    schema_data = pkgutil.get_data(__name__, 'schema.yaml')
-    return jsonschema.validate(data, yaml.safe_load(schema_data))
+    error = jsonschema.exceptions.best_match(_validator().iter_errors(data))
+    if error is not None:
+        raise error
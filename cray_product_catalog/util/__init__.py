@@ -22,5 +22,14 @@
 #
 # Defines a utility function for loading the k8s config.
 
-# import load_k8s here so that load_k8s can be imported from cray_product_catalog.util
-from cray_product_catalog.util.k8s import load_k8s
+
+def __getattr__(name):
+    """Import load_k8s on first use, so that it can be imported from cray_product_catalog.util.
+
+    Importing the kubernetes client is deferred until then, so modules of this
+    package which do not use it can be imported without it.
+    """
+    if name == 'load_k8s':
+        from cray_product_catalog.util.k8s import load_k8s  # pylint: disable=import-outside-toplevel
+        return load_k8s
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,229 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Contains functions for modifying decoded product catalog data.
+
+import yaml
+
+from cray_product_catalog.util import tracing
+from cray_product_catalog.util.merge_dict import merge_dict
+from cray_product_catalog.util.metrics import YAML_SECONDS
+
+UPDATE = 'update'
+DELETE = 'delete'
+
+
+def set_active_version(product_data, product_version):
+    """Modify product_data in place to set the 'active' key for product_version.
+
+    This also sets the 'active' key for other versions in product_data to False.
+    """
+    for version in product_data:
+        product_data[version]['active'] = version == product_version
+
+
+def current_version_is_active(product_data, product_version):
+    """Return True if product_version is active and no other version of the product is active."""
+    current_version = product_data[product_version]
+    other_versions = [version for version in product_data if version != product_version]
+
+    return current_version.get('active') and not any(
+        [product_data[version].get('active') for version in other_versions]
+    )
+
+
+def remove_active_field(product_data):
+    """Remove the 'active' field from all versions in product_data."""
+    for version in product_data:
+        if "active" in product_data[version]:
+            del product_data[version]["active"]
+
+
+def active_field_exists(product_data):
+    """Return True if any version of the given product is using the 'active' field."""
+    return any("active" in product_data[version] for version in product_data)
+
+
+def apply_update(product_data, product_version, data, set_active=False, remove_active=False):
+    """Merge data into a version of a product, modifying product_data in place.
+
+    Args:
+        product_data (dict): A mapping from version to version data for a
+            single product.
+        product_version (str): The version to update.
+        data (dict): The data to merge into the version.
+        set_active (bool): If True, make product_version the only active
+            version of the product.
+        remove_active (bool): If True, remove the 'active' field from all
+            versions of the product.
+
+    Returns:
+        bool: True if product_data was changed.
+
+    Raises:
+        ValueError: if both set_active and remove_active are given.
+        TypeError: if data cannot be merged with the existing version data.
+    """
+    if set_active and remove_active:
+        raise ValueError('set_active and remove_active cannot both be given')
+
+    existing = product_data.get(product_version)
+    with tracing.span('merge_dict'):
+        merged = merge_dict(data, existing or {})
+    changed = existing is None or merged != existing
+    product_data[product_version] = merged
+
+    if set_active and not current_version_is_active(product_data, product_version):
+        set_active_version(product_data, product_version)
+        changed = True
+    if remove_active and active_field_exists(product_data):
+        remove_active_field(product_data)
+        changed = True
+    return changed
+
+
+def apply_delete(product_data, product_version, key=None):
+    """Remove a version, or a key of a version, from product_data in place.
+
+    If a key is given and no keys remain in the version after it has been
+    removed, the version is removed as well.
+
+    Args:
+        product_data (dict): A mapping from version to version data for a
+            single product.
+        product_version (str): The version to remove, or remove a key from.
+        key (str, optional): The key within the version to remove.
+
+    Returns:
+        bool: True if product_data was changed.
+    """
+    if product_version not in product_data:
+        return False
+    if not key:
+        product_data.pop(product_version)
+        return True
+
+    changed = False
+    if key in product_data[product_version]:
+        product_data[product_version].pop(key)
+        changed = True
+    if not product_data[product_version].keys():
+        product_data.pop(product_version)
+        changed = True
+    return changed
+
+
+def update_request(product, product_version, data, set_active=False, remove_active=False):
+    """Return a request to update a product version, for use with apply_requests.
+
+    The data is carried as a YAML string so that requests can be serialized
+    as JSON, e.g. for the catalog coordinator.
+    """
+    return {
+        'op': UPDATE,
+        'product': product,
+        'version': product_version,
+        'data': yaml.safe_dump(data, default_flow_style=False),
+        'set_active': bool(set_active),
+        'remove_active': bool(remove_active),
+    }
+
+
+def delete_request(product, product_version, key=None):
+    """Return a request to delete a product version or key, for use with apply_requests."""
+    return {
+        'op': DELETE,
+        'product': product,
+        'version': product_version,
+        'key': key,
+    }
+
+
+def apply_request(product_data, request):
+    """Apply a single update or delete request to decoded product data in place.
+
+    Args:
+        product_data (dict): A mapping from version to version data for the
+            product named in the request.
+        request (dict): A request created by update_request or delete_request.
+
+    Returns:
+        bool: True if product_data was changed.
+
+    Raises:
+        ValueError: if the request is not valid.
+        TypeError: if update data cannot be merged with the existing data.
+    """
+    if request.get('op') == UPDATE:
+        return apply_update(
+            product_data, request['version'], yaml.safe_load(request.get('data') or '') or {},
+            set_active=request.get('set_active'), remove_active=request.get('remove_active')
+        )
+    elif request.get('op') == DELETE:
+        return apply_delete(product_data, request['version'], request.get('key'))
+    raise ValueError(f'Unrecognized catalog request operation "{request.get("op")}"')
+
+
+def apply_requests(config_map_data, requests, on_error=None):
+    """Apply a sequence of update and delete requests to ConfigMap data.
+
+    Each product's YAML is decoded at most once and encoded at most once, no
+    matter how many requests refer to it.
+
+    Args:
+        config_map_data (dict): The ConfigMap data, a mapping from product
+            name to a YAML string of that product's versions. Not modified.
+        requests (list of dict): The requests to apply, in order.
+        on_error (callable, optional): If given, called with (request, err)
+            when a request fails with ValueError or TypeError; that request
+            is skipped and the others are still applied. Otherwise the error
+            is raised.
+
+    Returns:
+        dict: a mapping from product name to the new YAML string for each
+            product that was changed, suitable for patching the ConfigMap.
+    """
+    decoded = {}
+    changed = set()
+    for request in requests:
+        product = request['product']
+        if product not in decoded:
+            if product not in config_map_data:
+                if request.get('op') != UPDATE:
+                    continue  # product doesn't exist, don't need to remove anything
+                decoded[product] = {}
+            else:
+                with YAML_SECONDS.time(action='parse'), tracing.span('yaml.safe_load'):
+                    decoded[product] = yaml.safe_load(config_map_data[product]) or {}
+        try:
+            if apply_request(decoded[product], request):
+                changed.add(product)
+        except (ValueError, TypeError) as err:
+            if on_error is None:
+                raise
+            on_error(request, err)
+
+    with YAML_SECONDS.time(action='dump'), tracing.span('yaml.safe_dump'):
+        return {
+            product: yaml.safe_dump(decoded[product], default_flow_style=False)
+            for product in changed
+        }
@@ -0,0 +1,342 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Defines the read-modify-write loops with which catalog_update and
+# catalog_delete apply a change to a product catalog ConfigMap.
+from contextlib import nullcontext
+import copy
+import logging
+import random
+
+from kubernetes import client
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+import yaml
+
+from cray_product_catalog.util import metrics, tracing
+from cray_product_catalog.util.catalog_data import active_field_exists, apply_delete, apply_update
+from cray_product_catalog.util.deadline import Deadline
+from cray_product_catalog.util.journal import record_write
+from cray_product_catalog.util.k8s import get_api_client, read_config_map, wait_for_config_map
+from cray_product_catalog.util.lease import LEASE_LOCK, LeaseLock, lease_name_for
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+
+LOGGER = logging.getLogger(__name__)
+
+
+@tracing.traced('update_config_map')
+def update_config_map(data, name, namespace, product, product_version, set_active=False, remove_active=False,
+                      lock_mode=None, lock_duration=15, wait_timeout=None, deadline=None, context=None,
+                      journal=None):
+    """
+    Get the config map `data` to be added.
+
+    1. Wait for the config map to be present in the namespace
+    2. Read the config map
+    3. Patch the config_map
+    4. Read back the config_map
+    5. Repeat steps 2-4 if config_map does not include the changes requested,
+       or if step 3 failed due to a conflict.
+
+    If `lock_mode` is 'lease', steps 2-3 are performed while holding a Lease
+    named after the config map, and step 4 is skipped once a patch succeeds.
+
+    Step 1 watches for the config map to be created, for up to `wait_timeout`
+    seconds, or indefinitely if `wait_timeout` is None.
+
+    If a `deadline` is given, every request, retry, and wait is bounded by it,
+    and DeadlineExceeded is raised once it has elapsed.
+
+    If a kubeconfig `context` is given, the config map is modified in that
+    context's cluster rather than with the default configuration.
+
+    If a `journal` is given, each successful patch is recorded in it.
+    """
+    deadline = deadline or Deadline()
+    k8sclient = get_api_client(retries=100, context=context)
+    api_instance = client.CoreV1Api(k8sclient)
+    if journal:
+        journal = journal.bind(api_instance, namespace)
+    attempt = 0
+    not_found_error = None
+    lock = None
+    if lock_mode == LEASE_LOCK:
+        lock = LeaseLock(client.CoordinationV1Api(k8sclient), lease_name_for(name), namespace,
+                         lease_duration=lock_duration, deadline=deadline)
+
+    # Requests retried by the shared client stop at the deadline while it is entered.
+    with deadline:
+        while True:
+            attempt += 1
+            with tracing.span('update_config_map.attempt', attempt=attempt):
+                # If the config map doesn't exist yet, watch for it to be created.
+                # Otherwise, wait a while to check the config map in case multiple
+                # products are attempting to update the same config map. Holders of
+                # the lease lock only need to wait if their first attempt did not
+                # succeed.
+                deadline.check(f'updating ConfigMap {namespace}/{name}')
+                deadline.count('attempts')
+                metrics.ATTEMPTS.inc(operation='update')
+                if not_found_error:
+                    if not wait_for_config_map(api_instance, name, namespace, deadline.limit(wait_timeout)):
+                        deadline.check(f'waiting for ConfigMap {namespace}/{name} to be created')
+                        LOGGER.error("ConfigMap %s/%s was not created within %ss", namespace, name, wait_timeout)
+                        raise not_found_error
+                    not_found_error = None
+                elif not lock or attempt > 1:
+                    sleepy_time = random.randint(1, 3)
+                    LOGGER.debug("Resting %ss before reading ConfigMap", sleepy_time)
+                    deadline.sleep(sleepy_time)
+
+                with lock or nullcontext():
+                    # Read in the config map
+                    try:
+                        response = read_config_map(api_instance, name, namespace, **deadline.request_kwargs())
+                    except ApiException as e:
+                        # Config map doesn't exist yet
+                        if e.status == ERR_NOT_FOUND:
+                            LOGGER.warning("ConfigMap %s/%s doesn't exist, waiting for it to be created",
+                                           namespace, name)
+                            deadline.count('not_found')
+                            metrics.NOT_FOUND_RETRIES.inc(operation='update')
+                            not_found_error = e
+                            continue
+                        else:
+                            metrics.API_ERRORS.inc(operation='update')
+                            LOGGER.exception("Error calling read_namespaced_config_map")
+                            raise  # unrecoverable
+
+                    # Determine if ConfigMap needs to be updated
+                    config_map_data = response.data or {}  # if no config map data exists
+                    if product not in config_map_data:
+                        LOGGER.info("Product=%s does not exist; will update", product)
+                        product_data = {}
+                    # Product exists in ConfigMap
+                    else:
+                        with metrics.YAML_SECONDS.time(action='parse'), tracing.span('yaml.safe_load'):
+                            product_data = yaml.safe_load(config_map_data[product])
+                        if product_version not in product_data:
+                            LOGGER.info(
+                                "Version=%s does not exist; will update", product_version
+                            )
+
+                    old_product_data = copy.deepcopy(product_data) if journal and product in config_map_data else None
+                    if remove_active and active_field_exists(product_data):
+                        LOGGER.info("Deleting 'active' field for all versions of %s", product)
+                    if not apply_update(product_data, product_version, data, set_active, remove_active):
+                        # Data to insert matches data found in configmap.
+                        if set_active:
+                            LOGGER.debug("ConfigMap data updates exist and desired version is active; Exiting")
+                        elif remove_active:
+                            LOGGER.debug("ConfigMap data updates exist and 'active' field has been cleared; Exiting")
+                        else:
+                            LOGGER.debug("ConfigMap data updates exist; Exiting")
+                        break
+
+                    # Patch the config map if needed
+                    with metrics.YAML_SECONDS.time(action='dump'), tracing.span('yaml.safe_dump'):
+                        config_map_data[product] = yaml.safe_dump(
+                            product_data, default_flow_style=False
+                        )
+                    LOGGER.debug("ConfigMap update attempt=%s", attempt)
+                    try:
+                        new_config_map = V1ConfigMap(data=config_map_data)
+                        new_config_map.metadata = V1ObjectMeta(
+                            name=name, resource_version=response.resource_version
+                        )
+                        with tracing.span('patch_config_map', config_map=name, namespace=namespace):
+                            result = api_instance.patch_namespaced_config_map(
+                                name, namespace, body=new_config_map, **deadline.request_kwargs()
+                            )
+                        record_write(journal, namespace, name, product, product_version, old_product_data,
+                                     product_data, result, response.resource_version)
+                        if lock:
+                            # The patch was made while holding the lock, so it does not
+                            # need to be read back.
+                            LOGGER.debug("ConfigMap update attempt %s successful; Exiting", attempt)
+                            break
+                    except ApiException as e:
+                        if e.status == ERR_CONFLICT:
+                            # A conflict is raised if the resourceVersion field was unexpectedly
+                            # incremented, e.g. if another process updated the config map. This
+                            # provides concurrency protection.
+                            deadline.count('conflicts')
+                            metrics.CONFLICTS.inc(operation='update')
+                            LOGGER.warning("Conflict updating config map")
+                        else:
+                            deadline.count('errors')
+                            metrics.API_ERRORS.inc(operation='update')
+                            LOGGER.exception("Error calling replace_namespaced_config_map")
+
+
+@tracing.traced('modify_config_map')
+def modify_config_map(name, namespace, product, product_version, key=None, lock_mode=None, lock_duration=15,
+                      wait_timeout=200, deadline=None, context=None, journal=None):
+    """Remove a product version from the catalog config map.
+
+    If a key is specified, delete the `key` content from a specific section
+    of the catalog config map. If there are no more keys after it has been
+    removed, remove the version mapping as well.
+
+    1. Wait for the config map to be present in the namespace
+    2. Patch the config_map, failing if its resourceVersion has changed
+    3. Read back the config_map
+    4. Repeat steps 2-3 if config_map does not reflect the changes requested
+
+    If `lock_mode` is 'lease', each read and patch is performed while holding
+    a Lease named after the config map.
+
+    Step 1 watches for the config map to be created, for up to `wait_timeout`
+    seconds, or indefinitely if `wait_timeout` is None.
+
+    If a `deadline` is given, every request, retry, and wait is bounded by it,
+    and DeadlineExceeded is raised once it has elapsed.
+
+    If a kubeconfig `context` is given, the config map is modified in that
+    context's cluster rather than with the default configuration.
+
+    If a `journal` is given, each successful patch is recorded in it.
+    """
+    deadline = deadline or Deadline()
+    k8sclient = get_api_client(retries=100, context=context)
+    api_instance = client.CoreV1Api(k8sclient)
+    if journal:
+        journal = journal.bind(api_instance, namespace)
+    attempt = 0
+    not_found_error = None
+    lock = None
+    if lock_mode == LEASE_LOCK:
+        lock = LeaseLock(client.CoordinationV1Api(k8sclient), lease_name_for(name), namespace,
+                         lease_duration=lock_duration, deadline=deadline)
+
+    # Requests retried by the shared client stop at the deadline while it is entered.
+    with deadline:
+        while True:
+            attempt += 1
+            with tracing.span('modify_config_map.attempt', attempt=attempt):
+                # If the config map doesn't exist yet, watch for it to be created.
+                # Otherwise, wait a while to check the config map in case multiple
+                # products are attempting to update the same config map. Holders of
+                # the lease lock only need to wait if their first attempt did not
+                # succeed.
+                deadline.check(f'updating ConfigMap {namespace}/{name}')
+                deadline.count('attempts')
+                metrics.ATTEMPTS.inc(operation='delete')
+                if not_found_error:
+                    if not wait_for_config_map(api_instance, name, namespace, deadline.limit(wait_timeout)):
+                        deadline.check(f'waiting for ConfigMap {namespace}/{name} to be created')
+                        LOGGER.error("ConfigMap %s/%s was not created within %ss", namespace, name, wait_timeout)
+                        raise not_found_error
+                    not_found_error = None
+                elif not lock or attempt > 1:
+                    sleepy_time = random.randint(1, 3)
+                    LOGGER.info("Resting %ss before reading ConfigMap", sleepy_time)
+                    deadline.sleep(sleepy_time)
+
+                with lock or nullcontext():
+                    # Read in the config map
+                    try:
+                        response = read_config_map(api_instance, name, namespace, **deadline.request_kwargs())
+                    except ApiException as e:
+                        # Config map doesn't exist yet
+                        if e.status == ERR_NOT_FOUND:
+                            LOGGER.warning("ConfigMap %s/%s doesn't exist, waiting for it to be created.",
+                                           namespace, name)
+                            deadline.count('not_found')
+                            metrics.NOT_FOUND_RETRIES.inc(operation='delete')
+                            not_found_error = e
+                            continue
+                        else:
+                            metrics.API_ERRORS.inc(operation='delete')
+                            LOGGER.exception("Error calling read_namespaced_config_map")
+                            raise  # unrecoverable
+
+                    # Determine if ConfigMap needs to be updated
+                    config_map_data = response.data or {}  # if no config map data exists
+                    if product not in config_map_data:
+                        break  # product doesn't exist, don't need to remove anything
+
+                    # Product exists in ConfigMap
+                    with metrics.YAML_SECONDS.time(action='parse'), tracing.span('yaml.safe_load'):
+                        product_data = yaml.safe_load(config_map_data[product])
+                    if product_version not in product_data:
+                        LOGGER.info(
+                            "Version %s not in ConfigMap", product_version
+                        )
+                        break  # product version is gone, we are done
+
+                    # Product version exists in ConfigMap
+                    if key and key in product_data[product_version]:
+                        LOGGER.info(
+                            "key=%s in version=%s exists; to be removed",
+                            key, product_version
+                        )
+                    if key and set(product_data[product_version].keys()) <= {key}:
+                        LOGGER.info(
+                            "No keys remain in version=%s; removing version",
+                            product_version
+                        )
+                    elif not key:
+                        LOGGER.info(
+                            "Removing product=%s, version=%s",
+                            product, product_version
+                        )
+                    old_product_data = copy.deepcopy(product_data) if journal else None
+                    if not apply_delete(product_data, product_version, key):
+                        break  # key is gone, we are done
+
+                    # Patch the config map
+                    with metrics.YAML_SECONDS.time(action='dump'), tracing.span('yaml.safe_dump'):
+                        config_map_data[product] = yaml.safe_dump(
+                            product_data, default_flow_style=False
+                        )
+                    LOGGER.info("ConfigMap update attempt=%s", attempt)
+                    # The resourceVersion makes the patch fail with a conflict if another
+                    # process updated the config map since it was read, even while the
+                    # lock is held, since the lock may have been taken over.
+                    new_config_map = client.V1ConfigMap(
+                        data=config_map_data,
+                        metadata=client.V1ObjectMeta(name=name, resource_version=response.resource_version)
+                    )
+                    try:
+                        with tracing.span('patch_config_map', config_map=name, namespace=namespace):
+                            result = api_instance.patch_namespaced_config_map(
+                                name, namespace, new_config_map, **deadline.request_kwargs()
+                            )
+                        LOGGER.info("ConfigMap update attempt %s successful", attempt)
+                        record_write(journal, namespace, name, product, product_version, old_product_data,
+                                     product_data, result, response.resource_version)
+                        if lock:
+                            break  # patched while holding the lock, no need to read it back
+                    except ApiException as e:
+                        if e.status == ERR_CONFLICT:
+                            deadline.count('conflicts')
+                            metrics.CONFLICTS.inc(operation='delete')
+                            LOGGER.warning("Conflict updating config map")
+                        else:
+                            deadline.count('errors')
+                            metrics.API_ERRORS.inc(operation='delete')
+                            LOGGER.exception("Error calling patch_namespaced_config_map")
@@ -0,0 +1,203 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Defines an end-to-end deadline shared by every layer of a catalog operation.
+
+from contextvars import ContextVar
+import os
+import threading
+import time
+
+from urllib3.util.retry import Retry
+
+from cray_product_catalog.util import tracing
+from cray_product_catalog.util.metrics import SLEEP_SECONDS
+
+# Exit status of a catalog script that ran out of time, matching timeout(1)
+DEADLINE_EXCEEDED_EXIT_CODE = 124
+
+# The Deadline of the operation running in the current thread, see Deadline.__enter__
+_active_deadline = ContextVar('active_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The deadline for a catalog operation elapsed before it completed."""
+
+
+class Deadline:
+    """A time budget for an operation and a record of how it was spent.
+
+    A Deadline with no limit never expires, so callers can use one
+    unconditionally. While a Deadline is entered as a context manager, it is
+    obeyed by DeadlineRetry objects without a deadline of their own, such as
+    those of the clients from util.k8s.get_api_client.
+
+    Attributes:
+        seconds (float): The total budget in seconds, or None if unlimited.
+        counts (dict): The number of each kind of event counted with `count`.
+        slept (float): Total seconds spent in `sleep`.
+    """
+    def __init__(self, seconds=None):
+        """Create the Deadline, starting its clock.
+
+        Args:
+            seconds (float, optional): The budget in seconds. Unlimited if None.
+        """
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.end = None if seconds is None else self.start + seconds
+        self.counts = {}
+        self.slept = 0.0
+        # A Deadline may be shared by operations in several threads, each of which enters it
+        self._local = threading.local()
+
+    def __enter__(self):
+        self._local.__dict__.setdefault('tokens', []).append(_active_deadline.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_deadline.reset(self._local.tokens.pop())
+
+    @staticmethod
+    def active():
+        """Return the Deadline entered in the current thread, or None."""
+        return _active_deadline.get()
+
+    @classmethod
+    def from_env(cls, var='CATALOG_DEADLINE_SECONDS'):
+        """Create a Deadline from an environment variable, unlimited if it is unset."""
+        return cls(float(os.environ.get(var) or 0) or None)
+
+    def elapsed(self):
+        """Return seconds since the deadline was started."""
+        return time.monotonic() - self.start
+
+    def remaining(self):
+        """Return the seconds left, never less than zero, or None if unlimited."""
+        if self.end is None:
+            return None
+        return max(0.0, self.end - time.monotonic())
+
+    def expired(self):
+        """Return True if the deadline has elapsed."""
+        return self.end is not None and time.monotonic() >= self.end
+
+    def count(self, event, n=1):
+        """Record that an event, e.g. an attempt or a conflict, occurred."""
+        self.counts[event] = self.counts.get(event, 0) + n
+
+    def summary(self):
+        """Return a one-line description of the time spent and events counted."""
+        counts = ''.join(f' {event}={n}' for event, n in sorted(self.counts.items()))
+        return f'elapsed={self.elapsed():.1f}s slept={self.slept:.1f}s{counts}'
+
+    def check(self, activity):
+        """Raise DeadlineExceeded if the deadline has elapsed.
+
+        Args:
+            activity (str): What was being done, for the error message.
+
+        Raises:
+            DeadlineExceeded: if the deadline has elapsed.
+        """
+        if self.expired():
+            raise DeadlineExceeded(f'Deadline of {self.seconds}s exceeded while {activity} ({self.summary()})')
+
+    def limit(self, timeout):
+        """Return `timeout` reduced to the time remaining.
+
+        Args:
+            timeout (float): Seconds, or None for no timeout.
+
+        Returns:
+            float: the smaller of `timeout` and the time remaining, or None
+                if both are unlimited.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def sleep(self, seconds):
+        """Sleep for `seconds` or until the deadline, whichever comes first."""
+        seconds = self.limit(seconds)
+        with tracing.span('sleep', seconds=seconds):
+            time.sleep(seconds)
+        self.slept += seconds
+        SLEEP_SECONDS.observe(seconds)
+
+    def request_kwargs(self):
+        """Return keyword arguments which limit a Kubernetes API call to the time remaining.
+
+        Returns:
+            dict: `_request_timeout` set to the time remaining, or an empty
+                dict if the deadline is unlimited.
+
+        Raises:
+            DeadlineExceeded: if the deadline has already elapsed.
+        """
+        if self.end is None:
+            return {}
+        self.check('making a Kubernetes API request')
+        return {'_request_timeout': self.remaining()}
+
+
+class DeadlineRetry(Retry):
+    """A urllib3 Retry which stops retrying and backing off at a deadline.
+
+    The deadline is the one given, or else the Deadline active in the thread
+    making the request, if any.
+    """
+
+    def __init__(self, *args, deadline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deadline = deadline
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.deadline = self.deadline
+        return retry
+
+    def _deadline(self):
+        return self.deadline or Deadline.active()
+
+    def increment(self, *args, **kwargs):
+        deadline = self._deadline()
+        if deadline is not None:
+            deadline.count('request_retries')
+            deadline.check('retrying a Kubernetes API request')
+        return super().increment(*args, **kwargs)
+
+    def sleep(self, response=None):
+        deadline = self._deadline()
+        if deadline is None:
+            super().sleep(response)
+            return None
+        seconds = None
+        if self.respect_retry_after_header and response:
+            seconds = self.get_retry_after(response)
+        if seconds is None:
+            seconds = self.get_backoff_time()
+        if seconds > 0:
+            deadline.sleep(seconds)
+        return None
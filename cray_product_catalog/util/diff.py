@@ -0,0 +1,169 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Contains functions for computing the differences between versions of
+# product catalog data.
+#
+# Catalog data maps each product name to a YAML string of its versions. Only
+# products whose strings, or recorded hashes, differ are parsed, so comparing
+# two large catalogs which differ in a few products costs little more than
+# comparing strings.
+
+from collections import namedtuple
+
+import yaml
+
+PRODUCT_ADDED = 'product_added'
+PRODUCT_REMOVED = 'product_removed'
+VERSION_ADDED = 'version_added'
+VERSION_REMOVED = 'version_removed'
+ACTIVE_CHANGED = 'active_changed'
+KEY_CHANGED = 'key_changed'
+
+# A change to the product catalog. `version` is None for product changes, and
+# `key` is only set for KEY_CHANGED changes; it is a top-level key of the
+# version data, or the dotted path of a nested field in a deep comparison.
+# `old` and `new` are the values before and after the change: the version
+# data for VERSION_ADDED and VERSION_REMOVED, the 'active' flag for
+# ACTIVE_CHANGED, and the value of the key, or None if it was missing, for
+# KEY_CHANGED. `resource_version` is the resourceVersion of the ConfigMap the
+# change was seen in, if known. `path` is only set in a deep comparison; it is
+# the tuple of keys leading to the field, which unlike `key` is unambiguous
+# when keys contain dots.
+CatalogChange = namedtuple(
+    'CatalogChange', ('type', 'product', 'version', 'key', 'old', 'new', 'resource_version', 'path'),
+    defaults=(None, None, None, None, None, None)
+)
+
+# Use the much faster LibYAML parser if PyYAML was built with it.
+_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _diff_fields(product, version, path, old_value, new_value):
+    """Yield KEY_CHANGED changes for the fields of two values which differ."""
+    if isinstance(old_value, dict) and isinstance(new_value, dict):
+        for key in list(old_value) + [key for key in new_value if key not in old_value]:
+            yield from _diff_fields(product, version, path + (key,), old_value.get(key), new_value.get(key))
+    elif old_value != new_value:
+        yield CatalogChange(KEY_CHANGED, product, version, '.'.join(str(key) for key in path), old_value, new_value,
+                            path=path)
+
+
+def diff_version(product, version, old_data, new_data, deep=False):
+    """Yield the changes between two versions of a product version's data.
+
+    Args:
+        product (str): The product name.
+        version (str): The product version.
+        old_data (dict): The version data before the change.
+        new_data (dict): The version data after the change.
+        deep (bool): If True, compare nested mappings field by field.
+
+    Yields:
+        CatalogChange: an ACTIVE_CHANGED change, and a KEY_CHANGED change for
+            each other top-level key, or nested field if `deep` is True,
+            whose value differs.
+    """
+    if old_data == new_data:
+        return
+    old_active, new_active = old_data.get('active', False), new_data.get('active', False)
+    if old_active != new_active:
+        yield CatalogChange(ACTIVE_CHANGED, product, version, old=old_active, new=new_active)
+    for key in list(old_data) + [key for key in new_data if key not in old_data]:
+        if key == 'active':
+            continue
+        if deep:
+            yield from _diff_fields(product, version, (key,), old_data.get(key), new_data.get(key))
+        elif old_data.get(key) != new_data.get(key):
+            yield CatalogChange(KEY_CHANGED, product, version, key, old_data.get(key), new_data.get(key))
+
+
+def diff_product(product, old_versions, new_versions, deep=False):
+    """Yield the changes between two versions of a product's data.
+
+    Args:
+        product (str): The product name.
+        old_versions (dict): A mapping from version to version data before
+            the change.
+        new_versions (dict): A mapping from version to version data after
+            the change.
+        deep (bool): If True, compare nested mappings field by field.
+
+    Yields:
+        CatalogChange: the changes to the product's versions.
+    """
+    for version, old_data in old_versions.items():
+        if version not in new_versions:
+            yield CatalogChange(VERSION_REMOVED, product, version, old=old_data)
+        else:
+            yield from diff_version(product, version, old_data or {}, new_versions[version] or {}, deep)
+    for version, new_data in new_versions.items():
+        if version not in old_versions:
+            yield CatalogChange(VERSION_ADDED, product, version, new=new_data)
+
+
+def _load(product_data):
+    return yaml.load(product_data, Loader=_LOADER) or {}
+
+
+def diff_catalog_data(old_data, new_data, old_hashes=None, new_hashes=None, deep=False):
+    """Yield the changes between two versions of product catalog data.
+
+    Products whose YAML strings are identical, or whose hashes are recorded
+    on both sides and equal, are skipped without being parsed.
+
+    Args:
+        old_data (dict): A mapping from product name to a YAML string of
+            its versions, before the change.
+        new_data (dict): The same, after the change.
+        old_hashes (dict, optional): A mapping from product name to the hash
+            of its YAML string in `old_data`.
+        new_hashes (dict, optional): The same, for `new_data`.
+        deep (bool): If True, compare nested mappings field by field.
+
+    Yields:
+        CatalogChange: the changes, product by product. A product which was
+            added or removed is reported with a PRODUCT_ADDED or
+            PRODUCT_REMOVED change followed by a change for each of its
+            versions.
+
+    Raises:
+        yaml.YAMLError: if the data of a changed product could not be parsed.
+    """
+    old_data, new_data = old_data or {}, new_data or {}
+    old_hashes, new_hashes = old_hashes or {}, new_hashes or {}
+    for product, old_yaml in old_data.items():
+        new_yaml = new_data.get(product)
+        old_hash = old_hashes.get(product)
+        if new_yaml == old_yaml or (old_hash is not None and old_hash == new_hashes.get(product)):
+            continue
+        old_versions = _load(old_yaml)
+        if new_yaml is None:
+            yield CatalogChange(PRODUCT_REMOVED, product)
+            yield from diff_product(product, old_versions, {}, deep)
+        else:
+            yield from diff_product(product, old_versions, _load(new_yaml), deep)
+    for product, new_yaml in new_data.items():
+        if product not in old_data:
+            yield CatalogChange(PRODUCT_ADDED, product)
+            yield from diff_product(product, {}, _load(new_yaml), deep)
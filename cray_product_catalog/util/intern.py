@@ -0,0 +1,103 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Contains a hash-consing pass which shares identical parts of product
+# catalog data.
+#
+# Consecutive versions of a product usually repeat most of their components
+# and repositories. Interning the data of all versions of a catalog replaces
+# each mapping with a read-only MappingProxyType, each list with a tuple, and
+# each string with an interned one, and makes every value which is equal to one
+# seen before, with the same types throughout, the same object as that one.
+# Data must be validated before it is interned, since the schema only accepts
+# dicts and lists.
+
+import sys
+from types import MappingProxyType
+
+# Returned by the table for values not seen before
+_MISSING = object()
+
+
+class Interner:
+    """Shares identical values among all of the data passed to intern.
+
+    The table of values seen is only needed while data is being interned, so
+    an Interner should be discarded once a catalog has been loaded.
+
+    Attributes:
+        values (int): The number of values other than strings interned.
+        shared (int): The number of those values which were replaced with an
+            equal value seen before.
+    """
+
+    def __init__(self):
+        self._table = {}
+        self.values = 0
+        self.shared = 0
+
+    def intern(self, value):
+        """Return an immutable value equal to `value`, shared with any equal value seen before.
+
+        Args:
+            value: Data loaded from YAML or JSON.
+
+        Returns:
+            The interned value: a MappingProxyType for a dict, a tuple for
+            a list, an interned str for a str, and otherwise the value
+            itself, shared if it is hashable.
+        """
+        return self._intern(value)[0]
+
+    def _intern(self, value):
+        """Return the interned value and the key it is stored under in the table."""
+        if isinstance(value, str):
+            value = sys.intern(value)
+            return value, value
+        if isinstance(value, dict):
+            items = [(self._intern(key), self._intern(item)) for key, item in value.items()]
+            key = (dict, tuple((key_key, item_key) for (_, key_key), (_, item_key) in items))
+        elif isinstance(value, (list, tuple)):
+            items = [self._intern(item) for item in value]
+            key = (tuple, tuple(item_key for _, item_key in items))
+        else:
+            # Scalars are keyed by their type too, since True == 1 == 1.0.
+            key = (type(value), value)
+
+        self.values += 1
+        try:
+            shared = self._table.get(key, _MISSING)
+        except TypeError:
+            # An unhashable value, e.g. a set from !!set, is not shared.
+            return value, (id, id(value))
+        if shared is not _MISSING:
+            self.shared += 1
+            return shared, key
+
+        if isinstance(value, dict):
+            shared = MappingProxyType({key: item for (key, _), (item, _) in items})
+        elif isinstance(value, (list, tuple)):
+            shared = tuple(item for item, _ in items)
+        else:
+            shared = value
+        self._table[key] = shared
+        return shared, key
@@ -0,0 +1,575 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Contains a bounded journal of the changes made to the product catalog, and
+# functions for rewinding catalog data to an earlier point using it.
+#
+# Each entry of the journal records one write of one product by catalog_update
+# or catalog_delete:
+#
+#   {"seq": 12, "time": "2023-06-01T12:00:00.000000+00:00",
+#    "namespace": "services", "name": "cray-product-catalog",
+#    "previousResourceVersion": "4560", "resourceVersion": "4567",
+#    "product": "sat", "version": "2.3.4",
+#    "before": "sha256:...", "after": "sha256:...",
+#    "changes": [{"version": "2.3.4", "path": ["active"], "old": false, "new": true}, ...]}
+#
+# Each change is a value within a version, at the given path of mapping keys,
+# or a whole version if it has no "path". Changes are found by the deep
+# comparison of util.diff, and a version is recorded whole if that does not
+# account for all of its changes, e.g. a key added with a value of None.
+# "old" is omitted if the value or version did not exist before, and "new" is
+# omitted if it was removed. The hashes are of the product's data before and after the write,
+# or null if the product did not exist, so a rewind can check that the
+# catalog has not been changed in other ways.
+#
+# resourceVersions are opaque strings, so entries are ordered by their
+# position in the journal. A rewind to a resourceVersion finds the entry
+# made at or just after it by comparing resourceVersions for equality only.
+#
+# Entries are kept in a ConfigMap, one data key per entry, or appended to a
+# local file as JSON lines. The oldest entries are dropped once a journal
+# grows past its size limit, so a journal can only rewind the catalog to a
+# point after its oldest entry.
+
+from abc import ABC, abstractmethod
+import copy
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError
+import yaml
+
+from cray_product_catalog.util.diff import KEY_CHANGED, diff_product
+from cray_product_catalog.util.k8s import read_config_map
+from cray_product_catalog.util.snapshot import hash_product_data
+
+LOGGER = logging.getLogger(__name__)
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+
+# The default limit on the size of the entries in a journal. A ConfigMap
+# holds at most 1 MiB.
+JOURNAL_MAX_BYTES = 512 * 1024
+# The number of times a journal ConfigMap is re-read after a conflict
+JOURNAL_MAX_ATTEMPTS = 5
+
+
+class JournalError(Exception):
+    """The journal could not be read, written, or replayed."""
+
+
+def hash_versions(product_data):
+    """Return the hash of a product's decoded data as the catalog stores it, or None for no product."""
+    if product_data is None:
+        return None
+    return hash_product_data(yaml.safe_dump(product_data, default_flow_style=False))
+
+
+def _lookup(data, path):
+    """Return whether a path of keys exists in nested mappings, and the value there."""
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return False, None
+        data = data[key]
+    return True, data
+
+
+def _set(data, path, change, side):
+    """Set the value at a path to one side, 'old' or 'new', of a change, or remove it if that side is missing."""
+    for key in path[:-1]:
+        data = data.setdefault(key, {})
+    if side in change:
+        data[path[-1]] = copy.deepcopy(change[side])
+    else:
+        data.pop(path[-1], None)
+
+
+def _diff_fields(version, old_version, new_version):
+    """Return the changes between the data of one version, each field by its path."""
+    changes = []
+    for change in diff_product(None, {version: old_version}, {version: new_version}, deep=True):
+        path = (change.path or (change.key,)) if change.type == KEY_CHANGED else ('active',)
+        record = {'version': version, 'path': list(path)}
+        for side, data in (('old', old_version), ('new', new_version)):
+            found, value = _lookup(data, path)
+            if found:
+                record[side] = value
+        changes.append(record)
+
+    # A field added or removed with a value of None, or an 'active' flag of
+    # False, is not a difference to diff_product, so record the whole
+    # version if the changes to its fields do not account for all of it.
+    applied = copy.deepcopy(old_version)
+    for record in changes:
+        _set(applied, record['path'], record, 'new')
+    if applied != new_version:
+        return [{'version': version, 'old': old_version, 'new': new_version}]
+    return changes
+
+
+def diff_versions(old_data, new_data):
+    """Return the changes between two versions of a product's data, as recorded in the journal.
+
+    The changes are found by a deep comparison with diff_product.
+
+    Args:
+        old_data (dict): A mapping from version to version data before the
+            change, or None if the product did not exist.
+        new_data (dict): A mapping from version to version data after the
+            change, or None if the product was removed.
+
+    Returns:
+        list of dict: the changes to each value within each version, or to
+            whole versions which were added, removed, or are not mappings.
+    """
+    old_data, new_data = old_data or {}, new_data or {}
+    changes = []
+    for version in list(old_data) + [version for version in new_data if version not in old_data]:
+        old_version, new_version = old_data.get(version), new_data.get(version)
+        if version not in new_data:
+            changes.append({'version': version, 'old': old_version})
+        elif version not in old_data:
+            changes.append({'version': version, 'new': new_version})
+        elif old_version == new_version:
+            continue
+        elif not isinstance(old_version, dict) or not isinstance(new_version, dict):
+            changes.append({'version': version, 'old': old_version, 'new': new_version})
+        else:
+            changes.extend(_diff_fields(version, old_version, new_version))
+    return changes
+
+
+def make_entry(namespace, name, product, product_version, old_data, new_data, resource_version=None,
+               previous_resource_version=None):
+    """Return a journal entry for a write of one product, without its sequence number.
+
+    Args:
+        namespace (str): The namespace of the catalog ConfigMap.
+        name (str): The name of the catalog ConfigMap.
+        product (str): The product written.
+        product_version (str): The version named in the request.
+        old_data (dict): The product's decoded data before the write, or
+            None if it did not exist.
+        new_data (dict): The product's decoded data after the write, or None
+            if it was removed.
+        resource_version (str, optional): The resourceVersion of the
+            ConfigMap after the write.
+        previous_resource_version (str, optional): The resourceVersion of
+            the ConfigMap that was read and written over.
+
+    Returns:
+        dict: the entry, or None if the write did not change the product.
+    """
+    changes = diff_versions(old_data, new_data)
+    if not changes:
+        return None
+    return {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'namespace': namespace,
+        'name': name,
+        'previousResourceVersion': previous_resource_version,
+        'resourceVersion': resource_version,
+        'product': product,
+        'version': product_version,
+        'before': hash_versions(old_data),
+        'after': hash_versions(new_data),
+        'changes': changes,
+    }
+
+
+class Journal(ABC):
+    """A bounded, append-only sequence of journal entries.
+
+    Attributes:
+        max_bytes (int): The size of the entries after which the oldest are
+            dropped.
+    """
+
+    def __init__(self, max_bytes=JOURNAL_MAX_BYTES):
+        self.max_bytes = max_bytes
+
+    @abstractmethod
+    def bind(self, api_instance, namespace):
+        """Return this journal for use with the catalog in the given namespace of the API's cluster."""
+
+    @abstractmethod
+    def append(self, entry):
+        """Add an entry to the journal, assigning its sequence number.
+
+        Raises:
+            JournalError: if the entry could not be added.
+        """
+
+    @abstractmethod
+    def entries(self):
+        """Return the entries in the journal, oldest first.
+
+        Raises:
+            JournalError: if the journal could not be read.
+        """
+
+    def record(self, namespace, name, product, product_version, old_data, new_data, resource_version=None,
+               previous_resource_version=None):
+        """Add an entry for a write of one product, as described by make_entry.
+
+        Returns:
+            dict: the entry added, or None if the write did not change the
+                product.
+
+        Raises:
+            JournalError: if the entry could not be added.
+        """
+        entry = make_entry(namespace, name, product, product_version, old_data, new_data, resource_version,
+                           previous_resource_version)
+        if entry:
+            self.append(entry)
+        return entry
+
+
+class FileJournal(Journal):
+    """A journal kept in a local file of JSON lines.
+
+    When the file grows past `max_bytes`, it is renamed with a '.1' suffix,
+    replacing the entries previously renamed, and a new file is started.
+
+    Attributes:
+        path (str): The path of the file.
+    """
+
+    def __init__(self, path, max_bytes=JOURNAL_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self, path):
+        try:
+            with open(path) as jfile:
+                return [json.loads(line) for line in jfile if line.strip()]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as err:
+            raise JournalError(f'Unable to read journal {path}: {err}')
+
+    def bind(self, api_instance, namespace):
+        # The file is the same whichever catalog it is used with.
+        return self
+
+    def entries(self):
+        return self._read(f'{self.path}.1') + self._read(self.path)
+
+    def append(self, entry):
+        with self._lock:
+            entries = self.entries()
+            entry = dict(entry, seq=entries[-1]['seq'] + 1 if entries else 1)
+            try:
+                with open(self.path, 'a') as jfile:
+                    jfile.write(json.dumps(entry, sort_keys=True, default=str) + '\n')
+                if os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f'{self.path}.1')
+            except OSError as err:
+                raise JournalError(f'Unable to write journal {self.path}: {err}')
+        return entry
+
+
+class ConfigMapJournal(Journal):
+    """A journal kept in a ConfigMap, with one data key per entry.
+
+    Each entry is added with a patch which is conditional on the
+    resourceVersion of the ConfigMap that was read, and the oldest entries
+    are removed in the same patch once the entries exceed `max_bytes`.
+
+    Attributes:
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        api_instance (CoreV1Api): The Kubernetes API to use.
+    """
+
+    def __init__(self, name, namespace=None, api_instance=None, max_bytes=JOURNAL_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.name = name
+        self.namespace = namespace
+        self.api_instance = api_instance
+
+    def bind(self, api_instance, namespace):
+        return ConfigMapJournal(self.name, self.namespace or namespace, self.api_instance or api_instance,
+                                self.max_bytes)
+
+    def _read(self):
+        try:
+            return read_config_map(self.api_instance, self.name, self.namespace)
+        except ApiException as err:
+            if err.status == ERR_NOT_FOUND:
+                return None
+            raise JournalError(f'Error reading journal ConfigMap {self.namespace}/{self.name}: {err.reason}')
+        except MaxRetryError as err:
+            raise JournalError(f'Unable to connect to Kubernetes to read journal ConfigMap '
+                               f'{self.namespace}/{self.name}: {err}')
+
+    def entries(self):
+        config_map = self._read()
+        data = (config_map and config_map.data) or {}
+        try:
+            return [json.loads(data[key]) for key in sorted(data)]
+        except ValueError as err:
+            raise JournalError(f'Unable to parse journal ConfigMap {self.namespace}/{self.name}: {err}')
+
+    def _write(self, config_map, key, value):
+        """Add one data key to the ConfigMap, removing the oldest keys if needed."""
+        if config_map is None:
+            body = client.V1ConfigMap(metadata=client.V1ObjectMeta(name=self.name), data={key: value})
+            self.api_instance.create_namespaced_config_map(self.namespace, body)
+            return
+
+        data = config_map.data or {}
+        size = len(value) + sum(len(item) for item in data.values())
+        patch_data = {key: value}
+        for old_key in sorted(data):
+            if size <= self.max_bytes:
+                break
+            patch_data[old_key] = None
+            size -= len(data[old_key])
+        body = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(name=self.name, resource_version=config_map.resource_version),
+            data=patch_data
+        )
+        self.api_instance.patch_namespaced_config_map(self.name, self.namespace, body)
+
+    def append(self, entry):
+        for attempt in range(1, JOURNAL_MAX_ATTEMPTS + 1):
+            config_map = self._read()
+            data = (config_map and config_map.data) or {}
+            seq = int(max(data)) + 1 if data else 1
+            entry = dict(entry, seq=seq)
+            try:
+                self._write(config_map, f'{seq:010d}', json.dumps(entry, sort_keys=True, default=str))
+                return entry
+            except ApiException as err:
+                if err.status != ERR_CONFLICT or attempt == JOURNAL_MAX_ATTEMPTS:
+                    raise JournalError(f'Error writing journal ConfigMap {self.namespace}/{self.name}: '
+                                       f'{err.reason}')
+                LOGGER.debug("Conflict writing journal ConfigMap %s/%s", self.namespace, self.name)
+            except MaxRetryError as err:
+                raise JournalError(f'Unable to connect to Kubernetes to write journal ConfigMap '
+                                   f'{self.namespace}/{self.name}: {err}')
+
+
+def journal_from_env():
+    """Return the journal configured by the environment, or None if there is none.
+
+    CATALOG_JOURNAL_FILE selects a FileJournal, and otherwise CATALOG_JOURNAL
+    names a ConfigMap in the catalog's namespace to use as the journal.
+    CATALOG_JOURNAL_MAX_BYTES limits the size of either.
+    """
+    max_bytes = int(os.environ.get('CATALOG_JOURNAL_MAX_BYTES') or JOURNAL_MAX_BYTES)
+    path = os.environ.get('CATALOG_JOURNAL_FILE', '').strip()
+    if path:
+        return FileJournal(path, max_bytes)
+    name = os.environ.get('CATALOG_JOURNAL', '').strip()
+    if name:
+        return ConfigMapJournal(name, max_bytes=max_bytes)
+    return None
+
+
+def record_write(journal, namespace, name, product, product_version, old_data, new_data, response=None,
+                 previous_resource_version=None):
+    """Record a successful write in a journal, logging rather than raising any error.
+
+    The catalog has already been changed, so failing to journal the change
+    must not fail the write.
+
+    Args:
+        journal (Journal): The journal, or None to do nothing.
+        response (V1ConfigMap, optional): The ConfigMap returned by the
+            write, for its resourceVersion.
+        previous_resource_version (str, optional): The resourceVersion of
+            the ConfigMap that was read before the write.
+        Other arguments are as for make_entry.
+    """
+    if journal is None:
+        return
+    metadata = getattr(response, 'metadata', None)
+    try:
+        journal.record(namespace, name, product, product_version, old_data, new_data,
+                       getattr(metadata, 'resource_version', None), previous_resource_version)
+    except JournalError as err:
+        LOGGER.warning("Unable to record change to %s in journal: %s", product, err)
+
+
+def record_patch(journal, namespace, name, config_map_data, patch_data, product_versions=None, response=None,
+                 previous_resource_version=None):
+    """Record each product changed by a patch of a ConfigMap's data in a journal, as record_write does.
+
+    Args:
+        journal (Journal): The journal, or None to do nothing.
+        namespace (str): The namespace of the ConfigMap.
+        name (str): The name of the ConfigMap.
+        config_map_data (dict): The ConfigMap data that was read and patched,
+            a mapping from product name to a YAML string of its versions.
+        patch_data (dict): The data patched into the ConfigMap. A product
+            whose value is None was removed.
+        product_versions (dict, optional): A mapping from product name to
+            the version or versions written, to record in each entry.
+        response (V1ConfigMap, optional): The ConfigMap returned by the
+            patch, for its resourceVersion.
+        previous_resource_version (str, optional): The resourceVersion of
+            the ConfigMap that was read before the patch.
+    """
+    if journal is None:
+        return
+    product_versions = product_versions or {}
+    for product, product_data in patch_data.items():
+        old_data = (yaml.safe_load(config_map_data[product]) or {}) if product in config_map_data else None
+        new_data = (yaml.safe_load(product_data) or {}) if product_data is not None else None
+        record_write(journal, namespace, name, product, product_versions.get(product), old_data, new_data,
+                     response, previous_resource_version)
+
+
+def request_versions(requests):
+    """Return a mapping from product name to the versions written by a batch of requests, for record_patch."""
+    versions = {}
+    for request in requests:
+        versions.setdefault(request['product'], set()).add(request['version'])
+    return {product: ', '.join(sorted(product_versions)) for product, product_versions in versions.items()}
+
+
+def parse_time(value):
+    """Parse an ISO 8601 time, which is taken to be UTC if it has no offset.
+
+    Raises:
+        JournalError: if the time is not valid.
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise JournalError(f'Invalid time "{value}"; expected an ISO 8601 time such as 2023-06-01T12:00:00Z')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _undo(product_data, changes):
+    """Reverse the changes of one journal entry in decoded product data."""
+    for change in reversed(changes):
+        version = change['version']
+        if 'path' not in change:
+            if 'old' in change:
+                product_data[version] = copy.deepcopy(change['old'])
+            else:
+                product_data.pop(version, None)
+        else:
+            _set(product_data.setdefault(version, {}), change['path'], change, 'old')
+
+
+def _later_entries(entries, time=None, resource_version=None):
+    """Return the entries made after a time or resourceVersion, in journal order.
+
+    Raises:
+        JournalError: if the journal does not reach back to the given point.
+    """
+    if time is not None:
+        later = [entry for entry in entries if parse_time(entry['time']) > time]
+        if later and later[0] is entries[0] and entries[0].get('seq', 1) > 1:
+            raise JournalError(f'The journal only reaches back to {entries[0]["time"]} '
+                               f'(resourceVersion {entries[0]["resourceVersion"]})')
+        return later
+
+    # Undo everything after the last entry which wrote the resourceVersion, or
+    # else from the first entry which wrote over it.
+    for index in range(len(entries) - 1, -1, -1):
+        if entries[index].get('resourceVersion') == resource_version:
+            return entries[index + 1:]
+    for index, entry in enumerate(entries):
+        if entry.get('previousResourceVersion') == resource_version:
+            return entries[index:]
+    if not entries:
+        raise JournalError(f'The journal is empty, so it does not reach back to resourceVersion {resource_version}')
+    raise JournalError(f'The journal only reaches back to {entries[0]["time"]} '
+                       f'(resourceVersion {entries[0]["resourceVersion"]}) and does not record '
+                       f'resourceVersion {resource_version}')
+
+
+def rewind(data, entries, time=None, resource_version=None, name=None, namespace=None):
+    """Return catalog data as it was at a time or resourceVersion by undoing later journal entries.
+
+    Only the products changed by the entries undone are decoded and encoded
+    again. Before each entry is undone, the product is checked against the
+    hash recorded after the write, and afterwards against the hash recorded
+    before it.
+
+    Args:
+        data (dict): The current catalog data, a mapping from product name to
+            a YAML string of its versions. Not modified.
+        entries (list of dict): The journal entries, oldest first.
+        time (datetime, optional): The time to rewind to.
+        resource_version (str, optional): The resourceVersion to rewind to,
+            if `time` is not given.
+        name (str, optional): If given, only undo entries for the ConfigMap
+            with this name.
+        namespace (str, optional): If given, only undo entries for the
+            ConfigMap in this namespace.
+
+    Returns:
+        dict: the catalog data as it was at the given point.
+
+    Raises:
+        JournalError: if the journal does not reach back to the given point,
+            or the catalog has been changed other than by the entries.
+    """
+    if time is None and resource_version is None:
+        raise JournalError('A time or resourceVersion to rewind to must be given')
+
+    later = _later_entries(entries, time, resource_version)
+    decoded, hashes = {}, {}
+    for entry in reversed(later):
+        if (name and entry['name'] != name) or (namespace and entry['namespace'] != namespace):
+            continue
+        product = entry['product']
+        if product not in decoded:
+            decoded[product] = (yaml.safe_load(data[product]) or {}) if product in data else None
+            hashes[product] = hash_versions(decoded[product])
+        if hashes[product] != entry['after']:
+            raise JournalError(f'Product {product} does not match the journal entry {entry.get("seq")} '
+                               f'made at {entry["time"]}; it was changed outside the journal')
+        product_data = decoded[product] if decoded[product] is not None else {}
+        _undo(product_data, entry['changes'])
+        decoded[product] = None if entry['before'] is None and not product_data else product_data
+        hashes[product] = hash_versions(decoded[product])
+        if hashes[product] != entry['before']:
+            raise JournalError(f'Undoing journal entry {entry.get("seq")} made at {entry["time"]} '
+                               f'did not restore product {product}')
+
+    rewound = dict(data)
+    for product, product_data in decoded.items():
+        if product_data is None:
+            rewound.pop(product, None)
+        else:
+            rewound[product] = yaml.safe_dump(product_data, default_flow_style=False)
+    return rewound
@@ -1,6 +1,6 @@
 # MIT License
 #
-# (C) Copyright 2021-2022 Hewlett Packard Enterprise Development LP
+# (C) Copyright 2021-2023 Hewlett Packard Enterprise Development LP
 #
 # Permission is hereby granted, free of charge, to any person obtaining a
 # copy of this software and associated documentation files (the "Software"),
@@ -20,14 +20,442 @@
 # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 # OTHER DEALINGS IN THE SOFTWARE.
 #
-# Defines a utility function for loading the k8s config.
+# Defines utility functions for loading the k8s config and waiting for ConfigMaps.
 
-from kubernetes import config
+from collections import namedtuple
+import copy
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import HTTPError
+
+from cray_product_catalog.util import metrics, tracing
+from cray_product_catalog.util.deadline import Deadline, DeadlineRetry
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+LOGGER = logging.getLogger(__name__)
+
+# The parts of a ConfigMap used by the product catalog, as returned by read_config_map
+ConfigMapContent = namedtuple('ConfigMapContent', ['data', 'resource_version', 'labels'], defaults=(None,))
+
+# Requests only the metadata of an object from API servers which support it, or
+# the whole object from those which do not.
+PARTIAL_OBJECT_METADATA = 'application/json;as=PartialObjectMetadata;g=meta.k8s.io;v=v1, application/json'
+
+# The longest single watch request made while waiting for a ConfigMap. Longer
+# waits are made up of several watches, so that a dropped connection is noticed.
+MAX_WATCH_SECONDS = 300
+
+# Seconds to back off after the first failed list or watch while waiting for a
+# ConfigMap, doubling after each consecutive failure up to the maximum.
+WATCH_BACKOFF_SECONDS = 0.5
+MAX_WATCH_BACKOFF_SECONDS = 30
+
+# The number of connections to the API server kept open by each shared ApiClient
+K8S_POOL_MAXSIZE = int(os.environ.get('K8S_POOL_MAXSIZE', '4'))
+# Seconds a pooled connection may be idle before TCP keep-alive probes are
+# sent, so that connections dropped by the network are noticed. 0 disables them.
+K8S_KEEPALIVE_SECONDS = int(os.environ.get('K8S_KEEPALIVE_SECONDS', '60'))
+
+_K8S_LOCK = threading.Lock()
+_k8s_config_loaded = False
+_api_clients = {}
+_context_configurations = {}
 
 
 def load_k8s():
-    """ Load Kubernetes Configuration """
+    """ Load Kubernetes Configuration, once per process """
+    global _k8s_config_loaded
+    with _K8S_LOCK:
+        if _k8s_config_loaded:
+            return
+        with tracing.span('load_k8s'):
+            try:
+                config.load_incluster_config()
+            except Exception:
+                config.load_kube_config()
+        _k8s_config_loaded = True
+
+
+def load_k8s_context(context):
+    """Load the Kubernetes configuration for a kubeconfig context, once per process.
+
+    Unlike load_k8s, this does not change the default configuration, so
+    several contexts may be used at once.
+
+    Args:
+        context (str): The name of the kubeconfig context.
+
+    Returns:
+        Configuration: the configuration for the context. Do not modify it.
+
+    Raises:
+        ConfigException: if the context could not be loaded.
+    """
+    with _K8S_LOCK:
+        if context not in _context_configurations:
+            configuration = client.Configuration()
+            config.load_kube_config(context=context, client_configuration=configuration)
+            _context_configurations[context] = configuration
+        return _context_configurations[context]
+
+
+def socket_options(keepalive=K8S_KEEPALIVE_SECONDS):
+    """Return the socket options for connections to the API server.
+
+    Args:
+        keepalive (int): Seconds of idle time before TCP keep-alive probes are
+            sent, or 0 to leave keep-alive disabled.
+
+    Returns:
+        list of tuple: options for urllib3's `socket_options` argument.
+    """
+    options = list(HTTPConnection.default_socket_options)
+    if keepalive:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        # These are not available on every platform.
+        for option, value in (('TCP_KEEPIDLE', keepalive), ('TCP_KEEPINTVL', max(1, keepalive // 4)),
+                              ('TCP_KEEPCNT', 4)):
+            if hasattr(socket, option):
+                options.append((socket.IPPROTO_TCP, getattr(socket, option), value))
+    return options
+
+
+def get_api_client(retries=None, pool_maxsize=K8S_POOL_MAXSIZE, keepalive=K8S_KEEPALIVE_SECONDS, context=None):
+    """Return an ApiClient shared by everything in the process.
+
+    Creating an ApiClient for every operation means a new connection, and a new
+    TLS handshake, for every operation. Instead one client is kept for each
+    combination of API server and arguments, and its pooled connections are
+    reused. Unless a `context` is given, the client uses the default
+    kubernetes configuration, so call load_k8s first.
+
+    Args:
+        retries (int, optional): The number of times to retry a failed
+            request, with backoff, and stopping at the Deadline active in the
+            calling thread. If None, the kubernetes client default is used.
+        pool_maxsize (int): The number of connections to keep open.
+        keepalive (int): See socket_options.
+        context (str, optional): A kubeconfig context to use instead of the
+            default configuration. See load_k8s_context.
+
+    Returns:
+        ApiClient: the shared client.
+
+    Raises:
+        ConfigException: if the `context` could not be loaded.
+    """
+    if context is None:
+        configuration = client.Configuration.get_default_copy()
+    else:
+        configuration = copy.deepcopy(load_k8s_context(context))
+    key = (context, configuration.host, retries, pool_maxsize, keepalive)
+    with _K8S_LOCK:
+        if key not in _api_clients:
+            configuration.connection_pool_maxsize = pool_maxsize
+            if retries is not None:
+                configuration.retries = DeadlineRetry(
+                    total=retries, read=retries, connect=retries, backoff_factor=0.3,
+                    status_forcelist=(500, 502, 503, 504)
+                )
+            api_client = client.ApiClient(configuration)
+            api_client.rest_client.pool_manager.connection_pool_kw['socket_options'] = socket_options(keepalive)
+            _instrument(api_client.rest_client.pool_manager)
+            _api_clients[key] = api_client
+        return _api_clients[key]
+
+
+def _instrument(pool_manager):
+    """Record the metrics and a span of every request made through a urllib3 PoolManager.
+
+    The duration, method and status of each request, and the size of its
+    body, are recorded. The size of the response is recorded here if it is
+    read before it is returned, and otherwise when it is decoded.
+    """
+    request = pool_manager.request
+
+    def instrumented_request(method, url, *args, **kwargs):
+        start = time.perf_counter()
+        code = 'error'
+        try:
+            with tracing.span(method, tracing.SPAN_KIND_CLIENT, **{
+                'http.request.method': method, 'url.path': urlsplit(url).path
+            }) as request_span:
+                response = request(method, url, *args, **kwargs)
+                request_span.set_attribute('http.response.status_code', response.status)
+            code = str(response.status)
+            if kwargs.get('preload_content', True):
+                metrics.API_RECEIVED_BYTES.observe(len(response.data or b''))
+            return response
+        finally:
+            metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method)
+            metrics.API_REQUESTS.inc(method=method, code=code)
+            if kwargs.get('body') is not None:
+                metrics.API_SENT_BYTES.observe(len(kwargs['body']))
+
+    pool_manager.request = instrumented_request
+
+
+def _read_json(response):
+    """Decode a JSON response which was not preloaded, record its size, and release its connection."""
     try:
-        config.load_incluster_config()
-    except Exception:
-        config.load_kube_config()
+        data = response.data
+        metrics.API_RECEIVED_BYTES.observe(len(data))
+        return json_loads(data)
+    finally:
+        response.release_conn()
+
+
+def read_config_map(api_instance, name, namespace, **kwargs):
+    """Read the data and resourceVersion of a ConfigMap.
+
+    The response is decoded directly from JSON rather than deserialized into a
+    V1ConfigMap, which is much faster and uses much less memory for a large
+    ConfigMap. orjson is used to decode it if it is installed.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        **kwargs: Additional arguments to read_namespaced_config_map, e.g.
+            `_request_timeout`.
+
+    Returns:
+        ConfigMapContent: the data of the ConfigMap, which is None if it has
+            no data, its resourceVersion, and its labels.
+
+    Raises:
+        ApiException: if the ConfigMap could not be read.
+    """
+    with tracing.span('read_config_map', config_map=name, namespace=namespace):
+        response = api_instance.read_namespaced_config_map(name, namespace, _preload_content=False, **kwargs)
+        return _decode_config_map(response)
+
+
+def _decode_config_map(response):
+    """Decode a raw ConfigMap response into a ConfigMapContent and release its connection."""
+    body = _read_json(response)
+    metadata = body.get('metadata', {})
+    return ConfigMapContent(body.get('data'), metadata.get('resourceVersion'), metadata.get('labels'))
+
+
+def write_config_map(api_instance, name, namespace, data, labels=None, **kwargs):
+    """Create a ConfigMap, or replace it if it already exists.
+
+    Only the name, namespace, and labels are set in the ConfigMap's metadata,
+    so metadata managed by the API server, such as the uid and
+    resourceVersion, is never copied from one ConfigMap to another. An
+    existing ConfigMap is replaced whatever its resourceVersion.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        data (dict): The data of the ConfigMap.
+        labels (dict, optional): The labels of the ConfigMap.
+        **kwargs: Additional arguments to create_namespaced_config_map and
+            replace_namespaced_config_map, e.g. `_request_timeout`.
+
+    Returns:
+        ConfigMapContent: the ConfigMap as written by the API server.
+
+    Raises:
+        ApiException: if the ConfigMap could not be written.
+    """
+    metadata = {'name': name, 'namespace': namespace}
+    if labels:
+        metadata['labels'] = labels
+    body = {'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': metadata, 'data': data or None}
+    try:
+        response = api_instance.create_namespaced_config_map(namespace, body, _preload_content=False, **kwargs)
+    except ApiException as err:
+        if err.status != 409:
+            raise
+        response = api_instance.replace_namespaced_config_map(name, namespace, body, _preload_content=False,
+                                                              **kwargs)
+    return _decode_config_map(response)
+
+
+def merge_config_map(api_instance, name, namespace, data, labels=None, **kwargs):
+    """Add the keys of `data` which a ConfigMap does not have, or create it if it does not exist.
+
+    Keys which the ConfigMap already has are left as they are, as are keys
+    which are not in `data`, so nothing written to the ConfigMap by others is
+    lost. The keys are added with a patch guarded by the resourceVersion of the
+    ConfigMap as read, which is retried if the ConfigMap changes in between.
+    Likewise, only labels which the ConfigMap does not have are added.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        data (dict): The data to add to the ConfigMap.
+        labels (dict, optional): The labels to add to the ConfigMap.
+        **kwargs: Additional arguments to read_namespaced_config_map,
+            create_namespaced_config_map, and patch_namespaced_config_map,
+            e.g. `_request_timeout`.
+
+    Returns:
+        tuple: the ConfigMapContent of the ConfigMap as written by the API
+            server, or as read if nothing was missing, and the list of keys
+            which were added.
+
+    Raises:
+        ApiException: if the ConfigMap could not be read or written.
+    """
+    data = data or {}
+    labels = labels or {}
+    while True:
+        try:
+            existing = read_config_map(api_instance, name, namespace, **kwargs)
+        except ApiException as err:
+            if err.status != 404:
+                raise
+            metadata = {'name': name, 'namespace': namespace}
+            if labels:
+                metadata['labels'] = labels
+            body = {'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': metadata, 'data': data or None}
+            try:
+                response = api_instance.create_namespaced_config_map(namespace, body, _preload_content=False,
+                                                                     **kwargs)
+            except ApiException as create_err:
+                if create_err.status != 409:
+                    raise
+                continue  # created by someone else in the meantime; merge into it
+            return _decode_config_map(response), sorted(data)
+
+        existing_data = existing.data or {}
+        existing_labels = existing.labels or {}
+        missing = {key: value for key, value in data.items() if key not in existing_data}
+        missing_labels = {key: value for key, value in labels.items() if key not in existing_labels}
+        if not missing and not missing_labels:
+            return existing, []
+
+        metadata = {'resourceVersion': existing.resource_version}
+        if missing_labels:
+            metadata['labels'] = missing_labels
+        try:
+            response = api_instance.patch_namespaced_config_map(
+                name, namespace, {'metadata': metadata, 'data': missing}, _preload_content=False, **kwargs
+            )
+        except ApiException as err:
+            if err.status != 409:
+                raise
+            LOGGER.debug("ConfigMap %s/%s changed while merging; retrying", namespace, name)
+            continue
+        return _decode_config_map(response), sorted(missing)
+
+
+def read_config_map_resource_version(api_instance, name, namespace, **kwargs):
+    """Read only the resourceVersion of a ConfigMap.
+
+    Only the ConfigMap's metadata is requested, so this is much cheaper than
+    reading the ConfigMap when it is large. It can be used to check whether a
+    ConfigMap has changed since it was read.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        **kwargs: Additional arguments to ApiClient.call_api, e.g. `_request_timeout`.
+
+    Returns:
+        str: the resourceVersion of the ConfigMap.
+
+    Raises:
+        ApiException: if the ConfigMap could not be read.
+    """
+    response = api_instance.api_client.call_api(
+        '/api/v1/namespaces/{namespace}/configmaps/{name}', 'GET',
+        path_params={'name': name, 'namespace': namespace},
+        header_params={'Accept': PARTIAL_OBJECT_METADATA},
+        auth_settings=['BearerToken'], _return_http_data_only=True, _preload_content=False, **kwargs
+    )
+    body = _read_json(response)
+    return body.get('metadata', {}).get('resourceVersion')
+
+
+def _sleep_until(seconds, end=None):
+    """Sleep for `seconds`, but not past the monotonic time `end` or the active Deadline."""
+    if end is not None:
+        seconds = max(0.0, min(seconds, end - time.monotonic()))
+    deadline = Deadline.active()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds)
+
+
+@tracing.traced('wait_for_config_map')
+def wait_for_config_map(api_instance, name, namespace, timeout=None):
+    """Wait for a ConfigMap to exist.
+
+    Rather than polling, this lists the ConfigMap by name and then watches
+    from the resourceVersion of that list, so it returns as soon as the
+    ConfigMap is created. After a failed list or watch, it backs off
+    exponentially before listing again, never past `timeout`.
+
+    Args:
+        api_instance (CoreV1Api): The Kubernetes API to use.
+        name (str): The name of the ConfigMap.
+        namespace (str): The namespace of the ConfigMap.
+        timeout (float, optional): Seconds to wait. Wait indefinitely if None.
+
+    Returns:
+        bool: True if the ConfigMap exists, False if `timeout` elapsed first.
+
+    Raises:
+        ApiException: if listing or watching ConfigMaps is not permitted.
+    """
+    field_selector = f'metadata.name={name}'
+    end = None if timeout is None else time.monotonic() + timeout
+    backoff = WATCH_BACKOFF_SECONDS
+    while True:
+        remaining = MAX_WATCH_SECONDS if end is None else end - time.monotonic()
+        if remaining <= 0:
+            return False
+        watch_seconds = max(1, int(min(remaining, MAX_WATCH_SECONDS)))
+
+        try:
+            existing = api_instance.list_namespaced_config_map(namespace, field_selector=field_selector)
+            if existing.items:
+                return True
+
+            config_map_watch = watch.Watch()
+            for event in config_map_watch.stream(
+                api_instance.list_namespaced_config_map, namespace, field_selector=field_selector,
+                resource_version=existing.metadata.resource_version, timeout_seconds=watch_seconds,
+                _request_timeout=watch_seconds + 10
+            ):
+                if event['type'] in ('ADDED', 'MODIFIED'):
+                    config_map_watch.stop()
+                    LOGGER.info("ConfigMap %s/%s has been created", namespace, name)
+                    return True
+            backoff = WATCH_BACKOFF_SECONDS
+            continue  # the watch timed out; watch again
+        except ApiException as err:
+            # Listing again cannot fix a lack of permission. Any other error,
+            # e.g. a 410 Gone when the list is too old to watch from, is
+            # retried by listing again.
+            if err.status in (401, 403):
+                raise
+            LOGGER.debug("Watch for ConfigMap %s/%s ended: %s", namespace, name, err.reason)
+        except HTTPError as err:
+            LOGGER.debug("Watch for ConfigMap %s/%s interrupted: %s", namespace, name, err)
+
+        # Back off before listing again, so that an API server which keeps
+        # failing is not sent requests in a tight loop.
+        _sleep_until(random.uniform(backoff / 2, backoff), end)
+        backoff = min(backoff * 2, MAX_WATCH_BACKOFF_SECONDS)
@@ -0,0 +1,249 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Defines a lock around catalog writes using a coordination.k8s.io Lease.
+
+from datetime import datetime, timezone
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from cray_product_catalog.util.deadline import Deadline, DeadlineExceeded
+
+LOGGER = logging.getLogger(__name__)
+
+ERR_NOT_FOUND = 404
+ERR_CONFLICT = 409
+
+# The value of CATALOG_LOCK which selects the Lease-based lock
+LEASE_LOCK = 'lease'
+
+
+class LeaseError(Exception):
+    """The lease could not be acquired."""
+
+
+def lease_name_for(config_map_name):
+    """Return the name of the Lease that guards writes to the given ConfigMap."""
+    return f'{config_map_name}-lock'
+
+
+class LeaseLock:
+    """A mutual exclusion lock held by updating a coordination.k8s.io Lease.
+
+    The lock is held while the Lease's holderIdentity is this lock's holder.
+    A holder that dies without releasing the lock does not block others
+    forever: once the Lease has been observed unchanged for its
+    leaseDurationSeconds, it is considered abandoned and may be taken over.
+    Expiry is judged by how long this process has observed the Lease
+    unchanged rather than by its renewTime, so clock skew between hosts does
+    not cause a live lock to be stolen.
+
+    While the lock is held as a context manager, a background thread renews
+    the Lease every `renew_interval` seconds, so a write which takes longer
+    than leaseDurationSeconds does not lose the lock.
+
+    Attributes:
+        name (str): The name of the Lease.
+        namespace (str): The namespace of the Lease.
+        holder (str): The identity recorded in the Lease while held.
+        lease_duration (int): Seconds after which an unchanged Lease held by
+            another holder is considered abandoned.
+        deadline (Deadline): The deadline which bounds waiting for the lock
+            when it is used as a context manager.
+        renew_interval (float): Seconds between renewals of the Lease while
+            it is held as a context manager.
+    """
+    def __init__(self, api_instance, name, namespace, holder=None, lease_duration=15,
+                 poll_interval=0.02, max_poll_interval=0.25, deadline=None, renew_interval=None):
+        """Create the LeaseLock.
+
+        Args:
+            api_instance (CoordinationV1Api): The Kubernetes API to use.
+            name (str): The name of the Lease.
+            namespace (str): The namespace of the Lease.
+            holder (str, optional): The holder identity. Defaults to a value
+                unique to this process.
+            lease_duration (int): See class attributes.
+            poll_interval (float): Initial seconds to wait between attempts
+                to take a held lock. Doubles up to `max_poll_interval`.
+            max_poll_interval (float): Maximum seconds to wait between attempts.
+            deadline (Deadline, optional): See class attributes. Unlimited if None.
+            renew_interval (float, optional): See class attributes. Defaults
+                to a third of `lease_duration`.
+        """
+        self.api_instance = api_instance
+        self.name = name
+        self.namespace = namespace
+        self.holder = holder or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.lease_duration = lease_duration
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.deadline = deadline or Deadline()
+        self.renew_interval = renew_interval or lease_duration / 3
+        self._observed = None
+        self._observed_at = None
+        self._released = None
+        self._renewer = None
+
+    def _spec(self, holder, transitions):
+        now = datetime.now(timezone.utc)
+        return client.V1LeaseSpec(
+            holder_identity=holder, lease_duration_seconds=self.lease_duration,
+            acquire_time=now, renew_time=now, lease_transitions=transitions
+        )
+
+    def _is_free(self, lease):
+        """Return True if the lease is unheld, held by us, or abandoned."""
+        spec = lease.spec or client.V1LeaseSpec()
+        if not spec.holder_identity or spec.holder_identity == self.holder:
+            return True
+
+        observed = (spec.holder_identity, lease.metadata.resource_version)
+        now = time.monotonic()
+        if observed != self._observed:
+            self._observed, self._observed_at = observed, now
+            return False
+        duration = spec.lease_duration_seconds or self.lease_duration
+        if now - self._observed_at >= duration:
+            LOGGER.warning("Lease %s/%s held by %s has not changed in %ss; taking over",
+                           self.namespace, self.name, spec.holder_identity, duration)
+            return True
+        return False
+
+    def _try_acquire(self):
+        """Make one attempt to take the lock. Return True if it is now held."""
+        try:
+            lease = self.api_instance.read_namespaced_lease(self.name, self.namespace,
+                                                            **self.deadline.request_kwargs())
+        except ApiException as err:
+            if err.status != ERR_NOT_FOUND:
+                raise
+            body = client.V1Lease(metadata=client.V1ObjectMeta(name=self.name),
+                                  spec=self._spec(self.holder, 0))
+            try:
+                self.api_instance.create_namespaced_lease(self.namespace, body, **self.deadline.request_kwargs())
+            except ApiException as err:
+                if err.status == ERR_CONFLICT:
+                    return False  # Another holder created it first
+                raise
+            return True
+
+        if not self._is_free(lease):
+            return False
+        spec = lease.spec or client.V1LeaseSpec()
+        transitions = (spec.lease_transitions or 0) + (spec.holder_identity != self.holder)
+        lease.spec = self._spec(self.holder, transitions)
+        try:
+            # The replace carries the resourceVersion we read, so only one of
+            # several processes racing for a free lease can succeed.
+            self.api_instance.replace_namespaced_lease(self.name, self.namespace, lease,
+                                                       **self.deadline.request_kwargs())
+        except ApiException as err:
+            if err.status == ERR_CONFLICT:
+                return False
+            raise
+        return True
+
+    def acquire(self, timeout=None):
+        """Take the lock, waiting for it if it is held by another holder.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Wait indefinitely if None.
+
+        Raises:
+            LeaseError: if the lock was not acquired within `timeout`.
+        """
+        start = time.monotonic()
+        interval = self.poll_interval
+        while not self._try_acquire():
+            if timeout is not None and time.monotonic() - start >= timeout:
+                raise LeaseError(f'Timed out after {timeout}s waiting for Lease {self.namespace}/{self.name}')
+            self.deadline.sleep(random.uniform(interval / 2, interval))
+            interval = min(interval * 2, self.max_poll_interval)
+        LOGGER.debug("Acquired Lease %s/%s as %s", self.namespace, self.name, self.holder)
+
+    def renew(self):
+        """Update the renewTime of the Lease so that others do not take it over.
+
+        Returns:
+            True if the lock is still held, or False if it was taken over.
+        """
+        lease = self.api_instance.read_namespaced_lease(self.name, self.namespace, **self.deadline.request_kwargs())
+        if (lease.spec and lease.spec.holder_identity) != self.holder:
+            LOGGER.warning("Lease %s/%s was taken over by %s", self.namespace, self.name,
+                           lease.spec and lease.spec.holder_identity)
+            return False
+        lease.spec.renew_time = datetime.now(timezone.utc)
+        self.api_instance.replace_namespaced_lease(self.name, self.namespace, lease, **self.deadline.request_kwargs())
+        LOGGER.debug("Renewed Lease %s/%s", self.namespace, self.name)
+        return True
+
+    def _renew_until_released(self):
+        """Renew the Lease every renew_interval seconds until the lock is released."""
+        while not self._released.wait(self.renew_interval):
+            try:
+                if not self.renew():
+                    return
+            except (ApiException, DeadlineExceeded) as err:
+                # A failed renewal is retried; the Lease is not lost until its duration has passed.
+                LOGGER.warning("Unable to renew Lease %s/%s: %s", self.namespace, self.name, err)
+
+    def release(self):
+        """Release the lock so that others may take it without waiting for it to expire."""
+        try:
+            lease = self.api_instance.read_namespaced_lease(self.name, self.namespace)
+            if (lease.spec and lease.spec.holder_identity) != self.holder:
+                LOGGER.warning("Lease %s/%s was taken over before it was released", self.namespace, self.name)
+                return
+            lease.spec.holder_identity = None
+            self.api_instance.replace_namespaced_lease(self.name, self.namespace, lease)
+            LOGGER.debug("Released Lease %s/%s", self.namespace, self.name)
+        except ApiException as err:
+            # The lease will expire on its own, so do not fail the write.
+            LOGGER.warning("Unable to release Lease %s/%s: %s", self.namespace, self.name, err.reason)
+        except DeadlineExceeded as err:
+            LOGGER.warning("Unable to release Lease %s/%s: %s", self.namespace, self.name, err)
+
+    def __enter__(self):
+        try:
+            self.acquire(self.deadline.remaining())
+        except LeaseError:
+            self.deadline.check(f'waiting for Lease {self.namespace}/{self.name}')
+            raise
+        self._released = threading.Event()
+        self._renewer = threading.Thread(target=self._renew_until_released, daemon=True,
+                                         name=f'renew-{self.name}')
+        self._renewer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._released.set()
+        self._renewer.join()
+        self.release()
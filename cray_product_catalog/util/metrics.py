@@ -0,0 +1,372 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Defines the counters and histograms recorded by catalog reads and writes, and
+# exports them in the Prometheus text format or as a one-line JSON summary.
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds of the buckets of histograms of durations, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds of the buckets of histograms of sizes, in bytes
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# The content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    """Format a sample value as in the Prometheus text format."""
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def _format_labels(labels):
+    """Format a sequence of (name, value) pairs as a Prometheus label set."""
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Registry:
+    """A collection of metrics which are exported together.
+
+    Attributes:
+        metrics (list of Counter or Histogram): The registered metrics, in
+            the order they were created.
+    """
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """Add a metric to the registry and return it."""
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self):
+        """Discard everything recorded by the registered metrics."""
+        for metric in self.metrics:
+            metric.reset()
+
+    def render(self):
+        """Return the registered metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(
+                f'{name}{_format_labels(labels)} {_format_value(value)}' for name, labels, value in metric.samples()
+            )
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Return the totals of the metrics which recorded anything, across all labels.
+
+        Returns:
+            dict: the total of each counter, and the count and sum of each
+                histogram, by metric name.
+        """
+        totals = {}
+        for metric in self.metrics:
+            total = metric.total()
+            if total:
+                totals[metric.name] = total
+        return totals
+
+
+# The registry of the metrics defined by this package
+REGISTRY = Registry()
+
+
+class _Metric:
+    """The labelled series common to counters and histograms."""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """Create the metric and add it to a registry.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): A description of the metric.
+            labelnames (tuple of str): The names of the labels which each
+                value is recorded with.
+            registry (Registry): The registry to add the metric to.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        """Return the values of the labels in the order of `labelnames`."""
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'Metric {self.name} requires labels {", ".join(self.labelnames) or "(none)"}')
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as err:
+            raise ValueError(f'Metric {self.name} requires label {err}')
+
+    def reset(self):
+        """Discard every recorded value."""
+        with self._lock:
+            self._series.clear()
+
+    def _labelled_series(self):
+        """Return (labels, series) pairs, including an empty unlabelled series."""
+        with self._lock:
+            series = dict(self._series)
+        if not self.labelnames and not series:
+            series[()] = self._new_series()
+        return [(tuple(zip(self.labelnames, key)), value) for key, value in sorted(series.items())]
+
+    def _new_series(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A count of events, e.g. attempts or conflicts, which only increases."""
+    type = 'counter'
+
+    def _new_series(self):
+        return 0
+
+    def inc(self, amount=1, **labels):
+        """Add `amount` to the count with the given labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the count with the given labels."""
+        return self._series.get(self._key(labels), 0)
+
+    def total(self):
+        """Return the sum of the counts of all labels."""
+        with self._lock:
+            return sum(self._series.values())
+
+    def samples(self):
+        """Yield the (name, labels, value) of each sample in the Prometheus text format."""
+        for labels, value in self._labelled_series():
+            yield self.name, labels, value
+
+
+class _HistogramSeries:
+    """The observations of a histogram with one set of labels."""
+    __slots__ = ('bucket_counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """The distribution of observed values, e.g. durations or sizes, in buckets."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS, registry=REGISTRY):
+        """Create the histogram and add it to a registry.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): A description of the metric.
+            labelnames (tuple of str): The names of the labels which each
+                value is observed with.
+            buckets (tuple of float): The increasing upper bounds of the
+                buckets, not including +Inf.
+            registry (Registry): The registry to add the histogram to.
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value, **labels):
+        """Record an observed value with the given labels."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = self._new_series()
+            series.bucket_counts[index] += 1
+            series.count += 1
+            series.sum += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds taken by the body of a with statement, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """Return the number of values observed with the given labels."""
+        series = self._series.get(self._key(labels))
+        return series.count if series else 0
+
+    def sum(self, **labels):
+        """Return the sum of the values observed with the given labels."""
+        series = self._series.get(self._key(labels))
+        return series.sum if series else 0.0
+
+    def total(self):
+        """Return the count and sum of the values observed with all labels, or None if there are none."""
+        with self._lock:
+            count = sum(series.count for series in self._series.values())
+            total = sum(series.sum for series in self._series.values())
+        if not count:
+            return None
+        return {'count': count, 'sum': round(total, 6)}
+
+    def samples(self):
+        """Yield the (name, labels, value) of each sample in the Prometheus text format."""
+        for labels, series in self._labelled_series():
+            with self._lock:
+                bucket_counts = list(series.bucket_counts)
+                count, total = series.count, series.sum
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', labels + (('le', _format_value(float(bound))),), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+# Modifications of a catalog ConfigMap, by operation, e.g. 'update' or 'delete'
+ATTEMPTS = Counter('catalog_write_attempts_total', 'Attempts to modify a catalog ConfigMap.', ('operation',))
+CONFLICTS = Counter('catalog_write_conflicts_total',
+                    'Patches of a catalog ConfigMap rejected with 409 Conflict.', ('operation',))
+NOT_FOUND_RETRIES = Counter('catalog_write_not_found_retries_total',
+                            'Attempts to modify a catalog ConfigMap which waited for it to be created.',
+                            ('operation',))
+API_ERRORS = Counter('catalog_api_errors_total',
+                     'Kubernetes API errors other than conflicts and missing ConfigMaps while modifying a catalog.',
+                     ('operation',))
+# Every Kubernetes API request made with a client from util.k8s.get_api_client
+API_REQUESTS = Counter('catalog_api_requests_total', 'Kubernetes API requests by method and response status code.',
+                       ('method', 'code'))
+API_REQUEST_SECONDS = Histogram('catalog_api_request_duration_seconds',
+                                'Seconds until the response to a Kubernetes API request, including retries.',
+                                ('method',))
+API_SENT_BYTES = Histogram('catalog_api_sent_bytes', 'Bytes of Kubernetes API request bodies.',
+                           buckets=SIZE_BUCKETS)
+API_RECEIVED_BYTES = Histogram('catalog_api_received_bytes', 'Bytes of Kubernetes API response bodies.',
+                               buckets=SIZE_BUCKETS)
+SLEEP_SECONDS = Histogram('catalog_sleep_seconds', 'Seconds slept between attempts and retried requests.',
+                          buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0))
+YAML_SECONDS = Histogram('catalog_yaml_duration_seconds', 'Seconds spent parsing or dumping catalog YAML.',
+                         ('action',))
+
+
+def write_metrics_file(path, registry=REGISTRY):
+    """Write metrics in the Prometheus text format to a file.
+
+    The file is replaced atomically, so it can be read at any time, e.g. by
+    the node exporter's textfile collector.
+
+    Args:
+        path (str): The file to write.
+        registry (Registry): The metrics to write.
+
+    Raises:
+        OSError: if the file could not be written.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as metrics_file:
+        metrics_file.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def _write_metrics_file_from_env(registry=REGISTRY):
+    """Write metrics to CATALOG_METRICS_FILE, if it is set, logging any error."""
+    path = os.environ.get('CATALOG_METRICS_FILE', '').strip()
+    if not path:
+        return
+    try:
+        write_metrics_file(path, registry)
+    except OSError as err:
+        LOGGER.warning("Unable to write metrics to %s: %s", path, err)
+
+
+def start_file_exporter(registry=REGISTRY):
+    """Write metrics to CATALOG_METRICS_FILE every CATALOG_METRICS_INTERVAL seconds, for long-running processes.
+
+    Returns:
+        threading.Thread: the daemon thread writing the file, or None if
+            CATALOG_METRICS_FILE is not set.
+    """
+    if not os.environ.get('CATALOG_METRICS_FILE', '').strip():
+        return None
+    interval = float(os.environ.get('CATALOG_METRICS_INTERVAL') or 15)
+
+    def export():
+        while True:
+            _write_metrics_file_from_env(registry)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=export, name='catalog-metrics', daemon=True)
+    thread.start()
+    return thread
+
+
+def report_at_exit(func):
+    """Decorate the main function of a Job to report metrics when it returns or exits.
+
+    A one-line JSON summary of the metrics is logged unless
+    CATALOG_METRICS_SUMMARY is 0, and the metrics are written to
+    CATALOG_METRICS_FILE if it is set.
+    """
+    @wraps(func)
+    def reported(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _write_metrics_file_from_env()
+            if os.environ.get('CATALOG_METRICS_SUMMARY', '1').strip() != '0':
+                LOGGER.info("Metrics: %s", json.dumps(REGISTRY.summary(), sort_keys=True))
+    return reported
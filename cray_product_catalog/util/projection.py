@@ -0,0 +1,259 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Contains functions for loading only some fields of product catalog data.
+#
+# A field is the dotted path of a key in a product version's data, e.g.
+# 'component_versions.docker' or 'configuration.commit'. The YAML string of a
+# product's versions is read as a stream of parser events, and only the values
+# of the requested fields are built into Python objects; everything else is
+# skipped by counting events. Documents which use aliases or merge keys in a
+# way that cannot be followed while skipping are loaded in full instead, so
+# the result is always the same as projecting the fully loaded data.
+
+import yaml
+from yaml.events import (
+    AliasEvent,
+    CollectionEndEvent,
+    CollectionStartEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    SequenceStartEvent,
+    StreamEndEvent,
+)
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+# Use the much faster LibYAML parser if PyYAML was built with it.
+_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_MERGE_TAG = 'tag:yaml.org,2002:merge'
+
+# A value in a field tree which means the whole value is wanted
+_ALL = None
+
+# Returned when a field is not present
+_MISSING = object()
+
+
+class _Unprojectable(Exception):
+    """The document cannot be projected while streaming, and must be loaded in full."""
+
+
+def field_tree(fields):
+    """Return a nested dict of the keys in a list of dotted field paths.
+
+    A key which maps to None is wanted with all of its value. If both a field
+    and one of its subfields are given, the whole field is wanted.
+
+    Args:
+        fields (list of str): The dotted field paths.
+
+    Returns:
+        dict: the field tree, e.g. {'configuration': {'commit': None}}.
+
+    Raises:
+        ValueError: if a field is empty or has an empty key.
+    """
+    tree = {}
+    for field in fields:
+        keys = field.split('.')
+        if not all(keys):
+            raise ValueError(f'Invalid field "{field}"')
+        node = tree
+        for key in keys[:-1]:
+            if key in node and node[key] is _ALL:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = _ALL
+    return tree
+
+
+def project(data, tree):
+    """Return a copy of data which has only the fields in a field tree.
+
+    Args:
+        data: The data to project; only dicts are descended into.
+        tree (dict): A field tree returned by field_tree.
+
+    Returns:
+        dict: the projected data, or _MISSING if data is not a dict.
+    """
+    if not isinstance(data, dict):
+        return _MISSING
+    result = {}
+    for key, subtree in tree.items():
+        if key in data:
+            value = data[key] if subtree is _ALL else project(data[key], subtree)
+            if value is not _MISSING:
+                result[key] = value
+    return result
+
+
+class _Projector:
+    """Builds the requested fields of one YAML document from its parser events.
+
+    Anchors are only remembered for values which were composed in full, so an
+    alias of a value which was skipped or only partly built cannot be followed
+    and raises _Unprojectable, as does an anchor which is defined twice.
+    """
+
+    def __init__(self, stream):
+        self.loader = _LOADER(stream)
+        # Composed nodes by anchor, and all anchors defined so far
+        self.anchors = {}
+        self.defined = set()
+
+    def _resolve(self, kind, event, value=None):
+        """Return the tag of a node as the Composer would."""
+        if event.tag is None or event.tag == '!':
+            return self.loader.resolve(kind, value, event.implicit)
+        return event.tag
+
+    def _define(self, event):
+        """Note the definition of an anchor, if the event has one."""
+        if event.anchor is not None:
+            if event.anchor in self.defined:
+                raise _Unprojectable(event.anchor)
+            self.defined.add(event.anchor)
+
+    def compose(self):
+        """Compose the node of the next value from the parser events."""
+        event = self.loader.get_event()
+        if isinstance(event, AliasEvent):
+            if event.anchor not in self.anchors:
+                raise _Unprojectable(event.anchor)
+            return self.anchors[event.anchor]
+        if isinstance(event, ScalarEvent):
+            node = ScalarNode(self._resolve(ScalarNode, event, event.value), event.value,
+                              event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, SequenceStartEvent):
+            node = SequenceNode(self._resolve(SequenceNode, event), [], event.start_mark, None,
+                                flow_style=event.flow_style)
+            while not isinstance(self.loader.peek_event(), CollectionEndEvent):
+                node.value.append(self.compose())
+            node.end_mark = self.loader.get_event().end_mark
+        else:
+            node = MappingNode(self._resolve(MappingNode, event), [], event.start_mark, None,
+                               flow_style=event.flow_style)
+            while not isinstance(self.loader.peek_event(), CollectionEndEvent):
+                node.value.append((self.compose(), self.compose()))
+            node.end_mark = self.loader.get_event().end_mark
+        self._define(event)
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+        return node
+
+    def skip(self):
+        """Skip the next value by counting events."""
+        depth = 0
+        while True:
+            event = self.loader.get_event()
+            if isinstance(event, CollectionStartEvent):
+                self._define(event)
+                depth += 1
+            elif isinstance(event, CollectionEndEvent):
+                depth -= 1
+            elif isinstance(event, ScalarEvent):
+                self._define(event)
+            if depth == 0:
+                return
+
+    def walk(self, tree):
+        """Build the fields of the next value which are in a field tree.
+
+        Args:
+            tree (dict): The field tree. A key of None in it matches any key.
+
+        Returns:
+            The projected value, or _MISSING if the value is not a mapping.
+        """
+        event = self.loader.peek_event()
+        if isinstance(event, AliasEvent):
+            raise _Unprojectable(event.anchor)
+        if not isinstance(event, MappingStartEvent):
+            self.skip()
+            return _MISSING
+        self._define(self.loader.get_event())
+
+        result = {}
+        any_key = tree.get(None, _MISSING)
+        while not isinstance(self.loader.peek_event(), MappingEndEvent):
+            key_node = self.compose()
+            if key_node.tag == _MERGE_TAG:
+                raise _Unprojectable(key_node.tag)
+            key = self.loader.construct_object(key_node, deep=True)
+            try:
+                subtree = tree.get(key, any_key)
+            except TypeError:
+                raise _Unprojectable(key_node.tag)
+            if subtree is _MISSING:
+                self.skip()
+            elif subtree is _ALL:
+                result[key] = self.loader.construct_object(self.compose(), deep=True)
+            else:
+                value = self.walk(subtree)
+                if value is not _MISSING:
+                    result[key] = value
+        self.loader.get_event()
+        return result
+
+    def dispose(self):
+        self.loader.dispose()
+
+
+def load_fields(stream, fields):
+    """Load only the given fields of each version from a product's YAML string.
+
+    Args:
+        stream (str): A YAML string mapping each version of a product to
+            its data, as in the product catalog config map.
+        fields (list of str or dict): The dotted paths of the fields to load,
+            or a field tree returned by field_tree.
+
+    Returns:
+        dict: a mapping from each version to a dict of only those fields of
+            its data that are present, nested as in the data.
+
+    Raises:
+        yaml.YAMLError: if the YAML could not be parsed.
+    """
+    tree = fields if isinstance(fields, dict) else field_tree(fields)
+    projector = _Projector(stream)
+    try:
+        projector.loader.get_event()
+        if isinstance(projector.loader.peek_event(), StreamEndEvent):
+            return {}
+        projector.loader.get_event()
+        result = projector.walk({None: tree})
+        if result is _MISSING:
+            # Not a mapping; load it as safe_load would to raise the same errors
+            raise _Unprojectable(None)
+        return result
+    except _Unprojectable:
+        pass
+    finally:
+        projector.dispose()
+
+    data = yaml.load(stream, Loader=_LOADER)
+    return {version: project(version_data, tree) for version, version_data in data.items()}
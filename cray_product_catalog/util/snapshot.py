@@ -0,0 +1,205 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Contains functions for reading and writing snapshots of product catalog data.
+#
+# A snapshot file is a JSON document of the form:
+#
+#   {"kind": "ProductCatalogSnapshot", "version": 1,
+#    "name": ..., "namespace": ..., "resourceVersion": ...,
+#    "data": {product: YAML string of its versions, ...},
+#    "hashes": {product: "sha256:<hex digest of its YAML string>", ...}}
+#
+# ConfigMaps saved with `kubectl get configmap -o yaml` or `-o json` can be
+# read as snapshots too. Files whose names end in .gz are written compressed,
+# and compressed files are read whatever their names.
+
+from collections import namedtuple
+import gzip
+import hashlib
+import json
+import os
+
+import yaml
+
+SNAPSHOT_KIND = 'ProductCatalogSnapshot'
+SNAPSHOT_VERSION = 1
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Product catalog data with where it came from. `hashes` maps each product to
+# the hash of its data, or is None if the source did not record hashes.
+Snapshot = namedtuple(
+    'Snapshot', ('data', 'hashes', 'name', 'namespace', 'resource_version'),
+    defaults=(None, None, None, None)
+)
+
+
+class SnapshotError(Exception):
+    """A snapshot could not be read or written."""
+
+
+def hash_product_data(product_data):
+    """Return the hash of a product's YAML string, e.g. 'sha256:0a1b...'."""
+    return 'sha256:' + hashlib.sha256(product_data.encode()).hexdigest()
+
+
+def make_snapshot(data, name=None, namespace=None, resource_version=None):
+    """Create a Snapshot of product catalog data, hashing each product.
+
+    Args:
+        data (dict): A mapping from product name to a YAML string of its
+            versions.
+        name (str, optional): The name of the ConfigMap.
+        namespace (str, optional): The namespace of the ConfigMap.
+        resource_version (str, optional): The resourceVersion of the ConfigMap.
+
+    Returns:
+        Snapshot: the snapshot.
+    """
+    data = data or {}
+    hashes = {product: hash_product_data(product_data) for product, product_data in data.items()}
+    return Snapshot(data, hashes, name, namespace, resource_version)
+
+
+def verify_hashes(data, hashes):
+    """Check that product catalog data matches the given hashes.
+
+    Args:
+        data (dict): A mapping from product name to a YAML string of its
+            versions.
+        hashes (dict): A mapping from product name to the expected hash of
+            its YAML string.
+
+    Raises:
+        SnapshotError: if a product is missing, unexpected, or has data
+            which does not match its hash.
+    """
+    data = data or {}
+    mismatched = sorted(
+        product for product in set(data) | set(hashes)
+        if product not in data or hashes.get(product) != hash_product_data(data[product])
+    )
+    if mismatched:
+        raise SnapshotError(f'Data does not match hashes for product(s): {", ".join(mismatched)}')
+
+
+def _parse(text):
+    """Parse JSON, or YAML if it is not JSON, which is much slower to parse."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return yaml.load(text, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def parse_snapshot(text):
+    """Parse the text of a snapshot file or a ConfigMap saved by kubectl.
+
+    Args:
+        text (str): The contents of the file.
+
+    Returns:
+        Snapshot: the snapshot. Hashes are only included for snapshot files.
+
+    Raises:
+        SnapshotError: if the text is not a snapshot or a ConfigMap.
+    """
+    try:
+        document = _parse(text)
+    except yaml.YAMLError as err:
+        raise SnapshotError(f'Unable to parse snapshot: {err}')
+    if not isinstance(document, dict):
+        raise SnapshotError('Snapshot is not a mapping')
+
+    kind = document.get('kind')
+    if kind == SNAPSHOT_KIND:
+        if document.get('version') != SNAPSHOT_VERSION:
+            raise SnapshotError(f'Unsupported snapshot version {document.get("version")}')
+        return Snapshot(document.get('data') or {}, document.get('hashes'), document.get('name'),
+                        document.get('namespace'), document.get('resourceVersion'))
+    if kind == 'ConfigMap':
+        metadata = document.get('metadata') or {}
+        return Snapshot(document.get('data') or {}, None, metadata.get('name'), metadata.get('namespace'),
+                        metadata.get('resourceVersion'))
+    raise SnapshotError(f'Expected a {SNAPSHOT_KIND} or ConfigMap, not {kind}')
+
+
+def read_snapshot(path):
+    """Read a snapshot file or a ConfigMap saved by kubectl.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        Snapshot: the snapshot.
+
+    Raises:
+        SnapshotError: if the file could not be read or parsed.
+    """
+    try:
+        with open(path, 'rb') as sfile:
+            content = sfile.read()
+        if content[:2] == GZIP_MAGIC:
+            content = gzip.decompress(content)
+        text = content.decode()
+    except (OSError, EOFError, UnicodeDecodeError) as err:
+        raise SnapshotError(f'Unable to read snapshot {path}: {err}')
+    try:
+        return parse_snapshot(text)
+    except SnapshotError as err:
+        raise SnapshotError(f'{path}: {err}')
+
+
+def write_snapshot(path, snapshot):
+    """Write a snapshot file, replacing any existing file atomically.
+
+    Args:
+        path (str): The path of the file. If it ends in .gz, the file is
+            compressed with gzip.
+        snapshot (Snapshot): The snapshot. Hashes are computed if it has none.
+
+    Raises:
+        SnapshotError: if the file could not be written.
+    """
+    hashes = snapshot.hashes
+    if hashes is None:
+        hashes = make_snapshot(snapshot.data).hashes
+    document = {
+        'kind': SNAPSHOT_KIND,
+        'version': SNAPSHOT_VERSION,
+        'name': snapshot.name,
+        'namespace': snapshot.namespace,
+        'resourceVersion': snapshot.resource_version,
+        'data': snapshot.data,
+        'hashes': hashes,
+    }
+    tmp_path = f'{path}.tmp'
+    try:
+        if path.endswith('.gz'):
+            with gzip.open(tmp_path, 'wt') as sfile:
+                json.dump(document, sfile, sort_keys=True)
+        else:
+            with open(tmp_path, 'w') as sfile:
+                json.dump(document, sfile, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        raise SnapshotError(f'Unable to write snapshot {path}: {err}')
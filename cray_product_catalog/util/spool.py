@@ -0,0 +1,165 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Contains functions for spooling catalog requests to a local directory, so
+# that catalog_update and catalog_delete can return without waiting for the
+# Kubernetes API server, and for reading them back for catalog_flush.
+#
+# Each request is written to its own file as JSON:
+#
+#   {"name": "cray-product-catalog", "namespace": "services",
+#    "time": "2023-06-01T12:00:00.000000+00:00", "request": {...}}
+#
+# where the request is made by update_request or delete_request. Files are
+# named after the time they were spooled, so sorting them by name orders the
+# requests. Each is written to a temporary file, synced to disk, and renamed,
+# so a request is either spooled completely or not at all, even if the host
+# crashes.
+
+from datetime import datetime, timezone
+import json
+import os
+import time
+import uuid
+
+SPOOL_SUFFIX = '.json'
+# The subdirectory to which requests which can never be applied are moved
+FAILED_DIR = 'failed'
+
+
+class SpoolError(Exception):
+    """A request could not be spooled or read from the spool."""
+
+
+def _sync_dir(path):
+    """Sync a directory so that files renamed or removed in it persist after a crash."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def spool_request(spool_dir, name, namespace, request):
+    """Durably write a catalog request to the spool.
+
+    Args:
+        spool_dir (str): The spool directory, which is created if needed.
+        name (str): The name of the catalog ConfigMap.
+        namespace (str): The namespace of the catalog ConfigMap.
+        request (dict): A request made by update_request or delete_request.
+
+    Returns:
+        str: the path of the spooled request.
+
+    Raises:
+        SpoolError: if the request could not be written.
+    """
+    entry = {
+        'name': name,
+        'namespace': namespace,
+        'time': datetime.now(timezone.utc).isoformat(),
+        'request': request,
+    }
+    filename = f'{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}{SPOOL_SUFFIX}'
+    path = os.path.join(spool_dir, filename)
+    tmp_path = os.path.join(spool_dir, f'.{filename}.tmp')
+    try:
+        os.makedirs(spool_dir, exist_ok=True)
+        with open(tmp_path, 'w') as sfile:
+            json.dump(entry, sfile, sort_keys=True)
+            sfile.flush()
+            os.fsync(sfile.fileno())
+        os.replace(tmp_path, path)
+        _sync_dir(spool_dir)
+    except OSError as err:
+        raise SpoolError(f'Unable to spool request to {spool_dir}: {err}')
+    return path
+
+
+def pending_requests(spool_dir):
+    """Return the paths of the requests in the spool, oldest first.
+
+    Raises:
+        SpoolError: if the spool directory could not be listed.
+    """
+    try:
+        filenames = os.listdir(spool_dir)
+    except FileNotFoundError:
+        return []
+    except OSError as err:
+        raise SpoolError(f'Unable to list spool {spool_dir}: {err}')
+    return [
+        os.path.join(spool_dir, filename) for filename in sorted(filenames)
+        if filename.endswith(SPOOL_SUFFIX) and not filename.startswith('.')
+    ]
+
+
+def read_request(path):
+    """Read a spooled request.
+
+    Returns:
+        dict: the spooled entry, with 'name', 'namespace', 'time', and
+            'request' keys.
+
+    Raises:
+        SpoolError: if the request could not be read or parsed.
+    """
+    try:
+        with open(path) as sfile:
+            entry = json.load(sfile)
+    except (OSError, ValueError) as err:
+        raise SpoolError(f'Unable to read spooled request {path}: {err}')
+    request = entry.get('request') if isinstance(entry, dict) else None
+    valid = isinstance(request, dict) and {'name', 'namespace'} <= set(entry) and {'product', 'version'} <= set(request)
+    if not valid:
+        raise SpoolError(f'Spooled request {path} is not valid')
+    return entry
+
+
+def remove_requests(paths):
+    """Remove spooled requests once they have been applied.
+
+    Requests already removed, e.g. by another flusher, are ignored.
+    """
+    directories = set()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        directories.add(os.path.dirname(path))
+    for directory in directories:
+        _sync_dir(directory)
+
+
+def fail_request(path):
+    """Move a spooled request which can never be applied to the failed subdirectory.
+
+    Returns:
+        str: the new path of the request.
+    """
+    failed_dir = os.path.join(os.path.dirname(path), FAILED_DIR)
+    os.makedirs(failed_dir, exist_ok=True)
+    failed_path = os.path.join(failed_dir, os.path.basename(path))
+    os.replace(path, failed_path)
+    return failed_path
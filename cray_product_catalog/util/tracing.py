@@ -0,0 +1,276 @@
+#
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# Records the phases of catalog reads and writes as spans, and writes them to a
+# file in the OpenTelemetry (OTLP) JSON format, without needing a collector.
+#
+# Tracing is enabled by setting CATALOG_TRACE_FILE. When it is not set, span()
+# returns a shared object which does nothing, so spans cost almost nothing.
+
+import atexit
+from contextvars import ContextVar
+from functools import wraps
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# The instrumentation scope of every span
+SCOPE_NAME = 'cray_product_catalog'
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_ERROR = 2
+
+# The span open in the current thread or task, the parent of new spans
+_current_span = ContextVar('current_span', default=None)
+
+
+def _attribute_value(value):
+    """Return an OTLP AnyValue for an attribute value."""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        # 64-bit integers are encoded as strings in OTLP JSON
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes):
+    """Return a list of OTLP KeyValues for a dict of attributes."""
+    return [{'key': key, 'value': _attribute_value(value)} for key, value in attributes.items()]
+
+
+class _NoopSpan:
+    """The span returned when tracing is disabled, which records nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed phase of an operation, which is recorded when its with statement exits.
+
+    Attributes:
+        name (str): The name of the span.
+        trace_id (str): The hex ID of the trace, shared by a root span and
+            all of its descendants.
+        span_id (str): The hex ID of the span.
+        parent_span_id (str): The ID of the parent span, or '' for a root span.
+        attributes (dict): The attributes of the span.
+    """
+    __slots__ = ('_tracer', 'name', 'kind', 'trace_id', 'span_id', 'parent_span_id', 'attributes',
+                 'start', 'end', 'status', 'events', '_token')
+
+    def __init__(self, tracer, name, attributes, kind=SPAN_KIND_INTERNAL):
+        self._tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else f'{random.getrandbits(128) or 1:032x}'
+        self.parent_span_id = parent.span_id if parent else ''
+        self.span_id = f'{random.getrandbits(64) or 1:016x}'
+        self.start = self.end = None
+        self.status = {}
+        self.events = []
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.time_ns()
+        _current_span.reset(self._token)
+        # Exiting successfully, e.g. from a main function, is not an error.
+        if exc_type is not None and not (issubclass(exc_type, SystemExit) and not exc_value.code):
+            self.status = {'code': STATUS_CODE_ERROR, 'message': str(exc_value)}
+            self.events.append({
+                'timeUnixNano': str(self.end),
+                'name': 'exception',
+                'attributes': _attributes({'exception.type': exc_type.__name__,
+                                           'exception.message': str(exc_value)}),
+            })
+        self._tracer.record(self)
+        return False
+
+    def set_attribute(self, key, value):
+        """Set an attribute of the span, e.g. a result which is not known when it starts."""
+        self.attributes[key] = value
+
+    def to_otlp(self):
+        """Return the span as an OTLP JSON Span."""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': _attributes(self.attributes),
+            'status': self.status,
+        }
+        if self.events:
+            span['events'] = self.events
+        return span
+
+
+class Tracer:
+    """Collects finished spans and appends them to a file.
+
+    The spans of a trace are written when its root span ends, or when
+    `max_buffered` spans are waiting, as one line holding an OTLP JSON
+    ExportTraceServiceRequest, as written by the OpenTelemetry Collector's
+    file exporter. Several processes may append to the same file.
+    """
+
+    def __init__(self, path, service_name='cray-product-catalog', max_buffered=512):
+        """Create the Tracer.
+
+        Args:
+            path (str): The file to append spans to.
+            service_name (str): The service.name of the resource.
+            max_buffered (int): The number of finished spans to keep before
+                they are written, even if their trace has not ended.
+        """
+        self.path = path
+        self.max_buffered = max_buffered
+        self.resource = {'attributes': _attributes({'service.name': service_name, 'process.pid': os.getpid()})}
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def span(self, name, attributes, kind=SPAN_KIND_INTERNAL):
+        """Return a new Span, a child of the span open in this thread, if any."""
+        return Span(self, name, attributes, kind)
+
+    def record(self, span):
+        """Keep a finished span, writing the buffered spans if it is a root span or the buffer is full."""
+        with self._lock:
+            self._spans.append(span)
+            full = len(self._spans) >= self.max_buffered
+        if full or not span.parent_span_id:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered spans to the file, logging any error."""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return
+        line = json.dumps({'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{'scope': {'name': SCOPE_NAME}, 'spans': [span.to_otlp() for span in spans]}],
+        }]}, separators=(',', ':'))
+        try:
+            with open(self.path, 'a') as trace_file:
+                trace_file.write(line + '\n')
+        except OSError as err:
+            LOGGER.warning("Unable to write %s trace spans to %s: %s", len(spans), self.path, err)
+
+
+# The Tracer spans are recorded with, or None if tracing is disabled
+_tracer = None
+
+
+def configure(path=None, service_name='cray-product-catalog'):
+    """Enable tracing to a file, or disable it.
+
+    Spans still buffered by the previous Tracer, if any, are written first.
+
+    Args:
+        path (str, optional): The file to append spans to, or None to
+            disable tracing.
+        service_name (str): The service.name of the spans' resource.
+
+    Returns:
+        Tracer: the new Tracer, or None if tracing is disabled.
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.flush()
+    _tracer = Tracer(path, service_name) if path else None
+    return _tracer
+
+
+def enabled():
+    """Return True if spans are being recorded."""
+    return _tracer is not None
+
+
+def span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """Return a context manager timing the body of a with statement as a span.
+
+    Args:
+        name (str): The name of the span, e.g. 'yaml.safe_load'.
+        kind (int): The OTLP span kind.
+        **attributes: The attributes of the span.
+
+    Returns:
+        Span: a span which is recorded when the with statement exits, or an
+            object which does nothing if tracing is disabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return tracer.span(name, attributes, kind)
+
+
+def traced(name):
+    """Decorate a function so that each call is recorded as a span with the given name."""
+    def decorator(func):
+        @wraps(func)
+        def traced_func(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name, {}):
+                return func(*args, **kwargs)
+        return traced_func
+    return decorator
+
+
+def _flush():
+    """Write the spans still buffered when the process exits."""
+    if _tracer is not None:
+        _tracer.flush()
+
+
+configure(os.environ.get('CATALOG_TRACE_FILE', '').strip() or None)
+atexit.register(_flush)
@@ -50,7 +50,7 @@ setup(
     url='https://github.com/Cray-HPE/cray-product-catalog',
     author='Hewlett Packard Enterprise Development LP',
     license='MIT',
-    packages=find_packages(exclude=['tests', 'tests.*']),
+    packages=find_packages(exclude=['tests', 'tests.*', 'benchmarks', 'benchmarks.*']),
     package_data={
         'cray_product_catalog.schema': ['schema.yaml']
     },
@@ -59,7 +59,16 @@ setup(
     install_requires=install_requires,
     entry_points={
         'console_scripts': [
+            'catalog_archive=cray_product_catalog.catalog_archive:main',
+            'catalog_backup=cray_product_catalog.catalog_backup:main',
+            'catalog_coordinator=cray_product_catalog.catalog_coordinator:main',
             'catalog_delete=cray_product_catalog.catalog_delete:main',
+            'catalog_diff=cray_product_catalog.catalog_diff:main',
+            'catalog_export=cray_product_catalog.catalog_export:main',
+            'catalog_flush=cray_product_catalog.catalog_flush:main',
+            'catalog_restore=cray_product_catalog.catalog_restore:main',
+            'catalog_rewind=cray_product_catalog.catalog_rewind:main',
+            'catalog_server=cray_product_catalog.catalog_server:main',
             'catalog_update=cray_product_catalog.catalog_update:main'
         ]
     }
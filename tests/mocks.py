@@ -22,6 +22,11 @@
 #
 # Mock data for ProductCatalog and InstalledProductVersion unit tests
 
+import json
+from unittest.mock import Mock
+
+from kubernetes.client import ApiClient, V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
 from yaml import safe_dump
 
 
@@ -135,3 +140,111 @@ MOCK_PRODUCT_CATALOG_DATA = {
     'cos': safe_dump(COS_VERSIONS),
     'other_product': safe_dump(OTHER_PRODUCT_VERSION)
 }
+
+
+class MockConfigMapResponse:
+    """A raw response from read_namespaced_config_map(..., _preload_content=False).
+
+    The body is encoded when it is read, so changes made to `config_map_data`
+    after the response is created are reflected in it.
+    """
+
+    def __init__(self, config_map_data, resource_version='1'):
+        self.config_map_data = config_map_data
+        self.resource_version = resource_version
+        self.release_conn = Mock()
+
+    @property
+    def data(self):
+        return json.dumps({
+            'kind': 'ConfigMap',
+            'metadata': {'resourceVersion': self.resource_version},
+            'data': self.config_map_data
+        }).encode()
+
+
+class MockRawResponse:
+    """A raw ConfigMap response from a _preload_content=False request."""
+    def __init__(self, obj):
+        self.data = json.dumps(obj).encode()
+        self.release_conn = Mock()
+
+
+class MockConfigMapApi:
+    """A mock CoreV1Api which stores ConfigMaps in memory.
+
+    Attributes:
+        config_maps (dict): A mapping from (namespace, name) to the stored
+            ConfigMap object.
+        requests (list): The names of the methods called.
+        corrupt (bool): If True, the API server drops one product of the
+            data it writes.
+    """
+    def __init__(self):
+        self.config_maps = {}
+        self.requests = []
+        self.corrupt = False
+
+    def add(self, namespace, name, data, labels=None, resource_version='1'):
+        self.config_maps[(namespace, name)] = {
+            'kind': 'ConfigMap', 'data': data,
+            'metadata': {'name': name, 'namespace': namespace, 'labels': labels, 'uid': 'abc',
+                         'resourceVersion': resource_version, 'annotations': {'last-applied': '...'}},
+        }
+
+    def read_namespaced_config_map(self, name, namespace, _preload_content=True):
+        self.requests.append('read')
+        if (namespace, name) not in self.config_maps:
+            raise ApiException(status=404, reason='Not Found')
+        return MockRawResponse(self.config_maps[(namespace, name)])
+
+    def _write(self, namespace, body):
+        body = json.loads(json.dumps(body))
+        if self.corrupt and body['data']:
+            body['data'].pop(sorted(body['data'])[0])
+        body['metadata']['resourceVersion'] = '100'
+        self.config_maps[(namespace, body['metadata']['name'])] = body
+        return MockRawResponse(body)
+
+    def create_namespaced_config_map(self, namespace, body, _preload_content=True):
+        self.requests.append('create')
+        body = ApiClient().sanitize_for_serialization(body)
+        if (namespace, body['metadata']['name']) in self.config_maps:
+            raise ApiException(status=409, reason='Conflict')
+        return self._write(namespace, body)
+
+    def replace_namespaced_config_map(self, name, namespace, body, _preload_content=True):
+        self.requests.append('replace')
+        return self._write(namespace, body)
+
+    def patch_namespaced_config_map(self, name, namespace, body, _preload_content=True):
+        self.requests.append('patch')
+        if (namespace, name) not in self.config_maps:
+            raise ApiException(status=404, reason='Not Found')
+        body = ApiClient().sanitize_for_serialization(body)
+        config_map = self.config_maps[(namespace, name)]
+        metadata = config_map['metadata']
+        expected = body.get('metadata', {}).get('resourceVersion')
+        if expected and expected != metadata['resourceVersion']:
+            raise ApiException(status=409, reason='Conflict')
+        patch_data = dict(body.get('data') or {})
+        if self.corrupt and patch_data:
+            patch_data.pop(sorted(patch_data)[0])
+        data = dict(config_map['data'] or {})
+        for key, value in patch_data.items():
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = value
+        config_map['data'] = data
+        labels = body.get('metadata', {}).get('labels')
+        if labels:
+            metadata['labels'] = dict(metadata['labels'] or {}, **labels)
+        metadata['resourceVersion'] = str(int(metadata['resourceVersion']) + 1)
+        if not _preload_content:
+            return MockRawResponse(config_map)
+        return V1ConfigMap(data=data, metadata=V1ObjectMeta(name=name, resource_version=metadata['resourceVersion']))
+
+    def delete_namespaced_config_map(self, name, namespace):
+        self.requests.append('delete')
+        del self.config_maps[(namespace, name)]
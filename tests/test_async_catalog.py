@@ -0,0 +1,188 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.async_catalog module
+
+import asyncio
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+from yaml import safe_dump, safe_load
+
+from cray_product_catalog.async_catalog import AsyncCatalogWriter, AsyncProductCatalog
+from cray_product_catalog.util.catalog_data import apply_requests
+from cray_product_catalog.query import ProductCatalog, ProductCatalogError
+from tests.mocks import MOCK_PRODUCT_CATALOG_DATA, MockConfigMapResponse
+
+
+class TestAsyncProductCatalog(unittest.IsolatedAsyncioTestCase):
+    """Tests for the AsyncProductCatalog class."""
+
+    def setUp(self):
+        """Set up mocks."""
+        self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
+        self.mock_k8s_api.read_namespaced_config_map.return_value = MockConfigMapResponse(MOCK_PRODUCT_CATALOG_DATA)
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    async def test_load(self):
+        """Test loading a product catalog."""
+        product_catalog = await AsyncProductCatalog.load('mock-name', 'mock-namespace')
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once_with(
+            'mock-name', 'mock-namespace', _preload_content=False
+        )
+        self.assertEqual('2.0.1', product_catalog.get_product('sat').version)
+        self.assertEqual(5, len(product_catalog.products))
+
+    async def test_concurrent_loads_share_fetch(self):
+        """Test that concurrent loads of the same config map make one request."""
+        product_catalogs = await asyncio.gather(*[
+            AsyncProductCatalog.load('mock-name', 'mock-namespace') for _ in range(10)
+        ])
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once()
+        self.assertTrue(all(catalog is product_catalogs[0] for catalog in product_catalogs))
+
+        # Once the fetch is complete, a new load fetches again.
+        await AsyncProductCatalog.load('mock-name', 'mock-namespace')
+        self.assertEqual(2, self.mock_k8s_api.read_namespaced_config_map.call_count)
+
+    async def test_load_error(self):
+        """Test that an error reading the config map is raised to every caller."""
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = ApiException(status=500, reason='Oops')
+        results = await asyncio.gather(*[
+            AsyncProductCatalog.load('mock-name', 'mock-namespace') for _ in range(3)
+        ], return_exceptions=True)
+        for result in results:
+            self.assertIsInstance(result, ProductCatalogError)
+
+    def test_create_directly(self):
+        """Test that an AsyncProductCatalog cannot be created without load()."""
+        with self.assertRaises(TypeError):
+            AsyncProductCatalog('mock-name', 'mock-namespace')
+
+
+class TestAsyncCatalogWriter(unittest.IsolatedAsyncioTestCase):
+    """Tests for the AsyncCatalogWriter class."""
+
+    def setUp(self):
+        """Set up a mock Kubernetes API holding a single ConfigMap."""
+        self.data = {'sat': safe_dump({'1.0.0': {'foo': 'bar', 'baz': []}})}
+        self.resource_version = 1
+        self.conflicts = 0
+        self.api = Mock()
+        self.api.read_namespaced_config_map.side_effect = lambda name, namespace, **kwargs: MockConfigMapResponse(
+            dict(self.data), str(self.resource_version)
+        )
+
+        def patch_config_map(name, namespace, body):
+            if self.conflicts:
+                # Simulate another writer changing the ConfigMap first
+                self.conflicts -= 1
+                self.resource_version += 1
+            if body.metadata.resource_version != str(self.resource_version):
+                raise ApiException(status=409)
+            self.data.update(body.data)
+            self.resource_version += 1
+
+        self.api.patch_namespaced_config_map.side_effect = patch_config_map
+        self.mock_sleep = patch('cray_product_catalog.async_catalog.asyncio.sleep').start()
+        self.writer = AsyncCatalogWriter('mock-name', 'mock-namespace', api_instance=self.api)
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    async def test_concurrent_requests_coalesced(self):
+        """Test that concurrent requests are applied in a single patch."""
+        await asyncio.gather(
+            self.writer.update('sat', '2.0.0', {'foo': 'new'}),
+            self.writer.update('cos', '1.0.0', {'foo': 'bar'}, set_active=True),
+            self.writer.delete('sat', '1.0.0'),
+        )
+        self.api.patch_namespaced_config_map.assert_called_once()
+        self.assertEqual({'2.0.0': {'foo': 'new'}}, safe_load(self.data['sat']))
+        self.assertEqual({'1.0.0': {'foo': 'bar', 'active': True}}, safe_load(self.data['cos']))
+
+    async def test_no_change(self):
+        """Test that no patch is made when the data is already present."""
+        await self.writer.update('sat', '1.0.0', {'foo': 'bar'})
+        self.api.patch_namespaced_config_map.assert_not_called()
+
+    async def test_conflict_retried(self):
+        """Test that a conflict is retried with a non-blocking backoff."""
+        self.conflicts = 2
+        await self.writer.update('sat', '2.0.0', {'foo': 'new'})
+        self.assertEqual(3, self.api.patch_namespaced_config_map.call_count)
+        self.assertIn('2.0.0', safe_load(self.data['sat']))
+        self.assertEqual(3, self.mock_sleep.await_count)  # coalesce window and two backoffs
+
+    async def test_requests_applied_in_executor(self):
+        """Test that the catalog's YAML is parsed and dumped off the event loop's thread."""
+        threads = []
+
+        def record_thread(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return apply_requests(*args, **kwargs)
+
+        with patch('cray_product_catalog.async_catalog.apply_requests', side_effect=record_thread):
+            await self.writer.update('sat', '2.0.0', {'foo': 'new'})
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.current_thread(), threads[0])
+        self.assertEqual({'1.0.0', '2.0.0'}, set(safe_load(self.data['sat'])))
+
+    async def test_failed_request(self):
+        """Test that a request which cannot be applied fails without failing the others."""
+        results = await asyncio.gather(
+            self.writer.update('sat', '1.0.0', {'baz': 'not a list'}),
+            self.writer.update('sat', '2.0.0', {'foo': 'new'}),
+            return_exceptions=True
+        )
+        self.assertIsInstance(results[0], TypeError)
+        self.assertIsNone(results[1])
+        self.assertEqual([], safe_load(self.data['sat'])['1.0.0']['baz'])
+        self.assertIn('2.0.0', safe_load(self.data['sat']))
+
+    async def test_api_error(self):
+        """Test that an error reading the ConfigMap is raised to every caller."""
+        self.api.read_namespaced_config_map.side_effect = ApiException(status=403)
+        with self.assertRaises(ApiException):
+            await self.writer.update('sat', '2.0.0', {'foo': 'new'})
+
+    async def test_wait_for_config_map(self):
+        """Test waiting for the ConfigMap to be created."""
+        read = self.api.read_namespaced_config_map.side_effect
+        self.api.read_namespaced_config_map.side_effect = iter([
+            ApiException(status=404), read('mock-name', 'mock-namespace')
+        ])
+        with patch('cray_product_catalog.async_catalog.wait_for_config_map', return_value=True) as mock_wait:
+            await self.writer.update('sat', '2.0.0', {'foo': 'new'})
+        mock_wait.assert_called_once_with(self.api, 'mock-name', 'mock-namespace', None)
+        self.assertIn('2.0.0', safe_load(self.data['sat']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Unit tests for cray_product_catalog.catalog_archive module
+
+import copy
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+from yaml import safe_dump, safe_load
+
+from cray_product_catalog.catalog_archive import (
+    archive_config_map,
+    merge_archive_data,
+    select_versions_to_archive,
+    split_config_map_data,
+    write_archive_config_map,
+    write_archive_file,
+)
+from cray_product_catalog.query import ProductCatalog
+from cray_product_catalog.util.deadline import Deadline, DeadlineExceeded
+from cray_product_catalog.util.journal import FileJournal, rewind
+from tests.mocks import COS_VERSIONS, MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS, MockConfigMapResponse
+
+
+def _versions(*versions, active=None):
+    """Return product data with the given versions, optionally marking one active."""
+    return {version: {'active': version == active} if active else {} for version in versions}
+
+
+class TestSelectVersionsToArchive(unittest.TestCase):
+    """Tests for select_versions_to_archive()."""
+
+    def test_keep_newest(self):
+        """Test that the newest versions are kept, by version order rather than string order."""
+        product_data = _versions('1.9.0', '1.10.0', '1.2.0', '1.11.0')
+        self.assertEqual(['1.2.0', '1.9.0'], select_versions_to_archive(product_data, 2))
+
+    def test_keep_active(self):
+        """Test that an old active version is not archived."""
+        product_data = _versions('1.0.0', '1.1.0', '1.2.0', '1.3.0', active='1.0.0')
+        self.assertEqual(['1.1.0', '1.2.0'], select_versions_to_archive(product_data, 1))
+
+    def test_nothing_to_archive(self):
+        """Test a product with no more versions than are kept."""
+        self.assertEqual([], select_versions_to_archive(_versions('1.0.0', '1.1.0'), 2))
+
+
+class TestSplitConfigMapData(unittest.TestCase):
+    """Tests for split_config_map_data()."""
+
+    def test_split(self):
+        """Test splitting ConfigMap data into archived and retained versions."""
+        archived, retained = split_config_map_data(MOCK_PRODUCT_CATALOG_DATA, 1)
+        self.assertEqual({'sat': {'2.0.0': SAT_VERSIONS['2.0.0']}, 'cos': {'2.0.0': COS_VERSIONS['2.0.0']}},
+                         archived)
+        self.assertEqual({'sat': {'2.0.1': SAT_VERSIONS['2.0.1']}, 'cos': {'2.0.1': COS_VERSIONS['2.0.1']}},
+                         retained)
+
+    def test_split_selected_products(self):
+        """Test that only the given products are considered."""
+        archived, retained = split_config_map_data(MOCK_PRODUCT_CATALOG_DATA, 1, products=['cos'])
+        self.assertEqual(['cos'], list(archived))
+        self.assertEqual(['cos'], list(retained))
+
+
+class TestArchiveStorage(unittest.TestCase):
+    """Tests for writing archived versions to a ConfigMap or file."""
+
+    def test_merge_archive_data(self):
+        """Test merging into existing archive data keeps previously archived versions."""
+        existing = {'sat': safe_dump({'1.0.0': {}}), 'cos': safe_dump({'1.0.0': {}})}
+        patch_data = merge_archive_data(existing, {'sat': {'2.0.0': SAT_VERSIONS['2.0.0']}})
+        self.assertEqual(['sat'], list(patch_data))
+        self.assertEqual({'1.0.0': {}, '2.0.0': SAT_VERSIONS['2.0.0']}, safe_load(patch_data['sat']))
+
+    def test_write_archive_file(self):
+        """Test that writing an archive file twice merges the versions."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'archive.yaml')
+            write_archive_file(path, {'sat': {'2.0.0': SAT_VERSIONS['2.0.0']}})
+            write_archive_file(path, {'sat': {'2.0.1': SAT_VERSIONS['2.0.1']}})
+            with open(path) as f:
+                self.assertEqual({'sat': SAT_VERSIONS}, safe_load(f))
+
+    def test_write_archive_config_map_create(self):
+        """Test that the archive ConfigMap is created when it does not exist."""
+        api = Mock()
+        api.read_namespaced_config_map.side_effect = ApiException(status=404)
+        write_archive_config_map(api, 'archive', 'ns', {'sat': {'2.0.0': {}}})
+        api.create_namespaced_config_map.assert_called_once()
+        namespace, body = api.create_namespaced_config_map.call_args[0]
+        self.assertEqual('ns', namespace)
+        self.assertEqual({'sat': safe_dump({'2.0.0': {}})}, body.data)
+        api.patch_namespaced_config_map.assert_not_called()
+
+    @patch('cray_product_catalog.util.deadline.time.sleep')
+    def test_write_archive_config_map_conflict(self, mock_sleep):
+        """Test that a conflict writing the archive ConfigMap is retried after a backoff."""
+        api = Mock()
+        api.read_namespaced_config_map.return_value = Mock(data={}, metadata=Mock(resource_version='1'))
+        api.patch_namespaced_config_map.side_effect = [ApiException(status=409), None]
+        deadline = Deadline()
+        write_archive_config_map(api, 'archive', 'ns', {'sat': {'2.0.0': {}}}, deadline)
+        self.assertEqual(2, api.patch_namespaced_config_map.call_count)
+        self.assertEqual({'conflicts': 1}, deadline.counts)
+        mock_sleep.assert_called_once()
+
+    @patch('cray_product_catalog.util.deadline.time.sleep')
+    def test_write_archive_config_map_deadline(self, _):
+        """Test that conflicts writing the archive ConfigMap are not retried past the deadline."""
+        api = Mock()
+        api.read_namespaced_config_map.return_value = Mock(data={}, metadata=Mock(resource_version='1'))
+        api.patch_namespaced_config_map.side_effect = ApiException(status=409)
+        deadline = Deadline(10)
+        deadline.end = deadline.start
+        with self.assertRaises(DeadlineExceeded):
+            write_archive_config_map(api, 'archive', 'ns', {'sat': {'2.0.0': {}}}, deadline)
+        api.patch_namespaced_config_map.assert_not_called()
+
+    def test_archive_file_not_queried(self):
+        """Test that versions archived to a file are not loaded with include_archived."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'archive.yaml')
+            write_archive_file(path, {'sat': {'2.0.0': SAT_VERSIONS['2.0.0']}})
+            with patch.object(ProductCatalog, '_get_k8s_api') as mock_get_k8s_api:
+                mock_get_k8s_api.return_value.read_namespaced_config_map.side_effect = [
+                    MockConfigMapResponse({'sat': safe_dump({'2.0.1': SAT_VERSIONS['2.0.1']})}),
+                    ApiException(status=404, reason='Not Found'),
+                ]
+                product_catalog = ProductCatalog('catalog', 'ns', include_archived=True)
+        self.assertEqual([('sat', '2.0.1')], [(p.name, p.version) for p in product_catalog.products])
+
+
+class TestArchiveConfigMap(unittest.TestCase):
+    """Tests for archive_config_map()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        patch('cray_product_catalog.util.deadline.time.sleep').start()
+        self.mock_api = patch('cray_product_catalog.catalog_archive.client.CoreV1Api').start().return_value
+        patch('cray_product_catalog.catalog_archive.get_api_client').start()
+        self.catalog_data = copy.deepcopy(MOCK_PRODUCT_CATALOG_DATA)
+
+        def read(name, namespace, **kwargs):
+            if name == 'archive':
+                raise ApiException(status=404)
+            return Mock(data=dict(self.catalog_data), metadata=Mock(resource_version='1'))
+
+        def patch_config_map(name, namespace, body, **kwargs):
+            self.catalog_data.update(body.data)
+
+        self.mock_api.read_namespaced_config_map.side_effect = read
+        self.mock_api.patch_namespaced_config_map.side_effect = patch_config_map
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_archive_config_map(self):
+        """Test that old versions are moved to the archive before being removed from the catalog."""
+        archive_config_map('catalog', 'ns', 1, archive_name='archive')
+
+        self.assertEqual({'2.0.1': SAT_VERSIONS['2.0.1']}, safe_load(self.catalog_data['sat']))
+        self.assertEqual({'2.0.1': COS_VERSIONS['2.0.1']}, safe_load(self.catalog_data['cos']))
+        archive_body = self.mock_api.create_namespaced_config_map.call_args[0][1]
+        self.assertEqual({'2.0.0': SAT_VERSIONS['2.0.0']}, safe_load(archive_body.data['sat']))
+        # The catalog patch only carries the products that changed.
+        catalog_patch = self.mock_api.patch_namespaced_config_map.call_args[0][2]
+        self.assertEqual({'sat', 'cos'}, set(catalog_patch.data))
+        self.assertEqual('1', catalog_patch.metadata.resource_version)
+
+    def test_archive_journaled(self):
+        """Test that the writes to the catalog and archive are recorded so the catalog can be rewound."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            journal = FileJournal(os.path.join(tmp_dir, 'journal.jsonl'))
+            archive_config_map('catalog', 'ns', 1, archive_name='archive', journal=journal)
+            entries = journal.entries()
+        self.assertEqual({('archive', 'sat'), ('archive', 'cos'), ('catalog', 'sat'), ('catalog', 'cos')},
+                         {(entry['name'], entry['product']) for entry in entries})
+        self.assertEqual(MOCK_PRODUCT_CATALOG_DATA,
+                         rewind(self.catalog_data, entries, resource_version='1', name='catalog', namespace='ns'))
+
+    def test_archive_patch_error(self):
+        """Test that an error other than a conflict patching the catalog is raised rather than retried."""
+        self.mock_api.patch_namespaced_config_map.side_effect = ApiException(status=403)
+        with self.assertRaises(ApiException):
+            archive_config_map('catalog', 'ns', 1, archive_name='archive')
+        self.mock_api.patch_namespaced_config_map.assert_called_once()
+        self.mock_api.create_namespaced_config_map.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
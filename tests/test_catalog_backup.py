@@ -0,0 +1,81 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_backup module
+
+import os
+import tempfile
+import unittest
+
+from cray_product_catalog.catalog_backup import backup_catalog
+from cray_product_catalog.util.snapshot import SnapshotError, make_snapshot, read_snapshot
+from tests.mocks import MockConfigMapApi
+
+
+class TestBackupCatalog(unittest.TestCase):
+    """Tests for backup_catalog()."""
+
+    def setUp(self):
+        """Set up a mock API holding the product catalog ConfigMap."""
+        self.api = MockConfigMapApi()
+        self.data = {'sat': '1.0.0: {}\n', 'cos': '2.0.0: {}\n'}
+        self.api.add('services', 'cray-product-catalog', self.data, labels={'app': 'catalog'})
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_backup_config_map(self):
+        """Test backing up to a ConfigMap in one read and one write, without server-managed metadata."""
+        snapshot = backup_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(make_snapshot(self.data, 'cray-product-catalog', 'services', '1'), snapshot)
+        self.assertEqual(['read', 'create'], self.api.requests)
+        backup = self.api.config_maps[('services', 'cpc-backup')]
+        self.assertEqual(self.data, backup['data'])
+        self.assertEqual({'name': 'cpc-backup', 'namespace': 'services', 'labels': {'app': 'catalog'},
+                          'resourceVersion': '100'}, backup['metadata'])
+
+    def test_backup_replaces_existing(self):
+        """Test that an existing backup ConfigMap is replaced."""
+        self.api.add('services', 'cpc-backup', {'old': ''})
+        backup_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(['read', 'create', 'replace'], self.api.requests)
+        self.assertEqual(self.data, self.api.config_maps[('services', 'cpc-backup')]['data'])
+
+    def test_backup_verify_failed(self):
+        """Test that a backup which was not written correctly is an error."""
+        self.api.corrupt = True
+        with self.assertRaisesRegex(SnapshotError, 'cpc-backup was not written correctly: .*cos'):
+            backup_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+
+    def test_backup_file(self):
+        """Test backing up to a compressed snapshot file only."""
+        path = os.path.join(self.tmp_dir.name, 'backup.json.gz')
+        backup_catalog(self.api, 'cray-product-catalog', 'services', backup_file=path)
+        self.assertEqual(['read'], self.api.requests)
+        self.assertEqual(make_snapshot(self.data, 'cray-product-catalog', 'services', '1'), read_snapshot(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
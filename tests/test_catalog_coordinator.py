@@ -0,0 +1,244 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Unit tests for cray_product_catalog.catalog_coordinator module
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+from yaml import safe_dump, safe_load
+
+from cray_product_catalog.catalog_coordinator import (
+    CatalogCoordinator,
+    CoordinatorAuthError,
+    CoordinatorError,
+    CoordinatorUnavailableError,
+    KubernetesAuthenticator,
+    make_server,
+    submit_request,
+)
+from cray_product_catalog.util import metrics
+from cray_product_catalog.util.catalog_data import delete_request, update_request
+from cray_product_catalog.util.journal import FileJournal, rewind
+
+
+class TestCatalogCoordinator(unittest.TestCase):
+    """Tests for the CatalogCoordinator class."""
+
+    def setUp(self):
+        """Set up a mock Kubernetes API holding a single ConfigMap."""
+        patch('cray_product_catalog.catalog_coordinator.time.sleep').start()
+        metrics.REGISTRY.reset()
+        self.data = {'sat': safe_dump({'1.0.0': {'foo': 'bar', 'baz': []}})}
+        self.resource_version = 1
+        self.api = Mock()
+        self.api.read_namespaced_config_map.side_effect = lambda name, namespace: Mock(
+            data=dict(self.data), metadata=Mock(resource_version=str(self.resource_version))
+        )
+
+        def patch_config_map(name, namespace, body):
+            if body.metadata.resource_version != str(self.resource_version):
+                raise ApiException(status=409)
+            self.data.update(body.data)
+            self.resource_version += 1
+            return Mock(metadata=Mock(resource_version=str(self.resource_version)))
+
+        self.api.patch_namespaced_config_map.side_effect = patch_config_map
+        self.coordinator = CatalogCoordinator(self.api, coalesce_window=0)
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_batch_single_patch(self):
+        """Test that all pending requests for a ConfigMap are applied in one patch."""
+        pending = [
+            self.coordinator.enqueue('cm', 'ns', update_request(f'product-{i}', '1.0.0', {'i': i}))
+            for i in range(5)
+        ] + [self.coordinator.enqueue('cm', 'ns', delete_request('sat', '1.0.0'))]
+        self.assertEqual(6, self.coordinator.run_once(block=False))
+
+        self.api.read_namespaced_config_map.assert_called_once_with('cm', 'ns')
+        self.api.patch_namespaced_config_map.assert_called_once()
+        for p in pending:
+            p.wait(0)
+        self.assertEqual({'1.0.0': {'i': 3}}, safe_load(self.data['product-3']))
+        self.assertEqual({}, safe_load(self.data['sat']))
+
+    def test_batch_conflict(self):
+        """Test that a batch is re-read and re-applied after a conflict."""
+        pending = self.coordinator.enqueue('cm', 'ns', update_request('cos', '1.0.0', {}))
+        self.api.patch_namespaced_config_map.side_effect = [ApiException(status=409), None]
+        self.coordinator.run_once(block=False)
+        pending.wait(0)
+        self.assertEqual(2, self.api.read_namespaced_config_map.call_count)
+        self.assertEqual(2, self.api.patch_namespaced_config_map.call_count)
+        self.assertEqual(2, metrics.ATTEMPTS.value(operation='coordinator'))
+        self.assertEqual(1, metrics.CONFLICTS.value(operation='coordinator'))
+        self.assertEqual(1, metrics.SLEEP_SECONDS.count())
+
+    def test_failed_request(self):
+        """Test that a request that cannot be merged fails without failing the rest of the batch."""
+        bad = self.coordinator.enqueue('cm', 'ns', update_request('sat', '1.0.0', {'foo': ['bar']}))
+        good = self.coordinator.enqueue('cm', 'ns', update_request('sat', '1.0.1', {}))
+        self.coordinator.run_once(block=False)
+        with self.assertRaises(CoordinatorError):
+            bad.wait(0)
+        good.wait(0)
+        self.assertIn('1.0.1', safe_load(self.data['sat']))
+
+    def test_no_changes(self):
+        """Test that requests which are already satisfied do not patch the ConfigMap."""
+        pending = self.coordinator.enqueue('cm', 'ns', update_request('sat', '1.0.0', {'foo': 'bar'}))
+        self.coordinator.run_once(block=False)
+        pending.wait(0)
+        self.api.patch_namespaced_config_map.assert_not_called()
+
+    def test_journaled(self):
+        """Test that a write applied by the coordinator is journaled and can be rewound."""
+        original = dict(self.data)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.coordinator.journal = FileJournal(os.path.join(tmp_dir, 'journal.jsonl'))
+            self.coordinator.enqueue('cm', 'ns', update_request('sat', '1.0.0', {'foo': 'qux'}))
+            self.coordinator.enqueue('cm', 'ns', update_request('cos', '2.0.0', {}))
+            self.coordinator.run_once(block=False)
+            entries = self.coordinator.journal.entries()
+        self.assertEqual({('sat', '1', '2'), ('cos', '1', '2')},
+                         {(entry['product'], entry['previousResourceVersion'], entry['resourceVersion'])
+                          for entry in entries})
+        self.assertEqual(original, rewind(self.data, entries, resource_version='1', name='cm', namespace='ns'))
+
+    def test_invalid_request(self):
+        """Test that a request without a product is rejected."""
+        with self.assertRaises(CoordinatorError):
+            self.coordinator.enqueue('cm', 'ns', {'op': 'update', 'version': '1.0.0'})
+
+
+class TestCoordinatorServer(unittest.TestCase):
+    """Tests for submitting requests to the coordinator over HTTP."""
+
+    def setUp(self):
+        """Start a coordinator HTTP server with a mock coordinator."""
+        self.coordinator = Mock()
+        self.server = make_server(self.coordinator, '127.0.0.1', 0, request_timeout=1)
+        self.url = 'http://{}:{}'.format(*self.server.server_address[:2])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_submit_request(self):
+        """Test a request that is applied successfully."""
+        request = update_request('sat', '1.0.0', {})
+        submit_request(self.url, 'cm', 'ns', request)
+        self.coordinator.enqueue.assert_called_once_with('cm', 'ns', request)
+        self.coordinator.enqueue.return_value.wait.assert_called_once_with(1)
+
+    def test_submit_request_failed(self):
+        """Test a request that the coordinator fails to apply."""
+        self.coordinator.enqueue.return_value.wait.side_effect = CoordinatorError('Conflict')
+        with self.assertRaisesRegex(CoordinatorError, 'rejected request: Conflict'):
+            submit_request(self.url, 'cm', 'ns', update_request('sat', '1.0.0', {}))
+
+    def test_submit_request_unavailable(self):
+        """Test submitting a request when no coordinator is listening."""
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(CoordinatorUnavailableError):
+            submit_request(self.url, 'cm', 'ns', update_request('sat', '1.0.0', {}), timeout=1)
+
+    def test_submit_request_timeout(self):
+        """Test that a request which times out after it was sent is not reported as unavailable."""
+        self.coordinator.enqueue.return_value.wait.side_effect = lambda timeout: time.sleep(1)
+        with self.assertRaisesRegex(CoordinatorError, 'may still be applied') as raised:
+            submit_request(self.url, 'cm', 'ns', update_request('sat', '1.0.0', {}), timeout=0.1)
+        self.assertNotIsInstance(raised.exception, CoordinatorUnavailableError)
+
+    def test_submit_request_authorized(self):
+        """Test that the bearer token is checked by the server's authenticator."""
+        self.server.authenticator = Mock()
+        submit_request(self.url, 'cm', 'ns', update_request('sat', '1.0.0', {}), token='token')
+        self.server.authenticator.authorize.assert_called_once_with('token', 'cm', 'ns')
+        self.coordinator.enqueue.assert_called_once()
+
+    def test_submit_request_unauthorized(self):
+        """Test that a request which is not authorized is rejected before it is queued."""
+        self.server.authenticator = Mock()
+        self.server.authenticator.authorize.side_effect = CoordinatorAuthError('Forbidden')
+        with self.assertRaisesRegex(CoordinatorError, 'rejected request: Forbidden'):
+            submit_request(self.url, 'cm', 'ns', update_request('sat', '1.0.0', {}), token='token')
+        self.coordinator.enqueue.assert_not_called()
+
+
+class TestKubernetesAuthenticator(unittest.TestCase):
+    """Tests for the KubernetesAuthenticator class."""
+
+    def setUp(self):
+        """Set up an authenticator with mock Kubernetes APIs that allow the request."""
+        self.authenticator = KubernetesAuthenticator(Mock())
+        self.authenticator.authentication_api = Mock()
+        self.authenticator.authorization_api = Mock()
+        self.token_review = self.authenticator.authentication_api.create_token_review.return_value
+        self.token_review.status.user.username = 'system:serviceaccount:ns:installer'
+        self.access_review = self.authenticator.authorization_api.create_subject_access_review.return_value
+
+    def test_allowed(self):
+        """Test that the access review is made for the token's user and the ConfigMap."""
+        self.authenticator.authorize('token', 'cm', 'ns')
+        review = self.authenticator.authentication_api.create_token_review.call_args.args[0]
+        self.assertEqual('token', review.spec.token)
+        access = self.authenticator.authorization_api.create_subject_access_review.call_args.args[0]
+        self.assertEqual('system:serviceaccount:ns:installer', access.spec.user)
+        self.assertEqual(('patch', 'configmaps', 'cm', 'ns'),
+                         (access.spec.resource_attributes.verb, access.spec.resource_attributes.resource,
+                          access.spec.resource_attributes.name, access.spec.resource_attributes.namespace))
+
+    def test_missing_token(self):
+        """Test that a request without a token is rejected with 401."""
+        with self.assertRaises(CoordinatorAuthError) as raised:
+            self.authenticator.authorize(None, 'cm', 'ns')
+        self.assertEqual(401, raised.exception.status)
+
+    def test_invalid_token(self):
+        """Test that a token which is not authenticated is rejected with 401."""
+        self.token_review.status.authenticated = False
+        with self.assertRaises(CoordinatorAuthError) as raised:
+            self.authenticator.authorize('token', 'cm', 'ns')
+        self.assertEqual(401, raised.exception.status)
+
+    def test_forbidden(self):
+        """Test that a user who may not patch the ConfigMap is rejected with 403."""
+        self.access_review.status.allowed = False
+        with self.assertRaises(CoordinatorAuthError) as raised:
+            self.authenticator.authorize('token', 'cm', 'ns')
+        self.assertEqual(403, raised.exception.status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_diff module
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from kubernetes.client.rest import ApiException
+from yaml import safe_dump
+
+from cray_product_catalog.catalog_diff import diff_catalogs, load_catalog, main
+from cray_product_catalog.util.k8s import ConfigMapContent
+from cray_product_catalog.util.snapshot import Snapshot, SnapshotError, make_snapshot, write_snapshot
+
+
+class TestCatalogDiff(unittest.TestCase):
+    """Tests for the catalog_diff script."""
+
+    def setUp(self):
+        """Write old and new snapshots."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.old_data = {
+            'sat': safe_dump({'1.0.0': {'active': True, 'configuration': {'commit': 'abc'}}}),
+            'cos': safe_dump({'2.0.0': {}}),
+        }
+        self.new_data = {
+            'sat': safe_dump({'1.0.0': {'active': False, 'configuration': {'commit': 'def'}}, '1.1.0': {}}),
+            'uan': safe_dump({'3.0.0': {}}),
+        }
+        self.old_path = os.path.join(self.tmp_dir.name, 'old.json')
+        self.new_path = os.path.join(self.tmp_dir.name, 'new.json')
+        write_snapshot(self.old_path, make_snapshot(self.old_data))
+        write_snapshot(self.new_path, make_snapshot(self.new_data))
+        self.mock_stdout = patch('sys.stdout', new_callable=io.StringIO).start()
+        self.mock_stderr = patch('sys.stderr', new_callable=io.StringIO).start()
+
+    def tearDown(self):
+        """Remove the temporary directory and stop patches."""
+        patch.stopall()
+        self.tmp_dir.cleanup()
+
+    def run_main(self, *args):
+        """Run main and return its exit status."""
+        with self.assertRaises(SystemExit) as cm:
+            main(list(args))
+        return cm.exception.code
+
+    def test_diff_text(self):
+        """Test the text output for each kind of difference."""
+        self.assertEqual(1, self.run_main(self.old_path, self.new_path))
+        self.assertEqual([
+            '- cos',
+            '- cos 2.0.0',
+            '~ sat 1.0.0 active: true -> false',
+            '~ sat 1.0.0 configuration: {"commit": "abc"} -> {"commit": "def"}',
+            '+ sat 1.1.0',
+            '+ uan',
+            '+ uan 3.0.0',
+        ], self.mock_stdout.getvalue().splitlines())
+
+    def test_diff_deep_json(self):
+        """Test the JSON output of a deep comparison."""
+        self.assertEqual(1, self.run_main(self.old_path, self.new_path, '--deep', '--format', 'json'))
+        lines = [json.loads(line) for line in self.mock_stdout.getvalue().splitlines()]
+        self.assertEqual(
+            {'type': 'key_changed', 'product': 'sat', 'version': '1.0.0', 'key': 'configuration.commit',
+             'old': 'abc', 'new': 'def', 'path': ['configuration', 'commit']},
+            lines[3]
+        )
+
+    def test_same(self):
+        """Test that identical catalogs have no output and exit 0."""
+        self.assertEqual(0, self.run_main(self.old_path, self.old_path))
+        self.assertEqual('', self.mock_stdout.getvalue())
+
+    def test_unreadable(self):
+        """Test that a missing file exits 2."""
+        self.assertEqual(2, self.run_main(self.old_path, os.path.join(self.tmp_dir.name, 'missing.json')))
+        self.assertIn('Unable to read snapshot', self.mock_stderr.getvalue())
+
+    def test_diff_catalogs_count(self):
+        """Test that diff_catalogs returns the number of differences."""
+        out = io.StringIO()
+        self.assertEqual(7, diff_catalogs(Snapshot(self.old_data), Snapshot(self.new_data), out))
+
+    @patch('cray_product_catalog.catalog_diff.load_k8s')
+    @patch('cray_product_catalog.catalog_diff.get_api_client')
+    @patch('cray_product_catalog.catalog_diff.read_config_map')
+    def test_load_config_map(self, mock_read_config_map, *_):
+        """Test loading a live ConfigMap, in the default namespace or a given one."""
+        mock_read_config_map.return_value = ConfigMapContent(self.old_data, '5')
+        self.assertEqual(Snapshot(self.old_data, None, 'cray-product-catalog', 'services', '5'),
+                         load_catalog('configmap:cray-product-catalog'))
+        self.assertEqual('other', load_catalog('cm:other/cpc-backup').namespace)
+        mock_read_config_map.side_effect = ApiException(status=404, reason='Not Found')
+        with self.assertRaisesRegex(SnapshotError, 'Error reading services/cpc-backup ConfigMap: Not Found'):
+            load_catalog('cm:cpc-backup')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_export module
+
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from yaml import safe_dump
+
+from cray_product_catalog.catalog_export import (
+    SCHEMA_VERSION,
+    ExportError,
+    ExportResult,
+    export_catalog,
+    main,
+    open_database,
+    parse_source,
+)
+from cray_product_catalog.query import ProductCatalog
+from cray_product_catalog.util.snapshot import make_snapshot, write_snapshot
+from tests.mocks import COS_VERSIONS, MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS
+
+
+class TestCatalogExport(unittest.TestCase):
+    """Tests for the catalog_export script."""
+
+    def setUp(self):
+        """Create an empty database."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'catalogs.db')
+        self.conn = open_database(self.db_path)
+        self.catalog = ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA, resource_version='5')
+
+    def tearDown(self):
+        """Close the database and remove the temporary directory."""
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def query(self, sql, *params):
+        """Return all rows of a query."""
+        return self.conn.execute(sql, params).fetchall()
+
+    def test_export(self):
+        """Test that products, versions, and their components are exported."""
+        self.assertEqual(ExportResult(3, 0, 0), export_catalog(self.conn, 'system-a', self.catalog))
+        self.assertEqual([('system-a', 'cray-product-catalog', 'services', '5')],
+                         self.query('SELECT label, name, namespace, resource_version FROM catalogs'))
+        self.assertEqual(
+            [('cos', '2.0.0', 2, 0, 0), ('cos', '2.0.1', 2, 0, 1), ('other_product', '2.0.0', 2, 0, 0),
+             ('sat', '2.0.0', 2, 0, 0), ('sat', '2.0.1', 2, 0, 1)],
+            self.query('SELECT product, version, major, minor, patch FROM catalog_versions ORDER BY product, version')
+        )
+        self.assertEqual(
+            [('other_product', '2.0.0'), ('sat', '2.0.1')],
+            self.query('SELECT product, versions.version FROM components JOIN versions ON versions.id = version_id '
+                       "WHERE type = 'docker' AND name = 'cray/cray-sat' AND components.version = '1.0.1' "
+                       'ORDER BY product')
+        )
+        self.assertEqual(
+            [('sat-sle-15sp2', 'sat-2.0.0-sle-15sp2'), ('sat-sle-15sp2', 'sat-2.0.1-sle-15sp2')],
+            self.query("SELECT repository, member FROM repository_members JOIN versions ON versions.id = version_id "
+                       "WHERE product = 'sat' ORDER BY member")
+        )
+        self.assertEqual(
+            [('image', 'e2d58d7e-42b7-434d-b689-31ca3d053c51'), ('recipe', '54bc9447-73ba-4b06-a647-e5225451596d')],
+            self.query('SELECT type, ims_id FROM ims_resources ORDER BY type')
+        )
+        self.assertEqual(
+            [('https://vcs.machine.dev.cray.com/vcs/cray/sat-config-management.git', 'cray/sat/2.0.0')],
+            self.query("SELECT clone_url, import_branch FROM versions WHERE product = 'sat' AND version = '2.0.0'")
+        )
+        self.assertEqual(
+            [(4,)], self.query("SELECT COUNT(*) FROM repositories JOIN versions ON versions.id = version_id "
+                               "WHERE product = 'sat'")
+        )
+
+    def test_export_version_comparison(self):
+        """Test that versions which are not PEP 440 versions have no numeric parts."""
+        catalog = ProductCatalog.from_mapping({'sat': safe_dump({'2.4.0': {}, 'latest-build': {}})})
+        export_catalog(self.conn, 'system-a', catalog)
+        self.assertEqual([('latest-build', None, None, None), ('2.4.0', 2, 4, 0)],
+                         self.query('SELECT version, major, minor, patch FROM versions ORDER BY major'))
+
+    def test_export_again_unchanged(self):
+        """Test that exporting an unchanged catalog again leaves its rows alone."""
+        export_catalog(self.conn, 'system-a', self.catalog)
+        version_ids = self.query('SELECT id FROM versions ORDER BY id')
+        self.assertEqual(ExportResult(0, 3, 0), export_catalog(self.conn, 'system-a', self.catalog))
+        self.assertEqual(version_ids, self.query('SELECT id FROM versions ORDER BY id'))
+
+    def test_export_again_changed(self):
+        """Test that only changed products are rewritten and removed products are deleted."""
+        export_catalog(self.conn, 'system-a', self.catalog)
+        cos_ids = self.query("SELECT id FROM versions WHERE product = 'cos' ORDER BY id")
+        sat_versions = dict(SAT_VERSIONS, **{'2.1.0': {}})
+        catalog = ProductCatalog.from_mapping(
+            {'sat': safe_dump(sat_versions), 'cos': safe_dump(COS_VERSIONS)}, resource_version='6'
+        )
+        self.assertEqual(ExportResult(1, 1, 1), export_catalog(self.conn, 'system-a', catalog))
+        self.assertEqual(cos_ids, self.query("SELECT id FROM versions WHERE product = 'cos' ORDER BY id"))
+        self.assertEqual([('cos', 2), ('sat', 3)],
+                         self.query('SELECT product, COUNT(*) FROM versions GROUP BY product ORDER BY product'))
+        self.assertEqual([('6',)], self.query('SELECT resource_version FROM catalogs'))
+        # Components of removed products and versions are removed with them
+        self.assertEqual([], self.query('SELECT * FROM components WHERE version_id NOT IN (SELECT id FROM versions)'))
+        self.assertEqual(
+            [], self.query("SELECT * FROM components WHERE name = 'cray/cray-sat' AND version_id IN "
+                           "(SELECT id FROM versions WHERE product = 'other_product')")
+        )
+
+    def test_export_multiple_catalogs(self):
+        """Test that catalogs with different labels are kept apart."""
+        export_catalog(self.conn, 'system-a', self.catalog)
+        export_catalog(self.conn, 'system-b', ProductCatalog.from_mapping({'sat': safe_dump(SAT_VERSIONS)}))
+        self.assertEqual(
+            [('system-a', 5), ('system-b', 2)],
+            self.query('SELECT catalog, COUNT(*) FROM catalog_versions GROUP BY catalog ORDER BY catalog')
+        )
+
+    def test_export_archived(self):
+        """Test that archived versions are marked as archived."""
+        catalog = ProductCatalog.from_mapping({'sat': safe_dump({'2.0.1': SAT_VERSIONS['2.0.1']})},
+                                              archive_data={'sat': safe_dump({'2.0.0': SAT_VERSIONS['2.0.0']})})
+        export_catalog(self.conn, 'system-a', catalog)
+        self.assertEqual([('2.0.0', 1), ('2.0.1', 0)],
+                         self.query('SELECT version, archived FROM versions ORDER BY version'))
+
+    def test_open_database_other_schema(self):
+        """Test that a database with another schema version is not used."""
+        self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+        self.conn.commit()
+        with self.assertRaisesRegex(ExportError, 'has schema version'):
+            open_database(self.db_path)
+
+    def test_open_database_not_database(self):
+        """Test that a file which is not a database is an error."""
+        path = os.path.join(self.tmp_dir.name, 'not.db')
+        with open(path, 'w') as f:
+            f.write('this is not a database' * 10)
+        with self.assertRaisesRegex(ExportError, 'Unable to open database'):
+            open_database(path)
+
+    def test_parse_source(self):
+        """Test splitting a label from a source."""
+        self.assertEqual(('a', 'catalog.yaml'), parse_source('a=catalog.yaml'))
+        self.assertEqual(('catalog.yaml', 'catalog.yaml'), parse_source('catalog.yaml'))
+        self.assertEqual(('a', 'configmap:services/cpc'), parse_source('a=configmap:services/cpc'))
+        self.assertEqual(('configmap:services/cpc', 'configmap:services/cpc'), parse_source('configmap:services/cpc'))
+
+    def test_main(self):
+        """Test exporting catalogs from files."""
+        catalog_path = os.path.join(self.tmp_dir.name, 'catalog.json')
+        write_snapshot(catalog_path, make_snapshot(MOCK_PRODUCT_CATALOG_DATA, 'cray-product-catalog', 'services', '7'))
+        with patch('sys.stdout', new_callable=io.StringIO) as mock_stdout:
+            with self.assertRaises(SystemExit) as raises_cm:
+                main([self.db_path, f'system-a={catalog_path}'])
+        self.assertEqual(0, raises_cm.exception.code)
+        self.assertEqual('system-a: 3 product(s) written, 0 unchanged, 0 removed\n', mock_stdout.getvalue())
+        self.assertEqual([('system-a', '7')], self.query('SELECT label, resource_version FROM catalogs'))
+
+    def test_main_error(self):
+        """Test that a catalog which cannot be loaded is reported and others are still exported."""
+        catalog_path = os.path.join(self.tmp_dir.name, 'catalog.json')
+        write_snapshot(catalog_path, make_snapshot(MOCK_PRODUCT_CATALOG_DATA, 'cray-product-catalog', 'services', '7'))
+        missing_path = os.path.join(self.tmp_dir.name, 'missing.json')
+        with patch('sys.stdout', new_callable=io.StringIO), \
+                patch('sys.stderr', new_callable=io.StringIO) as mock_stderr:
+            with self.assertRaises(SystemExit) as raises_cm:
+                main([self.db_path, missing_path, catalog_path])
+        self.assertEqual(1, raises_cm.exception.code)
+        self.assertIn(f'catalog_export: {missing_path}: ', mock_stderr.getvalue())
+        self.assertEqual([(catalog_path,)], self.query('SELECT label FROM catalogs'))
+
+    def test_foreign_keys(self):
+        """Test that foreign keys are enforced."""
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute("INSERT INTO products (catalog_id, name, hash) VALUES (99, 'sat', 'x')")
+
+
+if __name__ == '__main__':
+    unittest.main()
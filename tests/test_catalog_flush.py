@@ -0,0 +1,143 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_flush module
+
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError
+from yaml import safe_dump, safe_load
+
+from cray_product_catalog.catalog_flush import flush_spool, main
+from cray_product_catalog.util.catalog_data import delete_request, update_request
+from cray_product_catalog.util.journal import FileJournal
+from cray_product_catalog.util.spool import FAILED_DIR, pending_requests, spool_request
+from tests.mocks import MockConfigMapApi
+
+NAME = 'cray-product-catalog'
+NAMESPACE = 'services'
+
+
+class TestFlushSpool(unittest.TestCase):
+    """Tests for flushing spooled requests."""
+
+    def setUp(self):
+        """Create a spool directory and a catalog ConfigMap."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spool_dir = os.path.join(self.tmp_dir.name, 'spool')
+        self.api = MockConfigMapApi()
+        self.api.add(NAMESPACE, NAME, {'cos': safe_dump({'2.0.0': {'active': True}})})
+
+    def tearDown(self):
+        """Remove the temporary directory and stop patches."""
+        patch.stopall()
+        self.tmp_dir.cleanup()
+
+    def spool(self, request, name=NAME):
+        return spool_request(self.spool_dir, name, NAMESPACE, request)
+
+    def catalog(self, product):
+        return safe_load(self.api.config_maps[(NAMESPACE, NAME)]['data'][product])
+
+    def test_flush(self):
+        """Test that spooled requests are applied in order in one patch and removed."""
+        self.spool(update_request('sat', '1.0.0', {'a': 1}, set_active=True))
+        self.spool(update_request('sat', '1.1.0', {'b': 2}, set_active=True))
+        self.spool(delete_request('cos', '2.0.0'))
+        self.assertEqual(0, flush_spool(self.api, self.spool_dir))
+        self.assertEqual(['read', 'patch'], self.api.requests)
+        self.assertEqual({'1.0.0': {'a': 1, 'active': False}, '1.1.0': {'b': 2, 'active': True}},
+                         self.catalog('sat'))
+        self.assertEqual({}, self.catalog('cos'))
+
+    def test_flush_again(self):
+        """Test that requests applied again, e.g. after a crash before they were removed, change nothing."""
+        request = update_request('sat', '1.0.0', {'a': 1}, set_active=True)
+        self.spool(request)
+        flush_spool(self.api, self.spool_dir)
+        self.spool(request)
+        self.api.requests.clear()
+        self.assertEqual(0, flush_spool(self.api, self.spool_dir))
+        self.assertEqual(['read'], self.api.requests)
+
+    def test_conflict(self):
+        """Test that the ConfigMap is read and patched again after a conflict."""
+        self.spool(update_request('sat', '1.0.0', {'a': 1}))
+        self.api.patch_namespaced_config_map = Mock(
+            side_effect=[ApiException(status=409, reason='Conflict'), None]
+        )
+        self.assertEqual(0, flush_spool(self.api, self.spool_dir))
+        self.assertEqual(2, self.api.patch_namespaced_config_map.call_count)
+
+    def test_not_found(self):
+        """Test that requests for a ConfigMap which does not exist stay spooled."""
+        self.spool(update_request('sat', '1.0.0', {'a': 1}), name='other')
+        self.spool(update_request('sat', '1.0.0', {'a': 1}))
+        self.assertEqual(1, flush_spool(self.api, self.spool_dir))
+        self.assertEqual({'1.0.0': {'a': 1}}, self.catalog('sat'))
+
+    def test_unavailable(self):
+        """Test that requests stay spooled if the API server cannot be reached."""
+        self.spool(update_request('sat', '1.0.0', {'a': 1}))
+        self.api.read_namespaced_config_map = Mock(side_effect=MaxRetryError(None, '/'))
+        self.assertEqual(1, flush_spool(self.api, self.spool_dir))
+
+    def test_failed_request(self):
+        """Test that a request which cannot be applied is moved aside and the others applied."""
+        self.spool(update_request('sat', '1.0.0', {'a': {'b': 1}}))
+        bad = self.spool(update_request('sat', '1.0.0', {'a': 2}))
+        self.assertEqual(0, flush_spool(self.api, self.spool_dir))
+        self.assertEqual({'1.0.0': {'a': {'b': 1}}}, self.catalog('sat'))
+        self.assertTrue(os.path.exists(os.path.join(self.spool_dir, FAILED_DIR, os.path.basename(bad))))
+
+    def test_journal(self):
+        """Test that each product changed is recorded in the journal."""
+        journal = FileJournal(os.path.join(self.tmp_dir.name, 'journal.jsonl'))
+        self.spool(update_request('sat', '1.0.0', {'a': 1}))
+        self.spool(update_request('sat', '1.1.0', {'b': 2}))
+        flush_spool(self.api, self.spool_dir, journal)
+        entries = journal.entries()
+        self.assertEqual(1, len(entries))
+        self.assertEqual(('sat', '1.0.0, 1.1.0', None), (entries[0]['product'], entries[0]['version'],
+                                                         entries[0]['before']))
+
+    def test_main(self):
+        """Test that main exits 1 if requests remain spooled."""
+        self.spool(update_request('sat', '1.0.0', {'a': 1}), name='other')
+        patch('cray_product_catalog.catalog_flush.configure_logging').start()
+        patch('cray_product_catalog.catalog_flush.load_k8s').start()
+        patch('cray_product_catalog.catalog_flush.get_api_client').start()
+        patch('cray_product_catalog.catalog_flush.client.CoreV1Api', return_value=self.api).start()
+        with patch.dict(os.environ, {'CATALOG_SPOOL_DIR': self.spool_dir}):
+            with self.assertRaises(SystemExit) as raises_cm:
+                main()
+        self.assertEqual(1, raises_cm.exception.code)
+        self.assertEqual(1, len(pending_requests(self.spool_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_restore module
+
+import os
+import tempfile
+import unittest
+
+from kubernetes.client.rest import ApiException
+
+from cray_product_catalog.catalog_restore import restore_catalog
+from cray_product_catalog.util.snapshot import Snapshot, SnapshotError, make_snapshot, write_snapshot
+from tests.mocks import MockConfigMapApi
+
+
+class TestRestoreCatalog(unittest.TestCase):
+    """Tests for restore_catalog()."""
+
+    def setUp(self):
+        """Set up a mock API holding the product catalog and backup ConfigMaps."""
+        self.api = MockConfigMapApi()
+        self.data = {'sat': '1.0.0: {}\n', 'cos': '2.0.0: {}\n'}
+        self.api.add('services', 'cray-product-catalog', {'sat': '1.0.0: {}\n', 'uan': '3.0.0: {}\n'})
+        self.api.add('services', 'cpc-backup', self.data, labels={'app': 'catalog'})
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'backup.json.gz')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_restore_config_map(self):
+        """Test restoring missing products from the backup ConfigMap, then deleting the backup."""
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(['read', 'read', 'patch', 'delete'], self.api.requests)
+        catalog = self.api.config_maps[('services', 'cray-product-catalog')]
+        self.assertEqual(dict(self.data, uan='3.0.0: {}\n'), catalog['data'])
+        self.assertEqual({'app': 'catalog'}, catalog['metadata']['labels'])
+        self.assertNotIn(('services', 'cpc-backup'), self.api.config_maps)
+
+    def test_restore_keeps_newer_products(self):
+        """Test that products written since the backup was made are kept."""
+        self.api.add('services', 'cray-product-catalog', {'sat': '1.0.0: {}\n2.0.0: {}\n', 'uan': '3.0.0: {}\n'})
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(
+            {'sat': '1.0.0: {}\n2.0.0: {}\n', 'uan': '3.0.0: {}\n', 'cos': '2.0.0: {}\n'},
+            self.api.config_maps[('services', 'cray-product-catalog')]['data']
+        )
+
+    def test_restore_nothing_missing(self):
+        """Test that a catalog which has every product in the backup is not written."""
+        self.api.add('services', 'cray-product-catalog', dict(self.data, uan='3.0.0: {}\n'), labels={'app': 'catalog'})
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(['read', 'read', 'delete'], self.api.requests)
+
+    def test_restore_conflict(self):
+        """Test that the catalog is read again if it changes before it is patched."""
+        patch_config_map = self.api.patch_namespaced_config_map
+        calls = []
+
+        def change_then_patch(name, namespace, body, **kwargs):
+            if not calls:
+                self.api.config_maps[('services', name)]['metadata']['resourceVersion'] = '2'
+            calls.append(body)
+            return patch_config_map(name, namespace, body, **kwargs)
+
+        self.api.patch_namespaced_config_map = change_then_patch
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(3, self.api.requests.count('read'))
+        self.assertEqual(2, len(calls))
+        self.assertIn('cos', self.api.config_maps[('services', 'cray-product-catalog')]['data'])
+
+    def test_restore_missing_catalog(self):
+        """Test that the catalog is created from the backup if it does not exist."""
+        del self.api.config_maps[('services', 'cray-product-catalog')]
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertEqual(['read', 'read', 'create', 'delete'], self.api.requests)
+        self.assertEqual(self.data, self.api.config_maps[('services', 'cray-product-catalog')]['data'])
+
+    def test_restore_keep_backup(self):
+        """Test that the backup ConfigMap can be kept."""
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup', keep_backup=True)
+        self.assertIn(('services', 'cpc-backup'), self.api.config_maps)
+
+    def test_restore_missing_backup(self):
+        """Test that a missing backup ConfigMap is an error and the catalog is unchanged."""
+        with self.assertRaises(ApiException):
+            restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='missing')
+        self.assertEqual(['read'], self.api.requests)
+
+    def test_restore_verify_failed(self):
+        """Test that a catalog which was not restored correctly is an error and the backup is kept."""
+        self.api.corrupt = True
+        with self.assertRaisesRegex(SnapshotError, 'cray-product-catalog was not restored correctly'):
+            restore_catalog(self.api, 'cray-product-catalog', 'services', backup_name='cpc-backup')
+        self.assertIn(('services', 'cpc-backup'), self.api.config_maps)
+
+    def test_restore_file(self):
+        """Test restoring from a snapshot file."""
+        write_snapshot(self.path, make_snapshot(self.data))
+        restore_catalog(self.api, 'cray-product-catalog', 'services', backup_file=self.path)
+        self.assertEqual(['read', 'patch'], self.api.requests)
+        self.assertEqual(dict(self.data, uan='3.0.0: {}\n'),
+                         self.api.config_maps[('services', 'cray-product-catalog')]['data'])
+
+    def test_restore_file_bad_hashes(self):
+        """Test that a snapshot file whose data does not match its hashes is not restored."""
+        write_snapshot(self.path, Snapshot(self.data, make_snapshot({'sat': 'other'}).hashes))
+        with self.assertRaisesRegex(SnapshotError, 'Data does not match hashes'):
+            restore_catalog(self.api, 'cray-product-catalog', 'services', backup_file=self.path)
+        self.assertEqual([], self.api.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_rewind module
+
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from yaml import safe_dump
+
+from cray_product_catalog.catalog_rewind import apply_rewind, load_journal, main
+from cray_product_catalog.util.journal import ConfigMapJournal, FileJournal, JournalError
+from cray_product_catalog.util.snapshot import Snapshot, make_snapshot, read_snapshot, write_snapshot
+from tests.mocks import MockConfigMapApi
+
+
+class TestCatalogRewind(unittest.TestCase):
+    """Tests for the catalog_rewind script."""
+
+    def setUp(self):
+        """Write a catalog snapshot and a journal of the changes which made it."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.old_data = {'sat': safe_dump({'1.0.0': {'active': True}}, default_flow_style=False)}
+        self.new_data = {
+            'sat': safe_dump({'1.0.0': {'active': False}, '1.1.0': {'active': True}}, default_flow_style=False),
+            'cos': safe_dump({'2.0.0': {}}, default_flow_style=False),
+        }
+        self.catalog_path = os.path.join(self.tmp_dir.name, 'catalog.json')
+        self.journal_path = os.path.join(self.tmp_dir.name, 'journal.jsonl')
+        self.output_path = os.path.join(self.tmp_dir.name, 'rewound.json')
+        write_snapshot(self.catalog_path, make_snapshot(self.new_data, 'cray-product-catalog', 'services', '12'))
+        journal = FileJournal(self.journal_path)
+        journal.record('services', 'cray-product-catalog', 'sat', '1.1.0', {'1.0.0': {'active': True}},
+                       {'1.0.0': {'active': False}, '1.1.0': {'active': True}}, '11', '10')
+        journal.record('services', 'cray-product-catalog', 'cos', '2.0.0', None, {'2.0.0': {}}, '12', '11')
+        self.mock_stdout = patch('sys.stdout', new_callable=io.StringIO).start()
+        self.mock_stderr = patch('sys.stderr', new_callable=io.StringIO).start()
+
+    def tearDown(self):
+        """Remove the temporary directory and stop patches."""
+        patch.stopall()
+        self.tmp_dir.cleanup()
+
+    def test_main_output(self):
+        """Test that the differences are written and the rewound catalog saved."""
+        main(['--resource-version', '10', '--catalog', self.catalog_path, '--journal', self.journal_path,
+              '--output', self.output_path])
+        self.assertEqual('- cos\n- cos 2.0.0\n~ sat 1.0.0 active: false -> true\n- sat 1.1.0\n',
+                         self.mock_stdout.getvalue())
+        snapshot = read_snapshot(self.output_path)
+        self.assertEqual(self.old_data, snapshot.data)
+        self.assertEqual('cray-product-catalog', snapshot.name)
+
+    def test_main_partial(self):
+        """Test rewinding only the newest change."""
+        main(['--resource-version', '11', '--catalog', self.catalog_path, '--journal', self.journal_path])
+        self.assertEqual('- cos\n- cos 2.0.0\n', self.mock_stdout.getvalue())
+
+    def test_main_error(self):
+        """Test that a catalog changed outside the journal is reported."""
+        self.new_data['cos'] = safe_dump({'3.0.0': {}})
+        write_snapshot(self.catalog_path, make_snapshot(self.new_data, 'cray-product-catalog', 'services'))
+        with self.assertRaises(SystemExit) as raises_cm:
+            main(['--time', '2000-01-01', '--catalog', self.catalog_path, '--journal', self.journal_path])
+        self.assertEqual(1, raises_cm.exception.code)
+        self.assertIn('catalog_rewind: Product cos does not match', self.mock_stderr.getvalue())
+
+    def test_apply_requires_config_map(self):
+        """Test that --apply is rejected for a catalog file."""
+        with self.assertRaises(SystemExit) as raises_cm:
+            main(['--time', '2000-01-01', '--catalog', self.catalog_path, '--apply'])
+        self.assertEqual(2, raises_cm.exception.code)
+
+    def test_load_journal_config_map(self):
+        """Test loading a journal from a ConfigMap, in the services namespace by default."""
+        api = MockConfigMapApi()
+        ConfigMapJournal('cpc-journal', 'services', api).append({'product': 'sat'})
+        with patch('cray_product_catalog.catalog_rewind._api', return_value=api):
+            self.assertEqual([{'product': 'sat', 'seq': 1}], load_journal('configmap:cpc-journal'))
+
+    def test_apply_rewind(self):
+        """Test that only the products which differ are patched."""
+        api = MockConfigMapApi()
+        api.add('services', 'cray-product-catalog', dict(self.new_data), resource_version='12')
+        catalog = Snapshot(dict(self.new_data), None, 'cray-product-catalog', 'services', '12')
+        self.assertEqual(2, apply_rewind(api, catalog, self.old_data))
+        self.assertEqual(self.old_data, api.config_maps[('services', 'cray-product-catalog')]['data'])
+        self.assertEqual(0, apply_rewind(api, Snapshot(self.old_data, None, 'cray-product-catalog', 'services', '13'),
+                                         self.old_data))
+
+    def test_apply_rewind_conflict(self):
+        """Test that the catalog is not patched if it has changed since it was read."""
+        api = MockConfigMapApi()
+        api.add('services', 'cray-product-catalog', dict(self.new_data), resource_version='13')
+        catalog = Snapshot(dict(self.new_data), None, 'cray-product-catalog', 'services', '12')
+        with self.assertRaisesRegex(JournalError, 'changed while it was being rewound'):
+            apply_rewind(api, catalog, self.old_data)
+        self.assertEqual(self.new_data, api.config_maps[('services', 'cray-product-catalog')]['data'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,347 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.catalog_server module
+
+import copy
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+from kubernetes.client.rest import ApiException
+from yaml import safe_dump
+
+from cray_product_catalog.catalog_server import CatalogIndex, CatalogQueryService, make_server
+from cray_product_catalog.query import ProductCatalog
+from cray_product_catalog.util import metrics
+from tests.mocks import MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS, MockConfigMapResponse
+
+
+class CatalogServerTestCase(unittest.TestCase):
+    """Base class for tests with a ProductCatalog read from a mock Kubernetes API."""
+
+    def setUp(self):
+        """Set up a mock Kubernetes API holding the product catalog ConfigMap."""
+        self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
+        self.data = copy.deepcopy(MOCK_PRODUCT_CATALOG_DATA)
+        sat_versions = copy.deepcopy(SAT_VERSIONS)
+        sat_versions['2.0.0']['active'] = True
+        self.data['sat'] = safe_dump(sat_versions)
+        self.resource_version = '1'
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = lambda *args, **kwargs: MockConfigMapResponse(
+            self.data, self.resource_version
+        )
+        self.mock_k8s_api.api_client.call_api.side_effect = lambda *args, **kwargs: MockConfigMapResponse(
+            None, self.resource_version
+        )
+        self.catalog = ProductCatalog('mock-name', 'mock-namespace')
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+
+class TestCatalogIndex(CatalogServerTestCase):
+    """Tests for the CatalogIndex class."""
+
+    def setUp(self):
+        """Build an index of the mock catalog."""
+        super().setUp()
+        self.index = CatalogIndex(self.catalog)
+
+    def get(self, path):
+        """Get the status and decoded body of a query."""
+        response = self.index.get(path)
+        return response.status, json.loads(response.body)
+
+    def test_etag(self):
+        """Test that the ETag is derived from the resourceVersion."""
+        self.assertEqual('"1"', self.index.etag)
+
+    def test_products(self):
+        """Test listing the versions of each product."""
+        self.assertEqual(
+            (200, {'sat': ['2.0.0', '2.0.1'], 'cos': ['2.0.0', '2.0.1'], 'other_product': ['2.0.0']}),
+            self.get('/v1/products')
+        )
+
+    def test_product(self):
+        """Test getting all versions of one product."""
+        status, body = self.get('/v1/products/cos')
+        self.assertEqual(200, status)
+        self.assertEqual([('cos', '2.0.0'), ('cos', '2.0.1')], [(p['name'], p['version']) for p in body])
+
+    def test_product_version(self):
+        """Test getting one version, and the latest version, of a product."""
+        status, body = self.get('/v1/products/sat/2.0.0')
+        self.assertEqual((200, '2.0.0', True), (status, body['version'], body['active']))
+        self.assertEqual(SAT_VERSIONS['2.0.0']['component_versions'], body['data']['component_versions'])
+        status, body = self.get('/v1/products/sat/latest')
+        self.assertEqual((200, '2.0.1', False), (status, body['version'], body['active']))
+
+    def test_product_version_interned(self):
+        """Test that the data of a catalog loaded with intern_data is encoded as JSON."""
+        self.index = CatalogIndex(ProductCatalog('mock-name', 'mock-namespace', intern_data=True))
+        status, body = self.get('/v1/products/sat/2.0.0')
+        self.assertEqual(200, status)
+        self.assertEqual(SAT_VERSIONS['2.0.0']['component_versions'], body['data']['component_versions'])
+
+    def test_not_found(self):
+        """Test queries for products, versions, and paths that do not exist."""
+        self.assertEqual(
+            (404, {'error': 'No installed products with name foo.'}), self.get('/v1/products/foo/latest')
+        )
+        self.assertEqual(
+            (404, {'error': 'No installed products with name sat and version 9.9.9.'}),
+            self.get('/v1/products/sat/9.9.9')
+        )
+        self.assertEqual(404, self.get('/v2/products')[0])
+
+    def test_active(self):
+        """Test getting the active version of each product."""
+        self.assertEqual((200, {'sat': '2.0.0'}), self.get('/v1/active'))
+
+    def test_images(self):
+        """Test finding the product versions which include a Docker image."""
+        status, body = self.get('/v1/images/cray/cray-sat')
+        self.assertEqual(200, status)
+        self.assertEqual(
+            [('sat', '2.0.0', '1.0.0'), ('sat', '2.0.1', '1.0.1'), ('other_product', '2.0.0', '1.0.1')],
+            [(p['name'], p['version'], p['image_version']) for p in body]
+        )
+        self.assertEqual((200, []), self.get('/v1/images/cray/unknown'))
+
+    def test_repositories(self):
+        """Test finding the product versions which include a repository."""
+        status, body = self.get('/v1/repositories/sat-sle-15sp2')
+        self.assertEqual(200, status)
+        self.assertEqual(
+            [('sat', '2.0.0'), ('sat', '2.0.1'), ('other_product', '2.0.0')],
+            [(p['name'], p['version']) for p in body]
+        )
+
+    def test_responses_reused(self):
+        """Test that a response is computed once per index."""
+        self.assertIs(self.index.get('/v1/products/sat'), self.index.get('/v1/products/sat'))
+        self.assertIs(self.index.get('/v1/products/sat'), self.index.get('/v1/products/%73at/'))
+
+    def test_empty_responses_not_cached(self):
+        """Test that lookups which find nothing do not grow the response cache."""
+        for index in range(10):
+            self.assertEqual((200, []), self.get(f'/v1/images/cray/unknown-{index}'))
+            self.assertEqual((200, []), self.get(f'/v1/repositories/unknown-{index}'))
+            self.assertEqual(404, self.get(f'/v1/products/unknown-{index}')[0])
+        self.assertEqual({}, self.index._responses)
+
+
+class TestCatalogQueryService(CatalogServerTestCase):
+    """Tests for the CatalogQueryService class."""
+
+    def setUp(self):
+        """Create the service."""
+        super().setUp()
+        self.service = CatalogQueryService(self.catalog, refresh_interval=0)
+
+    def test_refresh_unchanged(self):
+        """Test that the index is kept when the catalog has not changed."""
+        index = self.service.index
+        self.assertFalse(self.service.refresh())
+        self.assertIs(index, self.service.index)
+
+    def test_refresh_changed(self):
+        """Test that a new index is published when the catalog has changed."""
+        index = self.service.index
+        self.resource_version = '2'
+        del self.data['cos']
+        self.assertTrue(self.service.refresh())
+        self.assertEqual('"2"', self.service.index.etag)
+        self.assertEqual(404, self.service.index.get('/v1/products/cos').status)
+        self.assertEqual(200, index.get('/v1/products/cos').status)
+
+    def test_refresh_error(self):
+        """Test that the index is kept when the catalog cannot be read."""
+        index = self.service.index
+        self.resource_version = '2'
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = ApiException(status=500, reason='Error')
+        with self.assertLogs(level='WARNING'):
+            self.assertFalse(self.service.refresh())
+        self.assertIs(index, self.service.index)
+
+    @staticmethod
+    def event(event_type, data, resource_version):
+        """Create a watch event for a ConfigMap."""
+        return {'type': event_type, 'raw_object': {'metadata': {'resourceVersion': resource_version}, 'data': data}}
+
+    @patch('cray_product_catalog.catalog_server.watch.Watch')
+    def test_run_loads_events(self, mock_watch):
+        """Test that the catalog is loaded from each watch event without reading the ConfigMap."""
+        data = {name: value for name, value in self.data.items() if name != 'cos'}
+
+        def stream(*args, **kwargs):
+            yield self.event('BOOKMARK', None, '2')
+            yield self.event('MODIFIED', data, '3')
+            self.service.stop()
+            yield self.event('MODIFIED', self.data, '4')
+
+        reads = self.mock_k8s_api.read_namespaced_config_map.call_count
+        mock_watch.return_value.stream.side_effect = stream
+        self.service.run()
+        self.assertEqual('"3"', self.service.index.etag)
+        self.assertEqual(404, self.service.index.get('/v1/products/cos').status)
+        self.assertEqual(reads, self.mock_k8s_api.read_namespaced_config_map.call_count)
+        self.mock_k8s_api.api_client.call_api.assert_not_called()
+        _, kwargs = mock_watch.return_value.stream.call_args
+        self.assertEqual('metadata.name=mock-name', kwargs['field_selector'])
+        self.assertEqual('1', kwargs['resource_version'])
+
+    @patch('cray_product_catalog.catalog_server.watch.Watch')
+    def test_run_continues_from_last_event(self, mock_watch):
+        """Test that the next watch starts from the resourceVersion of the last event."""
+        def stream(*args, **kwargs):
+            if kwargs['resource_version'] == '1':
+                yield self.event('BOOKMARK', None, '5')
+            else:
+                self.service.stop()
+
+        mock_watch.return_value.stream.side_effect = stream
+        self.service.run()
+        self.assertEqual(['1', '5'], [kwargs['resource_version']
+                                      for _, kwargs in mock_watch.return_value.stream.call_args_list])
+
+    @patch('cray_product_catalog.catalog_server.watch.Watch')
+    def test_run_watch_expired(self, mock_watch):
+        """Test that the catalog is loaded again at once when the resourceVersion is too old to watch."""
+        def stream(*args, **kwargs):
+            if kwargs['resource_version'] == '1':
+                self.resource_version = '2'
+                raise ApiException(status=410, reason='Gone')
+            self.service.stop()
+            yield from ()
+
+        mock_watch.return_value.stream.side_effect = stream
+        with patch.object(self.service._stopped, 'wait') as mock_wait:
+            self.service.run()
+        mock_wait.assert_not_called()
+        self.assertEqual('"2"', self.service.index.etag)
+        self.assertEqual('2', mock_watch.return_value.stream.call_args[1]['resource_version'])
+
+    @patch('cray_product_catalog.catalog_server.watch.Watch')
+    def test_run_watches_archive(self, mock_watch):
+        """Test that changes to the archive ConfigMap are loaded when archived versions are included."""
+        catalog = ProductCatalog('mock-name', 'mock-namespace', include_archived=True, archive_name='mock-archive')
+        self.service = CatalogQueryService(catalog, refresh_interval=0)
+        archive_data = {'sat': safe_dump({'1.0.0': SAT_VERSIONS['2.0.1']})}
+        archive_loaded = threading.Event()
+
+        def stream(*args, **kwargs):
+            if kwargs['field_selector'] == 'metadata.name=mock-archive' and not archive_loaded.is_set():
+                yield self.event('MODIFIED', archive_data, '7')
+                archive_loaded.set()
+            elif kwargs['field_selector'] == 'metadata.name=mock-name':
+                archive_loaded.wait(5)
+                self.service.stop()
+            else:
+                self.service._stopped.wait(5)
+
+        mock_watch.return_value.stream.side_effect = stream
+        self.service.run()
+        self.assertTrue(archive_loaded.is_set())
+        self.assertEqual('7', catalog.archive_resource_version)
+        self.assertEqual(200, self.service.index.get('/v1/products/sat/1.0.0').status)
+
+    @patch('cray_product_catalog.catalog_server.watch.Watch')
+    def test_run_watch_error(self, mock_watch):
+        """Test that the catalog is refreshed periodically when it cannot be watched."""
+        def stream(*args, **kwargs):
+            self.resource_version = '2'
+            self.service.stop()
+            raise ApiException(status=403, reason='Forbidden')
+
+        mock_watch.return_value.stream.side_effect = stream
+        self.service.run()
+        self.assertEqual('"2"', self.service.index.etag)
+
+
+class TestCatalogQueryServer(CatalogServerTestCase):
+    """Tests for querying the service over HTTP."""
+
+    def setUp(self):
+        """Start a query server for the mock catalog."""
+        super().setUp()
+        self.service = CatalogQueryService(self.catalog)
+        self.server = make_server(self.service, '127.0.0.1', 0)
+        self.url = 'http://{}:{}'.format(*self.server.server_address[:2])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def get(self, path, etag=None):
+        """Query the server and return the response or HTTPError."""
+        request = urllib.request.Request(self.url + path, headers={'If-None-Match': etag} if etag else {})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, response.headers.get('ETag'), json.loads(response.read())
+        except urllib.error.HTTPError as err:
+            return err.code, err.headers.get('ETag'), err.read()
+
+    def test_query(self):
+        """Test a query, which carries an ETag."""
+        status, etag, body = self.get('/v1/products/cos/latest')
+        self.assertEqual((200, '"1"', '2.0.1'), (status, etag, body['version']))
+
+    def test_not_modified(self):
+        """Test that a request with a matching If-None-Match gets 304 Not Modified."""
+        self.assertEqual((304, '"1"', b''), self.get('/v1/products', etag='"0", "1"'))
+        self.resource_version = '2'
+        self.service.refresh()
+        status, etag, _ = self.get('/v1/products', etag='"1"')
+        self.assertEqual((200, '"2"'), (status, etag))
+
+    def test_not_found(self):
+        """Test that a query for an unknown product is not found, even with If-None-Match."""
+        status, etag, body = self.get('/v1/products/foo', etag='"1"')
+        self.assertEqual((404, None), (status, etag))
+        self.assertEqual({'error': 'No installed products with name foo.'}, json.loads(body))
+
+    def test_healthz(self):
+        """Test the health check."""
+        self.assertEqual((200, None, {'status': 'ok'}), self.get('/healthz'))
+
+    def test_metrics(self):
+        """Test that metrics are served in the Prometheus text format."""
+        with urllib.request.urlopen(self.url + '/metrics', timeout=5) as response:
+            self.assertEqual(metrics.PROMETHEUS_CONTENT_TYPE, response.headers.get('Content-Type'))
+            body = response.read().decode()
+        self.assertIn('# TYPE catalog_yaml_duration_seconds histogram\n', body)
+        self.assertIn('catalog_yaml_duration_seconds_count{action="parse"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
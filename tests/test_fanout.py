@@ -0,0 +1,174 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.fanout module
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from cray_product_catalog.fanout import (
+    Target,
+    TargetResult,
+    delete_all,
+    fan_out,
+    make_targets,
+    query_all,
+    report,
+    targets_from_env,
+    update_all,
+)
+from cray_product_catalog.query import ProductCatalogError
+from cray_product_catalog.util.deadline import DEADLINE_EXCEEDED_EXIT_CODE, DeadlineExceeded
+
+
+class TestTargets(unittest.TestCase):
+    """Tests for making lists of targets."""
+
+    def test_make_targets(self):
+        """Test that every combination of context and namespace is a target."""
+        self.assertEqual(
+            [Target('a', 'ns1'), Target('a', 'ns2'), Target('b', 'ns1'), Target('b', 'ns2')],
+            make_targets(['a', 'b'], ['ns1', 'ns2'])
+        )
+
+    def test_make_targets_default_context(self):
+        """Test that the default configuration is used when no contexts are given."""
+        self.assertEqual([Target(None, 'ns1')], make_targets([], ['ns1']))
+
+    def test_targets_from_env(self):
+        """Test reading targets from the environment."""
+        with patch.dict('os.environ', {'KUBE_CONTEXTS': 'a, b', 'CONFIG_MAP_NAMESPACES': ''}):
+            self.assertEqual([Target('a', 'services'), Target('b', 'services')], targets_from_env('services'))
+        with patch.dict('os.environ', {'KUBE_CONTEXTS': '', 'CONFIG_MAP_NAMESPACES': 'ns1,ns2'}):
+            self.assertEqual([Target(None, 'ns1'), Target(None, 'ns2')], targets_from_env('services'))
+
+    def test_targets_from_env_unset(self):
+        """Test that no targets are returned when fan-out is not requested."""
+        with patch.dict('os.environ', {'KUBE_CONTEXTS': '', 'CONFIG_MAP_NAMESPACES': ''}):
+            self.assertEqual([], targets_from_env('services'))
+
+
+class TestFanOut(unittest.TestCase):
+    """Tests for fan_out()."""
+
+    def test_concurrent(self):
+        """Test that targets are operated on concurrently, so the total time tracks the slowest."""
+        targets = make_targets([], [f'ns{index}' for index in range(8)])
+        barrier = threading.Barrier(len(targets), timeout=5)
+
+        def operation(target):
+            barrier.wait()  # Only returns once every target is running at once
+            return target.namespace
+
+        start = time.monotonic()
+        results = fan_out(operation, targets, max_workers=8)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([target.namespace for target in targets], [result.result for result in results])
+        self.assertTrue(all(result.error is None for result in results))
+
+    def test_bounded_workers(self):
+        """Test that no more than max_workers targets are operated on at once."""
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def operation(target):
+            with lock:
+                running.append(target)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(target)
+
+        fan_out(operation, make_targets([], [f'ns{index}' for index in range(10)]), max_workers=3)
+        self.assertLessEqual(max(peak), 3)
+
+    def test_errors_per_target(self):
+        """Test that an error for one target does not affect the others."""
+        error = ProductCatalogError('Oops')
+
+        def operation(target):
+            if target.namespace == 'bad':
+                raise error
+            return 'ok'
+
+        results = fan_out(operation, make_targets([], ['good', 'bad']))
+        self.assertEqual(('ok', None), (results[0].result, results[0].error))
+        self.assertEqual((None, error), (results[1].result, results[1].error))
+
+    def test_no_targets(self):
+        """Test fanning out to no targets."""
+        self.assertEqual([], fan_out(lambda target: None, []))
+
+
+class TestOperations(unittest.TestCase):
+    """Tests for the query_all, update_all, and delete_all functions."""
+
+    def setUp(self):
+        """Set up targets."""
+        self.targets = [Target('a', 'ns1'), Target(None, 'ns2')]
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_query_all(self):
+        """Test that each target's ProductCatalog is loaded from its context and namespace."""
+        mock_catalog = patch('cray_product_catalog.fanout.ProductCatalog').start()
+        catalog = mock_catalog.return_value
+        results = query_all(self.targets, name='cm', include_archived=True)
+        mock_catalog.assert_any_call('cm', 'ns1', context='a', include_archived=True)
+        mock_catalog.assert_any_call('cm', 'ns2', context=None, include_archived=True)
+        self.assertEqual([catalog, catalog], [result.result for result in results])
+
+    def test_update_all(self):
+        """Test that each target's config map is updated."""
+        mock_update = patch('cray_product_catalog.fanout.update_config_map').start()
+        update_all(self.targets, {'foo': 'bar'}, 'cm', 'sat', '2.0.0', set_active=True)
+        mock_update.assert_any_call({'foo': 'bar'}, 'cm', 'ns1', product='sat', product_version='2.0.0',
+                                    context='a', set_active=True)
+        mock_update.assert_any_call({'foo': 'bar'}, 'cm', 'ns2', product='sat', product_version='2.0.0',
+                                    context=None, set_active=True)
+
+    def test_delete_all(self):
+        """Test that the product version is removed from each target's config map."""
+        mock_modify = patch('cray_product_catalog.fanout.modify_config_map').start()
+        delete_all(self.targets, 'cm', 'sat', '2.0.0', 'key')
+        mock_modify.assert_any_call('cm', 'ns1', 'sat', '2.0.0', 'key', context='a')
+        mock_modify.assert_any_call('cm', 'ns2', 'sat', '2.0.0', 'key', context=None)
+
+
+class TestReport(unittest.TestCase):
+    """Tests for report()."""
+
+    def test_report(self):
+        """Test the exit status for combinations of outcomes."""
+        ok = TargetResult(Target(None, 'ns'), None, None, 1.0)
+        failed = TargetResult(Target(None, 'ns'), None, ValueError('bad'), 1.0)
+        timed_out = TargetResult(Target(None, 'ns'), None, DeadlineExceeded('late'), 1.0)
+        with self.assertLogs(level='INFO'):
+            self.assertEqual(0, report([ok, ok]))
+            self.assertEqual(1, report([ok, failed, timed_out]))
+            self.assertEqual(DEADLINE_EXCEEDED_EXIT_CODE, report([ok, timed_out]))
@@ -1,6 +1,6 @@
 # MIT License
 #
-# (C) Copyright 2021-2022 Hewlett Packard Enterprise Development LP
+# (C) Copyright 2021-2023 Hewlett Packard Enterprise Development LP
 #
 # Permission is hereby granted, free of charge, to any person obtaining a
 # copy of this software and associated documentation files (the "Software"),
@@ -23,10 +23,20 @@
 # Unit tests for cray_product_catalog.query module
 
 import copy
+import io
+import json
 import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import Mock, patch
 
+from kubernetes.client.rest import ApiException
 from kubernetes.config import ConfigException
 from yaml import safe_dump
 
@@ -35,7 +45,16 @@ from cray_product_catalog.query import (
     InstalledProductVersion,
     ProductCatalogError
 )
-from tests.mocks import COS_VERSIONS, MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS
+from cray_product_catalog.util.diff import (
+    ACTIVE_CHANGED,
+    PRODUCT_ADDED,
+    PRODUCT_REMOVED,
+    VERSION_ADDED,
+    VERSION_REMOVED,
+    CatalogChange,
+)
+from cray_product_catalog.util.snapshot import make_snapshot, write_snapshot
+from tests.mocks import COS_VERSIONS, MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS, MockConfigMapResponse
 
 
 class TestGetK8sAPI(unittest.TestCase):
@@ -43,8 +62,9 @@ class TestGetK8sAPI(unittest.TestCase):
 
     def setUp(self):
         """Set up mocks."""
-        self.mock_load_k8s = patch('cray_product_catalog.query.load_k8s').start()
-        self.mock_corev1api = patch('cray_product_catalog.query.CoreV1Api').start()
+        self.mock_load_k8s = patch('cray_product_catalog.util.k8s.load_k8s').start()
+        self.mock_corev1api = patch('kubernetes.client.CoreV1Api').start()
+        self.mock_get_api_client = patch('cray_product_catalog.util.k8s.get_api_client').start()
 
     def tearDown(self):
         """Stop patches."""
@@ -54,7 +74,7 @@ class TestGetK8sAPI(unittest.TestCase):
         """Test the successful case of get_k8s_api."""
         api = ProductCatalog._get_k8s_api()
         self.mock_load_k8s.assert_called_once_with()
-        self.mock_corev1api.assert_called_once_with()
+        self.mock_corev1api.assert_called_once_with(self.mock_get_api_client.return_value)
         self.assertEqual(api, self.mock_corev1api.return_value)
 
     def test_get_k8s_api_config_exception(self):
@@ -73,7 +93,9 @@ class TestProductCatalog(unittest.TestCase):
         """Set up mocks."""
         self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
         self.mock_product_catalog_data = copy.deepcopy(MOCK_PRODUCT_CATALOG_DATA)
-        self.mock_k8s_api.read_namespaced_config_map.return_value = Mock(data=self.mock_product_catalog_data)
+        self.mock_k8s_api.read_namespaced_config_map.return_value = MockConfigMapResponse(
+            self.mock_product_catalog_data
+        )
 
     def tearDown(self):
         """Stop patches."""
@@ -82,7 +104,9 @@ class TestProductCatalog(unittest.TestCase):
     def create_and_assert_product_catalog(self):
         """Assert the product catalog was created as expected."""
         product_catalog = ProductCatalog('mock-name', 'mock-namespace')
-        self.mock_k8s_api.read_namespaced_config_map.assert_called_once_with('mock-name', 'mock-namespace')
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once_with(
+            'mock-name', 'mock-namespace', _preload_content=False
+        )
         return product_catalog
 
     def test_create_product_catalog(self):
@@ -96,6 +120,13 @@ class TestProductCatalog(unittest.TestCase):
         ]
         self.assertEqual(expected_names_and_versions, actual_names_and_versions)
 
+    def test_create_product_catalog_intern_data(self):
+        """Test that product versions loaded with intern_data are still valid against the schema."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace', intern_data=True)
+        self.assertEqual(5, len(product_catalog.products))
+        for product in product_catalog.products:
+            self.assertTrue(product.is_valid, str(product))
+
     def test_create_product_catalog_invalid_product_data(self):
         """Test creating a ProductCatalog when the product catalog contains invalid YAML."""
         self.mock_product_catalog_data['sat'] = '\t'
@@ -104,14 +135,14 @@ class TestProductCatalog(unittest.TestCase):
 
     def test_create_product_catalog_null_data(self):
         """Test creating a ProductCatalog when the product catalog contains null data."""
-        self.mock_k8s_api.read_namespaced_config_map.return_value = Mock(data=None)
+        self.mock_k8s_api.read_namespaced_config_map.return_value = MockConfigMapResponse(None)
         with self.assertRaisesRegex(ProductCatalogError,
                                     'No data found in mock-namespace/mock-name ConfigMap.'):
             self.create_and_assert_product_catalog()
 
     def test_create_product_catalog_invalid_product_schema(self):
         """Test creating a ProductCatalog when an entry contains valid YAML but does not match schema."""
-        self.mock_k8s_api.read_namespaced_config_map.return_value = Mock(data={
+        self.mock_k8s_api.read_namespaced_config_map.return_value = MockConfigMapResponse({
             'sat': safe_dump({'2.1': {'component_versions': {'docker': 'should be an array'}}})
         })
         with self.assertLogs(level=logging.DEBUG) as logs_cm:
@@ -145,6 +176,536 @@ class TestProductCatalog(unittest.TestCase):
         self.assertEqual(expected_component_data, actual_matching_product.data)
 
 
+class TestProductCatalogArchive(unittest.TestCase):
+    """Tests for ProductCatalog with include_archived set."""
+
+    def setUp(self):
+        """Set up mocks."""
+        self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
+        self.config_maps = {
+            'mock-name': MockConfigMapResponse({'sat': safe_dump({'2.0.1': SAT_VERSIONS['2.0.1']})}),
+            'mock-archive': MockConfigMapResponse({'sat': safe_dump(SAT_VERSIONS)}),
+        }
+
+        def read(name, namespace, **kwargs):
+            if name not in self.config_maps:
+                raise ApiException(status=404, reason='Not Found')
+            return self.config_maps[name]
+
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = read
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_archive_not_read_by_default(self):
+        """Test that the archive config map is only read when include_archived is set."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace', archive_name='mock-archive')
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once_with(
+            'mock-name', 'mock-namespace', _preload_content=False
+        )
+        self.assertEqual([('sat', '2.0.1')], [(p.name, p.version) for p in product_catalog.products])
+
+    def test_include_archived(self):
+        """Test that archived versions are included and flagged, without duplicating catalog versions."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace', include_archived=True,
+                                         archive_name='mock-archive')
+        self.assertEqual(
+            [('sat', '2.0.1', False), ('sat', '2.0.0', True)],
+            [(p.name, p.version, p.archived) for p in product_catalog.products]
+        )
+        self.assertEqual('2.0.0', product_catalog.get_product('sat', '2.0.0').version)
+
+    def test_include_archived_missing_archive(self):
+        """Test that a missing archive config map is treated as an empty archive."""
+        del self.config_maps['mock-archive']
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace', include_archived=True,
+                                         archive_name='mock-archive')
+        self.assertEqual([('sat', '2.0.1')], [(p.name, p.version) for p in product_catalog.products])
+
+    def test_include_archived_read_error(self):
+        """Test that errors other than a missing archive config map are raised."""
+        self.config_maps['mock-archive'] = None
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = [
+            self.config_maps['mock-name'], ApiException(status=500, reason='Internal Server Error')
+        ]
+        with self.assertRaisesRegex(ProductCatalogError, 'Error reading mock-namespace/mock-archive ConfigMap'):
+            ProductCatalog('mock-name', 'mock-namespace', include_archived=True, archive_name='mock-archive')
+
+
+class TestProductCatalogCache(unittest.TestCase):
+    """Tests for ProductCatalog.get_cached() and ProductCatalog.evict_cached()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
+        self.resource_version = '1'
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = lambda *args, **kwargs: MockConfigMapResponse(
+            MOCK_PRODUCT_CATALOG_DATA, self.resource_version
+        )
+        self.mock_k8s_api.api_client.call_api.side_effect = lambda *args, **kwargs: MockConfigMapResponse(
+            None, self.resource_version
+        )
+        self.now = 0
+        patch('cray_product_catalog.query.time.monotonic', side_effect=lambda: self.now).start()
+        patch.dict(ProductCatalog._cache, clear=True).start()
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def get_cached(self):
+        """Get the cached ProductCatalog with a TTL of 60 seconds."""
+        return ProductCatalog.get_cached('mock-name', 'mock-namespace', ttl=60)
+
+    def test_cached_within_ttl(self):
+        """Test that the same catalog is returned without API requests within the TTL."""
+        product_catalog = self.get_cached()
+        self.now = 59
+        self.assertIs(product_catalog, self.get_cached())
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once()
+        self.mock_k8s_api.api_client.call_api.assert_not_called()
+
+    def test_revalidated_unchanged(self):
+        """Test that an unchanged catalog is kept after checking its resourceVersion once the TTL expires."""
+        product_catalog = self.get_cached()
+        self.now = 61
+        self.assertIs(product_catalog, self.get_cached())
+        self.assertIs(product_catalog, self.get_cached())
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once()
+        self.mock_k8s_api.api_client.call_api.assert_called_once()
+        _, kwargs = self.mock_k8s_api.api_client.call_api.call_args
+        self.assertIn('PartialObjectMetadata', kwargs['header_params']['Accept'])
+
+    def test_revalidated_changed(self):
+        """Test that a changed catalog is loaded again once the TTL expires."""
+        product_catalog = self.get_cached()
+        self.resource_version = '2'
+        self.now = 61
+        new_product_catalog = self.get_cached()
+        self.assertIsNot(product_catalog, new_product_catalog)
+        self.assertEqual('2', new_product_catalog.resource_version)
+        self.assertEqual(2, self.mock_k8s_api.read_namespaced_config_map.call_count)
+
+    def test_concurrent_callers_share_load(self):
+        """Test that concurrent callers wait for a single load."""
+        started = threading.Event()
+        release = threading.Event()
+        read = self.mock_k8s_api.read_namespaced_config_map.side_effect
+
+        def slow_read(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return read(*args, **kwargs)
+
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = slow_read
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.get_cached())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once()
+        self.assertEqual(8, len(results))
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_evict(self):
+        """Test that an evicted catalog is loaded again."""
+        product_catalog = self.get_cached()
+        ProductCatalog.get_cached('other-name', 'mock-namespace')
+        self.assertEqual(1, ProductCatalog.evict_cached(name='mock-name'))
+        self.assertIsNot(product_catalog, self.get_cached())
+        self.assertEqual(2, ProductCatalog.evict_cached())
+        self.assertEqual({}, ProductCatalog._cache)
+
+
+class TestProductCatalogRefresh(unittest.TestCase):
+    """Tests for ProductCatalog.refresh()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
+        self.generation = 1
+        self.read_delay = 0
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = self.read_config_map
+        self.mock_k8s_api.api_client.call_api.side_effect = lambda *args, **kwargs: MockConfigMapResponse(
+            None, str(self.generation)
+        )
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    @staticmethod
+    def catalog_data(generation):
+        """Get catalog data in which every product has a version ending in the given generation."""
+        return {
+            product: safe_dump({f'2.0.{generation}': versions['2.0.0']})
+            for product, versions in (('sat', SAT_VERSIONS), ('cos', COS_VERSIONS))
+        }
+
+    def read_config_map(self, *args, **kwargs):
+        """Read the catalog of the current generation, optionally slowly."""
+        generation = self.generation
+        time.sleep(self.read_delay)
+        return MockConfigMapResponse(self.catalog_data(generation), str(generation))
+
+    def test_refresh_unchanged(self):
+        """Test that refresh does not read an unchanged catalog again."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace')
+        self.assertFalse(product_catalog.refresh())
+        self.mock_k8s_api.read_namespaced_config_map.assert_called_once()
+
+    def test_refresh_changed(self):
+        """Test that refresh loads a changed catalog in place."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace')
+        self.generation = 2
+        self.assertTrue(product_catalog.refresh())
+        self.assertEqual('2', product_catalog.resource_version)
+        self.assertEqual('2.0.2', product_catalog.get_product('sat').version)
+        with self.assertRaisesRegex(ProductCatalogError, 'No installed products with name sat and version 2.0.1'):
+            product_catalog.get_product('sat', '2.0.1')
+
+    def test_refresh_fields(self):
+        """Test that a refresh loads only the fields the catalog was created with."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace', fields=['configuration.import_branch'])
+        self.generation = 2
+        self.assertTrue(product_catalog.refresh())
+        self.assertEqual({'configuration': {'import_branch': 'cray/sat/2.0.0'}},
+                         product_catalog.get_product('sat').data)
+
+    def test_refresh_error_keeps_catalog(self):
+        """Test that a failed refresh keeps the current catalog."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace')
+        self.generation = 2
+        self.mock_k8s_api.read_namespaced_config_map.side_effect = ApiException(status=500, reason='Error')
+        with self.assertRaisesRegex(ProductCatalogError, 'Error reading mock-namespace/mock-name ConfigMap'):
+            product_catalog.refresh()
+        self.assertEqual('1', product_catalog.resource_version)
+        self.assertEqual('2.0.1', product_catalog.get_product('cos').version)
+
+    def test_products_is_a_copy(self):
+        """Test that modifying the products list does not modify the catalog."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace')
+        product_catalog.products.clear()
+        self.assertEqual(2, len(product_catalog.products))
+
+    def test_concurrent_reads_during_refreshes(self):
+        """Test that readers see whole catalogs and are not blocked while refreshes are frequent."""
+        product_catalog = ProductCatalog('mock-name', 'mock-namespace')
+        self.read_delay = 0.005
+        stop = threading.Event()
+        torn_reads = []
+        latencies = []
+
+        def read():
+            while not stop.is_set():
+                start = time.perf_counter()
+                products = product_catalog.products
+                latest = product_catalog.get_product('cos')
+                latencies.append(time.perf_counter() - start)
+                versions = {p.version for p in products}
+                if len(products) != 2 or len(versions) != 1:
+                    torn_reads.append(versions)
+                if latest.version not in ('2.0.1', '2.0.2', '2.0.3'):
+                    torn_reads.append({latest.version})
+                # Let other threads run, as a real reader would between queries
+                time.sleep(0)
+
+        def refresh():
+            for generation in (2, 3) * 5:
+                self.generation = generation
+                product_catalog.refresh()
+
+        readers = [threading.Thread(target=read) for _ in range(8)]
+        refreshers = [threading.Thread(target=refresh) for _ in range(2)]
+        for thread in readers + refreshers:
+            thread.start()
+        for thread in refreshers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual([], torn_reads)
+        self.assertGreater(len(latencies), 100)
+        # Reads never wait for a refresh, which spends at least read_delay reading the config map.
+        self.assertLess(statistics.median(latencies), self.read_delay)
+
+
+class TestProductCatalogChanges(unittest.TestCase):
+    """Tests for ProductCatalog.changes()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        self.mock_k8s_api = patch.object(ProductCatalog, '_get_k8s_api').start().return_value
+        self.data = {'sat': safe_dump({'2.0.0': SAT_VERSIONS['2.0.0']}), 'cos': safe_dump(COS_VERSIONS)}
+        self.mock_k8s_api.read_namespaced_config_map.return_value = MockConfigMapResponse(self.data, '1')
+        self.mock_k8s_api.list_namespaced_config_map.return_value = Mock(items=[Mock(data=self.data)])
+        self.product_catalog = ProductCatalog('mock-name', 'mock-namespace')
+        self.mock_watch = patch('kubernetes.watch.Watch').start().return_value
+        self.events = []
+        self.mock_watch.stream.side_effect = lambda *args, **kwargs: iter(self.events.pop(0))
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    @staticmethod
+    def event(event_type, data, resource_version):
+        """Create a watch event for the config map."""
+        return {'type': event_type, 'raw_object': {'metadata': {'resourceVersion': resource_version}, 'data': data}}
+
+    def test_changes(self):
+        """Test that changes are yielded for each modification of the config map."""
+        sat_versions = {'2.0.0': dict(SAT_VERSIONS['2.0.0'], active=True), '2.0.1': SAT_VERSIONS['2.0.1']}
+        cos_versions = {'2.0.1': COS_VERSIONS['2.0.1']}
+        self.events = [[
+            self.event('MODIFIED', dict(self.data, sat=safe_dump(sat_versions)), '2'),
+            self.event('MODIFIED', {'sat': safe_dump(sat_versions), 'cos': safe_dump(cos_versions)}, '3'),
+        ]]
+        changes = self.product_catalog.changes(timeout=60)
+        self.assertEqual([
+            CatalogChange(ACTIVE_CHANGED, 'sat', '2.0.0', old=False, new=True, resource_version='2'),
+            CatalogChange(VERSION_ADDED, 'sat', '2.0.1', new=SAT_VERSIONS['2.0.1'], resource_version='2'),
+            CatalogChange(VERSION_REMOVED, 'cos', '2.0.0', old=COS_VERSIONS['2.0.0'], resource_version='3'),
+        ], [next(changes) for _ in range(3)])
+        _, kwargs = self.mock_watch.stream.call_args
+        self.assertEqual('metadata.name=mock-name', kwargs['field_selector'])
+        self.assertEqual('1', kwargs['resource_version'])
+        self.mock_k8s_api.list_namespaced_config_map.assert_called_once_with(
+            'mock-namespace', field_selector='metadata.name=mock-name', resource_version='1',
+            resource_version_match='Exact'
+        )
+
+    def test_changes_continue_after_watch_ends(self):
+        """Test that watching continues from the last resourceVersion seen."""
+        self.events = [
+            [self.event('BOOKMARK', None, '5')],
+            [self.event('DELETED', self.data, '6')],
+        ]
+        changes = self.product_catalog.changes(since='4', timeout=60)
+        self.assertEqual(CatalogChange(PRODUCT_REMOVED, 'sat', resource_version='6'), next(changes))
+        self.assertEqual(
+            ['4', '5'], [kwargs['resource_version'] for _, kwargs in self.mock_watch.stream.call_args_list]
+        )
+
+    def test_changes_since(self):
+        """Test that changes after `since` are compared with the config map as it was at `since`."""
+        old_data = {'sat': safe_dump({'2.0.0': SAT_VERSIONS['2.0.0']})}
+        self.mock_k8s_api.list_namespaced_config_map.return_value = Mock(items=[Mock(data=old_data)])
+        self.events = [[self.event('MODIFIED', self.data, '5')]]
+        changes = self.product_catalog.changes(since='4', timeout=60)
+        self.assertEqual(CatalogChange(PRODUCT_ADDED, 'cos', resource_version='5'), next(changes))
+        _, kwargs = self.mock_k8s_api.list_namespaced_config_map.call_args
+        self.assertEqual(('4', 'Exact'), (kwargs['resource_version'], kwargs['resource_version_match']))
+
+    def test_changes_since_too_old(self):
+        """Test that a resourceVersion too old to read the config map at is an error."""
+        self.mock_k8s_api.list_namespaced_config_map.side_effect = ApiException(status=410, reason='Gone')
+        with self.assertRaisesRegex(ProductCatalogError, 'resourceVersion 4, which is too old'):
+            next(self.product_catalog.changes(since='4'))
+        self.mock_watch.stream.assert_not_called()
+
+    def test_changes_resource_version_expired(self):
+        """Test that the config map is read again when the resourceVersion is too old to watch."""
+        self.mock_watch.stream.side_effect = [
+            ApiException(status=410, reason='Gone'), ApiException(status=403, reason='Forbidden')
+        ]
+        self.mock_k8s_api.read_namespaced_config_map.return_value = MockConfigMapResponse(
+            {'sat': self.data['sat']}, '9'
+        )
+        changes = []
+        with self.assertRaises(ProductCatalogError):
+            for change in self.product_catalog.changes(timeout=60):
+                changes.append(change)
+        self.assertEqual([
+            CatalogChange(PRODUCT_REMOVED, 'cos', resource_version='9'),
+            CatalogChange(VERSION_REMOVED, 'cos', '2.0.0', old=COS_VERSIONS['2.0.0'], resource_version='9'),
+            CatalogChange(VERSION_REMOVED, 'cos', '2.0.1', old=COS_VERSIONS['2.0.1'], resource_version='9'),
+        ], changes)
+        self.assertEqual('9', self.mock_watch.stream.call_args[1]['resource_version'])
+
+    def test_changes_watch_error(self):
+        """Test that an error watching the config map is raised as a ProductCatalogError."""
+        self.mock_watch.stream.side_effect = ApiException(status=403, reason='Forbidden')
+        with self.assertRaisesRegex(ProductCatalogError,
+                                    'Error watching mock-namespace/mock-name ConfigMap: Forbidden'):
+            next(self.product_catalog.changes())
+
+    def test_changes_timeout(self):
+        """Test that the generator ends once the timeout has elapsed."""
+        self.assertEqual([], list(self.product_catalog.changes(timeout=0)))
+
+
+class TestProductCatalogOffline(unittest.TestCase):
+    """Tests for the ProductCatalog constructors which do not use Kubernetes."""
+
+    def setUp(self):
+        """Create a temporary directory and make Kubernetes unusable."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.mock_get_k8s_api = patch.object(ProductCatalog, '_get_k8s_api', side_effect=AssertionError).start()
+        self.config_map = {
+            'apiVersion': 'v1', 'kind': 'ConfigMap', 'data': MOCK_PRODUCT_CATALOG_DATA,
+            'metadata': {'name': 'mock-name', 'namespace': 'mock-namespace', 'resourceVersion': '7'},
+        }
+
+    def tearDown(self):
+        """Remove the temporary directory and stop patches."""
+        patch.stopall()
+        self.tmp_dir.cleanup()
+
+    def write(self, filename, content):
+        path = os.path.join(self.tmp_dir.name, filename)
+        with open(path, 'w') as cm_file:
+            cm_file.write(content)
+        return path
+
+    def assert_catalog(self, catalog, name='mock-name', namespace='mock-namespace'):
+        """Assert the catalog holds the mock data."""
+        self.assertEqual((name, namespace), (catalog.name, catalog.namespace))
+        self.assertEqual(
+            {('sat', '2.0.0'), ('sat', '2.0.1'), ('cos', '2.0.0'), ('cos', '2.0.1'), ('other_product', '2.0.0')},
+            {(product.name, product.version) for product in catalog.products}
+        )
+        self.assertEqual('2.0.1', catalog.get_product('sat').version)
+
+    def test_from_mapping(self):
+        """Test creating a catalog from a mapping."""
+        catalog = ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA, 'mock-name', 'mock-namespace', '5')
+        self.assert_catalog(catalog)
+        self.assertEqual('5', catalog.resource_version)
+        self.assertIsNone(catalog.k8s_client)
+
+    def test_from_mapping_archive(self):
+        """Test that archived versions are included when archive data is given."""
+        catalog = ProductCatalog.from_mapping({'sat': safe_dump({'2.0.1': SAT_VERSIONS['2.0.1']})},
+                                              archive_data={'sat': safe_dump({'2.0.0': SAT_VERSIONS['2.0.0']})})
+        self.assertTrue(catalog.include_archived)
+        self.assertTrue(catalog.get_product('sat', '2.0.0').archived)
+
+    def test_from_mapping_no_data(self):
+        """Test that a mapping of None is an error, as for a config map with no data."""
+        with self.assertRaisesRegex(ProductCatalogError, 'No data found'):
+            ProductCatalog.from_mapping(None)
+
+    def test_from_configmap_file(self):
+        """Test creating a catalog from config maps saved as YAML and JSON."""
+        for filename, content in (('cm.yaml', safe_dump(self.config_map)), ('cm.json', json.dumps(self.config_map))):
+            with self.subTest(filename=filename):
+                catalog = ProductCatalog.from_configmap_file(self.write(filename, content))
+                self.assert_catalog(catalog)
+                self.assertEqual('7', catalog.resource_version)
+
+    def test_from_configmap_file_stdin(self):
+        """Test creating a catalog from a config map on standard input."""
+        with patch('sys.stdin', io.StringIO(safe_dump(self.config_map))):
+            self.assert_catalog(ProductCatalog.from_configmap_file('-'))
+
+    def test_from_configmap_file_error(self):
+        """Test that a file which cannot be read is an error."""
+        with self.assertRaisesRegex(ProductCatalogError, 'Unable to load product catalog'):
+            ProductCatalog.from_configmap_file(os.path.join(self.tmp_dir.name, 'missing.yaml'))
+
+    def test_from_snapshot(self):
+        """Test creating a catalog from a snapshot file."""
+        path = os.path.join(self.tmp_dir.name, 'snapshot.json.gz')
+        write_snapshot(path, make_snapshot(MOCK_PRODUCT_CATALOG_DATA, 'mock-name', 'mock-namespace', '9'))
+        catalog = ProductCatalog.from_snapshot(path)
+        self.assert_catalog(catalog)
+        self.assertEqual('9', catalog.resource_version)
+
+    def test_from_snapshot_errors(self):
+        """Test that a snapshot which does not match its hashes, or a config map, is an error."""
+        snapshot = make_snapshot(MOCK_PRODUCT_CATALOG_DATA)
+        snapshot.hashes['sat'] = 'sha256:0'
+        path = os.path.join(self.tmp_dir.name, 'snapshot.json')
+        write_snapshot(path, snapshot)
+        with self.assertRaisesRegex(ProductCatalogError, 'Data does not match hashes for product\\(s\\): sat'):
+            ProductCatalog.from_snapshot(path)
+        with self.assertRaisesRegex(ProductCatalogError, 'is not a snapshot file'):
+            ProductCatalog.from_snapshot(self.write('cm.yaml', safe_dump(self.config_map)))
+
+    def test_from_mapping_fields(self):
+        """Test that only the requested fields of each version are loaded."""
+        catalog = ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA, fields=['component_versions.docker',
+                                                                                 'configuration.commit'])
+        self.assertEqual(['component_versions.docker', 'configuration.commit'], catalog.fields)
+        self.assertEqual(
+            {'component_versions': {'docker': SAT_VERSIONS['2.0.1']['component_versions']['docker']},
+             'configuration': {'commit': SAT_VERSIONS['2.0.1']['configuration']['commit']}},
+            catalog.get_product('sat').data
+        )
+        self.assertEqual([('cray/cray-cos', '1.0.0'), ('cray/cos-cfs-install', '1.4.0')],
+                         catalog.get_product('cos', '2.0.0').docker_images)
+        self.assertIsNone(catalog.get_product('cos', '2.0.0').commit)
+
+    def test_from_mapping_fields_archive(self):
+        """Test that only the requested fields of archived versions are loaded."""
+        catalog = ProductCatalog.from_mapping({'sat': safe_dump({'2.0.1': SAT_VERSIONS['2.0.1']})},
+                                              archive_data={'sat': safe_dump({'2.0.0': SAT_VERSIONS['2.0.0']})},
+                                              fields=['configuration.import_branch'])
+        self.assertEqual({'configuration': {'import_branch': 'cray/sat/2.0.0'}},
+                         catalog.get_product('sat', '2.0.0').data)
+
+    def test_from_mapping_intern_data(self):
+        """Test that identical data is shared among versions as read-only mappings and tuples."""
+        catalog = ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA, intern_data=True)
+        self.assertTrue(catalog.intern_data)
+        sat = catalog.get_product('sat', '2.0.0')
+        other = catalog.get_product('other_product', '2.0.0')
+        self.assertEqual(SAT_VERSIONS['2.0.0'], json.loads(json.dumps(sat.data, default=dict)))
+        self.assertIs(sat.repositories[0], other.repositories[0])
+        self.assertIs(sat.clone_url, catalog.get_product('sat', '2.0.1').clone_url)
+        self.assertEqual([('cray/cray-sat', '1.0.0'), ('cray/sat-cfs-install', '1.4.0')], sat.docker_images)
+        with self.assertRaises(TypeError):
+            sat.data['active'] = True
+        with self.assertRaises(AttributeError):
+            sat.repositories.append({})
+
+    def test_from_mapping_intern_data_valid(self):
+        """Test that versions with interned data are still valid against the schema."""
+        catalog = ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA, intern_data=True)
+        self.assertTrue(catalog.products)
+        for product in catalog.products:
+            self.assertTrue(product.is_valid, str(product))
+
+    def test_from_mapping_intern_invalid(self):
+        """Test that versions are validated before their data is interned."""
+        catalog = ProductCatalog.from_mapping(
+            {'sat': safe_dump({'2.0.0': SAT_VERSIONS['2.0.0'], '2.1.0': {'component_versions': {'docker': 'x'}}})},
+            intern_data=True
+        )
+        self.assertEqual(['2.0.0'], [product.version for product in catalog.products])
+
+    def test_from_mapping_invalid_fields(self):
+        """Test that an invalid field is an error."""
+        with self.assertRaisesRegex(ValueError, 'Invalid field "configuration."'):
+            ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA, fields=['configuration.'])
+
+    def test_refresh_offline(self):
+        """Test that a catalog not loaded from Kubernetes cannot be refreshed or watched."""
+        catalog = ProductCatalog.from_mapping(MOCK_PRODUCT_CATALOG_DATA)
+        with self.assertRaisesRegex(ProductCatalogError, 'was not loaded from Kubernetes'):
+            catalog.refresh()
+        with self.assertRaisesRegex(ProductCatalogError, 'was not loaded from Kubernetes'):
+            next(catalog.changes())
+
+    def test_kubernetes_not_imported(self):
+        """Test that loading and querying a catalog from a mapping does not import the kubernetes client."""
+        code = (
+            'import sys, yaml\n'
+            'from cray_product_catalog.query import ProductCatalog\n'
+            'catalog = ProductCatalog.from_mapping({"sat": yaml.safe_dump({"1.0.0": {}})})\n'
+            'catalog.get_product("sat")\n'
+            'print(sorted(module for module in sys.modules if module.startswith("kubernetes")))\n'
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual('[]', result.stdout.strip())
+
+
 class TestInstalledProductVersion(unittest.TestCase):
     """Tests for the InstalledProductVersion class."""
     def setUp(self):
@@ -0,0 +1,142 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Unit tests for the cray_product_catalog.util.catalog_data module
+
+import copy
+import unittest
+
+from yaml import safe_dump, safe_load
+
+from cray_product_catalog.util.catalog_data import (
+    apply_delete,
+    apply_requests,
+    apply_update,
+    delete_request,
+    update_request,
+)
+from tests.mocks import MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS
+
+
+class TestApplyUpdate(unittest.TestCase):
+    """Tests for apply_update()."""
+
+    def setUp(self):
+        self.product_data = copy.deepcopy(SAT_VERSIONS)
+
+    def test_new_version(self):
+        """Test adding a new version."""
+        self.assertTrue(apply_update(self.product_data, '2.1.0', {'foo': 'bar'}))
+        self.assertEqual({'foo': 'bar'}, self.product_data['2.1.0'])
+
+    def test_new_empty_version(self):
+        """Test that adding a new version with no data is still a change."""
+        self.assertTrue(apply_update(self.product_data, '2.1.0', {}))
+        self.assertEqual({}, self.product_data['2.1.0'])
+
+    def test_existing_data(self):
+        """Test that merging data already present is not a change."""
+        existing_data = {'configuration': {'import_branch': 'cray/sat/2.0.0'}}
+        self.assertFalse(apply_update(self.product_data, '2.0.0', existing_data))
+        self.assertEqual(SAT_VERSIONS, self.product_data)
+
+    def test_set_active(self):
+        """Test that set_active is a change until the version is the only active version."""
+        self.assertTrue(apply_update(self.product_data, '2.0.0', {}, set_active=True))
+        self.assertEqual([True, False], [self.product_data[v]['active'] for v in ('2.0.0', '2.0.1')])
+        self.assertFalse(apply_update(self.product_data, '2.0.0', {}, set_active=True))
+
+    def test_remove_active(self):
+        """Test that remove_active removes the active field from all versions."""
+        self.product_data['2.0.1']['active'] = True
+        self.assertTrue(apply_update(self.product_data, '2.0.0', {}, remove_active=True))
+        self.assertFalse(any('active' in v for v in self.product_data.values()))
+        self.assertFalse(apply_update(self.product_data, '2.0.0', {}, remove_active=True))
+
+    def test_set_and_remove_active(self):
+        """Test that set_active and remove_active cannot be combined."""
+        with self.assertRaises(ValueError):
+            apply_update(self.product_data, '2.0.0', {}, set_active=True, remove_active=True)
+
+
+class TestApplyDelete(unittest.TestCase):
+    """Tests for apply_delete()."""
+
+    def setUp(self):
+        self.product_data = copy.deepcopy(SAT_VERSIONS)
+
+    def test_delete_version(self):
+        """Test deleting a whole version."""
+        self.assertTrue(apply_delete(self.product_data, '2.0.0'))
+        self.assertEqual(['2.0.1'], list(self.product_data))
+        self.assertFalse(apply_delete(self.product_data, '2.0.0'))
+
+    def test_delete_key(self):
+        """Test deleting a key leaves the rest of the version."""
+        self.assertTrue(apply_delete(self.product_data, '2.0.0', 'configuration'))
+        self.assertEqual(['component_versions'], list(self.product_data['2.0.0']))
+        self.assertFalse(apply_delete(self.product_data, '2.0.0', 'configuration'))
+
+    def test_delete_last_key(self):
+        """Test that deleting the last key of a version removes the version."""
+        apply_delete(self.product_data, '2.0.0', 'configuration')
+        self.assertTrue(apply_delete(self.product_data, '2.0.0', 'component_versions'))
+        self.assertNotIn('2.0.0', self.product_data)
+
+
+class TestApplyRequests(unittest.TestCase):
+    """Tests for apply_requests()."""
+
+    def test_coalesce_requests(self):
+        """Test that several requests for a product produce a single patch entry."""
+        requests = [
+            update_request('sat', '2.1.0', {'foo': 'bar'}),
+            update_request('sat', '2.1.0', {}, set_active=True),
+            delete_request('sat', '2.0.0'),
+            update_request('new', '1.0.0', {}),
+            delete_request('missing', '1.0.0'),
+            delete_request('cos', '9.9.9'),
+        ]
+        patch_data = apply_requests(MOCK_PRODUCT_CATALOG_DATA, requests)
+        self.assertEqual({'sat', 'new'}, set(patch_data))
+        sat_data = safe_load(patch_data['sat'])
+        self.assertEqual(['2.0.1', '2.1.0'], sorted(sat_data))
+        self.assertEqual({'foo': 'bar', 'active': True}, sat_data['2.1.0'])
+        self.assertEqual({'1.0.0': {}}, safe_load(patch_data['new']))
+
+    def test_failed_request(self):
+        """Test that a request which cannot be merged is reported without failing the others."""
+        data = {'sat': safe_dump({'1.0.0': {'foo': 'bar', 'baz': []}})}
+        bad_request = update_request('sat', '1.0.0', {'foo': ['not', 'a', 'string']})
+        errors = []
+        patch_data = apply_requests(
+            data, [bad_request, update_request('sat', '1.0.1', {})],
+            on_error=lambda request, err: errors.append(request)
+        )
+        self.assertEqual([bad_request], errors)
+        self.assertEqual({'1.0.0': {'foo': 'bar', 'baz': []}, '1.0.1': {}}, safe_load(patch_data['sat']))
+        with self.assertRaises(TypeError):
+            apply_requests(data, [bad_request])
+
+
+if __name__ == '__main__':
+    unittest.main()
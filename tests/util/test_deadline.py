@@ -0,0 +1,177 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for the cray_product_catalog.util.deadline module
+
+import unittest
+from unittest.mock import Mock, patch
+
+from urllib3.exceptions import ConnectTimeoutError
+
+from cray_product_catalog.util.deadline import Deadline, DeadlineExceeded, DeadlineRetry
+
+
+class TestDeadline(unittest.TestCase):
+    """Tests for the Deadline class."""
+
+    def setUp(self):
+        """Set up a mock clock."""
+        self.now = 100
+        patch('cray_product_catalog.util.deadline.time.monotonic', side_effect=lambda: self.now).start()
+        self.mock_sleep = patch('cray_product_catalog.util.deadline.time.sleep').start()
+        self.mock_sleep.side_effect = self.advance
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def advance(self, seconds):
+        """Advance the mock clock."""
+        self.now += seconds
+
+    def test_unlimited(self):
+        """Test that a deadline without a limit never expires and does not limit timeouts."""
+        deadline = Deadline()
+        self.advance(10 ** 6)
+        self.assertFalse(deadline.expired())
+        self.assertIsNone(deadline.remaining())
+        self.assertEqual(30, deadline.limit(30))
+        self.assertIsNone(deadline.limit(None))
+        self.assertEqual({}, deadline.request_kwargs())
+        deadline.check('testing')
+
+    def test_limit(self):
+        """Test that timeouts are reduced to the time remaining."""
+        deadline = Deadline(60)
+        self.advance(45)
+        self.assertEqual(15, deadline.remaining())
+        self.assertEqual(10, deadline.limit(10))
+        self.assertEqual(15, deadline.limit(30))
+        self.assertEqual(15, deadline.limit(None))
+        self.assertEqual({'_request_timeout': 15}, deadline.request_kwargs())
+
+    def test_sleep_stops_at_deadline(self):
+        """Test that sleeping does not go past the deadline."""
+        deadline = Deadline(5)
+        deadline.sleep(3)
+        deadline.sleep(3)
+        self.assertEqual(105, self.now)
+        self.assertEqual(5, deadline.slept)
+        self.assertTrue(deadline.expired())
+
+    def test_check_expired(self):
+        """Test that an expired deadline raises an error summarizing the attempts made."""
+        deadline = Deadline(5)
+        deadline.count('attempts')
+        deadline.count('attempts')
+        deadline.count('conflicts')
+        deadline.sleep(6)
+        with self.assertRaises(DeadlineExceeded) as cm:
+            deadline.check('updating ConfigMap services/cray-product-catalog')
+        self.assertEqual(
+            'Deadline of 5s exceeded while updating ConfigMap services/cray-product-catalog '
+            '(elapsed=5.0s slept=5.0s attempts=2 conflicts=1)',
+            str(cm.exception)
+        )
+        with self.assertRaises(DeadlineExceeded):
+            deadline.request_kwargs()
+
+    def test_from_env(self):
+        """Test creating a deadline from the environment."""
+        with patch.dict('os.environ', {'CATALOG_DEADLINE_SECONDS': '90'}):
+            self.assertEqual(90, Deadline.from_env().seconds)
+        with patch.dict('os.environ', {'CATALOG_DEADLINE_SECONDS': ''}):
+            self.assertIsNone(Deadline.from_env().seconds)
+
+
+class TestDeadlineRetry(unittest.TestCase):
+    """Tests for the DeadlineRetry class."""
+
+    def setUp(self):
+        """Set up a mock clock."""
+        self.now = 0
+        patch('cray_product_catalog.util.deadline.time.monotonic', side_effect=lambda: self.now).start()
+        self.mock_sleep = patch('cray_product_catalog.util.deadline.time.sleep').start()
+        self.mock_sleep.side_effect = self.advance
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def advance(self, seconds):
+        """Advance the mock clock."""
+        self.now += seconds
+
+    def increment(self, retry):
+        """Record a connection timeout against the given Retry."""
+        return retry.increment('GET', '/api', error=ConnectTimeoutError())
+
+    def test_new_keeps_deadline(self):
+        """Test that the Retry made for each attempt shares the deadline."""
+        deadline = Deadline(10)
+        retry = self.increment(DeadlineRetry(deadline=deadline, total=5))
+        self.assertIsInstance(retry, DeadlineRetry)
+        self.assertIs(deadline, retry.deadline)
+        self.assertEqual(4, retry.total)
+        self.assertEqual({'request_retries': 1}, deadline.counts)
+
+    def test_backoff_limited_by_deadline(self):
+        """Test that backing off between retries stops at the deadline."""
+        deadline = Deadline(10)
+        retry = DeadlineRetry(deadline=deadline, total=100, backoff_factor=4)
+        for _ in range(3):
+            retry = self.increment(retry)
+            retry.sleep()
+        self.assertEqual(10, self.now)
+
+    def test_no_retries_after_deadline(self):
+        """Test that no further retries are made once the deadline has elapsed."""
+        deadline = Deadline(10)
+        retry = self.increment(DeadlineRetry(deadline=deadline, total=100))
+        self.advance(10)
+        with self.assertRaises(DeadlineExceeded):
+            self.increment(retry)
+
+    def test_active_deadline(self):
+        """Test that a Retry without a deadline obeys the Deadline entered in the current thread."""
+        retry = DeadlineRetry(total=100)
+        with Deadline(10) as deadline:
+            self.assertIs(deadline, Deadline.active())
+            retry = self.increment(retry)
+            self.advance(10)
+            with self.assertRaises(DeadlineExceeded):
+                self.increment(retry)
+        self.assertEqual({'request_retries': 2}, deadline.counts)
+        self.assertIsNone(Deadline.active())
+        self.increment(retry)
+
+    def test_retry_after_limited_by_deadline(self):
+        """Test that a Retry-After header does not extend past the deadline."""
+        deadline = Deadline(10)
+        retry = DeadlineRetry(deadline=deadline, total=100)
+        retry.sleep(Mock(headers={'Retry-After': '120'}))
+        self.assertEqual(10, self.now)
+
+
+if __name__ == '__main__':
+    unittest.main()
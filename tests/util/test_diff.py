@@ -0,0 +1,131 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.util.diff module
+
+import unittest
+from unittest.mock import patch
+
+from yaml import safe_dump
+
+from cray_product_catalog.util.diff import (
+    ACTIVE_CHANGED,
+    KEY_CHANGED,
+    PRODUCT_ADDED,
+    PRODUCT_REMOVED,
+    VERSION_ADDED,
+    VERSION_REMOVED,
+    CatalogChange,
+    _load,
+    diff_catalog_data,
+)
+
+
+class TestDiffCatalogData(unittest.TestCase):
+    """Tests for diff_catalog_data."""
+
+    def setUp(self):
+        """Set up catalog data with two products."""
+        self.sat = {
+            '1.0.0': {'active': True, 'component_versions': {'docker': [{'name': 'sat', 'version': '1.0.0'}]}},
+            '1.1.0': {'component_versions': {'docker': [{'name': 'sat', 'version': '1.1.0'}]}},
+        }
+        self.cos = {'2.0.0': {'configuration': {'commit': 'abc'}}}
+        self.old_data = {'sat': safe_dump(self.sat), 'cos': safe_dump(self.cos)}
+
+    def diff(self, new_data):
+        return list(diff_catalog_data(self.old_data, new_data))
+
+    def test_no_changes(self):
+        """Test that identical data has no changes."""
+        self.assertEqual([], self.diff(dict(self.old_data)))
+
+    def test_unchanged_products_not_parsed(self):
+        """Test that only products whose data changed are parsed."""
+        self.cos['2.0.0']['configuration']['commit'] = 'def'
+        with patch('cray_product_catalog.util.diff._load', wraps=_load) as mock_load:
+            self.diff({'sat': self.old_data['sat'], 'cos': safe_dump(self.cos)})
+        self.assertEqual(2, mock_load.call_count)
+
+    def test_equal_hashes_not_parsed(self):
+        """Test that products with equal hashes are skipped even if their strings differ."""
+        new_data = {'sat': self.old_data['sat'].replace('1.1.0', '9.9.9'), 'cos': self.old_data['cos']}
+        with patch('cray_product_catalog.util.diff._load', wraps=_load) as mock_load:
+            changes = list(diff_catalog_data(self.old_data, new_data, {'sat': 'sha256:1'}, {'sat': 'sha256:1'}))
+        self.assertEqual([], changes)
+        mock_load.assert_not_called()
+
+    def test_deep(self):
+        """Test comparing nested fields of versions."""
+        self.cos['2.0.0']['configuration'] = {'commit': 'def', 'import_branch': 'cray/cos/2.0.0'}
+        self.assertEqual([
+            CatalogChange(KEY_CHANGED, 'cos', '2.0.0', 'configuration.commit', 'abc', 'def',
+                          path=('configuration', 'commit')),
+            CatalogChange(KEY_CHANGED, 'cos', '2.0.0', 'configuration.import_branch', None, 'cray/cos/2.0.0',
+                          path=('configuration', 'import_branch')),
+        ], list(diff_catalog_data(self.old_data, {'sat': self.old_data['sat'], 'cos': safe_dump(self.cos)},
+                                  deep=True)))
+
+    def test_product_added_and_removed(self):
+        """Test adding and removing whole products."""
+        uan = {'1.0.0': {'active': False}}
+        self.assertEqual([
+            CatalogChange(PRODUCT_REMOVED, 'cos'),
+            CatalogChange(VERSION_REMOVED, 'cos', '2.0.0', old=self.cos['2.0.0']),
+            CatalogChange(PRODUCT_ADDED, 'uan'),
+            CatalogChange(VERSION_ADDED, 'uan', '1.0.0', new=uan['1.0.0']),
+        ], self.diff({'sat': self.old_data['sat'], 'uan': safe_dump(uan)}))
+
+    def test_version_added_and_removed(self):
+        """Test adding and removing versions of a product."""
+        new_version = self.sat.pop('1.1.0')
+        self.sat['1.2.0'] = new_version
+        self.assertEqual([
+            CatalogChange(VERSION_REMOVED, 'sat', '1.1.0', old=new_version),
+            CatalogChange(VERSION_ADDED, 'sat', '1.2.0', new=new_version),
+        ], self.diff({'sat': safe_dump(self.sat), 'cos': self.old_data['cos']}))
+
+    def test_active_changed(self):
+        """Test activating a version, including one without an active key."""
+        self.sat['1.0.0']['active'] = False
+        self.sat['1.1.0']['active'] = True
+        self.assertEqual([
+            CatalogChange(ACTIVE_CHANGED, 'sat', '1.0.0', old=True, new=False),
+            CatalogChange(ACTIVE_CHANGED, 'sat', '1.1.0', old=False, new=True),
+        ], self.diff({'sat': safe_dump(self.sat), 'cos': self.old_data['cos']}))
+
+    def test_key_changed(self):
+        """Test changing, adding, and removing keys of a version."""
+        self.cos['2.0.0']['configuration'] = {'commit': 'def'}
+        self.cos['2.0.0']['images'] = {'cos-image': {'id': '1'}}
+        del self.sat['1.1.0']['component_versions']
+        self.assertEqual([
+            CatalogChange(KEY_CHANGED, 'sat', '1.1.0', 'component_versions',
+                          {'docker': [{'name': 'sat', 'version': '1.1.0'}]}, None),
+            CatalogChange(KEY_CHANGED, 'cos', '2.0.0', 'configuration', {'commit': 'abc'}, {'commit': 'def'}),
+            CatalogChange(KEY_CHANGED, 'cos', '2.0.0', 'images', None, {'cos-image': {'id': '1'}}),
+        ], self.diff({'sat': safe_dump(self.sat), 'cos': safe_dump(self.cos)}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.util.intern module
+
+import datetime
+import unittest
+from types import MappingProxyType
+
+from cray_product_catalog.util.intern import Interner
+from tests.mocks import OTHER_PRODUCT_VERSION, SAT_VERSIONS
+
+
+class TestInterner(unittest.TestCase):
+    """Tests for the Interner class."""
+
+    def setUp(self):
+        """Create an Interner."""
+        self.interner = Interner()
+
+    def test_intern_immutable(self):
+        """Test that mappings become read-only and lists become tuples, with equal contents."""
+        value = self.interner.intern({'a': [1, {'b': 'c'}], 'd': None})
+        self.assertIsInstance(value, MappingProxyType)
+        self.assertEqual((1, {'b': 'c'}), value['a'])
+        self.assertIsInstance(value['a'][1], MappingProxyType)
+        self.assertEqual({'a': (1, {'b': 'c'}), 'd': None}, dict(value))
+
+    def test_intern_shares_equal_values(self):
+        """Test that equal values in different data are the same object."""
+        sat = self.interner.intern(SAT_VERSIONS['2.0.0'])
+        other = self.interner.intern(OTHER_PRODUCT_VERSION['2.0.0'])
+        self.assertIs(sat['component_versions']['repositories'], other['component_versions']['repositories'])
+        self.assertIs(self.interner.intern(SAT_VERSIONS['2.0.0']), sat)
+        self.assertGreater(self.interner.shared, 0)
+
+    def test_intern_strings(self):
+        """Test that equal strings are the same object."""
+        first = self.interner.intern({'name': ''.join(['cray/', 'cray-sat'])})
+        second = self.interner.intern([''.join(['cray/', 'cray-sat'])])
+        self.assertIs(first['name'], second[0])
+
+    def test_intern_types_kept_apart(self):
+        """Test that values which are equal but of different types are not shared."""
+        self.assertIs(True, self.interner.intern({'a': 1, 'b': True})['b'])
+        self.assertIs(True, self.interner.intern({'a': True})['a'])
+        self.assertIsInstance(self.interner.intern({'a': 1.0})['a'], float)
+        self.assertIsNot(self.interner.intern({'a': [1]})['a'], self.interner.intern({'a': [True]})['a'])
+
+    def test_intern_other_scalars(self):
+        """Test that dates are shared and unhashable values are kept as they are."""
+        date = self.interner.intern([datetime.date(2021, 7, 7)])
+        self.assertIs(date, self.interner.intern([datetime.date(2021, 7, 7)]))
+        self.assertEqual(({1, 2},), self.interner.intern([{1, 2}]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,330 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.util.journal module
+
+import copy
+from datetime import datetime, timedelta, timezone
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes.client.rest import ApiException
+from yaml import safe_dump, safe_load
+
+from cray_product_catalog.util.catalog_data import apply_delete, apply_update
+from cray_product_catalog.util.journal import (
+    ConfigMapJournal,
+    FileJournal,
+    JournalError,
+    diff_versions,
+    hash_versions,
+    journal_from_env,
+    make_entry,
+    parse_time,
+    record_write,
+    rewind,
+)
+from tests.mocks import MockConfigMapApi
+
+
+class TestDiffVersions(unittest.TestCase):
+    """Tests for the changes recorded in journal entries."""
+
+    def test_added_and_removed_versions(self):
+        """Test that whole versions are recorded when added or removed."""
+        self.assertEqual(
+            [{'version': '1.0.0', 'old': {'active': True}}, {'version': '2.0.0', 'new': {}}],
+            diff_versions({'1.0.0': {'active': True}}, {'2.0.0': {}})
+        )
+
+    def test_changed_keys(self):
+        """Test that only changed keys are recorded, with old or new omitted if missing."""
+        old = {'1.0.0': {'active': True, 'configuration': {'commit': 'abc'}, 'images': {}}}
+        new = {'1.0.0': {'active': False, 'configuration': {'commit': 'abc'}, 'recipes': []}}
+        self.assertEqual([
+            {'version': '1.0.0', 'path': ['active'], 'old': True, 'new': False},
+            {'version': '1.0.0', 'path': ['images'], 'old': {}},
+            {'version': '1.0.0', 'path': ['recipes'], 'new': []},
+        ], diff_versions(old, new))
+
+    def test_added_none(self):
+        """Test that a whole version is recorded if a key is only added with a value of None."""
+        old = {'1.0.0': {'active': False}}
+        new = {'1.0.0': {'active': False, 'recipes': None}}
+        self.assertEqual([{'version': '1.0.0', 'old': old['1.0.0'], 'new': new['1.0.0']}], diff_versions(old, new))
+
+    def test_changed_nested_keys(self):
+        """Test that changes within mappings are recorded by path, and lists as a whole."""
+        old = {'1.0.0': {'images': {'a': {'id': '1'}, 'b': {'id': '2'}}, 'component_versions': {'docker': [1]}}}
+        new = {'1.0.0': {'images': {'a': {'id': '3'}, 'b': {'id': '2'}}, 'component_versions': {'docker': [1, 2]}}}
+        self.assertEqual([
+            {'version': '1.0.0', 'path': ['images', 'a', 'id'], 'old': '1', 'new': '3'},
+            {'version': '1.0.0', 'path': ['component_versions', 'docker'], 'old': [1], 'new': [1, 2]},
+        ], diff_versions(old, new))
+
+    def test_no_product(self):
+        """Test that a missing product is treated as having no versions."""
+        self.assertEqual([{'version': '1.0.0', 'new': {}}], diff_versions(None, {'1.0.0': {}}))
+
+    def test_make_entry(self):
+        """Test that an entry records hashes of the product before and after."""
+        entry = make_entry('services', 'cray-product-catalog', 'sat', '1.0.0', None, {'1.0.0': {}}, '7')
+        self.assertIsNone(entry['before'])
+        self.assertEqual(hash_versions({'1.0.0': {}}), entry['after'])
+        self.assertEqual('7', entry['resourceVersion'])
+        self.assertIsNone(make_entry('services', 'cray-product-catalog', 'sat', '1.0.0', {}, {}))
+
+
+class TestFileJournal(unittest.TestCase):
+    """Tests for the FileJournal class."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'journal.jsonl')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_append(self):
+        """Test that entries are numbered and read back in order."""
+        journal = FileJournal(self.path)
+        self.assertEqual([], journal.entries())
+        journal.append({'product': 'sat'})
+        journal.append({'product': 'cos'})
+        self.assertEqual([{'product': 'sat', 'seq': 1}, {'product': 'cos', 'seq': 2}], journal.entries())
+
+    def test_rotate(self):
+        """Test that the oldest entries are dropped once the file grows past its limit."""
+        journal = FileJournal(self.path, max_bytes=100)
+        for index in range(10):
+            journal.append({'product': 'sat', 'padding': 'x' * 40, 'index': index})
+        entries = journal.entries()
+        self.assertLess(len(entries), 10)
+        self.assertEqual(list(range(11 - len(entries), 11)), [entry['seq'] for entry in entries])
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+
+    def test_unreadable(self):
+        """Test that a corrupt journal raises JournalError."""
+        with open(self.path, 'w') as jfile:
+            jfile.write('not json\n')
+        with self.assertRaisesRegex(JournalError, 'Unable to read journal'):
+            FileJournal(self.path).entries()
+
+
+class TestConfigMapJournal(unittest.TestCase):
+    """Tests for the ConfigMapJournal class."""
+
+    def setUp(self):
+        """Create a mock API and a journal bound to it."""
+        self.api = MockConfigMapApi()
+        self.journal = ConfigMapJournal('cpc-journal').bind(self.api, 'services')
+
+    def test_create(self):
+        """Test that the ConfigMap is created with the first entry."""
+        self.journal.append({'product': 'sat'})
+        self.assertEqual(['read', 'create'], self.api.requests)
+        self.assertEqual([{'product': 'sat', 'seq': 1}], self.journal.entries())
+
+    def test_append(self):
+        """Test that later entries are patched into the ConfigMap with its resourceVersion."""
+        self.journal.append({'product': 'sat'})
+        self.journal.append({'product': 'cos'})
+        data = self.api.config_maps[('services', 'cpc-journal')]['data']
+        self.assertEqual(['0000000001', '0000000002'], sorted(data))
+        self.assertEqual([1, 2], [entry['seq'] for entry in self.journal.entries()])
+
+    def test_trim(self):
+        """Test that the oldest entries are removed once the entries grow past the limit."""
+        self.journal.max_bytes = 200
+        for index in range(10):
+            self.journal.append({'product': 'sat', 'padding': 'x' * 40, 'index': index})
+        entries = self.journal.entries()
+        self.assertLess(len(entries), 10)
+        self.assertEqual(10, entries[-1]['seq'])
+
+    def test_conflict(self):
+        """Test that the ConfigMap is read again after a conflict."""
+        self.journal.append({'product': 'sat'})
+        self.api.patch_namespaced_config_map = Mock(side_effect=[ApiException(status=409, reason='Conflict'),
+                                                                 None])
+        self.assertEqual(2, self.journal.append({'product': 'cos'})['seq'])
+        self.assertEqual(2, self.api.patch_namespaced_config_map.call_count)
+
+    def test_error(self):
+        """Test that other errors raise JournalError."""
+        self.api.create_namespaced_config_map = Mock(side_effect=ApiException(status=403, reason='Forbidden'))
+        with self.assertRaisesRegex(JournalError, 'Error writing journal ConfigMap services/cpc-journal: Forbidden'):
+            self.journal.append({'product': 'sat'})
+
+    def test_record_write_logs_errors(self):
+        """Test that record_write logs a journal error rather than raising it."""
+        self.api.create_namespaced_config_map = Mock(side_effect=ApiException(status=403, reason='Forbidden'))
+        with self.assertLogs('cray_product_catalog.util.journal', 'WARNING'):
+            record_write(self.journal, 'services', 'cray-product-catalog', 'sat', '1.0.0', None, {'1.0.0': {}})
+
+
+class TestJournalFromEnv(unittest.TestCase):
+    """Tests for journal_from_env."""
+
+    def test_none(self):
+        """Test that there is no journal by default."""
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(journal_from_env())
+
+    def test_file(self):
+        """Test that CATALOG_JOURNAL_FILE selects a file journal."""
+        with patch.dict(os.environ, {'CATALOG_JOURNAL_FILE': '/tmp/j', 'CATALOG_JOURNAL': 'cpc-journal'}):
+            journal = journal_from_env()
+        self.assertIsInstance(journal, FileJournal)
+        self.assertEqual('/tmp/j', journal.path)
+
+    def test_config_map(self):
+        """Test that CATALOG_JOURNAL selects a ConfigMap journal with the given limit."""
+        with patch.dict(os.environ, {'CATALOG_JOURNAL': 'cpc-journal', 'CATALOG_JOURNAL_MAX_BYTES': '1000'},
+                        clear=True):
+            journal = journal_from_env()
+        self.assertIsInstance(journal, ConfigMapJournal)
+        self.assertEqual(('cpc-journal', 1000), (journal.name, journal.max_bytes))
+
+
+class TestRewind(unittest.TestCase):
+    """Tests for rewinding catalog data with a journal."""
+
+    def setUp(self):
+        """Create a journal and a catalog with one product."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal = FileJournal(os.path.join(self.tmp_dir.name, 'journal.jsonl'))
+        self.data = {'cos': safe_dump({'2.0.0': {'active': True}})}
+        self.history = [dict(self.data)]
+        self.resource_version = 10
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def write(self, product, version, func, *args):
+        """Change a product as catalog_update or catalog_delete would, recording it in the journal."""
+        old = safe_load(self.data[product]) if product in self.data else None
+        new = copy.deepcopy(old) if old is not None else {}
+        func(new, version, *args)
+        self.data[product] = safe_dump(new, default_flow_style=False)
+        self.resource_version += 1
+        self.journal.record('services', 'cray-product-catalog', product, version, old, new,
+                            str(self.resource_version), str(self.resource_version - 1))
+        self.history.append(dict(self.data))
+
+    def make_history(self):
+        """Make a series of updates and deletes."""
+        self.write('sat', '1.0.0', apply_update, {'configuration': {'commit': 'abc'}}, True)
+        self.write('sat', '1.1.0', apply_update, {'configuration': {'commit': 'def'}}, True)
+        self.write('cos', '2.0.0', apply_delete, 'active')
+        self.write('sat', '1.0.0', apply_delete)
+
+    def test_rewind_resource_version(self):
+        """Test rewinding to each resourceVersion in the journal."""
+        self.make_history()
+        entries = self.journal.entries()
+        for index, data in enumerate(self.history):
+            with self.subTest(resource_version=10 + index):
+                self.assertEqual(data, rewind(self.data, entries, resource_version=str(10 + index)))
+
+    def test_rewind_previous_resource_version(self):
+        """Test rewinding to a resourceVersion which was only written over, not written, by a journaled write."""
+        self.write('sat', '1.0.0', apply_update, {'configuration': {'commit': 'abc'}}, True)
+        self.resource_version += 5  # a write of another product which was not journaled
+        self.write('sat', '1.1.0', apply_update, {'configuration': {'commit': 'def'}}, True)
+        self.assertEqual(self.history[1], rewind(self.data, self.journal.entries(), resource_version='16'))
+
+    def test_opaque_resource_versions(self):
+        """Test that resourceVersions are ordered by journal position rather than compared as numbers."""
+        for previous, current in [('b', 'a'), ('a', 'c')]:
+            old = safe_load(self.data['cos'])
+            new = {'2.0.0': {'active': not old['2.0.0']['active']}}
+            self.data['cos'] = safe_dump(new, default_flow_style=False)
+            self.journal.record('services', 'cray-product-catalog', 'cos', '2.0.0', old, new, current, previous)
+            self.history.append(dict(self.data))
+        entries = self.journal.entries()
+        self.assertEqual(self.history[0], rewind(self.data, entries, resource_version='b'))
+        self.assertEqual(self.history[1], rewind(self.data, entries, resource_version='a'))
+        self.assertEqual(self.history[2], rewind(self.data, entries, resource_version='c'))
+
+    def test_rewind_nested_change(self):
+        """Test that a nested change is recorded and undone by its path."""
+        self.data = {'sat': safe_dump({'1.0.0': {'configuration': {'commit': 'abc', 'ref': 'main'}}})}
+        self.history = [dict(self.data)]
+        self.write('sat', '1.0.0', apply_update, {'configuration': {'commit': 'def', 'ref': 'main'}}, False)
+        entry = self.journal.entries()[-1]
+        self.assertEqual([{'version': '1.0.0', 'path': ['configuration', 'commit'], 'old': 'abc', 'new': 'def'}],
+                         entry['changes'])
+        self.assertEqual(self.history[0], rewind(self.data, self.journal.entries(), resource_version='10'))
+
+    def test_rewind_time(self):
+        """Test rewinding to a time before or after all changes."""
+        self.make_history()
+        entries = self.journal.entries()
+        self.assertEqual(self.history[0], rewind(self.data, entries, time=datetime.now(timezone.utc) - timedelta(1)))
+        self.assertEqual(self.data, rewind(self.data, entries, time=datetime.now(timezone.utc)))
+
+    def test_rewind_other_config_map(self):
+        """Test that entries for other ConfigMaps are not undone."""
+        self.make_history()
+        self.assertEqual(self.data, rewind(self.data, self.journal.entries(), resource_version='10',
+                                           name='cray-product-catalog', namespace='other'))
+
+    def test_changed_outside_journal(self):
+        """Test that a product changed without being journaled cannot be rewound."""
+        self.make_history()
+        self.data['sat'] = safe_dump({'9.9.9': {}})
+        with self.assertRaisesRegex(JournalError, 'Product sat does not match the journal entry 4'):
+            rewind(self.data, self.journal.entries(), resource_version='10')
+
+    def test_truncated_journal(self):
+        """Test that rewinding past the oldest entry of a trimmed journal fails."""
+        self.make_history()
+        entries = self.journal.entries()[1:]
+        with self.assertRaisesRegex(JournalError, 'The journal only reaches back to'):
+            rewind(self.data, entries, resource_version='9')
+        self.assertEqual(self.history[1], rewind(self.data, entries, resource_version='11'))
+        self.assertEqual(self.history[2], rewind(self.data, entries, resource_version='12'))
+
+    def test_no_point(self):
+        """Test that a time or resourceVersion is required."""
+        with self.assertRaisesRegex(JournalError, 'A time or resourceVersion'):
+            rewind(self.data, [])
+
+    def test_parse_time(self):
+        """Test parsing times with and without offsets."""
+        expected = datetime(2023, 6, 1, 12, tzinfo=timezone.utc)
+        self.assertEqual(expected, parse_time('2023-06-01T12:00:00Z'))
+        self.assertEqual(expected, parse_time('2023-06-01T12:00'))
+        self.assertEqual(expected, parse_time('2023-06-01T14:00:00+02:00'))
+        with self.assertRaisesRegex(JournalError, 'Invalid time'):
+            parse_time('yesterday')
+
+
+if __name__ == '__main__':
+    unittest.main()
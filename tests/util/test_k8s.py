@@ -0,0 +1,404 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Unit tests for the cray_product_catalog.util.k8s module
+
+import json
+import os
+import socket
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
+
+from cray_product_catalog.util import k8s, metrics, tracing
+from cray_product_catalog.util.deadline import Deadline, DeadlineRetry
+from cray_product_catalog.util.k8s import (
+    ConfigMapContent,
+    get_api_client,
+    load_k8s,
+    merge_config_map,
+    read_config_map,
+    read_config_map_resource_version,
+    wait_for_config_map,
+    write_config_map,
+)
+from tests.mocks import MockConfigMapApi, MockConfigMapResponse
+
+
+class TestReadConfigMapResourceVersion(unittest.TestCase):
+    """Tests for read_config_map_resource_version()."""
+
+    def test_read_resource_version(self):
+        """Test that only the metadata is requested, and the resourceVersion returned."""
+        api = Mock()
+        api.api_client.call_api.return_value = MockConfigMapResponse(None, resource_version='7')
+        self.assertEqual('7', read_config_map_resource_version(api, 'cm', 'ns'))
+        args, kwargs = api.api_client.call_api.call_args
+        self.assertEqual(('/api/v1/namespaces/{namespace}/configmaps/{name}', 'GET'), args)
+        self.assertEqual({'name': 'cm', 'namespace': 'ns'}, kwargs['path_params'])
+        self.assertTrue(kwargs['header_params']['Accept'].startswith('application/json;as=PartialObjectMetadata'))
+
+
+class TestLoadK8s(unittest.TestCase):
+    """Tests for load_k8s()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        patch.object(k8s, '_k8s_config_loaded', False).start()
+        self.mock_load_incluster = patch('cray_product_catalog.util.k8s.config.load_incluster_config').start()
+        self.mock_load_kube = patch('cray_product_catalog.util.k8s.config.load_kube_config').start()
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_load_once(self):
+        """Test that the configuration is only loaded by the first call."""
+        load_k8s()
+        load_k8s()
+        self.mock_load_incluster.assert_called_once_with()
+        self.mock_load_kube.assert_not_called()
+
+    def test_load_kube_config(self):
+        """Test falling back to the kubeconfig file outside a cluster."""
+        self.mock_load_incluster.side_effect = Exception
+        load_k8s()
+        load_k8s()
+        self.mock_load_kube.assert_called_once_with()
+
+    def test_load_failed(self):
+        """Test that loading is attempted again if it failed."""
+        self.mock_load_incluster.side_effect = Exception
+        self.mock_load_kube.side_effect = [Exception, None]
+        with self.assertRaises(Exception):
+            load_k8s()
+        load_k8s()
+        self.assertEqual(2, self.mock_load_kube.call_count)
+
+
+class TestGetApiClient(unittest.TestCase):
+    """Tests for get_api_client()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        patch.dict(k8s._api_clients, clear=True).start()
+        configuration = client.Configuration(host='https://api.example.com')
+        patch.object(client.Configuration, '_default', configuration).start()
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_shared(self):
+        """Test that the same client is returned to each caller with the same arguments."""
+        self.assertIs(get_api_client(retries=100), get_api_client(retries=100))
+        self.assertIsNot(get_api_client(retries=100), get_api_client())
+
+    def test_new_client_for_new_server(self):
+        """Test that a client is not reused once the default configuration points elsewhere."""
+        api_client = get_api_client()
+        with patch.object(client.Configuration, '_default', client.Configuration(host='https://other.example.com')):
+            self.assertEqual('https://other.example.com', get_api_client().configuration.host)
+        self.assertIs(api_client, get_api_client())
+
+    def test_pool_settings(self):
+        """Test the retries, pool size, and keep-alive settings of the client."""
+        pool_manager = get_api_client(retries=10, pool_maxsize=8, keepalive=30).rest_client.pool_manager
+        retry = pool_manager.connection_pool_kw['retries']
+        self.assertIsInstance(retry, DeadlineRetry)
+        self.assertEqual(10, retry.total)
+        self.assertEqual(8, pool_manager.connection_pool_kw['maxsize'])
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), pool_manager.connection_pool_kw['socket_options'])
+
+    def test_context(self):
+        """Test a client for a kubeconfig context, which is loaded once without changing the default."""
+        patch.dict(k8s._context_configurations, clear=True).start()
+
+        def load_kube_config(context, client_configuration):
+            client_configuration.host = f'https://{context}.example.com'
+
+        with patch('cray_product_catalog.util.k8s.config.load_kube_config', side_effect=load_kube_config) as mock_load:
+            api_client = get_api_client(context='other')
+            self.assertIs(api_client, get_api_client(context='other'))
+        mock_load.assert_called_once()
+        self.assertEqual('https://other.example.com', api_client.configuration.host)
+        self.assertEqual('https://api.example.com', get_api_client().configuration.host)
+
+    def test_keepalive_disabled(self):
+        """Test that TCP keep-alive can be disabled."""
+        pool_manager = get_api_client(keepalive=0).rest_client.pool_manager
+        self.assertNotIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), pool_manager.connection_pool_kw['socket_options'])
+
+
+class TestInstrument(unittest.TestCase):
+    """Tests for the metrics recorded for requests made with clients from get_api_client()."""
+
+    def setUp(self):
+        """Instrument a mock PoolManager."""
+        metrics.REGISTRY.reset()
+        self.pool_manager = Mock()
+        self.request = self.pool_manager.request
+        self.request.return_value = Mock(status=200, data=b'{"kind": "ConfigMap"}')
+        k8s._instrument(self.pool_manager)
+
+    def tearDown(self):
+        """Reset the metrics."""
+        metrics.REGISTRY.reset()
+
+    def test_preloaded_request(self):
+        """Test the metrics of a request whose response is read before it is returned."""
+        self.pool_manager.request('PATCH', 'https://api/cm', body='{"data": {}}', preload_content=True)
+        self.request.assert_called_once_with('PATCH', 'https://api/cm', body='{"data": {}}', preload_content=True)
+        self.assertEqual(1, metrics.API_REQUESTS.value(method='PATCH', code='200'))
+        self.assertEqual(1, metrics.API_REQUEST_SECONDS.count(method='PATCH'))
+        self.assertEqual(12, metrics.API_SENT_BYTES.sum())
+        self.assertEqual(21, metrics.API_RECEIVED_BYTES.sum())
+
+    def test_streamed_request(self):
+        """Test that the size of a response which is not preloaded is recorded when it is decoded."""
+        self.pool_manager.request('GET', 'https://api/cm', fields={}, preload_content=False)
+        self.assertEqual(0, metrics.API_SENT_BYTES.count())
+        self.assertEqual(0, metrics.API_RECEIVED_BYTES.count())
+
+        api = Mock()
+        api.read_namespaced_config_map.return_value = MockConfigMapResponse({'sat': 'data'})
+        read_config_map(api, 'cm', 'ns')
+        self.assertEqual(1, metrics.API_RECEIVED_BYTES.count())
+
+    def test_request_span(self):
+        """Test that a span of each request is recorded when tracing is enabled."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'trace.json')
+            tracing.configure(path)
+            try:
+                self.pool_manager.request('GET', 'https://api/api/v1/namespaces/ns/configmaps/cm?limit=1')
+            finally:
+                tracing.configure(None)
+            with open(path) as trace_file:
+                span = json.loads(trace_file.read())['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        self.assertEqual(('GET', tracing.SPAN_KIND_CLIENT), (span['name'], span['kind']))
+        self.assertIn({'key': 'url.path', 'value': {'stringValue': '/api/v1/namespaces/ns/configmaps/cm'}},
+                      span['attributes'])
+        self.assertIn({'key': 'http.response.status_code', 'value': {'intValue': '200'}}, span['attributes'])
+
+    def test_failed_request(self):
+        """Test that a request which raises is recorded without a status code."""
+        self.request.side_effect = OSError('Connection refused')
+        with self.assertRaises(OSError):
+            self.pool_manager.request('GET', 'https://api/cm')
+        self.assertEqual(1, metrics.API_REQUESTS.value(method='GET', code='error'))
+
+
+class TestReadConfigMap(unittest.TestCase):
+    """Tests for read_config_map()."""
+
+    def test_read_config_map(self):
+        """Test that the data and resourceVersion are decoded from the raw response."""
+        api = Mock()
+        response = MockConfigMapResponse({'sat': 'data'}, resource_version='42')
+        api.read_namespaced_config_map.return_value = response
+        self.assertEqual(ConfigMapContent({'sat': 'data'}, '42'),
+                         read_config_map(api, 'cm', 'ns', _request_timeout=5))
+        api.read_namespaced_config_map.assert_called_once_with('cm', 'ns', _preload_content=False,
+                                                               _request_timeout=5)
+        response.release_conn.assert_called_once_with()
+
+    def test_read_config_map_no_data(self):
+        """Test reading a ConfigMap which has no data."""
+        api = Mock()
+        api.read_namespaced_config_map.return_value = MockConfigMapResponse(None)
+        self.assertIsNone(read_config_map(api, 'cm', 'ns').data)
+
+
+class TestWriteConfigMap(unittest.TestCase):
+    """Tests for write_config_map()."""
+
+    def setUp(self):
+        """Set up a mock Kubernetes API."""
+        self.api = Mock()
+        self.api.create_namespaced_config_map.return_value = MockConfigMapResponse({'sat': 'data'}, '1')
+        self.api.replace_namespaced_config_map.return_value = MockConfigMapResponse({'sat': 'data'}, '2')
+
+    def test_create(self):
+        """Test creating a ConfigMap with only its name, namespace, and labels."""
+        self.assertEqual(ConfigMapContent({'sat': 'data'}, '1'),
+                         write_config_map(self.api, 'cm', 'ns', {'sat': 'data'}, {'app': 'catalog'}))
+        self.api.create_namespaced_config_map.assert_called_once_with('ns', {
+            'apiVersion': 'v1', 'kind': 'ConfigMap', 'data': {'sat': 'data'},
+            'metadata': {'name': 'cm', 'namespace': 'ns', 'labels': {'app': 'catalog'}},
+        }, _preload_content=False)
+        self.api.replace_namespaced_config_map.assert_not_called()
+
+    def test_replace_existing(self):
+        """Test replacing a ConfigMap which already exists."""
+        self.api.create_namespaced_config_map.side_effect = ApiException(status=409)
+        self.assertEqual('2', write_config_map(self.api, 'cm', 'ns', {}).resource_version)
+        _, _, body = self.api.replace_namespaced_config_map.call_args[0]
+        self.assertEqual({'name': 'cm', 'namespace': 'ns'}, body['metadata'])
+        self.assertIsNone(body['data'])
+
+    def test_create_error(self):
+        """Test that other errors creating the ConfigMap are raised."""
+        self.api.create_namespaced_config_map.side_effect = ApiException(status=403)
+        with self.assertRaises(ApiException):
+            write_config_map(self.api, 'cm', 'ns', {})
+
+
+class TestMergeConfigMap(unittest.TestCase):
+    """Tests for merge_config_map()."""
+
+    def setUp(self):
+        """Set up a mock Kubernetes API holding a ConfigMap."""
+        self.api = MockConfigMapApi()
+        self.api.add('ns', 'cm', {'sat': 'live'}, labels={'app': 'catalog'})
+
+    def test_add_missing(self):
+        """Test that only missing keys and labels are added."""
+        written, added = merge_config_map(self.api, 'cm', 'ns', {'sat': 'old', 'cos': 'data'},
+                                          {'app': 'other', 'tier': 'backup'})
+        self.assertEqual(['cos'], added)
+        self.assertEqual({'sat': 'live', 'cos': 'data'}, written.data)
+        self.assertEqual({'app': 'catalog', 'tier': 'backup'}, self.api.config_maps[('ns', 'cm')]['metadata']['labels'])
+
+    def test_nothing_missing(self):
+        """Test that a ConfigMap with every key is not written."""
+        written, added = merge_config_map(self.api, 'cm', 'ns', {'sat': 'old'})
+        self.assertEqual(([], {'sat': 'live'}), (added, written.data))
+        self.assertEqual(['read'], self.api.requests)
+
+    def test_create(self):
+        """Test that a missing ConfigMap is created."""
+        written, added = merge_config_map(self.api, 'other', 'ns', {'sat': 'data'})
+        self.assertEqual((['sat'], {'sat': 'data'}), (added, written.data))
+        self.assertEqual(['read', 'create'], self.api.requests)
+
+    def test_patch_error(self):
+        """Test that errors other than conflicts are raised."""
+        self.api.patch_namespaced_config_map = Mock(side_effect=ApiException(status=403))
+        with self.assertRaises(ApiException):
+            merge_config_map(self.api, 'cm', 'ns', {'cos': 'data'})
+
+
+class TestWaitForConfigMap(unittest.TestCase):
+    """Tests for wait_for_config_map()."""
+
+    def setUp(self):
+        """Set up mocks."""
+        self.api = Mock()
+        self.api.list_namespaced_config_map.return_value = Mock(items=[], metadata=Mock(resource_version='10'))
+        self.mock_watch = patch('cray_product_catalog.util.k8s.watch.Watch').start().return_value
+        self.mock_sleep = patch('cray_product_catalog.util.k8s.time.sleep').start()
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def test_already_exists(self):
+        """Test that no watch is started when the ConfigMap already exists."""
+        self.api.list_namespaced_config_map.return_value.items = [Mock()]
+        self.assertTrue(wait_for_config_map(self.api, 'cm', 'ns'))
+        self.api.list_namespaced_config_map.assert_called_once_with('ns', field_selector='metadata.name=cm')
+        self.mock_watch.stream.assert_not_called()
+
+    def test_created_during_watch(self):
+        """Test that the wait ends when the watch sees the ConfigMap added."""
+        self.mock_watch.stream.return_value = iter([{'type': 'ADDED', 'object': Mock()}])
+        self.assertTrue(wait_for_config_map(self.api, 'cm', 'ns', timeout=30))
+        _, kwargs = self.mock_watch.stream.call_args
+        self.assertEqual('metadata.name=cm', kwargs['field_selector'])
+        self.assertEqual('10', kwargs['resource_version'])
+        self.assertLessEqual(kwargs['timeout_seconds'], 30)
+        self.mock_watch.stop.assert_called_once_with()
+        self.mock_sleep.assert_not_called()
+
+    def test_watch_expired(self):
+        """Test that the ConfigMap is listed again when the watch expires."""
+        self.mock_watch.stream.side_effect = [ApiException(status=410), iter([{'type': 'ADDED'}])]
+        self.assertTrue(wait_for_config_map(self.api, 'cm', 'ns'))
+        self.assertEqual(2, self.api.list_namespaced_config_map.call_count)
+
+    def test_timeout(self):
+        """Test that False is returned when the ConfigMap is not created in time."""
+        with patch('cray_product_catalog.util.k8s.time.monotonic', side_effect=[0, 0, 5]):
+            self.mock_watch.stream.return_value = iter([])
+            self.assertFalse(wait_for_config_map(self.api, 'cm', 'ns', timeout=5))
+
+    def test_errors_back_off(self):
+        """Test that consecutive failed lists back off exponentially before listing again."""
+        existing = self.api.list_namespaced_config_map.return_value
+        existing.items = [Mock()]
+        self.api.list_namespaced_config_map.side_effect = [
+            ApiException(status=500), ApiException(status=500), ApiException(status=500), existing
+        ]
+        with patch('cray_product_catalog.util.k8s.random.uniform', side_effect=lambda low, high: high):
+            self.assertTrue(wait_for_config_map(self.api, 'cm', 'ns'))
+        self.assertEqual([0.5, 1, 2], [call.args[0] for call in self.mock_sleep.call_args_list])
+
+    def test_back_off_limited_by_timeout(self):
+        """Test that backing off after an error does not sleep past the timeout."""
+        self.api.list_namespaced_config_map.side_effect = ApiException(status=500)
+        with patch('cray_product_catalog.util.k8s.time.monotonic', side_effect=[0, 0, 9.8, 10]):
+            self.assertFalse(wait_for_config_map(self.api, 'cm', 'ns', timeout=10))
+        self.assertAlmostEqual(0.2, self.mock_sleep.call_args.args[0])
+
+    def test_back_off_uses_active_deadline(self):
+        """Test that the back off is recorded by the active Deadline."""
+        self.api.list_namespaced_config_map.side_effect = [
+            HTTPError('connection reset'), Mock(items=[Mock()])
+        ]
+        with Deadline() as deadline:
+            self.assertTrue(wait_for_config_map(self.api, 'cm', 'ns'))
+        self.assertGreater(deadline.slept, 0)
+
+    def test_forbidden(self):
+        """Test that a permissions error is raised."""
+        self.api.list_namespaced_config_map.side_effect = ApiException(status=403)
+        with self.assertRaises(ApiException):
+            wait_for_config_map(self.api, 'cm', 'ns')
+
+    def test_traced(self):
+        """Test that the whole wait, including any back off, is recorded as a single span."""
+        self.api.list_namespaced_config_map.side_effect = [
+            ApiException(status=500), HTTPError('connection reset'), Mock(items=[Mock()])
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'trace.json')
+            tracing.configure(path)
+            try:
+                self.assertTrue(wait_for_config_map(self.api, 'cm', 'ns'))
+            finally:
+                tracing.configure(None)
+            with open(path) as trace_file:
+                spans = [span for line in trace_file
+                         for resource_spans in json.loads(line)['resourceSpans']
+                         for scope_spans in resource_spans['scopeSpans']
+                         for span in scope_spans['spans']]
+        self.assertEqual(['wait_for_config_map'], [span['name'] for span in spans])
+        self.assertEqual(2, self.mock_sleep.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# Unit tests for the cray_product_catalog.util.lease module
+
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from cray_product_catalog.util.deadline import Deadline, DeadlineExceeded
+from cray_product_catalog.util.lease import LeaseError, LeaseLock
+
+
+class MockLeaseAPI:
+    """A stand-in for CoordinationV1Api holding a single Lease."""
+
+    def __init__(self):
+        self.lease = None
+        self.resource_version = 0
+
+    def _store(self, lease):
+        self.resource_version += 1
+        lease.metadata.resource_version = str(self.resource_version)
+        self.lease = lease
+        return lease
+
+    def read_namespaced_lease(self, name, namespace, **kwargs):
+        if self.lease is None:
+            raise ApiException(status=404)
+        return client.V1Lease(
+            metadata=client.V1ObjectMeta(name=name, resource_version=self.lease.metadata.resource_version),
+            spec=client.V1LeaseSpec(**{attr: getattr(self.lease.spec, attr)
+                                       for attr in client.V1LeaseSpec.attribute_map})
+        )
+
+    def create_namespaced_lease(self, namespace, body, **kwargs):
+        if self.lease is not None:
+            raise ApiException(status=409)
+        return self._store(body)
+
+    def replace_namespaced_lease(self, name, namespace, body, **kwargs):
+        if body.metadata.resource_version != self.lease.metadata.resource_version:
+            raise ApiException(status=409)
+        return self._store(body)
+
+
+class TestLeaseLock(unittest.TestCase):
+    """Tests for the LeaseLock class."""
+
+    def setUp(self):
+        """Set up a mock API and clock."""
+        self.api = MockLeaseAPI()
+        self.now = 0
+        patch('cray_product_catalog.util.lease.time.monotonic', side_effect=lambda: self.now).start()
+        self.mock_sleep = patch('cray_product_catalog.util.lease.time.sleep').start()
+        self.mock_sleep.side_effect = self.advance
+
+    def tearDown(self):
+        """Stop patches."""
+        patch.stopall()
+
+    def advance(self, seconds):
+        """Advance the mock clock."""
+        self.now += seconds
+
+    def test_acquire_creates_lease(self):
+        """Test acquiring a lock when the Lease does not exist yet."""
+        with LeaseLock(self.api, 'lock', 'ns', holder='me'):
+            self.assertEqual('me', self.api.lease.spec.holder_identity)
+        self.assertIsNone(self.api.lease.spec.holder_identity)
+        self.mock_sleep.assert_not_called()
+
+    def test_acquire_released_lease(self):
+        """Test acquiring a Lease that another holder has released."""
+        with LeaseLock(self.api, 'lock', 'ns', holder='other'):
+            pass
+        with LeaseLock(self.api, 'lock', 'ns', holder='me'):
+            self.assertEqual('me', self.api.lease.spec.holder_identity)
+            self.assertEqual(1, self.api.lease.spec.lease_transitions)
+
+    def test_abandoned_lease_taken_over(self):
+        """Test that a Lease left held by a dead holder is taken over after its duration."""
+        LeaseLock(self.api, 'lock', 'ns', holder='dead', lease_duration=5).acquire()
+        lock = LeaseLock(self.api, 'lock', 'ns', holder='me', lease_duration=5)
+        lock.acquire()
+        self.assertEqual('me', self.api.lease.spec.holder_identity)
+        self.assertGreaterEqual(self.now, 5)
+
+    def test_live_lease_not_taken_over(self):
+        """Test that a Lease which keeps changing is not considered abandoned."""
+        other = LeaseLock(self.api, 'lock', 'ns', holder='other', lease_duration=5)
+        other.acquire()
+
+        def renew(seconds):
+            self.advance(seconds)
+            other.acquire()  # re-acquiring renews the Lease and changes its resourceVersion
+
+        self.mock_sleep.side_effect = renew
+        with self.assertRaises(LeaseError):
+            LeaseLock(self.api, 'lock', 'ns', holder='me', lease_duration=5).acquire(timeout=20)
+        self.assertEqual('other', self.api.lease.spec.holder_identity)
+
+    def test_deadline_exceeded_waiting_for_lease(self):
+        """Test that waiting for a held Lease as a context manager stops at the deadline."""
+        LeaseLock(self.api, 'lock', 'ns', holder='other', lease_duration=60).acquire()
+        deadline = Deadline(10)
+        with self.assertRaises(DeadlineExceeded):
+            with LeaseLock(self.api, 'lock', 'ns', holder='me', lease_duration=60, deadline=deadline):
+                pass
+        self.assertEqual('other', self.api.lease.spec.holder_identity)
+        self.assertLessEqual(self.now, 10)
+
+    def test_release_after_takeover(self):
+        """Test that releasing a lock which was taken over leaves the new holder in place."""
+        lock = LeaseLock(self.api, 'lock', 'ns', holder='me')
+        lock.acquire()
+        self.api.lease.spec.holder_identity = 'other'
+        lock.release()
+        self.assertEqual('other', self.api.lease.spec.holder_identity)
+
+    def test_renew(self):
+        """Test that renewing a held Lease changes its resourceVersion so it is not taken over."""
+        lock = LeaseLock(self.api, 'lock', 'ns', holder='me')
+        lock.acquire()
+        resource_version = self.api.lease.metadata.resource_version
+        self.assertTrue(lock.renew())
+        self.assertNotEqual(resource_version, self.api.lease.metadata.resource_version)
+        self.assertEqual('me', self.api.lease.spec.holder_identity)
+
+    def test_renew_after_takeover(self):
+        """Test that renewing a Lease which was taken over leaves the new holder in place."""
+        lock = LeaseLock(self.api, 'lock', 'ns', holder='me')
+        lock.acquire()
+        self.api.lease.spec.holder_identity = 'other'
+        self.assertFalse(lock.renew())
+        self.assertEqual('other', self.api.lease.spec.holder_identity)
+
+    def test_renewed_while_held(self):
+        """Test that a Lease held as a context manager is renewed in the background."""
+        renewed = threading.Event()
+        replace = self.api.replace_namespaced_lease
+
+        def replace_lease(name, namespace, body, **kwargs):
+            if body.spec.holder_identity == 'me':
+                renewed.set()
+            return replace(name, namespace, body, **kwargs)
+
+        with LeaseLock(self.api, 'lock', 'ns', holder='me', renew_interval=0.01):
+            self.api.replace_namespaced_lease = replace_lease
+            self.assertTrue(renewed.wait(5))
+        self.assertIsNone(self.api.lease.spec.holder_identity)
+
+    def test_release_error(self):
+        """Test that an error releasing the lock is not raised."""
+        api = Mock()
+        api.read_namespaced_lease.side_effect = ApiException(status=500)
+        LeaseLock(api, 'lock', 'ns').release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for the cray_product_catalog.util.metrics module
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from cray_product_catalog.util import metrics
+from cray_product_catalog.util.metrics import Counter, Histogram, Registry, report_at_exit, write_metrics_file
+
+
+class TestCounter(unittest.TestCase):
+    """Tests for the Counter class."""
+
+    def setUp(self):
+        """Create a counter in its own registry."""
+        self.registry = Registry()
+        self.counter = Counter('test_total', 'Things counted.', ('operation',), registry=self.registry)
+
+    def test_inc(self):
+        """Test that counts are kept separately for each label value."""
+        self.counter.inc(operation='update')
+        self.counter.inc(2, operation='update')
+        self.counter.inc(operation='delete')
+        self.assertEqual(3, self.counter.value(operation='update'))
+        self.assertEqual(1, self.counter.value(operation='delete'))
+        self.assertEqual(0, self.counter.value(operation='other'))
+        self.assertEqual(4, self.counter.total())
+
+    def test_wrong_labels(self):
+        """Test that a value must be counted with exactly the counter's labels."""
+        with self.assertRaisesRegex(ValueError, 'requires labels operation'):
+            self.counter.inc()
+        with self.assertRaisesRegex(ValueError, "requires label 'operation'"):
+            self.counter.inc(op='update')
+
+    def test_duplicate_name(self):
+        """Test that two metrics in a registry cannot have the same name."""
+        with self.assertRaisesRegex(ValueError, 'already registered'):
+            Counter('test_total', 'Things counted again.', registry=self.registry)
+
+    def test_render(self):
+        """Test rendering a counter in the Prometheus text format, escaping label values."""
+        self.counter.inc(operation='say "hi"\n')
+        self.assertEqual(
+            '# HELP test_total Things counted.\n'
+            '# TYPE test_total counter\n'
+            'test_total{operation="say \\"hi\\"\\n"} 1\n',
+            self.registry.render()
+        )
+
+    def test_render_unlabelled(self):
+        """Test that a counter without labels is rendered before it is incremented."""
+        Counter('other_total', 'Other things.', registry=self.registry)
+        self.assertIn('\nother_total 0\n', self.registry.render())
+
+
+class TestHistogram(unittest.TestCase):
+    """Tests for the Histogram class."""
+
+    def setUp(self):
+        """Create a histogram in its own registry."""
+        self.registry = Registry()
+        self.histogram = Histogram('test_seconds', 'Time taken.', ('action',), buckets=(0.1, 1.0),
+                                   registry=self.registry)
+
+    def test_observe(self):
+        """Test the count and sum of observed values."""
+        for value in (0.05, 0.5, 5.0):
+            self.histogram.observe(value, action='parse')
+        self.assertEqual(3, self.histogram.count(action='parse'))
+        self.assertAlmostEqual(5.55, self.histogram.sum(action='parse'))
+        self.assertEqual(0, self.histogram.count(action='dump'))
+        self.assertEqual({'count': 3, 'sum': 5.55}, self.histogram.total())
+
+    def test_time(self):
+        """Test timing the body of a with statement, which is observed even if it raises."""
+        with patch('cray_product_catalog.util.metrics.time.perf_counter', side_effect=[10.0, 10.25]):
+            with self.assertRaises(KeyError):
+                with self.histogram.time(action='dump'):
+                    raise KeyError('product')
+        self.assertEqual(1, self.histogram.count(action='dump'))
+        self.assertEqual(0.25, self.histogram.sum(action='dump'))
+
+    def test_render(self):
+        """Test rendering cumulative buckets, the sum, and the count."""
+        self.histogram.observe(0.1, action='parse')
+        self.histogram.observe(2.0, action='parse')
+        self.assertEqual(
+            '# HELP test_seconds Time taken.\n'
+            '# TYPE test_seconds histogram\n'
+            'test_seconds_bucket{action="parse",le="0.1"} 1\n'
+            'test_seconds_bucket{action="parse",le="1.0"} 1\n'
+            'test_seconds_bucket{action="parse",le="+Inf"} 2\n'
+            'test_seconds_sum{action="parse"} 2.1\n'
+            'test_seconds_count{action="parse"} 2\n',
+            self.registry.render()
+        )
+
+
+class TestRegistry(unittest.TestCase):
+    """Tests for the Registry class."""
+
+    def setUp(self):
+        """Create a registry with a counter and a histogram."""
+        self.registry = Registry()
+        self.counter = Counter('test_total', 'Things counted.', ('operation',), registry=self.registry)
+        self.histogram = Histogram('test_bytes', 'Sizes.', registry=self.registry)
+
+    def test_summary(self):
+        """Test that the summary has totals across labels of the metrics which recorded anything."""
+        self.counter.inc(operation='update')
+        self.counter.inc(operation='delete')
+        self.assertEqual({'test_total': 2}, self.registry.summary())
+        self.histogram.observe(100)
+        self.assertEqual({'test_total': 2, 'test_bytes': {'count': 1, 'sum': 100}}, self.registry.summary())
+
+    def test_reset(self):
+        """Test that resetting the registry discards all recorded values."""
+        self.counter.inc(operation='update')
+        self.histogram.observe(100)
+        self.registry.reset()
+        self.assertEqual({}, self.registry.summary())
+
+    def test_write_metrics_file(self):
+        """Test writing the metrics to a file."""
+        self.counter.inc(operation='update')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'catalog.prom')
+            write_metrics_file(path, self.registry)
+            with open(path) as metrics_file:
+                self.assertEqual(self.registry.render(), metrics_file.read())
+            self.assertEqual(['catalog.prom'], os.listdir(tmp_dir))
+
+
+class TestReportAtExit(unittest.TestCase):
+    """Tests for the report_at_exit decorator."""
+
+    def setUp(self):
+        """Reset the package's metrics."""
+        metrics.REGISTRY.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'catalog.prom')
+
+    def tearDown(self):
+        """Remove the temporary directory and reset the package's metrics."""
+        self.tmp_dir.cleanup()
+        metrics.REGISTRY.reset()
+
+    @staticmethod
+    @report_at_exit
+    def job(status):
+        """Record an attempt, then exit with the given status."""
+        metrics.ATTEMPTS.inc(operation='update')
+        raise SystemExit(status)
+
+    def test_summary_and_file(self):
+        """Test that a JSON summary is logged and the file is written when the job exits."""
+        output = io.StringIO()
+        with patch.dict(os.environ, {'CATALOG_METRICS_FILE': self.path}), redirect_stdout(output):
+            with self.assertLogs(metrics.LOGGER, 'INFO') as logs, self.assertRaises(SystemExit):
+                self.job(1)
+        self.assertEqual('', output.getvalue())
+        self.assertEqual(1, len(logs.records))
+        message = logs.records[0].getMessage()
+        self.assertTrue(message.startswith('Metrics: '))
+        self.assertEqual({'catalog_write_attempts_total': 1}, json.loads(message[len('Metrics: '):]))
+        with open(self.path) as metrics_file:
+            self.assertIn('catalog_write_attempts_total{operation="update"} 1\n', metrics_file.read())
+
+    def test_summary_disabled(self):
+        """Test that the summary is not logged if CATALOG_METRICS_SUMMARY is 0."""
+        with patch.dict(os.environ, {'CATALOG_METRICS_SUMMARY': '0'}), patch.object(metrics, 'LOGGER') as logger:
+            with self.assertRaises(SystemExit):
+                self.job(0)
+        logger.info.assert_not_called()
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.util.projection module
+
+import unittest
+
+from yaml import YAMLError, safe_dump, safe_load
+
+from cray_product_catalog.util.projection import field_tree, load_fields, project
+from tests.mocks import COS_VERSIONS, MOCK_PRODUCT_CATALOG_DATA, SAT_VERSIONS
+
+
+class TestFieldTree(unittest.TestCase):
+    """Tests for field_tree."""
+
+    def test_field_tree(self):
+        """Test building a tree of nested fields."""
+        self.assertEqual({'component_versions': {'docker': None, 'helm': None}, 'active': None},
+                         field_tree(['component_versions.docker', 'active', 'component_versions.helm']))
+
+    def test_field_tree_whole_field(self):
+        """Test that a field wins over its subfields in either order."""
+        self.assertEqual({'configuration': None}, field_tree(['configuration.commit', 'configuration']))
+        self.assertEqual({'configuration': None}, field_tree(['configuration', 'configuration.commit']))
+
+    def test_field_tree_invalid(self):
+        """Test that empty fields and keys are rejected."""
+        for field in ('', 'configuration.', '.commit', 'a..b'):
+            with self.subTest(field=field):
+                with self.assertRaisesRegex(ValueError, 'Invalid field'):
+                    field_tree([field])
+
+
+class TestLoadFields(unittest.TestCase):
+    """Tests for load_fields."""
+
+    def assert_projected(self, text, fields):
+        """Assert that streaming projection matches projecting the fully loaded data."""
+        tree = field_tree(fields)
+        expected = {version: project(data, tree) for version, data in (safe_load(text) or {}).items()}
+        self.assertEqual(expected, load_fields(text, fields))
+
+    def test_load_fields(self):
+        """Test loading fields of the mock catalog."""
+        self.assertEqual(
+            {'2.0.0': {'component_versions': {'docker': COS_VERSIONS['2.0.0']['component_versions']['docker']}},
+             '2.0.1': {'component_versions': {'docker': COS_VERSIONS['2.0.1']['component_versions']['docker']}}},
+            load_fields(MOCK_PRODUCT_CATALOG_DATA['cos'], ['component_versions.docker'])
+        )
+        self.assertEqual({'2.0.0': {'configuration': {'commit': SAT_VERSIONS['2.0.0']['configuration']['commit']}},
+                          '2.0.1': {'configuration': {'commit': SAT_VERSIONS['2.0.1']['configuration']['commit']}}},
+                         load_fields(MOCK_PRODUCT_CATALOG_DATA['sat'], ['configuration.commit']))
+
+    def test_load_fields_matches_full_load(self):
+        """Test that projection matches projecting the full data for many fields."""
+        for product, text in MOCK_PRODUCT_CATALOG_DATA.items():
+            for fields in (['component_versions'], ['component_versions.repositories', 'images'],
+                           ['configuration.clone_url', 'recipes', 'missing.field'], ['component_versions.docker.x']):
+                with self.subTest(product=product, fields=fields):
+                    self.assert_projected(text, fields)
+
+    def test_load_fields_types(self):
+        """Test that scalars, keys, and tags are resolved as by safe_load."""
+        self.assert_projected('1.0: {active: true, n: 3, d: 2021-07-07, s: "3", t: !!str 4, e: ~}\n',
+                              ['active', 'n', 'd', 's', 't', 'e'])
+        self.assert_projected(safe_dump({'2.0': {'configuration': {'commit': '0123'}}}), ['configuration.commit'])
+
+    def test_load_fields_empty(self):
+        """Test that empty documents and versions without the fields give empty results."""
+        self.assertEqual({}, load_fields('', ['active']))
+        self.assertEqual({'1.0.0': {}}, load_fields(safe_dump({'1.0.0': {'configuration': 'x'}}),
+                                                    ['configuration.commit']))
+
+    def test_load_fields_aliases(self):
+        """Test that aliases are followed within and out of loaded values."""
+        self.assert_projected('a: &x {b: [1, 2]}\nc: *x\n', ['b'])
+        self.assert_projected('a: {b: &x [1, 2]}\nc: {b: *x}\n', ['b'])
+        self.assert_projected('a: {d: &x [1, 2]}\nc: {b: *x}\n', ['b'])
+        self.assert_projected('a: &x {b: 1, d: 2}\nc: {<<: *x, d: 3}\n', ['d'])
+
+    def test_load_fields_errors(self):
+        """Test that invalid YAML raises the same errors as safe_load."""
+        for text in ('\t', 'a: [1, 2\n', 'a: *missing\n', 'a: {b: &x 1, d: &x 2}\nc: {b: *x}\n'):
+            with self.subTest(text=text):
+                with self.assertRaises(YAMLError):
+                    load_fields(text, ['b'])
+        with self.assertRaises(AttributeError):
+            load_fields('- 1\n', ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
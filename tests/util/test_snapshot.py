@@ -0,0 +1,128 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.util.snapshot module
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from yaml import safe_dump
+
+from cray_product_catalog.util.snapshot import (
+    Snapshot,
+    SnapshotError,
+    hash_product_data,
+    make_snapshot,
+    parse_snapshot,
+    read_snapshot,
+    verify_hashes,
+    write_snapshot,
+)
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for reading and writing snapshots."""
+
+    def setUp(self):
+        """Create a temporary directory and some catalog data."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'snapshot.json')
+        self.data = {'sat': safe_dump({'1.0.0': {'active': True}}), 'cos': safe_dump({'2.0.0': {}})}
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_hash_product_data(self):
+        """Test that the hash is a prefixed SHA-256 digest."""
+        self.assertEqual(
+            'sha256:2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824', hash_product_data('hello')
+        )
+
+    def test_write_and_read(self):
+        """Test that a written snapshot is read back with its hashes."""
+        snapshot = make_snapshot(self.data, 'cray-product-catalog', 'services', '42')
+        write_snapshot(self.path, snapshot)
+        self.assertEqual(snapshot, read_snapshot(self.path))
+        self.assertEqual(hash_product_data(self.data['sat']), snapshot.hashes['sat'])
+        self.assertFalse(os.path.exists(f'{self.path}.tmp'))
+
+    def test_write_computes_hashes(self):
+        """Test that hashes are written for a snapshot without them."""
+        write_snapshot(self.path, Snapshot(self.data))
+        with open(self.path) as sfile:
+            self.assertEqual(make_snapshot(self.data).hashes, json.load(sfile)['hashes'])
+
+    def test_write_and_read_compressed(self):
+        """Test that a snapshot is compressed if its name ends in .gz."""
+        path = os.path.join(self.tmp_dir.name, 'snapshot.json.gz')
+        snapshot = make_snapshot(self.data)
+        write_snapshot(path, snapshot)
+        with gzip.open(path, 'rt') as sfile:
+            self.assertEqual(self.data, json.load(sfile)['data'])
+        self.assertEqual(snapshot, read_snapshot(path))
+
+    def test_verify_hashes(self):
+        """Test verifying data against hashes."""
+        hashes = make_snapshot(self.data).hashes
+        verify_hashes(self.data, hashes)
+        with self.assertRaisesRegex(SnapshotError, r'product\(s\): cos, sat$'):
+            verify_hashes({'sat': 'changed'}, hashes)
+        with self.assertRaisesRegex(SnapshotError, r'product\(s\): uan$'):
+            verify_hashes(dict(self.data, uan=''), hashes)
+        verify_hashes(None, {})
+
+    def test_read_kubectl_yaml(self):
+        """Test reading a ConfigMap saved with kubectl -o yaml."""
+        with open(self.path, 'w') as sfile:
+            sfile.write(safe_dump({
+                'apiVersion': 'v1', 'kind': 'ConfigMap', 'data': self.data,
+                'metadata': {'name': 'cpc-backup', 'namespace': 'services', 'resourceVersion': '7'},
+            }))
+        self.assertEqual(Snapshot(self.data, None, 'cpc-backup', 'services', '7'), read_snapshot(self.path))
+
+    def test_read_kubectl_json_without_data(self):
+        """Test reading an empty ConfigMap saved with kubectl -o json."""
+        text = json.dumps({'kind': 'ConfigMap', 'metadata': {'name': 'cpc-backup'}})
+        self.assertEqual(Snapshot({}, None, 'cpc-backup'), parse_snapshot(text))
+
+    def test_read_invalid(self):
+        """Test reading files which are not snapshots."""
+        for text, message in (('- a list', 'not a mapping'), ('kind: Secret', 'not Secret'),
+                              ('{"kind": "ProductCatalogSnapshot", "version": 2}', 'Unsupported snapshot version 2'),
+                              ('a: [', 'Unable to parse')):
+            with self.subTest(text=text):
+                with self.assertRaisesRegex(SnapshotError, message):
+                    parse_snapshot(text)
+
+    def test_read_missing(self):
+        """Test reading a file which does not exist."""
+        with self.assertRaisesRegex(SnapshotError, 'Unable to read snapshot'):
+            read_snapshot(os.path.join(self.tmp_dir.name, 'missing.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for cray_product_catalog.util.spool module
+
+import json
+import os
+import tempfile
+import unittest
+
+from cray_product_catalog.util.catalog_data import delete_request
+from cray_product_catalog.util.spool import (
+    FAILED_DIR,
+    SpoolError,
+    fail_request,
+    pending_requests,
+    read_request,
+    remove_requests,
+    spool_request,
+)
+
+
+class TestSpool(unittest.TestCase):
+    """Tests for spooling catalog requests."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spool_dir = os.path.join(self.tmp_dir.name, 'spool')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_spool_and_read(self):
+        """Test that spooled requests are read back in the order they were spooled."""
+        self.assertEqual([], pending_requests(self.spool_dir))
+        paths = [
+            spool_request(self.spool_dir, 'cray-product-catalog', 'services', delete_request('sat', version))
+            for version in ('1.0.0', '1.1.0', '1.2.0')
+        ]
+        self.assertEqual(paths, pending_requests(self.spool_dir))
+        entry = read_request(paths[0])
+        self.assertEqual(('cray-product-catalog', 'services'), (entry['name'], entry['namespace']))
+        self.assertEqual(delete_request('sat', '1.0.0'), entry['request'])
+
+    def test_temporary_files_ignored(self):
+        """Test that partly written requests are not pending."""
+        os.makedirs(self.spool_dir)
+        with open(os.path.join(self.spool_dir, '.1-2-3.json.tmp'), 'w') as sfile:
+            sfile.write('{')
+        self.assertEqual([], pending_requests(self.spool_dir))
+
+    def test_unwritable(self):
+        """Test that a spool which cannot be written raises SpoolError."""
+        with open(self.spool_dir, 'w'):
+            pass
+        with self.assertRaisesRegex(SpoolError, 'Unable to spool request'):
+            spool_request(self.spool_dir, 'cray-product-catalog', 'services', delete_request('sat', '1.0.0'))
+
+    def test_invalid(self):
+        """Test that a request which is not valid raises SpoolError."""
+        os.makedirs(self.spool_dir)
+        path = os.path.join(self.spool_dir, '1.json')
+        for content in ('{', '[]', json.dumps({'name': 'cm', 'namespace': 'ns', 'request': {'op': 'delete'}})):
+            with self.subTest(content=content):
+                with open(path, 'w') as sfile:
+                    sfile.write(content)
+                with self.assertRaises(SpoolError):
+                    read_request(path)
+
+    def test_remove_and_fail(self):
+        """Test removing applied requests, twice, and moving failed requests aside."""
+        paths = [
+            spool_request(self.spool_dir, 'cray-product-catalog', 'services', delete_request('sat', version))
+            for version in ('1.0.0', '1.1.0')
+        ]
+        remove_requests(paths[:1])
+        remove_requests(paths[:1])
+        failed_path = fail_request(paths[1])
+        self.assertEqual([], pending_requests(self.spool_dir))
+        self.assertEqual(os.path.join(self.spool_dir, FAILED_DIR, os.path.basename(paths[1])), failed_path)
+        self.assertTrue(os.path.exists(failed_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# MIT License
+#
+# (C) Copyright 2023 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+# Unit tests for the cray_product_catalog.util.tracing module
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from cray_product_catalog.util import tracing
+
+
+class TestTracing(unittest.TestCase):
+    """Tests for recording spans to a file."""
+
+    def setUp(self):
+        """Enable tracing to a temporary file."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'trace.json')
+        self.tracer = tracing.configure(self.path, service_name='test')
+
+    def tearDown(self):
+        """Disable tracing and remove the temporary directory."""
+        tracing.configure(None)
+        self.tmp_dir.cleanup()
+
+    def read_requests(self):
+        """Return the ExportTraceServiceRequests written to the trace file."""
+        with open(self.path) as trace_file:
+            return [json.loads(line) for line in trace_file]
+
+    def read_spans(self):
+        """Return all spans written to the trace file, by name."""
+        return {
+            span['name']: span
+            for request in self.read_requests()
+            for resource_spans in request['resourceSpans']
+            for scope_spans in resource_spans['scopeSpans']
+            for span in scope_spans['spans']
+        }
+
+    def test_nested_spans(self):
+        """Test that nested spans share a trace and are written in OTLP JSON when the root span ends."""
+        with tracing.span('root', product='sat', attempt=2, slept=1.5, active=True):
+            with tracing.span('child') as child:
+                child.set_attribute('http.response.status_code', 200)
+            self.assertFalse(os.path.exists(self.path))
+
+        requests = self.read_requests()
+        self.assertEqual(1, len(requests))
+        resource_spans = requests[0]['resourceSpans'][0]
+        self.assertIn({'key': 'service.name', 'value': {'stringValue': 'test'}},
+                      resource_spans['resource']['attributes'])
+        self.assertEqual({'name': 'cray_product_catalog'}, resource_spans['scopeSpans'][0]['scope'])
+
+        spans = self.read_spans()
+        root, child = spans['root'], spans['child']
+        self.assertEqual(root['traceId'], child['traceId'])
+        self.assertEqual(32, len(root['traceId']))
+        self.assertEqual('', root['parentSpanId'])
+        self.assertEqual(root['spanId'], child['parentSpanId'])
+        self.assertLessEqual(int(root['startTimeUnixNano']), int(child['startTimeUnixNano']))
+        self.assertLessEqual(int(child['endTimeUnixNano']), int(root['endTimeUnixNano']))
+        self.assertEqual([
+            {'key': 'product', 'value': {'stringValue': 'sat'}},
+            {'key': 'attempt', 'value': {'intValue': '2'}},
+            {'key': 'slept', 'value': {'doubleValue': 1.5}},
+            {'key': 'active', 'value': {'boolValue': True}},
+        ], root['attributes'])
+        self.assertEqual([{'key': 'http.response.status_code', 'value': {'intValue': '200'}}],
+                         child['attributes'])
+        self.assertEqual({}, root['status'])
+
+    def test_separate_traces(self):
+        """Test that consecutive root spans start separate traces."""
+        with tracing.span('first'):
+            pass
+        with tracing.span('second'):
+            pass
+        spans = self.read_spans()
+        self.assertNotEqual(spans['first']['traceId'], spans['second']['traceId'])
+        self.assertEqual(2, len(self.read_requests()))
+
+    def test_error(self):
+        """Test that a span which raises has an error status and an exception event."""
+        with self.assertRaises(ValueError):
+            with tracing.span('failed'):
+                raise ValueError('Invalid version')
+        span = self.read_spans()['failed']
+        self.assertEqual({'code': tracing.STATUS_CODE_ERROR, 'message': 'Invalid version'}, span['status'])
+        self.assertEqual('exception', span['events'][0]['name'])
+
+    def test_successful_exit(self):
+        """Test that exiting with status 0 is not an error."""
+        with self.assertRaises(SystemExit):
+            with tracing.span('main'):
+                raise SystemExit(0)
+        self.assertEqual({}, self.read_spans()['main']['status'])
+
+    def test_traced(self):
+        """Test that each call of a traced function is a span."""
+        @tracing.traced('traced_func')
+        def traced_func(value):
+            with tracing.span('inner'):
+                return value * 2
+
+        self.assertEqual(4, traced_func(2))
+        spans = self.read_spans()
+        self.assertEqual(spans['traced_func']['spanId'], spans['inner']['parentSpanId'])
+
+    def test_threads(self):
+        """Test that a span in a new thread does not have a parent in another thread."""
+        with tracing.span('main'):
+            thread = threading.Thread(target=lambda: tracing.span('thread').__enter__().__exit__(None, None, None))
+            thread.start()
+            thread.join()
+        self.assertEqual('', self.read_spans()['thread']['parentSpanId'])
+
+    def test_buffer_full(self):
+        """Test that spans are written once the buffer is full, before their trace ends."""
+        self.tracer.max_buffered = 2
+        with tracing.span('root'):
+            for _ in range(2):
+                with tracing.span('child'):
+                    pass
+            self.assertEqual(1, len(self.read_requests()))
+
+    def test_disabled(self):
+        """Test that nothing is recorded when tracing is disabled."""
+        tracing.configure(None)
+        self.assertFalse(tracing.enabled())
+        with tracing.span('ignored') as span:
+            span.set_attribute('key', 'value')
+        self.assertIs(tracing.span('other'), span)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_write_error(self):
+        """Test that an error writing the trace file is logged rather than raised."""
+        tracing.configure(os.path.join(self.tmp_dir.name, 'missing', 'trace.json'))
+        with self.assertLogs(tracing.LOGGER, 'WARNING'):
+            with tracing.span('root'):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()